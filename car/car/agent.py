@@ -248,6 +248,25 @@ class Agent:
                     "required": ["descripcion"]
                 }
             },
+            {
+                "type": "function",
+                "name": "buscar_diagnosticos_similares",
+                "description": "Busca diagnósticos históricos parecidos a la descripción de un problema, ordenados por similitud, con los componentes y acciones que se usaron en cada uno. Úsala cuando el usuario describa un síntoma o falla ('ruido al frenar', 'pierde aceite', 'no arranca en frío') para ver cómo se resolvieron casos similares.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "descripcion": {
+                            "type": "string",
+                            "description": "Descripción del problema o síntoma del vehículo"
+                        },
+                        "limite": {
+                            "type": "integer",
+                            "description": "Número máximo de diagnósticos a retornar (default: 5)"
+                        }
+                    },
+                    "required": ["descripcion"]
+                }
+            },
             {
                 "type": "function",
                 "name": "listado_acciones",
@@ -347,7 +366,7 @@ class Agent:
                     "properties": {
                         "limite": {
                             "type": "integer",
-                            "description": "Número máximo de repuestos a listar (default: 200 para cubrir todos los registros, máximo recomendado: 500)"
+                            "description": "Número máximo de repuestos a listar (default: 200, máximo: 500). Si hay más, usa el filtro o pide la siguiente página."
                         },
                         "filtro": {
                             "type": "string",
@@ -360,6 +379,21 @@ class Agent:
                     },
                     "required": []
                 }
+            },
+            {
+                "type": "function",
+                "name": "siguiente_pagina",
+                "description": "Devuelve las siguientes filas de un listado que quedó recortado. Úsala cuando un resultado anterior trae 'cursor' y 'filas_restantes' y el usuario pide 'muéstrame más', 'siguiente página', 'los demás' o similar.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "cursor": {
+                            "type": "string",
+                            "description": "Valor del campo 'cursor' de la tabla recortada"
+                        }
+                    },
+                    "required": ["cursor"]
+                }
             }
         ]
         
@@ -528,6 +562,7 @@ class Agent:
             "listado_componentes - Lista componentes del sistema",
             "listado_acciones - Lista acciones disponibles",
             "listado_diagnosticos - Lista diagnósticos (historial)",
+            "buscar_diagnosticos_similares - Diagnósticos parecidos a una descripción",
             "listado_compatibilidad - Consulta compatibilidad repuestos-vehículos",
             "listado_compras - Lista compras del taller",
             "listado_inventario - Lista inventario de repuestos con stock",
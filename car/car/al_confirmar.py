@@ -0,0 +1,56 @@
+"""
+Trabajo diferido hasta confirmar la transacción, agrupado por clave.
+
+Los signals de varios índices y cachés (pizarra, sellos de versión, totales de compra)
+se disparan una vez por fila guardada; lo que publican solo debe hacerse una vez por
+transacción y después de confirmarla (antes, otro proceso podría leer datos sin
+confirmar y guardarlos con el sello nuevo).
+
+- una_vez(clave, funcion): funcion() corre una sola vez al confirmar, aunque se
+  programe muchas veces en la misma transacción.
+- acumular(clave, funcion, elemento): los elementos se juntan en un set y
+  funcion(elementos) corre una sola vez al confirmar con todos ellos.
+
+Cada llamada registra su propio on_commit (si un savepoint se deshace, los callbacks
+que quedan siguen cubriendo la clave); el primero que corre hace el trabajo y los demás
+no encuentran nada pendiente. Sin transacción en curso se ejecuta de inmediato.
+Lo anotado dentro de un savepoint deshecho se publica igual con el resto: las
+funciones solo invalidan o recalculan, así que de más no hace daño.
+"""
+import threading
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+def _pendientes():
+    if not hasattr(_local, 'pendientes'):
+        _local.pendientes = {}
+    return _local.pendientes
+
+
+def _ejecutar(clave):
+    pendiente = _pendientes().pop(clave, None)
+    if pendiente is None:
+        return  # otro callback de esta transacción ya lo ejecutó
+    funcion, elementos = pendiente
+    if elementos is None:
+        funcion()
+    else:
+        funcion(elementos)
+
+
+def una_vez(clave, funcion):
+    """Ejecuta funcion() al confirmar la transacción en curso, una vez por clave."""
+    _pendientes()[clave] = (funcion, None)
+    transaction.on_commit(lambda: _ejecutar(clave))
+
+
+def acumular(clave, funcion, elemento):
+    """Anota `elemento` y al confirmar ejecuta funcion(elementos) una vez por clave."""
+    pendientes = _pendientes()
+    if clave not in pendientes:
+        pendientes[clave] = (funcion, set())
+    pendientes[clave][1].add(elemento)
+    transaction.on_commit(lambda: _ejecutar(clave))
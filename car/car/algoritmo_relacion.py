@@ -1,189 +1,287 @@
-from difflib import SequenceMatcher
-import re
+"""
+Algoritmo inteligente para relacionar repuestos con componentes.
+
+En lugar de comparar cada repuesto con cada componente (SequenceMatcher por par),
+se tokeniza todo una sola vez y se arma un índice invertido TF-IDF sobre los
+nombres de componentes. Para cada repuesto solo se puntúan los componentes que
+comparten al menos un token con él, acumulando los pesos en vectores NumPy.
+
+Puntuación (mismos pesos que la versión anterior):
+- 40% similitud coseno TF-IDF entre nombre del repuesto y nombre del componente
+- 20% similitud con la descripción del repuesto
+- 15% similitud con la posición del repuesto
+- 25% proporción de palabras del componente presentes en el repuesto
+- +0.1 por cada categoría automotriz con una palabra clave en ambos nombres
+"""
+import logging
+import math
 from collections import defaultdict
-from django.shortcuts import render
+
+import numpy as np
+
+from .busqueda_repuestos import normalizar_texto, tokenizar
 from .models import Repuesto, Componente, ComponenteRepuesto
 
-def algoritmo_relacion_inteligente(umbral=0.6, solo_analizar=False, ejecutar=False):
+logger = logging.getLogger(__name__)
+
+# Palabras clave para diferentes categorías
+PALABRAS_CLAVE = {
+    'motor': ['motor', 'cilindro', 'piston', 'valvula', 'bujia', 'filtro aceite', 'aceite', 'refrigerante', 'termostato', 'radiador', 'bomba agua', 'correa', 'tensor'],
+    'frenos': ['freno', 'pastilla', 'disco', 'tambor', 'liquido frenos', 'bomba frenos', 'cilindro freno', 'manguera freno', 'sensor abs'],
+    'suspension': ['amortiguador', 'resorte', 'brazo', 'rotula', 'terminal', 'buje', 'silentblock', 'barra estabilizadora', 'soporte motor'],
+    'direccion': ['direccion', 'cremallera', 'terminal', 'rotula', 'bomba direccion', 'liquido direccion', 'columna direccion'],
+    'transmision': ['embrague', 'disco embrague', 'plato presion', 'collar', 'caja cambios', 'diferencial', 'cardan', 'junta homocinetica'],
+    'electrico': ['alternador', 'motor arranque', 'bateria', 'fusible', 'relay', 'sensor', 'actuador', 'bobina', 'distribuidor'],
+    'combustible': ['bomba combustible', 'filtro combustible', 'inyector', 'regulador presion', 'tanque', 'manguera combustible'],
+    'escape': ['catalizador', 'silenciador', 'mofle', 'sonda lambda', 'sensor oxigeno', 'tubo escape'],
+    'climatizacion': ['compresor', 'condensador', 'evaporador', 'filtro aire', 'ventilador', 'termostato aire'],
+    'carroceria': ['parachoques', 'farol', 'luz', 'espejo', 'manija', 'cerradura', 'vidrio', 'parabrisas'],
+    'neumaticos': ['llanta', 'neumatico', 'rueda', 'valvula neumatico', 'sensor presion'],
+    'lubricacion': ['aceite', 'filtro', 'grasa', 'lubricante', 'aditivo'],
+    'refrigeracion': ['radiador', 'termostato', 'bomba agua', 'manguera', 'refrigerante', 'ventilador'],
+}
+
+PESO_NOMBRE = 0.4
+PESO_DESCRIPCION = 0.2
+PESO_POSICION = 0.15
+PESO_PALABRAS = 0.25
+BONUS_CATEGORIA = 0.1
+
+# Cada cuántos repuestos se informa el progreso
+INTERVALO_PROGRESO = 200
+
+
+def extraer_tokens(texto):
+    """Tokens normalizados de más de 2 letras, en singular aproximado ('pastillas' → 'pastilla')."""
+    tokens = []
+    for token in tokenizar(texto):
+        if len(token) <= 2:
+            continue
+        if len(token) > 4 and token.endswith('s'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class IndiceComponentes:
+    """Índice invertido TF-IDF sobre los nombres de los componentes activos."""
+
+    def __init__(self, componentes):
+        self.componentes = list(componentes)
+        n = len(self.componentes)
+        tokens_por_componente = [extraer_tokens(c.nombre) for c in self.componentes]
+
+        documentos_con_token = defaultdict(int)
+        for tokens in tokens_por_componente:
+            for token in set(tokens):
+                documentos_con_token[token] += 1
+        self.idf = {
+            token: math.log((1 + n) / (1 + df)) + 1
+            for token, df in documentos_con_token.items()
+        }
+
+        # token → (índices de componentes, peso TF-IDF normalizado)
+        postings = defaultdict(lambda: ([], []))
+        self.palabras_por_componente = np.zeros(n, dtype=np.float64)
+        for i, tokens in enumerate(tokens_por_componente):
+            vector = self._vector(tokens)
+            self.palabras_por_componente[i] = len(set(tokens))
+            for token, peso in vector.items():
+                postings[token][0].append(i)
+                postings[token][1].append(peso)
+        self.postings = {
+            token: (np.array(indices, dtype=np.intp), np.array(pesos))
+            for token, (indices, pesos) in postings.items()
+        }
+
+        # Matriz componente × palabra clave para el bonus de categoría
+        self.claves = [(cat, palabra) for cat, palabras in PALABRAS_CLAVE.items() for palabra in palabras]
+        nombres = [normalizar_texto(c.nombre) for c in self.componentes]
+        self.claves_componente = np.array(
+            [[palabra in nombre for _, palabra in self.claves] for nombre in nombres],
+            dtype=bool,
+        ).reshape(n, len(self.claves))
+
+    def _vector(self, tokens):
+        """Vector TF-IDF normalizado (solo tokens presentes en el vocabulario)."""
+        frecuencias = defaultdict(int)
+        for token in tokens:
+            if token in self.idf:
+                frecuencias[token] += 1
+        vector = {token: tf * self.idf[token] for token, tf in frecuencias.items()}
+        norma = math.sqrt(sum(p * p for p in vector.values()))
+        if norma:
+            vector = {token: p / norma for token, p in vector.items()}
+        return vector
+
+    def similitud(self, texto):
+        """Coseno TF-IDF del texto contra todos los componentes (ceros fuera de los candidatos)."""
+        puntajes = np.zeros(len(self.componentes))
+        for token, peso in self._vector(extraer_tokens(texto)).items():
+            indices, pesos = self.postings[token]
+            puntajes[indices] += peso * pesos
+        return puntajes
+
+    def coincidencias(self, tokens):
+        """Cantidad de palabras distintas de cada componente que aparecen en los tokens."""
+        conteo = np.zeros(len(self.componentes))
+        for token in set(tokens):
+            if token in self.postings:
+                conteo[self.postings[token][0]] += 1
+        return conteo
+
+    def bonus_categorias(self, nombre, candidatos):
+        """Bonus por categoría para los candidatos, y las palabras clave que lo justifican."""
+        nombre = normalizar_texto(nombre)
+        claves_repuesto = [k for k, (_, palabra) in enumerate(self.claves) if palabra in nombre]
+        bonus = np.zeros(len(candidatos))
+        motivos = [[] for _ in candidatos]
+        if not claves_repuesto:
+            return bonus, motivos
+        compartidas = self.claves_componente[np.ix_(candidatos, claves_repuesto)]
+        for fila, columna in zip(*np.nonzero(compartidas)):
+            categoria, palabra = self.claves[claves_repuesto[columna]]
+            if all(not m.startswith(f"Bonus categoría {categoria}:") for m in motivos[fila]):
+                bonus[fila] += BONUS_CATEGORIA
+                motivos[fila].append(f"Bonus categoría {categoria}: {palabra}")
+        return bonus, motivos
+
+
+def _resumen_repuesto(repuesto):
+    return {'id': repuesto.pk, 'nombre': repuesto.nombre, 'sku': repuesto.sku}
+
+
+def _resumen_componente(componente):
+    return {'id': componente.pk, 'nombre': componente.nombre, 'codigo': componente.codigo}
+
+
+def algoritmo_relacion_inteligente(umbral=0.6, solo_analizar=False, ejecutar=False, progreso=None):
     """
-    Algoritmo inteligente para relacionar repuestos con componentes
+    Algoritmo inteligente para relacionar repuestos con componentes.
+
+    Args:
+        umbral: Puntuación mínima para proponer (o crear) la relación
+        solo_analizar: Se mantiene por compatibilidad; sin `ejecutar` solo se analiza
+        ejecutar: Si es True, crea las relaciones encontradas (bulk_create)
+        progreso: Callback opcional progreso(procesados, total)
+
+    Returns:
+        dict: relaciones_encontradas, relaciones_no_encontradas y estadisticas.
+              Repuestos y componentes van como dicts serializables (id, nombre, sku/codigo).
     """
-    # Obtener todos los repuestos y componentes
-    repuestos = Repuesto.objects.all()
-    componentes = Componente.objects.filter(activo=True)
-    
-    # Obtener relaciones existentes
-    relaciones_existentes = set()
-    for rel in ComponenteRepuesto.objects.all():
-        relaciones_existentes.add((rel.componente.id, rel.repuesto.id))
-    
+    componentes = list(Componente.objects.filter(activo=True).only('id', 'nombre', 'codigo'))
+    indice = IndiceComponentes(componentes)
+    posicion_componente = {c.pk: i for i, c in enumerate(componentes)}
+
+    # Relaciones existentes agrupadas por repuesto (sin instanciar objetos)
+    relaciones_existentes = defaultdict(list)
+    total_existentes = 0
+    for componente_id, repuesto_id in ComponenteRepuesto.objects.values_list('componente_id', 'repuesto_id'):
+        total_existentes += 1
+        if componente_id in posicion_componente:
+            relaciones_existentes[repuesto_id].append(posicion_componente[componente_id])
+
+    repuestos = Repuesto.objects.only('id', 'nombre', 'sku', 'descripcion', 'posicion').order_by('id')
+    total_repuestos = repuestos.count()
+
     resultados = {
         'relaciones_encontradas': [],
         'relaciones_no_encontradas': [],
         'estadisticas': {
-            'total_repuestos': repuestos.count(),
-            'total_componentes': componentes.count(),
-            'relaciones_existentes': len(relaciones_existentes),
+            'total_repuestos': total_repuestos,
+            'total_componentes': len(componentes),
+            'relaciones_existentes': total_existentes,
             'nuevas_relaciones': 0,
             'porcentaje_exito': 0
         }
     }
-    
-    # Palabras clave para diferentes categorías
-    palabras_clave = {
-        'motor': ['motor', 'cilindro', 'piston', 'valvula', 'bujia', 'filtro aceite', 'aceite', 'refrigerante', 'termostato', 'radiador', 'bomba agua', 'correa', 'tensor'],
-        'frenos': ['freno', 'pastilla', 'disco', 'tambor', 'liquido frenos', 'bomba frenos', 'cilindro freno', 'manguera freno', 'sensor abs'],
-        'suspension': ['amortiguador', 'resorte', 'brazo', 'rotula', 'terminal', 'buje', 'silentblock', 'barra estabilizadora', 'soporte motor'],
-        'direccion': ['direccion', 'cremallera', 'terminal', 'rotula', 'bomba direccion', 'liquido direccion', 'columna direccion'],
-        'transmision': ['embrague', 'disco embrague', 'plato presion', 'collar', 'caja cambios', 'diferencial', 'cardan', 'junta homocinetica'],
-        'electrico': ['alternador', 'motor arranque', 'bateria', 'fusible', 'relay', 'sensor', 'actuador', 'bobina', 'distribuidor'],
-        'combustible': ['bomba combustible', 'filtro combustible', 'inyector', 'regulador presion', 'tanque', 'manguera combustible'],
-        'escape': ['catalizador', 'silenciador', 'mofle', 'sonda lambda', 'sensor oxigeno', 'tubo escape'],
-        'climatizacion': ['compresor', 'condensador', 'evaporador', 'filtro aire', 'ventilador', 'termostato aire'],
-        'carroceria': ['parachoques', 'farol', 'luz', 'espejo', 'manija', 'cerradura', 'vidrio', 'parabrisas'],
-        'neumaticos': ['llanta', 'neumatico', 'rueda', 'valvula neumatico', 'sensor presion'],
-        'lubricacion': ['aceite', 'filtro', 'grasa', 'lubricante', 'aditivo'],
-        'refrigeracion': ['radiador', 'termostato', 'bomba agua', 'manguera', 'refrigerante', 'ventilador'],
-    }
-    
-    # Función para calcular similitud
-    def calcular_similitud(texto1, texto2):
-        if not texto1 or not texto2:
-            return 0
-        return SequenceMatcher(None, texto1.lower(), texto2.lower()).ratio()
-    
-    # Función para extraer palabras clave
-    def extraer_palabras_clave(texto):
-        if not texto:
-            return []
-        texto_limpio = re.sub(r'[^\w\s]', ' ', texto.lower())
-        palabras = texto_limpio.split()
-        return [palabra for palabra in palabras if len(palabra) > 2]
-    
-    # Función para puntuar relación
-    def puntuar_relacion(repuesto, componente):
-        puntuacion = 0
-        razones = []
-        
-        # 1. Similitud directa de nombres (peso: 40%)
-        similitud_nombre = calcular_similitud(repuesto.nombre, componente.nombre)
-        if similitud_nombre > 0.3:
-            puntuacion += similitud_nombre * 0.4
-            razones.append(f"Similitud nombre: {similitud_nombre:.2f}")
-        
-        # 2. Coincidencia en descripción (peso: 20%)
-        if repuesto.descripcion:
-            similitud_desc = calcular_similitud(repuesto.descripcion, componente.nombre)
-            if similitud_desc > 0.3:
-                puntuacion += similitud_desc * 0.2
-                razones.append(f"Similitud descripción: {similitud_desc:.2f}")
-        
-        # 3. Coincidencia en posición (peso: 15%)
-        if repuesto.posicion:
-            similitud_pos = calcular_similitud(repuesto.posicion, componente.nombre)
-            if similitud_pos > 0.3:
-                puntuacion += similitud_pos * 0.15
-                razones.append(f"Similitud posición: {similitud_pos:.2f}")
-        
-        # 4. Palabras clave (peso: 25%)
-        palabras_repuesto = extraer_palabras_clave(repuesto.nombre + ' ' + (repuesto.descripcion or ''))
-        palabras_componente = extraer_palabras_clave(componente.nombre)
-        
-        coincidencias = 0
-        for palabra in palabras_repuesto:
-            if palabra in palabras_componente:
-                coincidencias += 1
-        
-        if palabras_componente:
-            ratio_coincidencias = coincidencias / len(palabras_componente)
-            puntuacion += ratio_coincidencias * 0.25
-            razones.append(f"Coincidencias palabras: {coincidencias}/{len(palabras_componente)}")
-        
-        # 5. Bonus por categorías específicas
-        for categoria, palabras in palabras_clave.items():
-            for palabra in palabras:
-                if palabra in repuesto.nombre.lower() and palabra in componente.nombre.lower():
-                    puntuacion += 0.1
-                    razones.append(f"Bonus categoría {categoria}: {palabra}")
-                    break
-        
-        return puntuacion, razones
-    
-    # Analizar cada repuesto
-    repuestos_sin_relacion = []
-    
-    for repuesto in repuestos:
-        mejor_puntuacion = 0
-        mejor_componente = None
-        mejores_razones = []
-        
-        # Buscar el mejor componente para este repuesto
-        for componente in componentes:
-            # Verificar si ya existe la relación
-            if (componente.id, repuesto.id) in relaciones_existentes:
-                continue
-            
-            puntuacion, razones = puntuar_relacion(repuesto, componente)
-            
-            if puntuacion > mejor_puntuacion:
-                mejor_puntuacion = puntuacion
-                mejor_componente = componente
-                mejores_razones = razones
-        
-        # Si encontramos una relación con puntuación suficiente
-        if mejor_puntuacion >= umbral and mejor_componente:
-            resultado = {
-                'repuesto': repuesto,
-                'componente': mejor_componente,
-                'puntuacion': mejor_puntuacion,
-                'razones': mejores_razones,
+
+    nuevas = []
+    for procesados, repuesto in enumerate(repuestos.iterator(chunk_size=1000), start=1):
+        mejor = _mejor_componente(indice, repuesto, relaciones_existentes.get(repuesto.pk, ()))
+
+        if mejor and mejor[1] >= umbral:
+            i, puntuacion, razones = mejor
+            resultados['relaciones_encontradas'].append({
+                'repuesto': _resumen_repuesto(repuesto),
+                'componente': _resumen_componente(componentes[i]),
+                'puntuacion': puntuacion,
+                'razones': razones,
                 'ya_existe': False
-            }
-            
+            })
             if ejecutar:
-                # Crear la relación
-                ComponenteRepuesto.objects.create(
-                    componente=mejor_componente,
-                    repuesto=repuesto,
-                    nota=f"Relación automática (puntuación: {mejor_puntuacion:.2f})"
-                )
-                resultados['estadisticas']['nuevas_relaciones'] += 1
-            
-            resultados['relaciones_encontradas'].append(resultado)
+                nuevas.append(ComponenteRepuesto(
+                    componente_id=componentes[i].pk,
+                    repuesto_id=repuesto.pk,
+                    nota=f"Relación automática (puntuación: {puntuacion:.2f})"
+                ))
         else:
-            repuestos_sin_relacion.append({
-                'repuesto': repuesto,
-                'mejor_puntuacion': mejor_puntuacion,
-                'mejor_componente': mejor_componente
+            resultados['relaciones_no_encontradas'].append({
+                'repuesto': _resumen_repuesto(repuesto),
+                'mejor_puntuacion': mejor[1] if mejor else 0,
+                'mejor_componente': _resumen_componente(componentes[mejor[0]]) if mejor else None,
             })
-    
-    resultados['relaciones_no_encontradas'] = repuestos_sin_relacion
-    
-    # Calcular estadísticas
-    total_repuestos = resultados['estadisticas']['total_repuestos']
-    relaciones_encontradas = len(resultados['relaciones_encontradas'])
-    
-    if total_repuestos > 0:
-        resultados['estadisticas']['porcentaje_exito'] = (relaciones_encontradas / total_repuestos) * 100
-    
-    return resultados
-
-
-
-
-
-
-
-
 
+        if progreso and (procesados % INTERVALO_PROGRESO == 0 or procesados == total_repuestos):
+            progreso(procesados, total_repuestos)
 
+    if nuevas:
+        ComponenteRepuesto.objects.bulk_create(nuevas, batch_size=500, ignore_conflicts=True)
+        resultados['estadisticas']['nuevas_relaciones'] = len(nuevas)
 
+    relaciones_encontradas = len(resultados['relaciones_encontradas'])
+    if total_repuestos > 0:
+        resultados['estadisticas']['porcentaje_exito'] = (relaciones_encontradas / total_repuestos) * 100
 
+    return resultados
 
 
+def _mejor_componente(indice, repuesto, excluidos):
+    """
+    Puntúa los componentes candidatos (los que comparten tokens con el repuesto).
+    Devuelve (índice, puntuación, razones) del mejor, o None si no hay candidatos.
+    """
+    if not indice.componentes:
+        return None
 
+    sim_nombre = indice.similitud(repuesto.nombre)
+    sim_desc = indice.similitud(repuesto.descripcion) if repuesto.descripcion else None
+    sim_pos = indice.similitud(repuesto.posicion) if repuesto.posicion else None
+    coincidencias = indice.coincidencias(
+        extraer_tokens(f"{repuesto.nombre} {repuesto.descripcion or ''}")
+    )
 
+    candidatos = np.flatnonzero(coincidencias > 0)
+    if sim_pos is not None:
+        candidatos = np.union1d(candidatos, np.flatnonzero(sim_pos > 0))
+    if len(excluidos):
+        candidatos = np.setdiff1d(candidatos, np.asarray(excluidos, dtype=np.intp))
+    if not len(candidatos):
+        return None
 
+    puntajes = PESO_NOMBRE * sim_nombre[candidatos]
+    if sim_desc is not None:
+        puntajes += PESO_DESCRIPCION * sim_desc[candidatos]
+    if sim_pos is not None:
+        puntajes += PESO_POSICION * sim_pos[candidatos]
+    ratio_palabras = coincidencias[candidatos] / np.maximum(indice.palabras_por_componente[candidatos], 1)
+    puntajes += PESO_PALABRAS * ratio_palabras
+    bonus, motivos = indice.bonus_categorias(repuesto.nombre, candidatos)
+    puntajes += bonus
 
+    fila = int(np.argmax(puntajes))
+    i = int(candidatos[fila])
 
+    razones = []
+    if sim_nombre[i]:
+        razones.append(f"Similitud nombre: {sim_nombre[i]:.2f}")
+    if sim_desc is not None and sim_desc[i]:
+        razones.append(f"Similitud descripción: {sim_desc[i]:.2f}")
+    if sim_pos is not None and sim_pos[i]:
+        razones.append(f"Similitud posición: {sim_pos[i]:.2f}")
+    razones.append(
+        f"Coincidencias palabras: {int(coincidencias[i])}/{int(indice.palabras_por_componente[i])}"
+    )
+    razones.extend(motivos[fila])
 
+    return i, float(puntajes[fila]), razones
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CarConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'car'
+
+    def ready(self):
+        from . import signals
+        from . import tareas_registradas  # noqa: F401 (registra las tareas en segundo plano)
+        post_migrate.connect(signals.crear_indices_busqueda, sender=self)
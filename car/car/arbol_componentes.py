@@ -0,0 +1,290 @@
+"""
+Jerarquía de Componente sobre una tabla de cierre (ComponenteAncestro).
+
+- Cada componente tiene una fila por cada ancestro (y una consigo mismo, profundidad 0),
+  así que ancestros y descendientes se obtienen en una sola consulta sin recorrer padres.
+- Componente.save() mantiene las filas al crear o mover un componente y recodifica
+  toda la descendencia con un único UPDATE cuando cambia el código.
+- arbol() devuelve el árbol de componentes activos ya serializado, cacheado en la
+  memoria del proceso con un sello de versión compartido (como cache_configuracion):
+  los signals de Componente publican un sello nuevo al confirmar la transacción y cada
+  proceso recarga al notarlo. COMPONENTES_ARBOL_MAX_SEGUNDOS acota la vida de una copia.
+
+`manage.py reconstruir_arbol_componentes` regenera la tabla de cierre (y con
+--recodificar corrige códigos que no sigan el del padre).
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+from . import al_confirmar
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = 'componentes_arbol:version'
+
+_memoria = None  # (version, arbol, verificado_en, cargado_en)
+_lock = threading.Lock()
+
+
+def primer_libre(base, ocupados):
+    """base, base-1, base-2, ... el primero que no esté en `ocupados`."""
+    if base not in ocupados:
+        return base
+    contador = 1
+    while f"{base}-{contador}" in ocupados:
+        contador += 1
+    return f"{base}-{contador}"
+
+
+# ========================
+# TABLA DE CIERRE
+# ========================
+
+def registrar(componente):
+    """Componente nuevo: fila propia + una por cada ancestro del padre."""
+    from .models import ComponenteAncestro
+
+    filas = [ComponenteAncestro(ancestro_id=componente.pk, descendiente_id=componente.pk, profundidad=0)]
+    if componente.padre_id:
+        filas += [
+            ComponenteAncestro(ancestro_id=ancestro_id, descendiente_id=componente.pk, profundidad=profundidad + 1)
+            for ancestro_id, profundidad in ComponenteAncestro.objects.filter(
+                descendiente_id=componente.padre_id
+            ).values_list('ancestro_id', 'profundidad')
+        ]
+    ComponenteAncestro.objects.bulk_create(filas, ignore_conflicts=True)
+
+
+def mover(componente):
+    """
+    Cambió el padre: el subárbol completo se desprende de sus ancestros anteriores
+    y se cuelga de los del nuevo padre (producto ancestros × subárbol).
+    """
+    from .models import ComponenteAncestro
+
+    subarbol = list(
+        ComponenteAncestro.objects.filter(ancestro_id=componente.pk).values_list('descendiente_id', 'profundidad')
+    )
+    ids = [descendiente_id for descendiente_id, _ in subarbol]
+    ComponenteAncestro.objects.filter(descendiente_id__in=ids).exclude(ancestro_id__in=ids).delete()
+
+    if componente.padre_id:
+        ancestros_padre = ComponenteAncestro.objects.filter(
+            descendiente_id=componente.padre_id
+        ).values_list('ancestro_id', 'profundidad')
+        ComponenteAncestro.objects.bulk_create([
+            ComponenteAncestro(
+                ancestro_id=ancestro_id, descendiente_id=descendiente_id,
+                profundidad=profundidad_ancestro + profundidad + 1,
+            )
+            for ancestro_id, profundidad_ancestro in ancestros_padre
+            for descendiente_id, profundidad in subarbol
+        ], batch_size=500)
+
+
+def recodificar_descendientes(componente, codigo_anterior):
+    """
+    Reemplaza el prefijo `codigo_anterior-` por el código nuevo en toda la
+    descendencia con un solo UPDATE. Devuelve la cantidad de filas recodificadas.
+    """
+    from .models import Componente, ComponenteAncestro
+
+    return Componente.objects.filter(
+        pk__in=ComponenteAncestro.objects.filter(
+            ancestro_id=componente.pk, profundidad__gt=0
+        ).values('descendiente_id'),
+        codigo__startswith=f"{codigo_anterior}-",
+    ).update(codigo=Concat(Value(componente.codigo), Substr('codigo', len(codigo_anterior) + 1)))
+
+
+def es_descendiente(componente_id, ancestro_id):
+    """True si componente_id está dentro del subárbol de ancestro_id (o es el mismo)."""
+    from .models import ComponenteAncestro
+
+    return ComponenteAncestro.objects.filter(ancestro_id=ancestro_id, descendiente_id=componente_id).exists()
+
+
+def ancestros(componente, incluir_propio=False):
+    """Ancestros ordenados desde la raíz hasta el padre (o el propio componente)."""
+    from .models import Componente
+
+    minimo = 0 if incluir_propio else 1
+    return Componente.objects.filter(
+        cierre_descendientes__descendiente_id=componente.pk,
+        cierre_descendientes__profundidad__gte=minimo,
+    ).order_by('-cierre_descendientes__profundidad')
+
+
+def descendientes(componente, incluir_propio=False):
+    """Descendencia ordenada por nivel y nombre."""
+    from .models import Componente
+
+    minimo = 0 if incluir_propio else 1
+    return Componente.objects.filter(
+        cierre_ancestros__ancestro_id=componente.pk,
+        cierre_ancestros__profundidad__gte=minimo,
+    ).order_by('cierre_ancestros__profundidad', 'nombre')
+
+
+def reconstruir(recodificar=False, batch_size=500):
+    """
+    Regenera la tabla de cierre desde los padres. Con recodificar=True también
+    corrige los códigos que no empiezan con el código de su padre.
+    Devuelve (filas de cierre, componentes recodificados).
+    """
+    from .models import Componente, ComponenteAncestro
+
+    with transaction.atomic():
+        componentes = {
+            c['id']: c for c in Componente.objects.values('id', 'padre_id', 'nombre', 'codigo').order_by('id')
+        }
+
+        recodificados = []
+        if recodificar:
+            from django.utils.text import slugify
+
+            ocupados = {c['codigo'] for c in componentes.values()}
+            hijos = {}
+            for c in componentes.values():
+                hijos.setdefault(c['padre_id'], []).append(c)
+            pendientes = list(hijos.get(None, []))
+            while pendientes:
+                c = pendientes.pop()
+                padre = componentes.get(c['padre_id'])
+                if padre and not c['codigo'].startswith(f"{padre['codigo']}-"):
+                    ocupados.discard(c['codigo'])
+                    slug = slugify(c['nombre']).replace('_', '-')
+                    c['codigo'] = primer_libre(f"{padre['codigo']}-{slug}", ocupados)
+                    ocupados.add(c['codigo'])
+                    recodificados.append(Componente(pk=c['id'], codigo=c['codigo']))
+                pendientes.extend(hijos.get(c['id'], []))
+            Componente.objects.bulk_update(recodificados, ['codigo'], batch_size=batch_size)
+
+        ComponenteAncestro.objects.all().delete()
+        total = 0
+        lote = []
+        for componente_id, c in componentes.items():
+            actual, profundidad, vistos = c, 0, set()
+            while actual and actual['id'] not in vistos:
+                vistos.add(actual['id'])
+                lote.append(ComponenteAncestro(
+                    ancestro_id=actual['id'], descendiente_id=componente_id, profundidad=profundidad,
+                ))
+                actual = componentes.get(actual['padre_id'])
+                profundidad += 1
+            if len(lote) >= batch_size:
+                ComponenteAncestro.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            ComponenteAncestro.objects.bulk_create(lote)
+            total += len(lote)
+
+    invalidar_arbol()
+    return total, len(recodificados)
+
+
+def poblar_si_vacio():
+    """Primer llenado de la tabla de cierre (post_migrate)."""
+    from .models import Componente, ComponenteAncestro
+
+    try:
+        if not ComponenteAncestro.objects.exists() and Componente.objects.exists():
+            total, _ = reconstruir()
+            logger.info(f"✅ Tabla de cierre de componentes creada: {total} filas")
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo poblar la tabla de cierre de componentes: {e}")
+
+
+# ========================
+# ÁRBOL SERIALIZADO EN CACHÉ
+# ========================
+
+def _cache():
+    return caches[getattr(settings, 'COMPONENTES_ARBOL_CACHE', 'default')]
+
+
+def _segundos_verificacion():
+    return getattr(settings, 'COMPONENTES_ARBOL_VERIFICAR_SEGUNDOS', 5)
+
+
+def _max_segundos():
+    return getattr(settings, 'COMPONENTES_ARBOL_MAX_SEGUNDOS', 600)
+
+
+def _version_vigente(cache):
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _construir_arbol():
+    """Componentes activos (una consulta) anidados por padre y ordenados por nombre."""
+    from .models import Componente
+
+    nodos = {}
+    raices = []
+    filas = Componente.objects.filter(activo=True).order_by('nombre').values('id', 'nombre', 'codigo', 'padre_id')
+    for fila in filas:
+        nodos[fila['id']] = {
+            'id': fila['id'],
+            'nombre': fila['nombre'],
+            'codigo': fila['codigo'],
+            'padre_id': fila['padre_id'],
+            'activo': True,
+            'hijos': [],
+        }
+    for nodo in nodos.values():
+        if nodo['padre_id'] is None:
+            raices.append(nodo)
+        elif nodo['padre_id'] in nodos:
+            nodos[nodo['padre_id']]['hijos'].append(nodo)
+    return raices
+
+
+def arbol():
+    """
+    Árbol de componentes activos: lista de raíces, cada nodo un dict con
+    id, nombre, codigo, padre_id, activo e hijos (ordenados por nombre).
+    La estructura es compartida entre requests: no modificarla.
+    """
+    global _memoria
+    ahora = time.monotonic()
+    memoria = _memoria
+
+    if memoria and ahora - memoria[2] < _segundos_verificacion():
+        return memoria[1]
+
+    version = _version_vigente(_cache())
+    if memoria and memoria[0] == version and ahora - memoria[3] < _max_segundos():
+        _memoria = (version, memoria[1], ahora, memoria[3])
+        return memoria[1]
+
+    with _lock:
+        raices = _construir_arbol()
+        _memoria = (version, raices, ahora, ahora)
+    return raices
+
+
+def _publicar_version():
+    global _memoria
+    _memoria = None
+    _cache().set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar_arbol():
+    """
+    Al confirmar la transacción descarta el árbol en memoria y publica un nuevo sello
+    (una vez por transacción). Publicarlo antes dejaría que otro proceso guarde el
+    árbol sin confirmar con el sello nuevo.
+    """
+    al_confirmar.una_vez(CLAVE_VERSION, _publicar_version)
@@ -0,0 +1,118 @@
+"""
+Operaciones del libro de bonos que trabajan sobre muchas filas a la vez.
+
+- aplicar_pago(): marca como pagados los bonos de un PagoMecanico con un único
+  UPDATE (antes PagoMecanico.save() y registrar_pago_mecanico guardaban bono por bono)
+- cerrar_periodos(): cierre de un mes para todos los mecánicos (o los indicados):
+  totales de todos con un GROUP BY (BonoGeneradoQuerySet.totales_por_mecanico),
+  los CierrePeriodo con bulk_create y los bonos marcados como cerrados con un
+  solo update(), sin importar cuántos mecánicos haya
+"""
+import logging
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+
+logger = logging.getLogger(__name__)
+
+
+# ========================
+# PAGOS
+# ========================
+
+def aplicar_pago(pago, bonos=None):
+    """
+    Marca como pagados los bonos del pago (los de pago.bonos_aplicados, o el
+    queryset/lista de ids `bonos`) y les asigna el período del pago si no tienen.
+    Un solo UPDATE; devuelve la cantidad de bonos marcados.
+    """
+    from .models import BonoGenerado
+
+    if bonos is None:
+        filas = BonoGenerado.objects.filter(pagos=pago)
+    else:
+        filas = BonoGenerado.objects.filter(pk__in=bonos)
+
+    cambios = {'pagado': True, 'fecha_pago': pago.fecha_pago}
+    if pago.periodo_mes and pago.periodo_anio:
+        # Sincronizar el período del pago a los bonos que no tienen período
+        sin_periodo = Q(periodo_mes__isnull=True) | Q(periodo_anio__isnull=True)
+        for campo in ('periodo_mes', 'periodo_anio'):
+            cambios[campo] = Case(
+                When(sin_periodo, then=Value(getattr(pago, campo))),
+                default=F(campo),
+                output_field=BonoGenerado._meta.get_field(campo),
+            )
+    return filas.update(**cambios)
+
+
+# ========================
+# CIERRE DE PERÍODO
+# ========================
+
+def cerrar_periodos(mes, anio, usuario=None, notas='', mecanicos=None):
+    """
+    Cierra el período mes/año de todos los mecánicos con bonos en él (o solo de
+    `mecanicos`), salvo los que ya tienen cierre. Si otra petición cierra alguno
+    al mismo tiempo (unique_together de CierrePeriodo) se vuelve a calcular sin él.
+
+    Returns:
+        list[CierrePeriodo]: cierres creados, con sus totales (vacía si no quedó
+        ningún mecánico por cerrar)
+
+    Raises:
+        ValueError: período inválido
+    """
+    if not 1 <= mes <= 12:
+        raise ValueError("Mes inválido")
+
+    for intento in range(3):
+        try:
+            return _cerrar_periodos(mes, anio, usuario, notas, mecanicos)
+        except IntegrityError:
+            logger.warning(f"⚠️ Cierre {mes}/{anio} concurrente (intento {intento + 1}); recalculando")
+    return []
+
+
+def _cerrar_periodos(mes, anio, usuario, notas, mecanicos):
+    from .models import BonoGenerado, CierrePeriodo
+
+    with transaction.atomic():
+        bonos = BonoGenerado.objects.filter(periodo_mes=mes, periodo_anio=anio)
+        if mecanicos is not None:
+            bonos = bonos.filter(mecanico__in=mecanicos)
+
+        ya_cerrados = set(
+            CierrePeriodo.objects.filter(periodo_mes=mes, periodo_anio=anio).values_list('mecanico_id', flat=True)
+        )
+        bonos = bonos.exclude(mecanico_id__in=ya_cerrados)
+
+        totales = bonos.totales_por_mecanico()
+        if mecanicos is not None:
+            # Un mecánico indicado explícitamente se cierra aunque no tenga bonos (en cero)
+            for mecanico_id in {getattr(m, 'pk', m) for m in mecanicos} - ya_cerrados - set(totales):
+                totales[mecanico_id] = {'total': Decimal('0'), 'pagado': Decimal('0'), 'pendiente': Decimal('0'), 'cantidad': 0}
+        if not totales:
+            return []
+
+        cierres = CierrePeriodo.objects.bulk_create([
+            CierrePeriodo(
+                mecanico_id=mecanico_id,
+                periodo_mes=mes,
+                periodo_anio=anio,
+                cerrado_por=usuario,
+                notas=notas,
+                total_bonos=datos['total'],
+                total_pagado=datos['pagado'],
+                saldo_pendiente=datos['pendiente'],
+            )
+            for mecanico_id, datos in sorted(totales.items())
+        ])
+        cerrados = bonos.filter(mecanico_id__in=list(totales)).update(cerrado=True)
+
+    logger.info(
+        f"🔒 Período {mes}/{anio} cerrado: {len(cierres)} mecánicos, {cerrados} bonos",
+        extra={'periodo_mes': mes, 'periodo_anio': anio, 'cierres': len(cierres), 'bonos': cerrados},
+    )
+    return cierres
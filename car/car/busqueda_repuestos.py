@@ -0,0 +1,259 @@
+"""
+Índice de búsqueda de repuestos compartido por POS, insumos y endpoints de lookup.
+
+Cada Repuesto tiene un documento desnormalizado (RepuestoBusqueda) con todos los
+campos buscables ya normalizados (minúsculas, sin acentos). Sobre ese documento:
+
+- SQLite: tabla virtual FTS5 (car_repuesto_fts) sincronizada por triggers,
+  consultas por prefijo y ranking bm25().
+- PostgreSQL: índice GIN pg_trgm sobre el documento, ranking por similitud.
+- Otros motores: filtro `contains` sobre la tabla angosta del documento.
+"""
+import logging
+import re
+import unicodedata
+
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'car_repuesto_fts'
+
+# Campos del Repuesto que forman el documento de búsqueda
+CAMPOS_BUSQUEDA = (
+    'nombre', 'sku', 'oem', 'referencia', 'codigo_barra', 'marca', 'descripcion',
+    'marca_veh', 'tipo_de_motor', 'cod_prov', 'origen_repuesto', 'carroceria',
+)
+
+# Valores por defecto del modelo que no aportan nada a la búsqueda
+VALORES_RELLENO = {'oem', 'no-tiene', 'xxx', 'xxxx', 'zzzzzz', 'zzzz', 'yyyyyy', 'sin-origen'}
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# En el respaldo `contains` un token de una letra coincide con casi todo el catálogo
+MIN_TOKEN_CONTAINS = 2
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin acentos, para que 'Válvula' y 'valvula' coincidan."""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return texto.lower()
+
+
+def tokenizar(texto):
+    """Divide el texto normalizado en tokens (los guiones del SKU separan tokens)."""
+    return _TOKEN_RE.findall(normalizar_texto(texto))
+
+
+def construir_documento(repuesto):
+    """Construye el documento de búsqueda de un repuesto."""
+    partes = []
+    for campo in CAMPOS_BUSQUEDA:
+        valor = getattr(repuesto, campo, None)
+        if not valor:
+            continue
+        valor = normalizar_texto(valor).strip()
+        if valor and valor not in VALORES_RELLENO:
+            partes.append(valor)
+    return ' '.join(partes)
+
+
+def actualizar_documento(repuesto):
+    """Crea o actualiza el documento de búsqueda de un repuesto."""
+    from .models import RepuestoBusqueda
+    RepuestoBusqueda.objects.update_or_create(
+        repuesto_id=repuesto.pk,
+        defaults={'documento': construir_documento(repuesto)},
+    )
+
+
+def reconstruir_documentos(batch_size=500):
+    """
+    Regenera todos los documentos de búsqueda y el índice del motor.
+    Devuelve la cantidad de repuestos indexados.
+    """
+    from .models import Repuesto, RepuestoBusqueda
+
+    total = 0
+    with transaction.atomic():
+        RepuestoBusqueda.objects.all().delete()
+        lote = []
+        for repuesto in Repuesto.objects.only(*CAMPOS_BUSQUEDA).iterator(chunk_size=batch_size):
+            lote.append(RepuestoBusqueda(repuesto_id=repuesto.pk, documento=construir_documento(repuesto)))
+            if len(lote) >= batch_size:
+                RepuestoBusqueda.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            RepuestoBusqueda.objects.bulk_create(lote)
+            total += len(lote)
+
+        if connection.vendor == 'sqlite' and _fts_disponible():
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return total
+
+
+# ========================
+# CREACIÓN DEL ÍNDICE SEGÚN MOTOR
+# ========================
+
+def _fts_disponible():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def asegurar_indice():
+    """
+    Crea las estructuras del índice propias del motor (idempotente).
+    Se ejecuta desde post_migrate porque las migraciones no conocen FTS5/pg_trgm.
+    """
+    from .models import Repuesto, RepuestoBusqueda
+    tabla = RepuestoBusqueda._meta.db_table
+
+    try:
+        if connection.vendor == 'sqlite':
+            creado = not _fts_disponible()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    f"documento, content='{tabla}', content_rowid='repuesto_id', "
+                    f"tokenize='unicode61 remove_diacritics 2')"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {tabla} BEGIN "
+                    f"INSERT INTO {FTS_TABLE}(rowid, documento) VALUES (new.repuesto_id, new.documento); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {tabla} BEGIN "
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, documento) "
+                    f"VALUES ('delete', old.repuesto_id, old.documento); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {tabla} BEGIN "
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, documento) "
+                    f"VALUES ('delete', old.repuesto_id, old.documento); "
+                    f"INSERT INTO {FTS_TABLE}(rowid, documento) VALUES (new.repuesto_id, new.documento); END"
+                )
+            if creado:
+                logger.info("Índice FTS5 de repuestos creado")
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {tabla}_doc_trgm "
+                    f"ON {tabla} USING gin (documento gin_trgm_ops)"
+                )
+    except Exception as e:
+        # Sin FTS5/pg_trgm la búsqueda sigue funcionando con el filtro de respaldo
+        logger.warning(f"No se pudo crear el índice de búsqueda de repuestos: {e}")
+
+    # Poblar documentos la primera vez (o si quedaron repuestos sin documento)
+    if RepuestoBusqueda.objects.count() != Repuesto.objects.count():
+        total = reconstruir_documentos()
+        logger.info(f"Documentos de búsqueda de repuestos regenerados: {total}")
+
+
+# ========================
+# CONSULTA
+# ========================
+
+def _consulta_fts(tokens):
+    # Cada token se busca por prefijo; las comillas evitan la sintaxis FTS5 del usuario
+    return ' '.join('"{}"*'.format(t.replace('"', '""')) for t in tokens)
+
+
+def _buscar_fts(tokens, limite):
+    sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE})"
+    params = [_consulta_fts(tokens)]
+    if limite:
+        sql += " LIMIT %s"
+        params.append(limite)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _documentos_contains(tokens):
+    from .models import RepuestoBusqueda
+
+    documentos = RepuestoBusqueda.objects.all()
+    for token in tokens:
+        documentos = documentos.filter(documento__contains=token)
+    return documentos
+
+
+def _buscar_contains(tokens, limite, query):
+    tokens = [t for t in tokens if len(t) >= MIN_TOKEN_CONTAINS]
+    if not tokens:
+        return []
+
+    documentos = _documentos_contains(tokens)
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        documentos = documentos.annotate(
+            rank=TrigramWordSimilarity(normalizar_texto(query), 'documento')
+        ).order_by('-rank', 'repuesto__nombre')
+    else:
+        documentos = documentos.order_by('repuesto__nombre')
+
+    ids = documentos.values_list('repuesto_id', flat=True)
+    return list(ids[:limite] if limite else ids)
+
+
+def buscar_repuesto_ids(query, limite=20):
+    """
+    Busca repuestos y devuelve sus IDs ordenados por relevancia.
+
+    Todos los tokens de la consulta deben aparecer en el documento. Con limite=None
+    se devuelven todas las coincidencias.
+    """
+    tokens = tokenizar(query)
+    if not tokens:
+        return []
+
+    if connection.vendor == 'sqlite':
+        try:
+            ids = _buscar_fts(tokens, limite)
+            if ids:
+                return ids
+        except Exception as e:
+            logger.warning(f"Búsqueda FTS5 no disponible, usando respaldo: {e}")
+        # FTS5 solo encuentra prefijos; el respaldo cubre coincidencias a mitad de palabra
+
+    return _buscar_contains(tokens, limite, query)
+
+
+def contar_repuestos(query):
+    """Cantidad de repuestos que buscar_repuesto_ids(query, limite=None) devolvería, sin traer los IDs."""
+    tokens = tokenizar(query)
+    if not tokens:
+        return 0
+
+    if connection.vendor == 'sqlite':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_consulta_fts(tokens)]
+                )
+                total = cursor.fetchone()[0]
+            if total:
+                return total
+        except Exception as e:
+            logger.warning(f"Búsqueda FTS5 no disponible, usando respaldo: {e}")
+
+    tokens = [t for t in tokens if len(t) >= MIN_TOKEN_CONTAINS]
+    return _documentos_contains(tokens).count() if tokens else 0
+
+
+def ordenar_por_ranking(objetos, ids, clave=lambda obj: obj.pk):
+    """Ordena objetos según la posición de su repuesto en la lista de IDs rankeada."""
+    posicion = {repuesto_id: i for i, repuesto_id in enumerate(ids)}
+    return sorted(objetos, key=lambda obj: posicion.get(clave(obj), len(posicion)))
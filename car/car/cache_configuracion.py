@@ -0,0 +1,109 @@
+"""
+Caché de la configuración del taller (AdministracionTaller).
+
+La configuración se lee en cada render (context processor) y varias veces por vista.
+Se guarda en dos niveles, identificados por un sello de versión:
+
+1. Memoria del proceso: se reutiliza sin consultar nada durante
+   CONFIG_TALLER_VERIFICAR_SEGUNDOS.
+2. Backend de caché (CONFIG_TALLER_CACHE, 'default' si no se indica): guarda el sello
+   de versión vigente y la instancia serializada para esa versión.
+
+Los signals post_save/post_delete de AdministracionTaller cambian el sello al confirmar
+la transacción (antes, otro proceso podría recargar la configuración sin confirmar y
+guardarla con el sello nuevo), con lo que todos los procesos que compartan el backend
+recargan en la siguiente verificación. CONFIG_TALLER_CACHE_TIMEOUT acota cuánto puede
+quedar desactualizada una copia si el backend no es compartido.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import al_confirmar
+
+CLAVE_VERSION = 'config_taller:version'
+CLAVE_INSTANCIA = 'config_taller:{version}'
+
+_memoria = None  # (version, instancia, cargado_en, verificado_en)
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'CONFIG_TALLER_CACHE', 'default')]
+
+
+def _segundos_verificacion():
+    return getattr(settings, 'CONFIG_TALLER_VERIFICAR_SEGUNDOS', 5)
+
+
+def _timeout():
+    return getattr(settings, 'CONFIG_TALLER_CACHE_TIMEOUT', 60)
+
+
+def _nuevo_sello():
+    return time.time_ns()
+
+
+def _version_vigente(cache):
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, _nuevo_sello(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _cargar_de_bd():
+    from .models import AdministracionTaller
+
+    config = AdministracionTaller.objects.first()
+    if not config:
+        # Crear configuración por defecto si no existe
+        config = AdministracionTaller.objects.create(
+            nombre_taller="Mi Taller Mecánico",
+            creado_por=None
+        )
+    return config
+
+
+def obtener_configuracion():
+    """
+    Devuelve la configuración activa del taller.
+    Cada llamada recibe una copia, para que los formularios que la modifican
+    no alteren la instancia compartida.
+    """
+    global _memoria
+    ahora = time.monotonic()
+    memoria = _memoria
+
+    if memoria and ahora - memoria[3] < _segundos_verificacion() and ahora - memoria[2] < _timeout():
+        return copy.copy(memoria[1])
+
+    cache = _cache()
+    version = _version_vigente(cache)
+
+    if memoria and memoria[0] == version and ahora - memoria[2] < _timeout():
+        _memoria = (version, memoria[1], memoria[2], ahora)
+        return copy.copy(memoria[1])
+
+    with _lock:
+        clave = CLAVE_INSTANCIA.format(version=version)
+        config = cache.get(clave)
+        if config is None:
+            config = _cargar_de_bd()
+            cache.set(clave, config, _timeout())
+        _memoria = (version, config, ahora, ahora)
+    return copy.copy(config)
+
+
+def _publicar_version():
+    global _memoria
+    _memoria = None
+    _cache().set(CLAVE_VERSION, _nuevo_sello(), None)
+
+
+def invalidar_configuracion():
+    """Al confirmar la transacción descarta la configuración en memoria y publica un nuevo sello."""
+    al_confirmar.una_vez(CLAVE_VERSION, _publicar_version)
@@ -0,0 +1,203 @@
+"""
+Escritura diferida y en lote de RegistroEvento.
+
+utils_auditoria.registrar_evento ya no inserta ni calcula totales dentro del request:
+arma el RegistroEvento en memoria (sin consultas) y lo deja en esta cola.
+
+- Al confirmar la transacción el evento pasa a la lista del request (si la transacción
+  se revierte, el evento se descarta con ella).
+- AuditoriaMiddleware vacía la lista al terminar el request; fuera de un request
+  (comandos, worker) se vacía en cuanto se confirma.
+- escribir() completa los datos del vehículo y los totales de todos los trabajos del
+  lote con una consulta (with_totales), inserta con bulk_create y acumula las
+  estadísticas de cada evento.
+
+Con AUDITORIA_MODO = 'hilo' el lote se entrega a un hilo escritor del proceso y el
+request no espera la escritura; 'sincrono' (por defecto) escribe al final del request.
+"""
+import atexit
+import functools
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+_cola = None
+_hilo = None
+_lock = threading.Lock()
+
+
+def _modo():
+    return getattr(settings, 'AUDITORIA_MODO', 'sincrono')
+
+
+# ========================
+# COLA EN MEMORIA
+# ========================
+
+def _confirmados():
+    if not hasattr(_local, 'confirmados'):
+        _local.confirmados = []
+    return _local.confirmados
+
+
+def _confirmar(pendiente):
+    _confirmados().append(pendiente)
+    if not getattr(_local, 'en_request', False):
+        vaciar()
+
+
+def agregar(registro, trabajo=None, diagnostico=None, accion=None, repuesto=None):
+    """
+    Encola un RegistroEvento sin guardar. Se escribe después de confirmar la
+    transacción en curso (de inmediato si no hay transacción ni request).
+    """
+    pendiente = (registro, trabajo, diagnostico, accion, repuesto)
+    transaction.on_commit(functools.partial(_confirmar, pendiente))
+
+
+def vaciar():
+    """Escribe (o entrega al hilo escritor) los eventos confirmados de este hilo."""
+    pendientes = _confirmados()
+    if not pendientes:
+        return
+    _local.confirmados = []
+
+    if _modo() == 'hilo':
+        _escritor().put(pendientes)
+        return
+    try:
+        escribir(pendientes)
+    except Exception:
+        logger.exception(f"❌ Error escribiendo {len(pendientes)} eventos de auditoría")
+
+
+# ========================
+# ESCRITURA EN LOTE
+# ========================
+
+def _datos_vehiculo(vehiculo):
+    cliente = getattr(vehiculo, 'cliente', None)
+    return {
+        'vehiculo_id': vehiculo.id,
+        'vehiculo_placa': vehiculo.placa,
+        'vehiculo_marca': vehiculo.marca,
+        'vehiculo_modelo': vehiculo.modelo,
+        'cliente_nombre': cliente.nombre if cliente else None,
+    }
+
+
+def escribir(pendientes):
+    """
+    Completa los snapshots, inserta todos los eventos con un bulk_create y acumula
+    las estadísticas (un error en un evento no impide el resto).
+    """
+    from .estadisticas import acumular_evento
+    from .models import Diagnostico, RegistroEvento, Trabajo
+
+    trabajo_ids = {trabajo.pk for _, trabajo, _, _, _ in pendientes if trabajo is not None}
+    diagnostico_ids = {
+        diagnostico.pk for _, trabajo, diagnostico, _, _ in pendientes
+        if trabajo is None and diagnostico is not None
+    }
+    trabajos = (
+        Trabajo.objects.with_totales().select_related('vehiculo__cliente').in_bulk(trabajo_ids)
+        if trabajo_ids else {}
+    )
+    diagnosticos = (
+        Diagnostico.objects.select_related('vehiculo__cliente').in_bulk(diagnostico_ids)
+        if diagnostico_ids else {}
+    )
+
+    registros = []
+    for registro, trabajo, diagnostico, _, _ in pendientes:
+        if trabajo is not None:
+            actual = trabajos.get(trabajo.pk)
+            if actual is not None:
+                for campo, valor in _datos_vehiculo(actual.vehiculo).items():
+                    setattr(registro, campo, valor)
+                registro.fecha_ingreso = actual.fecha_inicio
+                registro.fecha_entrega = actual.fecha_fin if actual.estado == 'entregado' else None
+                registro.dias_en_taller = actual.dias_en_taller
+                registro.total_mano_obra = actual.total_mano_obra or 0
+                registro.total_repuestos = actual.total_repuestos or 0
+                registro.total_general = actual.total_general or 0
+        elif diagnostico is not None:
+            actual = diagnosticos.get(diagnostico.pk)
+            if actual is not None:
+                for campo, valor in _datos_vehiculo(actual.vehiculo).items():
+                    setattr(registro, campo, valor)
+        registros.append(registro)
+
+    RegistroEvento.objects.bulk_create(registros)
+
+    # Acumular en las estadísticas (un error aquí no debe impedir el registro del evento)
+    for registro, _, _, accion, repuesto in pendientes:
+        try:
+            with transaction.atomic():
+                acumular_evento(registro, accion=accion, repuesto=repuesto)
+        except Exception as e:
+            logger.warning(f"⚠️ Error acumulando estadísticas del evento {registro.pk}: {e}")
+
+    return len(registros)
+
+
+# ========================
+# HILO ESCRITOR
+# ========================
+
+def _bucle(cola):
+    while True:
+        pendientes = cola.get()
+        try:
+            escribir(pendientes)
+        except Exception:
+            logger.exception(f"❌ Error escribiendo {len(pendientes)} eventos de auditoría")
+        finally:
+            close_old_connections()
+            cola.task_done()
+
+
+def _escritor():
+    """Cola del hilo escritor del proceso (se inicia con el primer lote)."""
+    global _cola, _hilo
+    with _lock:
+        if _hilo is None or not _hilo.is_alive():
+            _cola = queue.Queue()
+            _hilo = threading.Thread(target=_bucle, args=(_cola,), name='auditoria', daemon=True)
+            _hilo.start()
+    return _cola
+
+
+def esperar():
+    """Bloquea hasta que el hilo escritor termine los lotes recibidos."""
+    if _cola is not None:
+        _cola.join()
+
+
+atexit.register(esperar)
+
+
+# ========================
+# MIDDLEWARE
+# ========================
+
+class AuditoriaMiddleware:
+    """Junta los eventos confirmados durante el request y los escribe al final."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.en_request = True
+        try:
+            return self.get_response(request)
+        finally:
+            _local.en_request = False
+            vaciar()
@@ -0,0 +1,282 @@
+"""
+Índice de compatibilidad repuesto ↔ vehículo para las sugerencias del diagnóstico.
+
+Cada Repuesto tiene en CompatibilidadRepuesto:
+- una fila general (version=None) con marca/motor/cilindrada/... ya normalizados
+  (minúsculas, sin acentos) y las marcas de "repuesto general" precalculadas
+- una fila por RepuestoAplicacion con marca/modelo/rango de años de la versión
+
+Las filas se mantienen con signals (Repuesto, RepuestoAplicacion, VehiculoVersion) y
+`manage.py reconstruir_compatibilidad` las regenera completas (por ejemplo después de
+cargas masivas con bulk_create/update, que no disparan signals).
+
+sugerir() resuelve componentes + versión + características + puntaje en una sola
+consulta sobre la tabla angosta, ordenada por puntaje y stock.
+"""
+import functools
+import logging
+import operator
+
+from django.db import transaction
+from django.db.models import Case, Exists, OuterRef, Q, Value, When
+
+from .busqueda_repuestos import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+# Campos del Repuesto que forman la fila de compatibilidad
+CAMPOS_COMPATIBILIDAD = (
+    'marca_veh', 'tipo_de_motor', 'cilindrada', 'nro_valvulas', 'combustible', 'otro_especial',
+)
+
+# Valores que identifican un repuesto "general" (sirve para cualquier marca / motor)
+MARCAS_GENERALES = {'general', 'xxx', ''}
+MOTORES_GENERALES = {'zzzzzz', ''}
+
+
+def normalizar(valor, largo=None):
+    texto = normalizar_texto(valor).strip()
+    return texto[:largo] if largo else texto
+
+
+def _caracteristicas(repuesto):
+    marca = normalizar(repuesto.marca_veh, 100)
+    motor = normalizar(repuesto.tipo_de_motor)
+    return {
+        'marca': marca,
+        'motor': motor,
+        'cilindrada': normalizar(repuesto.cilindrada, 50),
+        'nro_valvulas': repuesto.nro_valvulas,
+        'combustible': normalizar(repuesto.combustible, 50),
+        'otro_especial': normalizar(repuesto.otro_especial, 200),
+        'marca_general': marca in MARCAS_GENERALES,
+        'motor_general': motor in MOTORES_GENERALES,
+    }
+
+
+def _datos_version(version):
+    return {
+        'marca_version': normalizar(version.marca, 80),
+        'modelo_version': normalizar(version.modelo, 120),
+        'anio_desde': version.anio_desde,
+        'anio_hasta': version.anio_hasta,
+    }
+
+
+# ========================
+# MANTENIMIENTO INCREMENTAL
+# ========================
+
+def actualizar_repuesto(repuesto):
+    """Cambió el repuesto: actualiza sus características en todas sus filas."""
+    from .models import CompatibilidadRepuesto
+
+    caracteristicas = _caracteristicas(repuesto)
+    actualizadas = CompatibilidadRepuesto.objects.filter(repuesto_id=repuesto.pk).update(**caracteristicas)
+    if not actualizadas:
+        CompatibilidadRepuesto.objects.create(repuesto_id=repuesto.pk, **caracteristicas)
+
+
+def actualizar_aplicacion(aplicacion):
+    """Se creó o modificó una RepuestoAplicacion: crea/actualiza su fila."""
+    from .models import CompatibilidadRepuesto
+
+    CompatibilidadRepuesto.objects.update_or_create(
+        repuesto_id=aplicacion.repuesto_id,
+        version_id=aplicacion.version_id,
+        defaults={**_caracteristicas(aplicacion.repuesto), **_datos_version(aplicacion.version)},
+    )
+
+
+def quitar_aplicacion(aplicacion):
+    from .models import CompatibilidadRepuesto
+
+    CompatibilidadRepuesto.objects.filter(
+        repuesto_id=aplicacion.repuesto_id, version_id=aplicacion.version_id,
+    ).delete()
+
+
+def actualizar_version(version):
+    """Cambió marca/modelo/años de la versión: actualiza las filas que la usan."""
+    from .models import CompatibilidadRepuesto
+
+    CompatibilidadRepuesto.objects.filter(version_id=version.pk).update(**_datos_version(version))
+
+
+def reconstruir(batch_size=500):
+    """
+    Regenera el índice completo. Devuelve (repuestos, aplicaciones) indexados.
+    """
+    from .models import CompatibilidadRepuesto, Repuesto, RepuestoAplicacion
+
+    repuestos = aplicaciones = 0
+    with transaction.atomic():
+        CompatibilidadRepuesto.objects.all().delete()
+
+        lote = []
+        for repuesto in Repuesto.objects.only(*CAMPOS_COMPATIBILIDAD).iterator(chunk_size=batch_size):
+            lote.append(CompatibilidadRepuesto(repuesto_id=repuesto.pk, **_caracteristicas(repuesto)))
+            if len(lote) >= batch_size:
+                CompatibilidadRepuesto.objects.bulk_create(lote)
+                repuestos += len(lote)
+                lote = []
+        if lote:
+            CompatibilidadRepuesto.objects.bulk_create(lote)
+            repuestos += len(lote)
+
+        lote = []
+        filas = RepuestoAplicacion.objects.select_related('repuesto', 'version').only(
+            'repuesto_id', 'version_id', 'version__marca', 'version__modelo',
+            'version__anio_desde', 'version__anio_hasta',
+            *[f'repuesto__{campo}' for campo in CAMPOS_COMPATIBILIDAD],
+        )
+        for aplicacion in filas.iterator(chunk_size=batch_size):
+            lote.append(CompatibilidadRepuesto(
+                repuesto_id=aplicacion.repuesto_id, version_id=aplicacion.version_id,
+                **_caracteristicas(aplicacion.repuesto), **_datos_version(aplicacion.version),
+            ))
+            if len(lote) >= batch_size:
+                CompatibilidadRepuesto.objects.bulk_create(lote)
+                aplicaciones += len(lote)
+                lote = []
+        if lote:
+            CompatibilidadRepuesto.objects.bulk_create(lote)
+            aplicaciones += len(lote)
+    return repuestos, aplicaciones
+
+
+def poblar_si_vacio():
+    """Primer llenado del índice (post_migrate): solo si está vacío y hay repuestos."""
+    from .models import CompatibilidadRepuesto, Repuesto
+
+    try:
+        if not CompatibilidadRepuesto.objects.exists() and Repuesto.objects.exists():
+            repuestos, aplicaciones = reconstruir()
+            logger.info(f"✅ Índice de compatibilidad creado: {repuestos} repuestos, {aplicaciones} aplicaciones")
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo poblar el índice de compatibilidad: {e}")
+
+
+# ========================
+# CONSULTA DE SUGERENCIAS
+# ========================
+
+def _puntaje(marca, motor):
+    """
+    Puntaje 0-100 calculado en la base:
+    marca (40 exacta / 30 contiene / 20 general) + motor (30 / 20 / 15)
+    + 20 si el repuesto tiene stock + 10 si tiene precio de venta.
+    """
+    partes = [
+        Case(When(repuesto__stock__gt=0, then=Value(20)), default=Value(0)),
+        Case(When(repuesto__precio_venta__gt=0, then=Value(10)), default=Value(0)),
+    ]
+    if marca:
+        partes.append(Case(
+            When(marca='', then=Value(0)),
+            When(marca=marca, then=Value(40)),
+            When(marca__contains=marca, then=Value(30)),
+            When(marca_general=True, then=Value(20)),
+            default=Value(0),
+        ))
+    if motor:
+        partes.append(Case(
+            When(motor='', then=Value(0)),
+            When(motor=motor, then=Value(30)),
+            When(motor__contains=motor, then=Value(20)),
+            When(motor_general=True, then=Value(15)),
+            default=Value(0),
+        ))
+    return functools.reduce(operator.add, partes)
+
+
+def _filtro_caracteristicas(marca, motor, cilindrada, nro_valvulas, combustible, otro_especial):
+    """Coincide con el vehículo en alguna característica o es un repuesto general."""
+    filtro = Q()
+    if marca:
+        filtro |= Q(marca__contains=marca) | Q(marca_general=True)
+    if motor:
+        filtro |= Q(motor__contains=motor) | Q(motor_general=True)
+    if cilindrada:
+        filtro |= Q(cilindrada__contains=cilindrada) | Q(cilindrada='')
+    if nro_valvulas:
+        try:
+            filtro |= Q(nro_valvulas=int(nro_valvulas)) | Q(nro_valvulas__isnull=True)
+        except (TypeError, ValueError):
+            pass
+    if combustible:
+        filtro |= Q(combustible__contains=combustible) | Q(combustible='')
+    if otro_especial:
+        filtro |= Q(otro_especial__contains=otro_especial) | Q(otro_especial='')
+    return filtro
+
+
+def sugerir(componentes_ids, marca=None, modelo=None, anio=None, motor=None, cilindrada=None,
+            nro_valvulas=None, combustible=None, otro_especial=None, limite=80):
+    """
+    Repuestos sugeridos para los componentes y el vehículo, en una sola consulta.
+
+    - Solo repuestos ligados a los componentes (ComponenteRepuesto)
+    - Si existe una VehiculoVersion para marca/modelo/año del vehículo (la primera,
+      como antes), solo los repuestos aplicados a esa versión, aunque no tenga ninguno
+    - Filtro por características del vehículo (o repuestos generales)
+    - Orden: puntaje, stock, nombre
+
+    Devuelve filas de CompatibilidadRepuesto con `.repuesto` cargado y `.puntaje`.
+    """
+    from .models import CompatibilidadRepuesto, ComponenteRepuesto, VehiculoVersion
+
+    marca_vehiculo, modelo_vehiculo = marca, modelo
+    marca = normalizar(marca)
+    motor = normalizar(motor)
+
+    filas = CompatibilidadRepuesto.objects.filter(
+        version__isnull=True,
+        repuesto_id__in=ComponenteRepuesto.objects.filter(
+            componente_id__in=componentes_ids
+        ).values('repuesto_id'),
+    )
+
+    try:
+        anio = int(anio) if anio else None
+    except (TypeError, ValueError):
+        anio = None
+    if marca_vehiculo and modelo_vehiculo and anio:
+        # Intersección con la versión del vehículo: la primera que coincide, tenga o no aplicaciones
+        version_id = VehiculoVersion.objects.filter(
+            marca__iexact=marca_vehiculo,
+            modelo__iexact=modelo_vehiculo,
+            anio_desde__lte=anio,
+            anio_hasta__gte=anio,
+        ).values_list('pk', flat=True).first()
+        if version_id is not None:
+            filas = filas.filter(Exists(CompatibilidadRepuesto.objects.filter(
+                version_id=version_id, repuesto_id=OuterRef('repuesto_id'),
+            )))
+
+    filtro = _filtro_caracteristicas(
+        marca, motor, normalizar(cilindrada), nro_valvulas, normalizar(combustible), normalizar(otro_especial),
+    )
+    if filtro:
+        filas = filas.filter(filtro)
+
+    return list(
+        filas.select_related('repuesto')
+        .annotate(puntaje=_puntaje(marca, motor))
+        .order_by('-puntaje', '-repuesto__stock', 'repuesto__nombre')[:limite]
+    )
+
+
+def mejores_stocks(repuesto_ids):
+    """
+    Fila de RepuestoEnStock a mostrar por repuesto (una consulta para todos):
+    la más reciente con stock, o la más reciente si ninguna tiene.
+    """
+    from .models import RepuestoEnStock
+
+    elegidas = {}
+    for fila in RepuestoEnStock.objects.filter(repuesto_id__in=repuesto_ids).order_by('-ultima_actualizacion'):
+        actual = elegidas.get(fila.repuesto_id)
+        if actual is None or (actual.stock <= 0 < fila.stock):
+            elegidas[fila.repuesto_id] = fila
+    return elegidas
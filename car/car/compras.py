@@ -0,0 +1,248 @@
+"""
+Operaciones de compras que trabajan sobre muchas filas a la vez.
+
+- programar_total(): el total de la Compra se recalcula una sola vez por transacción,
+  al confirmar, en vez de en cada CompraItem.save()
+- guardar_items(): alta/actualización de muchos items en una sola operación
+  (bulk_create + bulk_update)
+- recibir_items(): recepción de mercadería de toda una compra con una cantidad fija
+  de consultas, sin importar cuántos items tenga
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import al_confirmar
+
+logger = logging.getLogger(__name__)
+
+
+# ========================
+# TOTAL DIFERIDO
+# ========================
+
+def _recalcular(compra_ids):
+    from .models import Compra
+    for compra in Compra.objects.filter(pk__in=compra_ids):
+        compra.calcular_total()
+
+
+def programar_total(compra_id):
+    """
+    Recalcula el total de la compra al confirmar la transacción en curso (de inmediato
+    si no hay transacción). Varias llamadas para la misma compra en una transacción
+    hacen un solo recálculo.
+    """
+    al_confirmar.acumular('compras:total', _recalcular, compra_id)
+
+
+# ========================
+# ITEMS EN LOTE
+# ========================
+
+def _agrupar_lineas(lineas):
+    """Valida las líneas y suma las que repiten repuesto (gana el último precio)."""
+    agrupadas = {}
+    for numero, linea in enumerate(lineas, start=1):
+        try:
+            repuesto_id = int(linea['repuesto_id'])
+            cantidad = int(linea['cantidad'])
+            precio = Decimal(str(linea['precio_unitario']))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise ValueError(f"Línea {numero}: repuesto_id, cantidad y precio_unitario son obligatorios")
+        if cantidad <= 0:
+            raise ValueError(f"Línea {numero}: la cantidad debe ser mayor a 0")
+        if precio < 0 or not precio.is_finite():
+            raise ValueError(f"Línea {numero}: el precio unitario no es válido")
+
+        if repuesto_id in agrupadas:
+            agrupadas[repuesto_id][0] += cantidad
+            agrupadas[repuesto_id][1] = precio
+        else:
+            agrupadas[repuesto_id] = [cantidad, precio]
+    return agrupadas
+
+
+def guardar_items(compra, lineas, reemplazar=False):
+    """
+    Agrega o actualiza muchos items de una compra.
+
+    Args:
+        compra: Compra a modificar (no puede estar recibida ni cancelada)
+        lineas: lista de dicts con repuesto_id, cantidad y precio_unitario
+        reemplazar: si es False la cantidad se suma a la del item existente
+            (igual que al agregar desde el formulario); si es True la reemplaza
+
+    Returns:
+        dict: {'creados': n, 'actualizados': m}
+
+    Raises:
+        ValueError: datos inválidos o compra cerrada
+    """
+    from .models import CompraItem, Repuesto
+
+    if compra.estado in ('recibida', 'cancelada'):
+        raise ValueError(f"La compra #{compra.numero_compra} está {compra.get_estado_display().lower()}")
+
+    agrupadas = _agrupar_lineas(lineas)
+    if not agrupadas:
+        raise ValueError("No se enviaron items")
+
+    existentes = set(Repuesto.objects.filter(pk__in=agrupadas).values_list('pk', flat=True))
+    faltantes = sorted(set(agrupadas) - existentes)
+    if faltantes:
+        raise ValueError(f"Repuestos inexistentes: {', '.join(map(str, faltantes))}")
+
+    with transaction.atomic():
+        items = {
+            item.repuesto_id: item
+            for item in CompraItem.objects.select_for_update().filter(compra=compra, repuesto_id__in=agrupadas)
+        }
+        nuevos, actualizados = [], []
+        for repuesto_id, (cantidad, precio) in agrupadas.items():
+            item = items.get(repuesto_id)
+            if item is None:
+                nuevos.append(CompraItem(
+                    compra=compra, repuesto_id=repuesto_id, cantidad=cantidad,
+                    precio_unitario=precio, subtotal=cantidad * precio,
+                ))
+                continue
+            item.cantidad = cantidad if reemplazar else item.cantidad + cantidad
+            item.precio_unitario = precio
+            item.subtotal = item.cantidad * precio
+            actualizados.append(item)
+
+        CompraItem.objects.bulk_create(nuevos, batch_size=500)
+        CompraItem.objects.bulk_update(actualizados, ['cantidad', 'precio_unitario', 'subtotal'], batch_size=500)
+        programar_total(compra.pk)
+
+    return {'creados': len(nuevos), 'actualizados': len(actualizados)}
+
+
+# ========================
+# RECEPCIÓN DE MERCADERÍA
+# ========================
+
+def recibir_items(compra, usuario=None, item_ids=None):
+    """
+    Recibe los items pendientes de una compra (todos, o solo `item_ids`).
+
+    Por cada item: suma la cantidad al stock del repuesto, fija el precio de costo y
+    recalcula el de venta con el factor de margen (Repuesto.precio_venta_con_margen),
+    refleja lo mismo en la fila bodega-principal de RepuestoEnStock y registra el
+    StockMovimiento de ingreso. Todo en memoria y escrito con bulk_update/bulk_create:
+    la cantidad de consultas no depende de la cantidad de items.
+
+    Al recibir la compra completa (sin item_ids) la compra queda en estado 'recibida'.
+
+    Returns:
+        dict: {'recibidos': n, 'items': [detalle por item]}
+    """
+    from .models import Compra, CompraItem, Repuesto, RepuestoEnStock, StockMovimiento
+    from .movimientos_stock import DEPOSITO_PRINCIPAL
+
+    ahora = timezone.now()
+    motivo = f'Compra #{compra.numero_compra}'
+    referencia = f'COMPRA-{compra.pk}'
+
+    with transaction.atomic():
+        # Bloquea items y repuestos mientras se calculan los nuevos precios
+        pendientes = CompraItem.objects.select_for_update().select_related('repuesto').filter(
+            compra=compra, recibido=False,
+        )
+        if item_ids is not None:
+            pendientes = pendientes.filter(pk__in=item_ids)
+        items = list(pendientes.order_by('pk'))
+        if not items:
+            return {'recibidos': 0, 'items': []}
+
+        # Fila bodega-principal más reciente de cada repuesto (mismo criterio que mover_stock)
+        depositos = {}
+        for fila in RepuestoEnStock.objects.filter(
+            repuesto_id__in=[item.repuesto_id for item in items], deposito=DEPOSITO_PRINCIPAL,
+        ).order_by('id'):
+            depositos[fila.repuesto_id] = fila
+
+        repuestos, filas_deposito, filas_nuevas, movimientos, detalle = [], [], [], [], []
+        for item in items:
+            repuesto = item.repuesto
+            stock_anterior = repuesto.stock or 0
+            precio_costo_anterior = repuesto.precio_costo or Decimal('0')
+            precio_venta_anterior = repuesto.precio_venta or Decimal('0')
+            precio_costo = item.precio_unitario
+            precio_venta = repuesto.precio_venta_con_margen(precio_costo)
+
+            detalle.append({
+                'item_id': item.pk,
+                'repuesto_id': repuesto.pk,
+                'repuesto': repuesto.nombre,
+                'cantidad_agregada': item.cantidad,
+                'stock_anterior': stock_anterior,
+                'stock_nuevo': stock_anterior + item.cantidad,
+                'precio_costo_anterior': float(precio_costo_anterior),
+                'precio_costo_nuevo': float(precio_costo),
+                'precio_venta_anterior': float(precio_venta_anterior),
+                'precio_venta_nuevo': float(precio_venta),
+            })
+
+            # El stock se suma con F() para no pisar movimientos concurrentes
+            repuesto.stock = F('stock') + item.cantidad
+            repuesto.precio_costo = precio_costo
+            repuesto.precio_venta = precio_venta
+            repuestos.append(repuesto)
+
+            fila = depositos.get(repuesto.pk)
+            if fila is None:
+                filas_nuevas.append(RepuestoEnStock(
+                    repuesto_id=repuesto.pk, deposito=DEPOSITO_PRINCIPAL, proveedor=compra.proveedor,
+                    stock=stock_anterior + item.cantidad, reservado=0,
+                    precio_compra=precio_costo, precio_venta=precio_venta,
+                ))
+            else:
+                fila.stock = F('stock') + item.cantidad
+                fila.precio_compra = precio_costo
+                fila.precio_venta = precio_venta
+                fila.ultima_actualizacion = ahora  # bulk_update no aplica auto_now
+                if compra.proveedor:
+                    fila.proveedor = compra.proveedor
+                filas_deposito.append(fila)
+
+            movimientos.append(StockMovimiento(
+                repuesto_id=repuesto.pk, tipo='ingreso', cantidad=item.cantidad,
+                motivo=motivo, referencia=referencia, usuario=usuario,
+            ))
+            item.recibido = True
+            item.fecha_recibido = ahora
+
+        Repuesto.objects.bulk_update(repuestos, ['stock', 'precio_costo', 'precio_venta'], batch_size=500)
+        RepuestoEnStock.objects.bulk_update(
+            filas_deposito, ['stock', 'precio_compra', 'precio_venta', 'proveedor', 'ultima_actualizacion'],
+            batch_size=500,
+        )
+        RepuestoEnStock.objects.bulk_create(filas_nuevas, batch_size=500)
+        StockMovimiento.objects.bulk_create(movimientos, batch_size=500)
+        CompraItem.objects.bulk_update(items, ['recibido', 'fecha_recibido'], batch_size=500)
+
+        if item_ids is None:
+            Compra.objects.filter(pk=compra.pk).update(estado='recibida', fecha_recibida=ahora.date())
+            compra.estado = 'recibida'
+            compra.fecha_recibida = ahora.date()
+
+    # Dejar las instancias con valores concretos en vez de expresiones F()
+    for item, datos in zip(items, detalle):
+        item.repuesto.stock = datos['stock_nuevo']
+
+    logger.info(
+        f"📦 Compra #{compra.numero_compra}: {len(items)} items recibidos",
+        extra={'compra_id': compra.pk, 'items': len(items), 'usuario_id': getattr(usuario, 'pk', None)},
+    )
+    for datos in detalle:
+        logger.debug(
+            f"   {datos['repuesto']}: stock {datos['stock_anterior']} → {datos['stock_nuevo']}, "
+            f"costo ${datos['precio_costo_nuevo']}, venta ${datos['precio_venta_nuevo']}",
+            extra={'compra_id': compra.pk, **datos},
+        )
+    return {'recibidos': len(items), 'items': detalle}
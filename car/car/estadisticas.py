@@ -0,0 +1,389 @@
+"""
+Estadísticas acumuladas de trabajos (tabla EstadisticaAcumulada).
+
+La página de estadísticas ya no recorre el historial: lee filas pre-agregadas que se
+actualizan de forma incremental cada vez que utils_auditoria registra un evento.
+
+Dimensiones y periodos:
+- estado:     trabajos por estado actual ('total')
+- etapa:      días acumulados en cada etapa al salir de ella ('total')
+- respuesta:  horas entre diagnóstico creado y aprobado ('total')
+- ingreso:    vehículos ingresados ('dia', 'semana')
+- entrega:    entregas y sus montos ('dia', 'semana')
+- accion, componente, par (acción + componente), repuesto, actividad:
+              ítems completados por fecha de completado ('dia', 'semana')
+
+Los contadores se suman con UPDATE ... F() (sin leer la fila). Una acción o repuesto
+que vuelve a pendiente descuenta en el periodo en que se había completado.
+
+Los cambios que no pasan por el registro de auditoría (ediciones masivas, admin)
+se reflejan al ejecutar `python manage.py reconstruir_estadisticas`.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import (
+    EstadisticaAcumulada, RegistroEvento, ResumenTrabajo, TrabajoAccion, TrabajoRepuesto,
+)
+
+INICIO_TOTAL = date(2000, 1, 1)
+PERIODOS_ITEM = ('dia', 'semana')
+ETAPAS = ('iniciado', 'trabajando', 'completado', 'entregado')
+
+
+def _fecha_local(fecha):
+    if isinstance(fecha, datetime):
+        return timezone.localdate(fecha) if timezone.is_aware(fecha) else fecha.date()
+    return fecha
+
+
+def inicio_periodo(periodo, fecha):
+    """Fecha de inicio del periodo que contiene a `fecha` (día, lunes de la semana o fija)."""
+    if periodo == 'total':
+        return INICIO_TOTAL
+    dia = _fecha_local(fecha)
+    if periodo == 'semana':
+        return dia - timedelta(days=dia.weekday())
+    return dia
+
+
+def _rango(periodo, inicio):
+    """Rango [desde, hasta) en datetimes para filtrar campos DateTimeField."""
+    dias = 7 if periodo == 'semana' else 1
+    desde = datetime.combine(inicio, time.min)
+    hasta = datetime.combine(inicio + timedelta(days=dias), time.min)
+    if timezone.is_naive(timezone.now()):
+        return desde, hasta
+    return timezone.make_aware(desde), timezone.make_aware(hasta)
+
+
+def filtro_ventana(desde, hoy):
+    """
+    Q que cubre los días desde `desde` hasta hoy con la menor cantidad de filas:
+    filas diarias para los bordes y semanales para las semanas completas.
+    """
+    lunes_actual = inicio_periodo('semana', hoy)
+    primer_lunes = inicio_periodo('semana', desde)
+    if primer_lunes < desde:
+        primer_lunes += timedelta(days=7)
+    return (
+        Q(periodo='dia', inicio__gte=desde, inicio__lt=min(primer_lunes, lunes_actual))
+        | Q(periodo='semana', inicio__gte=primer_lunes, inicio__lt=lunes_actual)
+        | Q(periodo='dia', inicio__gte=max(lunes_actual, desde))
+    )
+
+
+def acumular(dimension, clave, periodo, inicio, nombre='', detalle='', **deltas):
+    """Suma los deltas a la fila (periodo, inicio, dimension, clave), creándola si falta."""
+    deltas = {campo: valor for campo, valor in deltas.items() if valor}
+    if not deltas:
+        return
+    filtro = {'periodo': periodo, 'inicio': inicio, 'dimension': dimension, 'clave': str(clave)}
+    cambios = {campo: F(campo) + valor for campo, valor in deltas.items()}
+    if nombre:
+        cambios['nombre'] = nombre[:200]
+    if detalle:
+        cambios['detalle'] = detalle[:200]
+
+    filas = EstadisticaAcumulada.objects.filter(**filtro)
+    if filas.update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            EstadisticaAcumulada.objects.create(
+                nombre=nombre[:200], detalle=detalle[:200], **filtro, **deltas
+            )
+    except IntegrityError:
+        # Otro proceso creó la fila entre el UPDATE y el INSERT
+        filas.update(**cambios)
+
+
+def mover_estado(estado_anterior, estado_nuevo):
+    """Actualiza el conteo de trabajos por estado (estado_anterior=None para trabajos nuevos)."""
+    if estado_anterior == estado_nuevo:
+        return
+    if estado_anterior:
+        acumular('estado', estado_anterior, 'total', INICIO_TOTAL, cantidad=-1)
+    if estado_nuevo:
+        acumular('estado', estado_nuevo, 'total', INICIO_TOTAL, cantidad=1)
+
+
+# ========================
+# ACUMULACIÓN POR EVENTO
+# ========================
+
+def acumular_evento(registro, accion=None, repuesto=None):
+    """
+    Aplica un RegistroEvento recién creado a las estadísticas.
+
+    Args:
+        registro: RegistroEvento creado por utils_auditoria.registrar_evento
+        accion: TrabajoAccion del evento (acciones completadas / pendientes)
+        repuesto: TrabajoRepuesto del evento (repuestos instalados / pendientes)
+    """
+    tipo = registro.tipo_evento
+
+    if tipo == 'diagnostico_aprobado' and registro.diagnostico_id:
+        creado = RegistroEvento.objects.filter(
+            diagnostico_id=registro.diagnostico_id, tipo_evento='diagnostico_creado'
+        ).order_by('fecha_evento').values_list('fecha_evento', flat=True).first()
+        if creado:
+            horas = (registro.fecha_evento - creado).total_seconds() / 3600
+            acumular('respuesta', 'diagnostico', 'total', INICIO_TOTAL, cantidad=1, duracion=horas)
+
+    elif tipo == 'ingreso':
+        for periodo in PERIODOS_ITEM:
+            acumular('ingreso', 'vehiculos', periodo, inicio_periodo(periodo, registro.fecha_evento), cantidad=1)
+
+    elif tipo == 'cambio_estado' and registro.trabajo_id:
+        _acumular_etapa(registro)
+
+    elif tipo == 'entrega':
+        for periodo in PERIODOS_ITEM:
+            acumular(
+                'entrega', 'trabajos', periodo, inicio_periodo(periodo, registro.fecha_evento),
+                cantidad=1,
+                monto_mano_obra=registro.total_mano_obra or 0,
+                monto_repuestos=registro.total_repuestos or 0,
+            )
+
+    elif tipo in ('accion_completada', 'accion_pendiente') and isinstance(accion, TrabajoAccion):
+        _acumular_accion(registro, accion, 1 if tipo == 'accion_completada' else -1)
+
+    elif tipo in ('repuesto_instalado', 'repuesto_pendiente') and isinstance(repuesto, TrabajoRepuesto):
+        _acumular_repuesto(registro, repuesto, 1 if tipo == 'repuesto_instalado' else -1)
+
+
+def _acumular_etapa(registro):
+    """Al cambiar de estado se cierra la etapa anterior con los días que duró."""
+    anterior = RegistroEvento.objects.filter(
+        trabajo_id=registro.trabajo_id,
+        tipo_evento__in=('ingreso', 'cambio_estado'),
+        fecha_evento__lte=registro.fecha_evento,
+    ).exclude(pk=registro.pk).order_by('-fecha_evento', '-pk').values(
+        'tipo_evento', 'estado_nuevo', 'fecha_evento'
+    ).first()
+    if not anterior:
+        return
+    etapa = 'iniciado' if anterior['tipo_evento'] == 'ingreso' else anterior['estado_nuevo']
+    if etapa in ETAPAS:
+        dias = (registro.fecha_evento - anterior['fecha_evento']).days
+        acumular('etapa', etapa, 'total', INICIO_TOTAL, cantidad=1, duracion=dias)
+
+
+def _fecha_completado(registro, item, tipo_completado, signo):
+    """
+    Fecha con la que se contó el ítem: la actual al completarlo; al volver a pendiente,
+    la del último evento de completado (o las fechas del trabajo, como en la reconstrucción).
+    """
+    if signo > 0:
+        return item.fecha or registro.fecha_evento
+    filtro = {'accion_id': item.pk} if tipo_completado == 'accion_completada' else {
+        'repuesto_id': item.repuesto_id or item.repuesto_externo_id
+    }
+    fecha = RegistroEvento.objects.filter(
+        trabajo_id=item.trabajo_id, tipo_evento=tipo_completado,
+        fecha_evento__lte=registro.fecha_evento, **filtro
+    ).order_by('-fecha_evento').values_list('fecha_evento', flat=True).first()
+    if fecha:
+        return fecha
+    trabajo = item.trabajo
+    return trabajo.fecha_fin or trabajo.fecha_inicio
+
+
+def _acumular_items(modelo, item, fecha, signo, campos_otros, dimensiones, **montos):
+    """
+    Suma (o resta) un ítem en sus dimensiones para el día y la semana de `fecha`.
+    `trabajos` solo cambia si el trabajo no tiene otro ítem de la misma clave completado
+    en el mismo periodo (conteo de trabajos distintos).
+    """
+    desde, hasta = _rango('semana', inicio_periodo('semana', fecha))
+    otros = list(
+        modelo.objects.filter(
+            trabajo_id=item.trabajo_id, completado=True, fecha__gte=desde, fecha__lt=hasta
+        ).exclude(pk=item.pk).values_list(*campos_otros, 'fecha')
+    )
+    for periodo in PERIODOS_ITEM:
+        inicio = inicio_periodo(periodo, fecha)
+        en_periodo = [o for o in otros if inicio_periodo(periodo, o[-1]) == inicio]
+        for dimension, clave, nombre, detalle, coincide in dimensiones:
+            repetido = any(coincide(o) for o in en_periodo)
+            acumular(
+                dimension, clave, periodo, inicio, nombre=nombre, detalle=detalle,
+                cantidad=signo,
+                unidades=signo * (item.cantidad or 0),
+                trabajos=0 if repetido else signo,
+                **{campo: signo * valor for campo, valor in montos.items()}
+            )
+
+
+def _acumular_accion(registro, accion, signo):
+    fecha = _fecha_completado(registro, accion, 'accion_completada', signo)
+    accion_nombre = accion.accion.nombre
+    componente_nombre = accion.componente.nombre
+    a, c = accion.accion_id, accion.componente_id
+    _acumular_items(
+        TrabajoAccion, accion, fecha, signo, ('accion_id', 'componente_id'),
+        [
+            ('accion', a, accion_nombre, '', lambda o: o[0] == a),
+            ('componente', c, componente_nombre, '', lambda o: o[1] == c),
+            ('par', f'{a}:{c}', accion_nombre, componente_nombre, lambda o: o[:2] == (a, c)),
+            ('actividad', 'trabajos', '', '', lambda o: True),
+        ],
+        monto_mano_obra=(accion.precio_mano_obra or 0) * (accion.cantidad or 0),
+    )
+
+
+def clave_repuesto(repuesto_id, repuesto_externo_id):
+    return f'r{repuesto_id}' if repuesto_id else f'e{repuesto_externo_id}'
+
+
+def _acumular_repuesto(registro, repuesto, signo):
+    fecha = _fecha_completado(registro, repuesto, 'repuesto_instalado', signo)
+    propio = repuesto.repuesto
+    externo = repuesto.repuesto_externo
+    nombre = propio.nombre if propio else (externo.nombre if externo else 'Repuesto Externo')
+    clave = (repuesto.repuesto_id, repuesto.repuesto_externo_id)
+    _acumular_items(
+        TrabajoRepuesto, repuesto, fecha, signo, ('repuesto_id', 'repuesto_externo_id'),
+        [
+            ('repuesto', clave_repuesto(*clave), nombre, (propio.sku or '') if propio else '',
+             lambda o: o[:2] == clave),
+        ],
+        monto_repuestos=repuesto.subtotal or 0,
+    )
+
+
+# ========================
+# RECONSTRUCCIÓN COMPLETA
+# ========================
+
+class _Acumulador:
+    """Agrega filas en memoria para la reconstrucción (un solo bulk_create al final)."""
+
+    def __init__(self):
+        self.filas = {}
+        self.trabajos = defaultdict(set)
+
+    def sumar(self, dimension, clave, periodo, fecha, nombre='', detalle='', trabajo_id=None, **deltas):
+        inicio = inicio_periodo(periodo, fecha)
+        llave = (periodo, inicio, dimension, str(clave))
+        fila = self.filas.get(llave)
+        if fila is None:
+            fila = self.filas[llave] = EstadisticaAcumulada(
+                periodo=periodo, inicio=inicio, dimension=dimension, clave=str(clave)
+            )
+        if nombre:
+            fila.nombre = nombre[:200]
+        if detalle:
+            fila.detalle = detalle[:200]
+        for campo, valor in deltas.items():
+            setattr(fila, campo, getattr(fila, campo) + valor)
+        if trabajo_id is not None and trabajo_id not in self.trabajos[llave]:
+            self.trabajos[llave].add(trabajo_id)
+            fila.trabajos += 1
+
+    def sumar_periodos(self, dimension, clave, fecha, **kwargs):
+        for periodo in PERIODOS_ITEM:
+            self.sumar(dimension, clave, periodo, fecha, **kwargs)
+
+
+def reconstruir(batch_size=1000):
+    """
+    Regenera todas las estadísticas desde ResumenTrabajo, RegistroEvento y el estado
+    actual de acciones y repuestos.
+
+    Returns:
+        int: Cantidad de filas creadas
+    """
+    from django.db.models import Max, Min
+    from django.db.models.functions import Coalesce
+
+    acumulado = _Acumulador()
+
+    # Estados y vehículos ingresados (una fila por trabajo)
+    for estado, fecha_ingreso in ResumenTrabajo.objects.values_list('estado_actual', 'fecha_ingreso').iterator():
+        acumulado.sumar('estado', estado, 'total', None, cantidad=1)
+        if fecha_ingreso:
+            acumulado.sumar_periodos('ingreso', 'vehiculos', fecha_ingreso, cantidad=1)
+
+    # Tiempo de respuesta de diagnósticos
+    creados = dict(
+        RegistroEvento.objects.filter(tipo_evento='diagnostico_creado', diagnostico_id__isnull=False)
+        .values('diagnostico_id').annotate(fecha=Min('fecha_evento')).values_list('diagnostico_id', 'fecha')
+    )
+    aprobados = (
+        RegistroEvento.objects.filter(tipo_evento='diagnostico_aprobado', diagnostico_id__in=list(creados))
+        .values('diagnostico_id').annotate(fecha=Max('fecha_evento')).values_list('diagnostico_id', 'fecha')
+    )
+    for diagnostico_id, fecha in aprobados:
+        horas = (fecha - creados[diagnostico_id]).total_seconds() / 3600
+        acumulado.sumar('respuesta', 'diagnostico', 'total', None, cantidad=1, duracion=horas)
+
+    # Días por etapa: se recorren los eventos de cada trabajo en orden
+    eventos = RegistroEvento.objects.filter(
+        Q(tipo_evento='ingreso') | Q(tipo_evento='cambio_estado', estado_nuevo__isnull=False),
+        trabajo_id__isnull=False,
+    ).order_by('trabajo_id', 'fecha_evento', 'pk').values_list('trabajo_id', 'tipo_evento', 'estado_nuevo', 'fecha_evento')
+    trabajo_actual = etapa = inicio_etapa = None
+    for trabajo_id, tipo, estado_nuevo, fecha in eventos.iterator():
+        if trabajo_id != trabajo_actual:
+            trabajo_actual, etapa, inicio_etapa = trabajo_id, None, None
+        if tipo == 'ingreso':
+            etapa, inicio_etapa = 'iniciado', fecha
+            continue
+        if etapa in ETAPAS and inicio_etapa:
+            acumulado.sumar('etapa', etapa, 'total', None, cantidad=1, duracion=(fecha - inicio_etapa).days)
+        etapa, inicio_etapa = estado_nuevo, fecha
+
+    # Entregas
+    entregas = RegistroEvento.objects.filter(tipo_evento='entrega').values_list(
+        'trabajo_id', 'fecha_evento', 'total_mano_obra', 'total_repuestos'
+    )
+    for trabajo_id, fecha, mano_obra, repuestos in entregas.iterator():
+        acumulado.sumar_periodos(
+            'entrega', 'trabajos', fecha, cantidad=1,
+            monto_mano_obra=mano_obra or 0, monto_repuestos=repuestos or 0,
+        )
+
+    # Acciones completadas
+    acciones = TrabajoAccion.objects.filter(completado=True).annotate(
+        fecha_completado=Coalesce('fecha', 'trabajo__fecha_fin', 'trabajo__fecha_inicio')
+    ).values_list(
+        'trabajo_id', 'accion_id', 'accion__nombre', 'componente_id', 'componente__nombre',
+        'cantidad', 'precio_mano_obra', 'fecha_completado'
+    )
+    for trabajo_id, a, a_nombre, c, c_nombre, cantidad, precio, fecha in acciones.iterator():
+        datos = {
+            'fecha': fecha, 'trabajo_id': trabajo_id, 'cantidad': 1, 'unidades': cantidad or 0,
+            'monto_mano_obra': (precio or Decimal('0')) * (cantidad or 0),
+        }
+        acumulado.sumar_periodos('accion', a, nombre=a_nombre, **datos)
+        acumulado.sumar_periodos('componente', c, nombre=c_nombre, **datos)
+        acumulado.sumar_periodos('par', f'{a}:{c}', nombre=a_nombre, detalle=c_nombre, **datos)
+        acumulado.sumar_periodos('actividad', 'trabajos', **datos)
+
+    # Repuestos instalados
+    repuestos = TrabajoRepuesto.objects.filter(completado=True).annotate(
+        fecha_completado=Coalesce('fecha', 'trabajo__fecha_fin', 'trabajo__fecha_inicio')
+    ).values_list(
+        'trabajo_id', 'repuesto_id', 'repuesto__nombre', 'repuesto__sku',
+        'repuesto_externo_id', 'repuesto_externo__nombre', 'cantidad', 'subtotal', 'fecha_completado'
+    )
+    for trabajo_id, r, r_nombre, sku, e, e_nombre, cantidad, subtotal, fecha in repuestos.iterator():
+        acumulado.sumar_periodos(
+            'repuesto', clave_repuesto(r, e), fecha,
+            nombre=r_nombre or e_nombre or 'Repuesto Externo', detalle=sku or '',
+            trabajo_id=trabajo_id, cantidad=1, unidades=cantidad or 0,
+            monto_repuestos=subtotal or Decimal('0'),
+        )
+
+    with transaction.atomic():
+        EstadisticaAcumulada.objects.all().delete()
+        EstadisticaAcumulada.objects.bulk_create(acumulado.filas.values(), batch_size=batch_size)
+    return len(acumulado.filas)
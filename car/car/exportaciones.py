@@ -0,0 +1,183 @@
+"""
+Exportaciones a Excel / CSV con memoria constante.
+
+Cada exportación se define por sus encabezados y un generador de filas que recorre
+la base en bloques (`.iterator(chunk_size=...)`) con select_related/prefetch_related,
+así que la cantidad de consultas crece con los bloques y no con las filas.
+
+Las filas se escriben con:
+- respuesta_csv(): StreamingHttpResponse, se envía mientras se lee la base
+- escribir_xlsx(): openpyxl en modo write-only sobre un archivo temporal
+- respuesta_xlsx(): el archivo temporal servido con FileResponse
+"""
+import csv
+import tempfile
+from decimal import Decimal
+
+from django.db.models import Count, Prefetch
+from django.http import FileResponse, StreamingHttpResponse
+
+from .models import (
+    Accion, Componente, ComponenteAccion, Diagnostico, DiagnosticoComponenteAccion,
+    DiagnosticoRepuesto,
+)
+
+TAMANO_BLOQUE = 500
+
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+# ========================
+# ESCRITORES
+# ========================
+
+class _Eco:
+    """Objeto tipo archivo que devuelve lo escrito (csv.writer → StreamingHttpResponse)"""
+
+    def write(self, valor):
+        return valor
+
+
+def _texto_csv(valor):
+    if isinstance(valor, Decimal):
+        return format(valor, 'f')
+    return '' if valor is None else valor
+
+
+def respuesta_csv(nombre, encabezados, filas):
+    """CSV en streaming (UTF-8 con BOM para que Excel respete los acentos)"""
+    escritor = csv.writer(_Eco())
+
+    def contenido():
+        yield '﻿' + escritor.writerow(encabezados)
+        for fila in filas:
+            yield escritor.writerow([_texto_csv(valor) for valor in fila])
+
+    response = StreamingHttpResponse(contenido(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+    return response
+
+
+def escribir_xlsx(destino, hoja, encabezados, filas):
+    """Escribe las filas en modo write-only (openpyxl no guarda el libro en memoria)"""
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=hoja)
+    ws.append(encabezados)
+    for fila in filas:
+        ws.append(fila)
+    wb.save(destino)
+
+
+def respuesta_xlsx(nombre, hoja, encabezados, filas):
+    """Excel generado en un archivo temporal y enviado por bloques desde el disco"""
+    archivo = tempfile.TemporaryFile(suffix='.xlsx')
+    escribir_xlsx(archivo, hoja, encabezados, filas)
+    archivo.seek(0)
+    return FileResponse(archivo, as_attachment=True, filename=f"{nombre}.xlsx", content_type=TIPO_XLSX)
+
+
+def respuesta_exportacion(request, nombre, hoja, encabezados, filas):
+    """Excel por defecto; `?formato=csv` para CSV en streaming"""
+    if request.GET.get('formato') == 'csv':
+        return respuesta_csv(nombre, encabezados, filas)
+    return respuesta_xlsx(nombre, hoja, encabezados, filas)
+
+
+# ========================
+# DIAGNÓSTICOS
+# ========================
+
+ENCABEZADOS_DIAGNOSTICOS = [
+    "Fecha", "Cliente", "Teléfono", "Vehículo", "Diagnóstico",
+    "Acciones", "Total Mano de Obra",
+    "Repuestos", "Total Repuestos",
+    "Total Presupuesto"
+]
+
+
+def contar_diagnosticos():
+    return Diagnostico.objects.count()
+
+
+def filas_diagnosticos(progreso=None):
+    """
+    Una fila por diagnóstico. Cada bloque de TAMANO_BLOQUE diagnósticos usa
+    3 consultas (diagnósticos + acciones + repuestos).
+    """
+    diagnosticos = Diagnostico.objects.select_related('vehiculo__cliente').prefetch_related(
+        Prefetch('acciones_componentes',
+                 queryset=DiagnosticoComponenteAccion.objects.select_related('componente', 'accion')),
+        Prefetch('repuestos',
+                 queryset=DiagnosticoRepuesto.objects.select_related('repuesto', 'repuesto_externo')),
+    ).order_by('pk')
+
+    for i, diag in enumerate(diagnosticos.iterator(chunk_size=TAMANO_BLOQUE), start=1):
+        acciones = ", ".join([f"{dca.componente.nombre} - {dca.accion.nombre}" for dca in diag.acciones_componentes.all()])
+        repuestos = ", ".join([str(dr) for dr in diag.repuestos.all()])
+        total_mo = diag.total_mano_obra
+        total_repuestos = diag.total_repuestos
+        cliente = diag.vehiculo.cliente
+
+        yield [
+            diag.fecha.strftime("%d-%m-%Y"),
+            cliente.nombre if cliente else '',
+            cliente.telefono if cliente else '',
+            str(diag.vehiculo),
+            diag.descripcion_problema,
+            acciones,
+            total_mo,
+            repuestos,
+            total_repuestos,
+            total_mo + total_repuestos
+        ]
+        if progreso and i % TAMANO_BLOQUE == 0:
+            progreso(i)
+
+
+# ========================
+# COMPONENTES, ACCIONES Y PRECIOS
+# ========================
+
+ENCABEZADOS_COMPONENTES = ['Código', 'Nombre', 'Estado', 'Familia', 'Hijos']
+
+
+def filas_componentes():
+    componentes = Componente.objects.filter(padre__isnull=True).select_related('padre').annotate(
+        cantidad_hijos=Count('hijos')
+    ).order_by('padre__nombre', 'nombre')
+    for comp in componentes.iterator(chunk_size=TAMANO_BLOQUE):
+        yield [
+            comp.codigo or '',
+            comp.nombre,
+            'Activo' if comp.activo else 'Inactivo',
+            comp.padre.nombre if comp.padre else 'Principal',
+            comp.cantidad_hijos,
+        ]
+
+
+ENCABEZADOS_ACCIONES = ['Nombre', 'ID', 'Usos']
+
+
+def filas_acciones():
+    acciones = Accion.objects.annotate(usos=Count('componenteaccion')).order_by('nombre')
+    for accion in acciones.iterator(chunk_size=TAMANO_BLOQUE):
+        yield [accion.nombre, accion.id, accion.usos]
+
+
+ENCABEZADOS_PRECIOS = ['Componente', 'Acción', 'Precio Mano de Obra', 'Familia', 'ID']
+
+
+def filas_precios():
+    items = ComponenteAccion.objects.select_related("componente__padre", "accion").order_by(
+        "componente__padre__nombre", "componente__nombre", "accion__nombre"
+    )
+    for item in items.iterator(chunk_size=TAMANO_BLOQUE):
+        yield [
+            item.componente.nombre,
+            item.accion.nombre,
+            f"${item.precio_mano_obra:,.0f}" if item.precio_mano_obra else '$0',
+            item.componente.padre.nombre if item.componente.padre else 'Principal',
+            item.id,
+        ]
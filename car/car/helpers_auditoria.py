@@ -8,59 +8,6 @@ from django.utils import timezone
 from .models import RegistroEvento, Trabajo, TrabajoAccion, TrabajoRepuesto, TrabajoAbono
 
 
-def obtener_datos_vehiculo(trabajo):
-    """Extrae datos del vehículo y cliente de un trabajo"""
-    try:
-        vehiculo = trabajo.vehiculo
-        cliente = vehiculo.cliente if hasattr(vehiculo, 'cliente') else None
-        
-        return {
-            'vehiculo_id': vehiculo.id,
-            'vehiculo_placa': vehiculo.placa,
-            'vehiculo_marca': vehiculo.marca if hasattr(vehiculo, 'marca') else None,
-            'vehiculo_modelo': vehiculo.modelo if hasattr(vehiculo, 'modelo') else None,
-            'cliente_nombre': cliente.nombre if cliente and hasattr(cliente, 'nombre') else None,
-        }
-    except Exception:
-        return {
-            'vehiculo_id': trabajo.vehiculo_id if hasattr(trabajo, 'vehiculo_id') else None,
-            'vehiculo_placa': 'N/A',
-            'vehiculo_marca': None,
-            'vehiculo_modelo': None,
-            'cliente_nombre': None,
-        }
-
-
-def obtener_totales_trabajo(trabajo):
-    """Calcula los totales actuales de un trabajo"""
-    try:
-        return {
-            'total_mano_obra': float(trabajo.total_mano_obra or 0),
-            'total_repuestos': float(trabajo.total_repuestos or 0),
-            'total_general': float(trabajo.total_general or 0),
-        }
-    except Exception:
-        return {
-            'total_mano_obra': 0,
-            'total_repuestos': 0,
-            'total_general': 0,
-        }
-
-
-def obtener_usuario_actual(request=None, user=None):
-    """Obtiene información del usuario actual"""
-    usuario = user or (request.user if request and hasattr(request, 'user') else None)
-    if usuario and usuario.is_authenticated:
-        return {
-            'usuario_id': usuario.id,
-            'usuario_nombre': usuario.username,
-        }
-    return {
-        'usuario_id': None,
-        'usuario_nombre': None,
-    }
-
-
 def registrar_evento(
     trabajo,
     tipo_evento,
@@ -93,75 +40,23 @@ def registrar_evento(
         fecha_evento: DateTime (opcional, si no se proporciona usa timezone.now())
     """
     try:
-        # Datos del vehículo
-        datos_vehiculo = obtener_datos_vehiculo(trabajo)
-        
-        # Totales del trabajo
-        totales = obtener_totales_trabajo(trabajo)
-        
-        # Usuario
-        usuario_info = obtener_usuario_actual(request, user)
-        
-        # Fecha del evento
-        if fecha_evento is None:
-            fecha_evento = timezone.now()
-        
-        # Datos del evento
-        evento_data = {
-            'trabajo_id': trabajo.id,
-            'diagnostico_id': trabajo.diagnostico_id if hasattr(trabajo, 'diagnostico_id') else None,
-            'vehiculo_id': datos_vehiculo['vehiculo_id'],
-            'tipo_evento': tipo_evento,
-            'fecha_evento': fecha_evento,
-            'vehiculo_placa': datos_vehiculo['vehiculo_placa'],
-            'vehiculo_marca': datos_vehiculo['vehiculo_marca'],
-            'vehiculo_modelo': datos_vehiculo['vehiculo_modelo'],
-            'cliente_nombre': datos_vehiculo['cliente_nombre'],
-            'estado_anterior': estado_anterior,
-            'estado_nuevo': estado_nuevo,
-            'usuario_id': usuario_info['usuario_id'],
-            'usuario_nombre': usuario_info['usuario_nombre'],
-            'monto': monto,
-            'descripcion': descripcion,
-            'fecha_ingreso': trabajo.fecha_inicio,
-            'fecha_entrega': trabajo.fecha_fin if trabajo.estado == 'entregado' else None,
-            'dias_en_taller': trabajo.dias_en_taller,
-            'total_mano_obra': totales['total_mano_obra'],
-            'total_repuestos': totales['total_repuestos'],
-            'total_general': totales['total_general'],
-        }
-        
-        # Datos específicos de acción
-        if accion:
-            evento_data.update({
-                'accion_id': accion.id,
-                'accion_nombre': accion.accion.nombre if hasattr(accion, 'accion') and accion.accion else None,
-                'componente_nombre': accion.componente.nombre if hasattr(accion, 'componente') and accion.componente else None,
-                'monto': accion.precio_mano_obra if hasattr(accion, 'precio_mano_obra') else monto,
-            })
-        
-        # Datos específicos de repuesto
-        if repuesto:
-            evento_data.update({
-                'repuesto_id': repuesto.id,
-                'repuesto_nombre': repuesto.repuesto.nombre if hasattr(repuesto, 'repuesto') and repuesto.repuesto else (
-                    repuesto.repuesto_externo.nombre if hasattr(repuesto, 'repuesto_externo') and repuesto.repuesto_externo else None
-                ),
-                'repuesto_cantidad': repuesto.cantidad if hasattr(repuesto, 'cantidad') else None,
-                'monto': repuesto.subtotal if hasattr(repuesto, 'subtotal') else monto,
-            })
-        
-        # Datos específicos de mecánico
-        if mecanico:
-            evento_data.update({
-                'mecanico_id': mecanico.id if hasattr(mecanico, 'id') else mecanico,
-                'mecanico_nombre': mecanico.user.username if hasattr(mecanico, 'user') and mecanico.user else (
-                    str(mecanico) if hasattr(mecanico, '__str__') else None
-                ),
-            })
-        
-        # Crear el registro
-        RegistroEvento.objects.create(**evento_data)
+        # Misma cola diferida que utils_auditoria (snapshot y totales se completan al escribir)
+        from .utils_auditoria import registrar_evento as registrar_evento_en_cola
+
+        registrar_evento_en_cola(
+            trabajo=trabajo,
+            tipo_evento=tipo_evento,
+            fecha_evento=fecha_evento,
+            estado_anterior=estado_anterior,
+            estado_nuevo=estado_nuevo,
+            accion=accion,
+            repuesto=repuesto,
+            mecanico=mecanico,
+            monto=monto,
+            descripcion=descripcion,
+            request=request,
+            usuario=user,
+        )
         
     except Exception as e:
         # No fallar silenciosamente en producción, pero no interrumpir el flujo principal
@@ -352,6 +247,6 @@ def obtener_trabajos_para_pizarra(dias_desde_entrega=3):
     """
     from .models import Trabajo
     
-    trabajos = Trabajo.objects.select_related("vehiculo", "vehiculo__cliente")
+    trabajos = Trabajo.objects.select_related("vehiculo", "vehiculo__cliente").with_totales()
     return filtrar_trabajos_entregados_por_dias(trabajos, dias_desde_entrega)
 
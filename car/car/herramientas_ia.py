@@ -0,0 +1,171 @@
+"""
+Ejecución de las function calls de Netgogo: en paralelo y con caché de resultados.
+
+Cuando la IA pide varias herramientas en una respuesta (p. ej. query_sistema +
+listado_inventario) las vistas las ejecutaban una tras otra, y dentro de una misma
+conversación repetían las mismas consultas pesadas en cada turno. Ahora:
+
+- ejecutar_llamadas(): las herramientas de solo lectura corren a la vez en un pool
+  de hilos (cada hilo con su conexión a la base, cerrada al terminar); el turno
+  tarda lo que la más lenta. Las que tocan el agente o archivos corren en orden en
+  el hilo del request.
+- ejecutar(): el resultado de una herramienta de solo lectura se guarda en la caché
+  por (consola, función, argumentos, versión de datos) durante
+  HERRAMIENTAS_IA_CACHE_TIMEOUT segundos.
+- La versión de datos es un sello en la caché que los signals de los modelos que
+  leen las herramientas renuevan al confirmar un cambio (como arbol_componentes):
+  un resultado nunca sobrevive a un save/delete. Los update()/bulk_create() no
+  disparan signals; para ellos el límite es el TTL.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from . import al_confirmar
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = 'herramientas_ia:version'
+CLAVE_RESULTADO = 'herramientas_ia:{consola}:{fn_name}:{huella}:{version}'
+
+# Herramientas que solo leen la base: se pueden cachear y ejecutar en paralelo.
+# (list_files_in_dir, read_file, edit_file, netgogo y los tests usan el agente o archivos)
+SOLO_LECTURA = {
+    'query_sistema',
+    'listado_trabajos',
+    'listado_mecanicos',
+    'listado_clientes',
+    'listado_vehiculos',
+    'listado_componentes',
+    'listado_acciones',
+    'listado_diagnosticos',
+    'listado_compatibilidad',
+    'listado_compras',
+    'listado_inventario',
+    'sugerir_componentes_por_descripcion',
+    'buscar_diagnosticos_similares',
+}
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'HERRAMIENTAS_IA_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'HERRAMIENTAS_IA_CACHE_TIMEOUT', 60)
+
+
+# ========================
+# VERSIÓN DE DATOS
+# ========================
+
+def version_datos():
+    """Sello vigente de los datos que leen las herramientas (se crea si la caché no lo tiene)."""
+    cache = _cache()
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _publicar_version():
+    _cache().set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar():
+    """
+    Los datos cambiaron: al confirmar la transacción se publica un sello nuevo y los
+    resultados guardados dejan de usarse (una vez por transacción).
+    """
+    al_confirmar.una_vez(CLAVE_VERSION, _publicar_version)
+
+
+# ========================
+# EJECUCIÓN
+# ========================
+
+def _huella(args):
+    texto = json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def ejecutar(fn_name, args, agent, consola='netgogo', version=None):
+    """
+    Resultado de la herramienta, desde la caché si ya se calculó con los mismos
+    argumentos y la misma versión de datos. Los errores no se guardan.
+    """
+    from .views_ia import ejecutar_herramienta
+
+    if fn_name not in SOLO_LECTURA or _timeout() <= 0:
+        return ejecutar_herramienta(fn_name, args, agent, consola)
+
+    cache = _cache()
+    clave = CLAVE_RESULTADO.format(
+        consola=consola,
+        fn_name=fn_name,
+        huella=_huella(args),
+        version=version if version is not None else version_datos(),
+    )
+    result = cache.get(clave)
+    if result is not None:
+        logger.debug(f"♻️ {fn_name} desde caché")
+        return result
+
+    result = ejecutar_herramienta(fn_name, args, agent, consola)
+    if result.get('success') is not False and 'error' not in result:
+        cache.set(clave, result, _timeout())
+    return result
+
+
+def _ejecutar_en_hilo(fn_name, args, agent, consola, version):
+    try:
+        return ejecutar(fn_name, args, agent, consola, version)
+    finally:
+        # Cada hilo del pool abre su propia conexión: no dejarla abierta entre tareas
+        connections.close_all()
+
+
+def _pool_hilos():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'HERRAMIENTAS_IA_HILOS', 4),
+                thread_name_prefix='herramientas_ia',
+            )
+    return _pool
+
+
+def ejecutar_llamadas(llamadas, agent, consola='netgogo'):
+    """
+    Ejecuta las function calls [(fn_name, args), ...] y devuelve sus resultados en
+    el mismo orden. Con más de una herramienta de solo lectura, esas corren en paralelo.
+    """
+    version = version_datos()
+    paralelas = [i for i, (fn_name, _) in enumerate(llamadas) if fn_name in SOLO_LECTURA]
+    if len(paralelas) < 2 or connections['default'].in_atomic_block:
+        # Una sola (o dentro de una transacción, que los otros hilos no verían): en este hilo
+        paralelas = []
+
+    resultados = [None] * len(llamadas)
+    futuros = {
+        i: _pool_hilos().submit(_ejecutar_en_hilo, *llamadas[i], agent, consola, version)
+        for i in paralelas
+    }
+    for i, (fn_name, args) in enumerate(llamadas):
+        if i not in futuros:
+            resultados[i] = ejecutar(fn_name, args, agent, consola, version)
+    for i, futuro in futuros.items():
+        resultados[i] = futuro.result()
+    return resultados
@@ -0,0 +1,22 @@
+"""
+Almacenamiento del historial de los chats con IA fuera de la sesión.
+"""
+from .models import ConversacionIA
+
+
+def obtener_conversacion(usuario, canal):
+    """Devuelve la conversación del usuario en el canal, o None si no existe."""
+    return ConversacionIA.objects.filter(usuario=usuario, canal=canal).first()
+
+
+def guardar_conversacion(usuario, canal, mensajes=None, estado=None):
+    """Crea o actualiza la conversación (solo los campos indicados)."""
+    valores = {}
+    if mensajes is not None:
+        valores['mensajes'] = mensajes
+    if estado is not None:
+        valores['estado'] = estado
+    conversacion, _ = ConversacionIA.objects.update_or_create(
+        usuario=usuario, canal=canal, defaults=valores
+    )
+    return conversacion
@@ -0,0 +1,294 @@
+"""
+Líneas de un diagnóstico (acciones y repuestos) dadas de alta y clonadas en lote.
+
+- guardar_lineas(): toma los JSON ocultos del formulario de ingreso
+  (acciones_componentes_json, repuestos_json, repuestos_externos_json) y crea
+  todas las filas con bulk_create. Los precios de catálogo (ComponenteAccion),
+  repuestos, stocks y repuestos externos se cargan con una consulta cada uno,
+  en vez de una por línea como hacía DiagnosticoComponenteAccion.save().
+- clonar_en_trabajo(): Diagnostico.aprobar_y_clonar() con bulk_create de
+  componentes, acciones y repuestos del trabajo.
+- registrar_aprobacion(): los eventos de auditoría de la aprobación; la cola de
+  auditoría los escribe al confirmar la transacción, fuera del camino crítico y
+  solo si la aprobación realmente quedó guardada.
+
+Las líneas del diagnóstico (DiagnosticoComponenteAccion, DiagnosticoRepuesto) no tienen
+signals. Las del trabajo sí (TrabajoAccion/TrabajoRepuesto: pizarra en vivo y caché de las
+herramientas de Netgogo) y bulk_create no los dispara, así que clonar_en_trabajo() hace
+esas invalidaciones a mano una vez, después de los inserts.
+"""
+import json
+import logging
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+def _leer_json(valor):
+    """Lista desde el hidden JSON del formulario ([] si viene vacío o mal formado)."""
+    valor = (valor or "").strip()
+    if not valor:
+        return []
+    try:
+        datos = json.loads(valor)
+    except json.JSONDecodeError as e:
+        logger.warning(f"⚠️ JSON de líneas inválido: {e}")
+        return []
+    return datos if isinstance(datos, list) else []
+
+
+def _decimal(valor, defecto=None):
+    try:
+        numero = Decimal(str(valor).strip())
+    except (InvalidOperation, TypeError, ValueError):
+        return defecto
+    return numero if numero.is_finite() else defecto
+
+
+def _cantidad(valor):
+    try:
+        return int(valor) if valor else 1
+    except (TypeError, ValueError):
+        return 1
+
+
+def precios_catalogo(pares):
+    """{(componente_id, accion_id): precio_mano_obra} de ComponenteAccion en una consulta."""
+    from .models import ComponenteAccion
+
+    pares = set(pares)
+    if not pares:
+        return {}
+    componentes = {componente_id for componente_id, _ in pares}
+    acciones = {accion_id for _, accion_id in pares}
+    filas = ComponenteAccion.objects.filter(
+        componente_id__in=componentes, accion_id__in=acciones,
+    ).values_list('componente_id', 'accion_id', 'precio_mano_obra')
+    return {(c, a): precio for c, a, precio in filas if (c, a) in pares}
+
+
+# ========================
+# ALTA DE LÍNEAS
+# ========================
+
+def crear_acciones(diagnostico, items, componentes_ids):
+    """
+    DiagnosticoComponenteAccion para los items {componente_id, accion_id,
+    precio_mano_obra, cantidad}. Se ignoran los de componentes no seleccionados;
+    sin precio (o en 0) toma el del catálogo, igual que el save() del modelo.
+    """
+    from .models import DiagnosticoComponenteAccion
+
+    seleccionados = {int(c) for c in componentes_ids if str(c).isdigit()}
+    lineas = []
+    for it in items:
+        try:
+            componente_id = int(it.get("componente_id"))
+            accion_id = int(it.get("accion_id"))
+        except (AttributeError, TypeError, ValueError):
+            continue
+        if componente_id not in seleccionados:
+            continue
+        precio = _decimal(it.get("precio_mano_obra") or "", Decimal('0'))
+        lineas.append((componente_id, accion_id, precio, _cantidad(it.get("cantidad"))))
+
+    catalogo = precios_catalogo((c, a) for c, a, precio, _ in lineas if not precio)
+    return DiagnosticoComponenteAccion.objects.bulk_create([
+        DiagnosticoComponenteAccion(
+            diagnostico=diagnostico,
+            componente_id=componente_id,
+            accion_id=accion_id,
+            precio_mano_obra=precio or catalogo.get((componente_id, accion_id), Decimal('0')),
+            cantidad=cantidad,
+        )
+        for componente_id, accion_id, precio, cantidad in lineas
+    ])
+
+
+def crear_repuestos(diagnostico, items):
+    """DiagnosticoRepuesto de inventario para los items {id, repuesto_stock_id, cantidad, precio_unitario}."""
+    from .models import DiagnosticoRepuesto, Repuesto, RepuestoEnStock
+
+    lineas = []
+    for it in items:
+        try:
+            lineas.append((int(it.get("id")), it))
+        except (AttributeError, TypeError, ValueError):
+            continue
+    if not lineas:
+        return []
+
+    repuestos = Repuesto.objects.in_bulk({repuesto_id for repuesto_id, _ in lineas})
+    stocks_ids = set()
+    for _, it in lineas:
+        try:
+            stocks_ids.add(int(it.get("repuesto_stock_id")))
+        except (TypeError, ValueError):
+            pass
+    stocks = RepuestoEnStock.objects.in_bulk(stocks_ids) if stocks_ids else {}
+
+    filas = []
+    for repuesto_id, it in lineas:
+        repuesto = repuestos.get(repuesto_id)
+        if repuesto is None:
+            continue
+        try:
+            repuesto_stock = stocks.get(int(it.get("repuesto_stock_id")))
+        except (TypeError, ValueError):
+            repuesto_stock = None
+        cantidad = _cantidad(it.get("cantidad", 1))
+        precio = _decimal(it.get("precio_unitario"), repuesto.precio_venta or Decimal('0'))
+        filas.append(DiagnosticoRepuesto(
+            diagnostico=diagnostico,
+            repuesto=repuesto,
+            repuesto_stock=repuesto_stock,
+            cantidad=cantidad,
+            precio_unitario=precio,
+            subtotal=cantidad * precio,
+        ))
+    return DiagnosticoRepuesto.objects.bulk_create(filas)
+
+
+def crear_repuestos_externos(diagnostico, items):
+    """
+    DiagnosticoRepuesto con referencia a RepuestoExterno para los items
+    {id, cantidad, precio}; el contador de uso se incrementa con un UPDATE.
+    """
+    from .models import DiagnosticoRepuesto, RepuestoExterno
+
+    lineas = []
+    for it in items:
+        try:
+            lineas.append((int(it.get("id")), it))
+        except (AttributeError, TypeError, ValueError):
+            continue
+    if not lineas:
+        return []
+
+    externos = RepuestoExterno.objects.in_bulk({externo_id for externo_id, _ in lineas})
+    filas = []
+    usos = Counter()
+    for externo_id, it in lineas:
+        externo = externos.get(externo_id)
+        if externo is None:
+            continue
+        cantidad = _cantidad(it.get("cantidad", 1))
+        precio = _decimal(it.get("precio"), externo.precio_referencial)
+        filas.append(DiagnosticoRepuesto(
+            diagnostico=diagnostico,
+            repuesto=None,
+            repuesto_externo=externo,
+            repuesto_stock=None,
+            cantidad=cantidad,
+            precio_unitario=precio,
+            subtotal=cantidad * precio,
+        ))
+        usos[externo_id] += 1
+
+    creados = DiagnosticoRepuesto.objects.bulk_create(filas)
+
+    # Un UPDATE por cada cantidad distinta de usos (normalmente uno solo)
+    por_veces = {}
+    for externo_id, veces in usos.items():
+        por_veces.setdefault(veces, []).append(externo_id)
+    for veces, ids in por_veces.items():
+        RepuestoExterno.objects.filter(pk__in=ids).update(veces_usado=F('veces_usado') + veces)
+    return creados
+
+
+def guardar_lineas(diagnostico, datos, componentes_ids):
+    """
+    Crea acciones, repuestos y repuestos externos del diagnóstico desde los hidden
+    JSON del formulario (`datos` es request.POST o un dict equivalente).
+    Devuelve {'acciones': n, 'repuestos': m, 'externos': k}.
+    """
+    with transaction.atomic():
+        acciones = crear_acciones(
+            diagnostico, _leer_json(datos.get("acciones_componentes_json")), componentes_ids,
+        )
+        repuestos = crear_repuestos(diagnostico, _leer_json(datos.get("repuestos_json")))
+        externos = crear_repuestos_externos(diagnostico, _leer_json(datos.get("repuestos_externos_json")))
+    return {'acciones': len(acciones), 'repuestos': len(repuestos), 'externos': len(externos)}
+
+
+# ========================
+# CLONADO A TRABAJO
+# ========================
+
+def clonar_en_trabajo(diagnostico):
+    """
+    Crea el Trabajo del diagnóstico con sus componentes, acciones y repuestos
+    (bulk_create) y deja el diagnóstico aprobado.
+    """
+    from . import herramientas_ia, pizarra
+    from .models import Trabajo, TrabajoAccion, TrabajoRepuesto
+
+    with transaction.atomic():
+        trabajo = Trabajo.objects.create(
+            diagnostico=diagnostico,
+            vehiculo=diagnostico.vehiculo,
+            estado="iniciado",
+            observaciones=diagnostico.descripcion_problema,
+        )
+
+        # 🔹 Componentes (M2M) directo sobre la tabla intermedia
+        Intermedia = Trabajo.componentes.through
+        Intermedia.objects.bulk_create([
+            Intermedia(trabajo_id=trabajo.pk, componente_id=componente_id)
+            for componente_id in diagnostico.componentes.values_list('pk', flat=True)
+        ])
+
+        # 🔹 Acciones (arrancan pendientes)
+        TrabajoAccion.objects.bulk_create([
+            TrabajoAccion(
+                trabajo=trabajo,
+                componente_id=dca['componente_id'],
+                accion_id=dca['accion_id'],
+                precio_mano_obra=dca['precio_mano_obra'],
+                cantidad=dca['cantidad'],
+                completado=False,
+            )
+            for dca in diagnostico.acciones_componentes.order_by('pk').values(
+                'componente_id', 'accion_id', 'precio_mano_obra', 'cantidad',
+            )
+        ])
+
+        # 🔹 Repuestos (incluyendo externos)
+        TrabajoRepuesto.objects.bulk_create([
+            TrabajoRepuesto(
+                trabajo=trabajo,
+                componente=None,
+                repuesto_id=dr['repuesto_id'],
+                repuesto_externo_id=dr['repuesto_externo_id'],
+                cantidad=dr['cantidad'],
+                precio_unitario=dr['precio_unitario'] or 0,
+                subtotal=dr['subtotal'] or 0,
+            )
+            for dr in diagnostico.repuestos.order_by('pk').values(
+                'repuesto_id', 'repuesto_externo_id', 'cantidad', 'precio_unitario', 'subtotal',
+            )
+        ])
+
+        # Lo que harían los post_save de cada TrabajoAccion/TrabajoRepuesto (se publica al confirmar)
+        pizarra.marcar_cambio(trabajo.pk)
+        herramientas_ia.invalidar()
+
+        diagnostico.estado = "aprobado"
+        diagnostico.save(update_fields=['estado'])
+
+    return trabajo
+
+
+def registrar_aprobacion(diagnostico, trabajo, request=None):
+    """
+    Eventos 'diagnostico_aprobado' e 'ingreso'. registrar_evento ya los deja en la cola
+    de auditoría y los escribe al confirmar la transacción (cola_auditoria).
+    """
+    from .utils_auditoria import registrar_diagnostico_aprobado, registrar_ingreso
+
+    registrar_diagnostico_aprobado(diagnostico, trabajo, request=request)
+    registrar_ingreso(trabajo, request=request)
@@ -0,0 +1,134 @@
+"""
+Cliente asíncrono del LLM (API Responses) para las consolas Netgogo en streaming.
+
+netgogo_chat y netgogo2_chat llaman a call_openai_api de forma síncrona: el worker
+queda bloqueado hasta 60 s por llamada, y hay dos llamadas por turno cuando la IA
+usa una herramienta. Las vistas de views_ia_stream.py usan este módulo bajo ASGI:
+
+- un httpx.AsyncClient por event loop, con pool de conexiones keep-alive (el TLS con
+  la API se negocia una vez y se reutiliza entre peticiones)
+- responder(): una llamada completa; devuelve el mismo JSON que call_openai_api
+  ({"output": [{"type": "message" | "function_call", ...}]})
+- transmitir(): la misma llamada con stream=True; entrega los tokens a medida que
+  llegan (eventos SSE response.output_text.delta) y al final la respuesta completa
+
+LLM_URL apunta a la API (o a `manage.py mock_llm` en pruebas y benchmarks) y la
+clave se lee de LLM_API_KEY / OPENAI_API_KEY. httpx es opcional: sin él solo
+fallan las vistas en streaming.
+"""
+import asyncio
+import json
+import weakref
+
+from django.conf import settings
+
+try:
+    import httpx
+except ImportError:  # las vistas síncronas siguen funcionando sin httpx
+    httpx = None
+
+# Un cliente por event loop: un AsyncClient no puede usarse desde otro loop, y fuera
+# de ASGI (async_to_sync) cada request corre en un loop nuevo que se descarta al terminar
+_clientes = weakref.WeakKeyDictionary()
+
+
+class ErrorLLM(Exception):
+    """La API del LLM respondió con error, cortó el stream o no está disponible."""
+
+
+def _url():
+    return getattr(settings, 'LLM_URL', 'https://api.openai.com/v1/responses')
+
+
+def _cabeceras():
+    cabeceras = {'Content-Type': 'application/json'}
+    clave = getattr(settings, 'LLM_API_KEY', None)
+    if clave:
+        cabeceras['Authorization'] = f'Bearer {clave}'
+    return cabeceras
+
+
+def cliente():
+    """AsyncClient compartido del event loop actual (se crea con la primera llamada)."""
+    if httpx is None:
+        raise ErrorLLM("httpx no está instalado: pip install httpx")
+    loop = asyncio.get_running_loop()
+    actual = _clientes.get(loop)
+    if actual is None or actual.is_closed:
+        actual = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                getattr(settings, 'LLM_TIMEOUT', 60),
+                connect=getattr(settings, 'LLM_TIMEOUT_CONEXION', 10),
+            ),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, 'LLM_MAX_CONEXIONES', 20),
+                max_keepalive_connections=getattr(settings, 'LLM_MAX_CONEXIONES', 20),
+            ),
+            headers=_cabeceras(),
+        )
+        _clientes[loop] = actual
+    return actual
+
+
+async def cerrar():
+    """Cierra el cliente del event loop actual (al terminar un benchmark o un test)."""
+    actual = _clientes.pop(asyncio.get_running_loop(), None)
+    if actual is not None:
+        await actual.aclose()
+
+
+def _cuerpo(input_data, model, tools, store, stream):
+    cuerpo = {'model': model, 'input': input_data, 'store': store}
+    if tools:
+        cuerpo['tools'] = tools
+    if stream:
+        cuerpo['stream'] = True
+    return cuerpo
+
+
+async def responder(input_data, model, tools=None, store=True):
+    """Llamada sin streaming; devuelve el JSON de la respuesta como call_openai_api."""
+    http = cliente()
+    try:
+        respuesta = await http.post(_url(), json=_cuerpo(input_data, model, tools, store, False))
+    except httpx.HTTPError as e:
+        raise ErrorLLM(f"Error conectando con el LLM: {type(e).__name__}: {e}") from e
+    if respuesta.status_code >= 400:
+        raise ErrorLLM(f"El LLM respondió {respuesta.status_code}: {respuesta.text[:500]}")
+    return respuesta.json()
+
+
+async def transmitir(input_data, model, tools=None, store=True):
+    """
+    Llamada con streaming. Genera ('delta', texto) por cada fragmento de texto y
+    termina con ('fin', respuesta), donde respuesta es el mismo JSON que devuelve
+    responder() (incluye los function_call que haya pedido la IA).
+    """
+    cuerpo = _cuerpo(input_data, model, tools, store, True)
+    http = cliente()
+    try:
+        async with http.stream('POST', _url(), json=cuerpo) as respuesta:
+            if respuesta.status_code >= 400:
+                detalle = (await respuesta.aread()).decode('utf-8', 'replace')
+                raise ErrorLLM(f"El LLM respondió {respuesta.status_code}: {detalle[:500]}")
+
+            async for linea in respuesta.aiter_lines():
+                if not linea.startswith('data:'):
+                    continue  # líneas 'event:', comentarios y separadores
+                datos = linea[5:].strip()
+                if not datos or datos == '[DONE]':
+                    continue
+                evento = json.loads(datos)
+                tipo = evento.get('type')
+                if tipo == 'response.output_text.delta':
+                    if evento.get('delta'):
+                        yield 'delta', evento['delta']
+                elif tipo == 'response.completed':
+                    yield 'fin', evento.get('response') or {}
+                    return
+                elif tipo in ('response.failed', 'response.incomplete', 'error'):
+                    error = (evento.get('response') or {}).get('error') or evento.get('message') or tipo
+                    raise ErrorLLM(f"El LLM cortó la respuesta: {error}")
+    except httpx.HTTPError as e:
+        raise ErrorLLM(f"Error conectando con el LLM: {type(e).__name__}: {e}") from e
+    raise ErrorLLM("El stream del LLM terminó sin response.completed")
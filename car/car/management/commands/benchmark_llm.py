@@ -0,0 +1,87 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from car import llm
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+async def _una(indice, stream, semaforo):
+    """(segundos hasta el primer token, segundos totales) de una llamada."""
+    mensajes = [{"role": "user", "content": f"Benchmark {indice}: ¿cuántos trabajos hay en el taller?"}]
+    async with semaforo:
+        inicio = time.perf_counter()
+        primero = None
+        if stream:
+            async for tipo, _ in llm.transmitir(mensajes, model="gpt-5-nano"):
+                if tipo == 'delta' and primero is None:
+                    primero = time.perf_counter() - inicio
+        else:
+            await llm.responder(mensajes, model="gpt-5-nano")
+        total = time.perf_counter() - inicio
+    return primero if primero is not None else total, total
+
+
+async def _ejecutar(peticiones, concurrencia, stream):
+    semaforo = asyncio.Semaphore(concurrencia)
+    try:
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(
+            *(_una(i, stream, semaforo) for i in range(peticiones)),
+            return_exceptions=True,
+        )
+        return resultados, time.perf_counter() - inicio
+    finally:
+        await llm.cerrar()
+
+
+class Command(BaseCommand):
+    help = 'Mide latencia y throughput del cliente LLM asíncrono (car/llm.py), p. ej. contra mock_llm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Endpoint del LLM (default: LLM_URL de settings)')
+        parser.add_argument('--peticiones', type=int, default=50, help='Cantidad de llamadas (default: 50)')
+        parser.add_argument('--concurrencia', type=int, default=10, help='Llamadas simultáneas (default: 10)')
+        parser.add_argument('--sin-stream', action='store_true', help='Usar responder() en vez de transmitir()')
+
+    def handle(self, *args, **options):
+        url = options['url'] or settings.LLM_URL
+        peticiones = max(1, options['peticiones'])
+        concurrencia = max(1, options['concurrencia'])
+        stream = not options['sin_stream']
+
+        self.stdout.write(
+            f"⏱️ {peticiones} llamadas a {url} con concurrencia {concurrencia} "
+            f"({'streaming' if stream else 'sin streaming'})..."
+        )
+        with override_settings(LLM_URL=url):
+            resultados, duracion = asyncio.run(_ejecutar(peticiones, concurrencia, stream))
+
+        errores = [r for r in resultados if isinstance(r, BaseException)]
+        correctos = [r for r in resultados if not isinstance(r, BaseException)]
+        for error in errores[:3]:
+            self.stdout.write(self.style.WARNING(f"⚠️ {type(error).__name__}: {error}"))
+        if not correctos:
+            self.stdout.write(self.style.ERROR(f"❌ Las {len(errores)} llamadas fallaron"))
+            return
+
+        primeros = [p for p, _ in correctos]
+        totales = [t for _, t in correctos]
+        self.stdout.write(f"   Correctas: {len(correctos)}  Errores: {len(errores)}")
+        self.stdout.write(f"   Duración: {duracion:.2f}s  ({len(correctos) / duracion:.1f} llamadas/s)")
+        for nombre, valores in (('Primer token', primeros), ('Total', totales)):
+            self.stdout.write(
+                f"   {nombre:<13} p50 {statistics.median(valores) * 1000:7.0f} ms   "
+                f"p95 {_percentil(valores, 95) * 1000:7.0f} ms   max {max(valores) * 1000:7.0f} ms"
+            )
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark terminado"))
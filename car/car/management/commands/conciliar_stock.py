@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from car.movimientos_stock import conciliar_depositos
+
+
+class Command(BaseCommand):
+    help = (
+        'Reparación única: deja una fila de bodega-principal por repuesto con el stock de '
+        'Repuesto y completa el repuesto en movimientos antiguos'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Conciliando RepuestoEnStock con Repuesto.stock...")
+
+        resultado = conciliar_depositos()
+
+        self.stdout.write(f"   • Movimientos completados: {resultado['movimientos']}")
+        self.stdout.write(f"   • Duplicados eliminados: {resultado['duplicados']}")
+        self.stdout.write(f"   • Filas creadas: {resultado['creados']}")
+        self.stdout.write(f"   • Filas igualadas: {resultado['igualados']}")
+        self.stdout.write(self.style.SUCCESS("✅ Conciliación completada"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from car import sugerencias_ingreso
+
+
+class Command(BaseCommand):
+    help = 'Entrena el modelo de sugerencias del ingreso (co-ocurrencias del historial de diagnósticos y trabajos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--probar',
+            type=str,
+            help='Muestra las sugerencias para esta descripción después de entrenar',
+        )
+        parser.add_argument(
+            '--componentes',
+            type=lambda valor: [int(c) for c in valor.split(',') if c.strip()],
+            default=[],
+            help='IDs de componentes ya elegidos para la prueba, separados por coma',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🧠 Entrenando modelo de sugerencias del ingreso...")
+
+        resumen = sugerencias_ingreso.entrenar()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {resumen['casos']} casos, {resumen['rasgos']} rasgos, {resumen['objetivos']} objetivos, "
+            f"{resumen['pares']} pares en {resumen['segundos']}s"
+        ))
+
+        consulta = options.get('probar')
+        if consulta:
+            sugerencias = sugerencias_ingreso.sugerir(consulta, options['componentes'], limite=5)
+            self.stdout.write(f"🔍 '{consulta}':")
+            for nombre, filas in sugerencias.items():
+                self.stdout.write(f"   {nombre}: {filas}")
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from car.models import Repuesto
+from car import busqueda_repuestos, compatibilidad_repuestos
+from car.movimientos_stock import conciliar_depositos
 
 
 class Command(BaseCommand):
@@ -26,7 +28,7 @@ class Command(BaseCommand):
             'origen_vacio': Repuesto.objects.filter(origen_repuesto__in=['sin-origen', '']).count(),
             'marca_veh_vacia': Repuesto.objects.filter(marca_veh__in=['xxx', 'xxxx', '']).count(),
             'tipo_motor_vacio': Repuesto.objects.filter(tipo_de_motor__in=['zzzzzz', 'zzzz', '']).count(),
-            'marca_general': Repuesto.objects.filter(marca__in=['general', '']).count(),
+            'marca_general': Repuesto.objects.filter(marca='general').count(),
         }
         
         total_problemas = sum(problemas.values())
@@ -60,16 +62,17 @@ class Command(BaseCommand):
             Repuesto.objects.filter(origen_repuesto__in=['sin-origen', '']).update(origen_repuesto=None)
             Repuesto.objects.filter(marca_veh__in=['xxx', 'xxxx', '']).update(marca_veh=None)
             Repuesto.objects.filter(tipo_de_motor__in=['zzzzzz', 'zzzz', '']).update(tipo_de_motor=None)
-            Repuesto.objects.filter(marca__in=['general', '']).update(marca=None)
+            # marca no admite NULL: el valor limpio es ''
+            Repuesto.objects.filter(marca='general').update(marca='')
             
-            # Sincronizar stock con RepuestoEnStock
+            # Sincronizar stock con RepuestoEnStock (filas de bodega-principal faltantes o desiguales)
             self.stdout.write("Sincronizando stock...")
-            repuestos_sin_stock_detallado = Repuesto.objects.filter(
-                stocks__isnull=True
-            ).exclude(stock=0)
-            
-            for repuesto in repuestos_sin_stock_detallado:
-                repuesto._sincronizar_con_stock_detallado(0, repuesto.precio_costo or 0)
+            resultado = conciliar_depositos()
+            self.stdout.write(f"  {resultado}")
+
+            # Los update() masivos no disparan signals: documentos de búsqueda e índice de compatibilidad
+            busqueda_repuestos.reconstruir_documentos()
+            compatibilidad_repuestos.reconstruir()
         
         self.stdout.write(self.style.SUCCESS('Limpieza completada exitosamente.'))
 
@@ -0,0 +1,173 @@
+"""
+Servidor LLM simulado para pruebas y benchmarks de las consolas Netgogo.
+
+Imita el endpoint /v1/responses: responde en JSON o, con "stream": true, con los
+eventos SSE que lee car.llm.transmitir (response.output_text.delta y
+response.completed). La latencia hasta el primer token y la velocidad de los tokens
+son configurables. Si la petición trae herramientas y se indicó --herramienta, la
+primera respuesta es esa function call; la continuación (sin herramientas) es texto.
+
+    python manage.py mock_llm --puerto 8765 --latencia 0.8 --tokens-por-segundo 40
+    LLM_URL=http://127.0.0.1:8765/v1/responses python manage.py runserver
+"""
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+def _texto(cuerpo, cantidad):
+    """Tokens de la respuesta simulada (repite el inicio del último mensaje del usuario)."""
+    ultimo = ''
+    entrada = cuerpo.get('input')
+    if isinstance(entrada, list):
+        for msg in reversed(entrada):
+            if isinstance(msg, dict) and msg.get('role') == 'user':
+                ultimo = str(msg.get('content', ''))[:60]
+                break
+    elif isinstance(entrada, str):
+        ultimo = entrada[:60]
+    base = f"Respuesta simulada a «{ultimo}»:".split() if ultimo else ["Respuesta", "simulada:"]
+    relleno = [f"token{i}" for i in range(max(0, cantidad - len(base)))]
+    return [palabra + ' ' for palabra in base + relleno]
+
+
+def _crear_handler(opciones):
+    latencia = opciones['latencia']
+    pausa_token = 1 / opciones['tokens_por_segundo'] if opciones['tokens_por_segundo'] > 0 else 0
+    herramienta = opciones['herramienta']
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, para medir el pool de conexiones
+
+        def log_message(self, formato, *args):
+            if opciones['verbosity'] > 1:
+                super().log_message(formato, *args)
+
+        def _salida(self, cuerpo):
+            nombres = {t.get('name') for t in cuerpo.get('tools') or [] if isinstance(t, dict)}
+            if herramienta and herramienta in nombres:
+                return [{
+                    'type': 'function_call',
+                    'id': f'fc_{uuid.uuid4().hex[:12]}',
+                    'call_id': f'call_{uuid.uuid4().hex[:12]}',
+                    'name': herramienta,
+                    'arguments': json.dumps(opciones['argumentos']),
+                }], []
+            tokens = _texto(cuerpo, opciones['tokens'])
+            mensaje = {
+                'type': 'message',
+                'id': f'msg_{uuid.uuid4().hex[:12]}',
+                'role': 'assistant',
+                'content': [{'type': 'output_text', 'text': ''.join(tokens).strip()}],
+            }
+            return [mensaje], tokens
+
+        def _respuesta(self, cuerpo, output):
+            return {
+                'id': f'resp_{uuid.uuid4().hex[:12]}',
+                'object': 'response',
+                'created_at': int(time.time()),
+                'model': cuerpo.get('model'),
+                'status': 'completed',
+                'output': output,
+            }
+
+        def _enviar_chunk(self, datos):
+            self.wfile.write(f"{len(datos):x}\r\n".encode() + datos + b"\r\n")
+            self.wfile.flush()
+
+        def _evento(self, datos):
+            self._enviar_chunk(f"event: {datos['type']}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n".encode())
+
+        def do_POST(self):
+            largo = int(self.headers.get('Content-Length') or 0)
+            try:
+                cuerpo = json.loads(self.rfile.read(largo) or b'{}')
+            except ValueError:
+                self.send_error(400, 'JSON inválido')
+                return
+
+            output, tokens = self._salida(cuerpo)
+            respuesta = self._respuesta(cuerpo, output)
+
+            if not cuerpo.get('stream'):
+                time.sleep(latencia + pausa_token * len(tokens))
+                datos = json.dumps(respuesta, ensure_ascii=False).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                self._evento({'type': 'response.created', 'response': {**respuesta, 'status': 'in_progress', 'output': []}})
+                time.sleep(latencia)
+                for token in tokens:
+                    self._evento({'type': 'response.output_text.delta', 'output_index': 0, 'content_index': 0, 'delta': token})
+                    if pausa_token:
+                        time.sleep(pausa_token)
+                self._evento({'type': 'response.completed', 'response': respuesta})
+                self._enviar_chunk(b'')
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # el cliente cortó el stream
+
+    return Handler
+
+
+class Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # el default (5) rechaza conexiones en benchmarks concurrentes
+
+
+class Command(BaseCommand):
+    help = 'Servidor LLM simulado (API Responses, JSON y SSE) para pruebas y benchmarks de Netgogo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Dirección de escucha (default: 127.0.0.1)')
+        parser.add_argument('--puerto', type=int, default=8765, help='Puerto (default: 8765)')
+        parser.add_argument(
+            '--latencia',
+            type=float,
+            default=0.5,
+            help='Segundos hasta el primer token (default: 0.5)',
+        )
+        parser.add_argument(
+            '--tokens-por-segundo',
+            type=float,
+            default=50,
+            help='Velocidad de generación; 0 = todos de inmediato (default: 50)',
+        )
+        parser.add_argument('--tokens', type=int, default=40, help='Tokens por respuesta (default: 40)')
+        parser.add_argument(
+            '--herramienta',
+            help='Function call que devuelve cuando la petición trae herramientas (p. ej. listado_trabajos)',
+        )
+        parser.add_argument(
+            '--argumentos',
+            type=json.loads,
+            default={},
+            help='Argumentos JSON de la function call (default: {})',
+        )
+
+    def handle(self, *args, **options):
+        servidor = Servidor((options['host'], options['puerto']), _crear_handler(options))
+        self.stdout.write(
+            f"🤖 LLM simulado en http://{options['host']}:{options['puerto']}/v1/responses "
+            f"(latencia {options['latencia']}s, {options['tokens_por_segundo']} tokens/s)"
+        )
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write("🛑 LLM simulado detenido")
@@ -0,0 +1,57 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from car import resumenes
+from car.models import Trabajo
+
+
+def _calcular_lote(trabajo_ids):
+    """Cálculo de un lote en un proceso hijo (con su propia conexión, solo lectura)."""
+    close_old_connections()
+    try:
+        return resumenes.calcular(trabajo_ids)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Recalcula ResumenTrabajo de todos los trabajos en lotes, calculando en varios procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Cantidad de trabajos por lote (default: 200)',
+        )
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=2,
+            help='Procesos que recalculan lotes en paralelo (default: 2; 1 = sin procesos hijos)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        procesos = max(1, options['procesos'])
+
+        ids = list(Trabajo.objects.order_by('pk').values_list('pk', flat=True))
+        lotes = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        self.stdout.write(f"🔄 Recalculando {len(ids)} resúmenes en {len(lotes)} lote(s) con {procesos} proceso(s)...")
+
+        total = 0
+        if procesos == 1 or len(lotes) <= 1:
+            for lote in lotes:
+                total += resumenes.actualizar(lote)
+        else:
+            # Los hijos hacen las consultas pesadas; las escrituras quedan en este proceso
+            # para no competir por el bloqueo de escritura (SQLite)
+            connections.close_all()
+            contexto = multiprocessing.get_context('fork')
+            with contexto.Pool(processes=procesos) as pool:
+                for datos in pool.imap_unordered(_calcular_lote, lotes):
+                    total += resumenes.guardar(datos)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} resúmenes actualizados"))
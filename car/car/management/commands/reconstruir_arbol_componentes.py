@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from car import arbol_componentes
+
+
+class Command(BaseCommand):
+    help = 'Regenera la tabla de cierre de la jerarquía de componentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recodificar',
+            action='store_true',
+            help='Corrige también los códigos que no empiezan con el código de su padre',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Cantidad de filas por lote (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Reconstruyendo jerarquía de componentes...")
+
+        total, recodificados = arbol_componentes.reconstruir(
+            recodificar=options['recodificar'], batch_size=options['batch_size'],
+        )
+
+        if options['recodificar']:
+            self.stdout.write(f"🏷️ {recodificados} componentes recodificados")
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} relaciones ancestro → descendiente"))
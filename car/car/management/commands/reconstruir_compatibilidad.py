@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from car import compatibilidad_repuestos
+
+
+class Command(BaseCommand):
+    help = 'Regenera el índice de compatibilidad repuesto ↔ vehículo usado por las sugerencias de repuestos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Cantidad de filas por lote (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Reconstruyendo índice de compatibilidad de repuestos...")
+
+        repuestos, aplicaciones = compatibilidad_repuestos.reconstruir(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {repuestos} repuestos y {aplicaciones} aplicaciones indexados"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from car import estadisticas
+
+
+class Command(BaseCommand):
+    help = 'Regenera las estadísticas acumuladas de trabajos desde el historial de auditoría'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Cantidad de filas por INSERT (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Reconstruyendo estadísticas acumuladas...")
+
+        total = estadisticas.reconstruir(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} filas de estadísticas generadas"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from car import busqueda_repuestos
+
+
+class Command(BaseCommand):
+    help = 'Regenera los documentos de búsqueda de repuestos y el índice FTS5/pg_trgm'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Cantidad de repuestos por lote (default: 500)',
+        )
+        parser.add_argument(
+            '--probar',
+            type=str,
+            help='Ejecuta una búsqueda de prueba después de reconstruir',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Reconstruyendo índice de búsqueda de repuestos...")
+
+        busqueda_repuestos.asegurar_indice()
+        total = busqueda_repuestos.reconstruir_documentos(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} repuestos indexados"))
+
+        consulta = options.get('probar')
+        if consulta:
+            ids = busqueda_repuestos.buscar_repuesto_ids(consulta, limite=10)
+            self.stdout.write(f"🔍 '{consulta}': {len(ids)} resultados → {ids}")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from car import similitud_diagnosticos
+
+
+class Command(BaseCommand):
+    help = 'Regenera el índice TF-IDF de diagnósticos parecidos (segmento NumPy y delta)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--probar',
+            type=str,
+            help='Busca diagnósticos parecidos a este texto después de reconstruir',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Reconstruyendo índice de diagnósticos parecidos...")
+
+        total = similitud_diagnosticos.reconstruir()
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} diagnósticos indexados"))
+
+        consulta = options.get('probar')
+        if consulta:
+            resultados = similitud_diagnosticos.similares(consulta, limite=10)
+            self.stdout.write(f"🔍 '{consulta}': {len(resultados)} resultados")
+            for diagnostico_id, similitud in resultados:
+                self.stdout.write(f"   #{diagnostico_id}  {similitud:.3f}")
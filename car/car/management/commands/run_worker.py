@@ -0,0 +1,112 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from car import tareas
+
+logger = logging.getLogger(__name__)
+
+
+def _bucle(intervalo, detener):
+    """Ciclo de un proceso del worker: toma tareas hasta que se pida detener."""
+    # Los handlers solo marcan una bandera: llamar a detener.set() desde un handler
+    # mientras el proceso está dentro de detener.wait() se bloquea para siempre
+    terminado = []
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: terminado.append(True))
+    worker = tareas.nombre_worker()
+    while not detener.is_set() and not terminado:
+        try:
+            if not tareas.procesar_pendientes(worker, limite=1):
+                detener.wait(intervalo)
+        except Exception:
+            logger.exception("❌ Error en el worker de tareas")
+            detener.wait(intervalo)
+        finally:
+            close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de tareas en segundo plano (PDF, Excel, algoritmo de relación, compras)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=getattr(settings, 'TAREAS_PROCESOS', 2),
+            help='Cantidad de procesos que toman tareas en paralelo (default: TAREAS_PROCESOS o 2)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos de espera cuando la cola está vacía (default: 2)',
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa las tareas pendientes y termina (para cron)',
+        )
+
+    def handle(self, *args, **options):
+        reintentadas, fallidas = tareas.liberar_abandonadas()
+        if reintentadas or fallidas:
+            self.stdout.write(f"♻️ Tareas abandonadas: {reintentadas} reintentadas, {fallidas} con error")
+
+        if options['una_vez']:
+            total = tareas.procesar_pendientes(tareas.nombre_worker())
+            tareas.limpiar_terminadas()
+            self.stdout.write(self.style.SUCCESS(f"✅ {total} tareas procesadas"))
+            return
+
+        procesos = max(1, options['procesos'])
+        intervalo = options['intervalo']
+        self.stdout.write(f"🚀 Worker de tareas iniciado con {procesos} proceso(s)")
+
+        # Cada proceso hijo abre sus propias conexiones
+        connections.close_all()
+        contexto = multiprocessing.get_context('fork')
+        detener = contexto.Event()
+
+        def lanzar():
+            hijo = contexto.Process(target=_bucle, args=(intervalo, detener), daemon=True)
+            hijo.start()
+            return hijo
+
+        detenido = []
+
+        def parar(*_):
+            detenido.append(True)
+
+        signal.signal(signal.SIGINT, parar)
+        signal.signal(signal.SIGTERM, parar)
+
+        hijos = [lanzar() for _ in range(procesos)]
+        ultima_revision = ultima_limpieza = time.monotonic()
+        while not detenido:
+            time.sleep(1)
+            # Reemplazar procesos que hayan muerto
+            for i, hijo in enumerate(hijos):
+                if not hijo.is_alive() and not detenido:
+                    logger.warning(f"⚠️ Proceso del worker {hijo.pid} terminó (código {hijo.exitcode}); se reinicia")
+                    hijos[i] = lanzar()
+            ahora = time.monotonic()
+            if ahora - ultima_revision > 60:
+                tareas.liberar_abandonadas()
+                connections.close_all()
+                ultima_revision = ahora
+            if ahora - ultima_limpieza > 3600:
+                tareas.limpiar_terminadas()
+                connections.close_all()
+                ultima_limpieza = ahora
+
+        self.stdout.write("⏹️ Deteniendo worker, esperando las tareas en curso...")
+        detener.set()
+        for hijo in hijos:
+            hijo.join()
+        self.stdout.write(self.style.SUCCESS("✅ Worker detenido"))
@@ -1,82 +1,117 @@
-from django.http import HttpResponseForbidden
-from django.shortcuts import redirect
-from django.contrib import messages
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+
+from . import al_confirmar
+
+PERMISOS_ANONIMO = {
+    'diagnosticos': False,
+    'trabajos': False,
+    'pos': False,
+    'compras': False,
+    'inventario': False,
+    'administracion': False,
+    'crear_clientes': False,
+    'crear_vehiculos': False,
+    'aprobar_diagnosticos': False,
+    'gestionar_usuarios': False,
+}
+
+CLAVE_SESION = 'permisos_usuario'
+CLAVE_REVISION = 'permisos:revision:{user_id}'
+
+
+def _cache():
+    return caches[getattr(settings, 'PERMISOS_CACHE', 'default')]
+
+
+def revision_permisos(user_id):
+    """
+    Revisión vigente de los permisos del usuario. Si no existe (o expiró) se crea
+    una nueva, lo que obliga a recalcular los permisos guardados en la sesión.
+    """
+    cache = _cache()
+    clave = CLAVE_REVISION.format(user_id=user_id)
+    revision = cache.get(clave)
+    if revision is None:
+        cache.add(clave, time.time_ns(), getattr(settings, 'PERMISOS_CACHE_TIMEOUT', 300))
+        revision = cache.get(clave)
+    return revision
+
+
+def _publicar_revisiones(user_ids):
+    _cache().set_many(
+        {CLAVE_REVISION.format(user_id=user_id): time.time_ns() for user_id in user_ids},
+        getattr(settings, 'PERMISOS_CACHE_TIMEOUT', 300)
+    )
+
+
+def invalidar_permisos(user_id):
+    """
+    Al confirmar la transacción cambia la revisión del usuario; su próxima petición
+    recalcula los permisos. Publicarla antes dejaría que otra petición lea el Mecanico
+    sin confirmar y guarde el mapa viejo bajo la revisión nueva.
+    """
+    al_confirmar.acumular('permisos:revision', _publicar_revisiones, user_id)
+
+
+def permisos_de_mecanico(mecanico):
+    """Mapa de permisos a partir del perfil Mecanico"""
+    return {
+        'diagnosticos': mecanico.puede_ver_diagnosticos,
+        'trabajos': mecanico.puede_ver_trabajos,
+        'pos': mecanico.puede_ver_pos,
+        'compras': mecanico.puede_ver_compras,
+        'inventario': mecanico.puede_ver_inventario,
+        'administracion': mecanico.puede_ver_administracion,
+        'crear_clientes': mecanico.crear_clientes,
+        'crear_vehiculos': mecanico.crear_vehiculos,
+        'aprobar_diagnosticos': mecanico.aprobar_diagnosticos,
+        'gestionar_usuarios': mecanico.gestionar_usuarios,
+        'rol': mecanico.rol,
+        'es_mecanico': mecanico.rol == 'mecanico',
+        'es_vendedor': mecanico.rol == 'vendedor',
+        'es_admin': mecanico.rol == 'admin',
+    }
+
 
 class PermisosMiddleware:
     """
-    Middleware para manejar permisos de usuarios según su rol
+    Middleware para manejar permisos de usuarios según su rol.
+
+    request.permisos se evalúa de forma perezosa: las peticiones que no lo usan
+    (estáticos, anónimos) no consultan nada. El mapa se guarda en la sesión junto
+    con la revisión del usuario y solo se recalcula cuando esta cambia.
     """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        # Agregar permisos al request si el usuario está autenticado
-        if request.user.is_authenticated:
-            request.permisos = self.obtener_permisos(request.user)
-        else:
-            request.permisos = {
-                'diagnosticos': False,
-                'trabajos': False,
-                'pos': False,
-                'compras': False,
-                'inventario': False,
-                'administracion': False,
-                'crear_clientes': False,
-                'crear_vehiculos': False,
-                'aprobar_diagnosticos': False,
-                'gestionar_usuarios': False,
-            }
-        
+        request.permisos = SimpleLazyObject(lambda: self.permisos_request(request))
         return self.get_response(request)
-    
-    def obtener_permisos(self, user):
-        """
-        Obtiene los permisos del usuario desde el modelo Mecanico
-        """
-        try:
-            mecanico = user.mecanico
-            return {
-                'diagnosticos': mecanico.puede_ver_diagnosticos,
-                'trabajos': mecanico.puede_ver_trabajos,
-                'pos': mecanico.puede_ver_pos,
-                'compras': mecanico.puede_ver_compras,
-                'inventario': mecanico.puede_ver_inventario,
-                'administracion': mecanico.puede_ver_administracion,
-                'crear_clientes': mecanico.crear_clientes,
-                'crear_vehiculos': mecanico.crear_vehiculos,
-                'aprobar_diagnosticos': mecanico.aprobar_diagnosticos,
-                'gestionar_usuarios': mecanico.gestionar_usuarios,
-                'rol': mecanico.rol,
-                'es_mecanico': mecanico.rol == 'mecanico',
-                'es_vendedor': mecanico.rol == 'vendedor',
-                'es_admin': mecanico.rol == 'admin',
-            }
-        except:
-            # Si no tiene perfil de mecánico, crear uno por defecto
-            from .models import Mecanico
-            mecanico = Mecanico.objects.create(
-                user=user,
-                rol='mecanico'  # Rol por defecto
-            )
-            return {
-                'diagnosticos': True,
-                'trabajos': True,
-                'pos': True,  # ← CAMBIADO: Permitir POS por defecto
-                'compras': True,  # ← CAMBIADO: Permitir compras por defecto
-                'inventario': True,  # ← CAMBIADO: Permitir inventario por defecto
-                'administracion': True,  # ← CAMBIADO: Permitir administración por defecto
-                'crear_clientes': True,
-                'crear_vehiculos': True,
-                'aprobar_diagnosticos': True,  # ← CAMBIADO: Permitir aprobar diagnósticos
-                'gestionar_usuarios': True,  # ← CAMBIADO: Permitir gestionar usuarios
-                'rol': 'mecanico',
-                'es_mecanico': True,
-                'es_vendedor': False,
-                'es_admin': False,
-            }
-
-
 
+    def permisos_request(self, request):
+        if not request.user.is_authenticated:
+            return dict(PERMISOS_ANONIMO)
 
+        revision = revision_permisos(request.user.pk)
+        guardado = request.session.get(CLAVE_SESION)
+        if guardado and guardado.get('revision') == revision:
+            return guardado['mapa']
 
+        mapa = self.obtener_permisos(request.user)
+        request.session[CLAVE_SESION] = {'revision': revision, 'mapa': mapa}
+        return mapa
 
+    def obtener_permisos(self, user):
+        """
+        Obtiene los permisos del usuario desde el modelo Mecanico.
+        Sin perfil se usan los valores por defecto del modelo (no se crea el perfil aquí).
+        """
+        from .models import Mecanico
+        mecanico = Mecanico.objects.filter(user_id=user.pk).first()
+        if mecanico is None:
+            mecanico = Mecanico(user_id=user.pk, rol='mecanico')
+        return permisos_de_mecanico(mecanico)
@@ -8,6 +8,38 @@ from django.contrib.auth.models import User
 from django.db import transaction
 from django.utils.timezone import now
 
+class MecanicoQuerySet(models.QuerySet):
+    """QuerySet de Mecanico con saldos de bonos calculados en SQL."""
+
+    def with_saldos_bonos(self):
+        """
+        Anota los saldos de bonos de cada mecánico en la misma consulta: un GROUP BY
+        sobre BonoGenerado con SUM condicionales (pendientes, pagados, total) y una
+        subconsulta agregada para los PagoMecanico registrados. Incluye la configuración
+        de bono (select_related). Las @property de saldo de Mecanico usan estos valores
+        y evitan cuatro consultas por mecánico.
+        """
+        from django.db.models import DecimalField, OuterRef, Q, Subquery, Value
+        from django.db.models.functions import Coalesce
+
+        dinero = DecimalField(max_digits=14, decimal_places=2)
+        cero = Value(Decimal('0'))
+
+        def suma_bonos(filtro=None):
+            return Coalesce(Sum('bonos_generados__monto', filter=filtro, output_field=dinero), cero, output_field=dinero)
+
+        pagos = (
+            PagoMecanico.objects.filter(mecanico=OuterRef('pk'))
+            .values('mecanico').annotate(total=Sum('monto', output_field=dinero)).values('total')
+        )
+        return self.select_related('configuracion_bono').annotate(
+            suma_bonos_total=suma_bonos(),
+            suma_bonos_pendientes=suma_bonos(Q(bonos_generados__pagado=False)),
+            suma_bonos_pagados=suma_bonos(Q(bonos_generados__pagado=True)),
+            suma_pagos=Coalesce(Subquery(pagos, output_field=dinero), cero, output_field=dinero),
+        )
+
+
 class Mecanico(models.Model):
     ROLES_CHOICES = [
         ('mecanico', 'Mecánico'),
@@ -37,37 +69,53 @@ class Mecanico(models.Model):
     aprobar_diagnosticos = models.BooleanField(default=False)
     gestionar_usuarios = models.BooleanField(default=False)
 
+    objects = MecanicoQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username} ({self.get_rol_display()})"
     
+    def _anotado(self, nombre):
+        """Valor anotado por MecanicoQuerySet.with_saldos_bonos(), o None si no se anotó."""
+        return self.__dict__.get(nombre)
+
     @property
     def saldo_bonos_pendiente(self):
         """
         Calcula el saldo total de bonos pendientes de pago.
         """
-        bonos_pendientes = BonoGenerado.objects.filter(
-            mecanico=self,
-            pagado=False
-        ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-        
-        return bonos_pendientes
+        if self._anotado('suma_bonos_pendientes') is not None:
+            return self.suma_bonos_pendientes
+
+        return BonoGenerado.objects.filter(mecanico=self).totales()['pendiente']
     
     @property
     def saldo_bonos_total(self):
         """
         Calcula el total de bonos generados (incluyendo pagados).
         """
-        bonos_totales = BonoGenerado.objects.filter(
-            mecanico=self
-        ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-        
-        return bonos_totales
+        if self._anotado('suma_bonos_total') is not None:
+            return self.suma_bonos_total
+
+        return BonoGenerado.objects.filter(mecanico=self).totales()['total']
+
+    @property
+    def saldo_bonos_pagados(self):
+        """
+        Suma de los bonos marcados como pagados.
+        """
+        if self._anotado('suma_bonos_pagados') is not None:
+            return self.suma_bonos_pagados
+
+        return BonoGenerado.objects.filter(mecanico=self).totales()['pagado']
     
     @property
     def total_pagado(self):
         """
         Calcula el total pagado al mecánico.
         """
+        if self._anotado('suma_pagos') is not None:
+            return self.suma_pagos
+
         pagos = PagoMecanico.objects.filter(
             mecanico=self
         ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
@@ -232,83 +280,57 @@ class Componente(models.Model):
             return f"{self.padre.codigo}-{slug}"
         return slug
 
-    def _update_descendant_codes(self):
-        """Propaga el nuevo código a toda la descendencia."""
-        for hijo in self.hijos.all():
-            # recalcular usando el nuevo self.codigo como base
-            hijo.codigo = f"{self.codigo}-{slugify(hijo.nombre).replace('_','-')}"
-            super(Componente, hijo).save(update_fields=['codigo'])  # guarda sin recursión extra
-            hijo._update_descendant_codes()
-
     def save(self, *args, **kwargs):
-        # Detectar si cambia padre o nombre (para decidir si propagamos)
-        old_nombre = None
-        old_parent_id = None
+        from . import arbol_componentes
+
+        # Detectar si cambia padre o código (para decidir si propagamos)
+        prev = None
         if self.pk:
-            try:
-                prev = type(self).objects.get(pk=self.pk)
-                old_parent_id = prev.padre_id
-                old_nombre = prev.nombre
-            except type(self).DoesNotExist:
-                # Si no existe el objeto anterior, es un objeto nuevo
-                pass
+            prev = type(self).objects.filter(pk=self.pk).values('padre_id', 'codigo').first()
+
+        if prev and self.padre_id and prev['padre_id'] != self.padre_id:
+            if arbol_componentes.es_descendiente(self.padre_id, self.pk):
+                raise ValueError(f"No se puede mover '{self.nombre}' dentro de uno de sus propios subcomponentes.")
 
         # Normalizar el nombre
         if self.nombre:
             self.nombre = self.nombre.lower()
-        
-        # Verificar restricción unique_together (padre, nombre)
+
+        # Restricción (padre, nombre): si ya existe se agrega un sufijo numérico
+        hermanos = Componente.objects.filter(padre_id=self.padre_id, nombre__startswith=self.nombre)
         if self.pk:
-            # Para objetos existentes, excluir el propio objeto
-            existe_nombre = Componente.objects.filter(
-                padre=self.padre, 
-                nombre=self.nombre
-            ).exclude(pk=self.pk).exists()
-        else:
-            # Para objetos nuevos, verificar si existe
-            existe_nombre = Componente.objects.filter(
-                padre=self.padre, 
-                nombre=self.nombre
-            ).exists()
-        
-        if existe_nombre:
-            # Si el nombre ya existe bajo el mismo padre, agregar un sufijo numérico
-            contador = 1
-            nombre_base = self.nombre
-            while Componente.objects.filter(
-                padre=self.padre, 
-                nombre=self.nombre
-            ).exclude(pk=self.pk if self.pk else None).exists():
-                self.nombre = f"{nombre_base}-{contador}"
-                contador += 1
-
-        # Siempre recalculamos el código antes de guardar
+            hermanos = hermanos.exclude(pk=self.pk)
+        self.nombre = arbol_componentes.primer_libre(self.nombre, set(hermanos.values_list('nombre', flat=True)))
+
+        # Siempre recalculamos el código antes de guardar (único, con sufijo si hace falta)
         nuevo_codigo = self.build_codigo()
-        
-        # Verificar si el nuevo código ya existe en otro componente
+        ocupados = Componente.objects.filter(codigo__startswith=nuevo_codigo)
         if self.pk:
-            # Para objetos existentes, excluir el propio objeto
-            existe_codigo = Componente.objects.filter(codigo=nuevo_codigo).exclude(pk=self.pk).exists()
-        else:
-            # Para objetos nuevos, verificar si existe
-            existe_codigo = Componente.objects.filter(codigo=nuevo_codigo).exists()
-        
-        if existe_codigo:
-            # Si el código ya existe, agregar un sufijo numérico
-            contador = 1
-            codigo_base = nuevo_codigo
-            while Componente.objects.filter(codigo=nuevo_codigo).exclude(pk=self.pk if self.pk else None).exists():
-                nuevo_codigo = f"{codigo_base}-{contador}"
-                contador += 1
-        
-        self.codigo = nuevo_codigo
-        
-        super().save(*args, **kwargs)
+            ocupados = ocupados.exclude(pk=self.pk)
+        self.codigo = arbol_componentes.primer_libre(nuevo_codigo, set(ocupados.values_list('codigo', flat=True)))
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if prev is None:
+                arbol_componentes.registrar(self)
+            elif prev['padre_id'] != self.padre_id:
+                arbol_componentes.mover(self)
+
+            # Si cambió el código (nombre o padre), la descendencia se recodifica en un UPDATE
+            if prev and prev['codigo'] != self.codigo:
+                arbol_componentes.recodificar_descendientes(self, prev['codigo'])
+
+    def ancestros(self, incluir_propio=False):
+        """Ancestros del más cercano a la raíz, en una consulta (tabla de cierre)."""
+        from . import arbol_componentes
+        return arbol_componentes.ancestros(self, incluir_propio)
+
+    def descendientes(self, incluir_propio=False):
+        """Toda la descendencia, en una consulta (tabla de cierre)."""
+        from . import arbol_componentes
+        return arbol_componentes.descendientes(self, incluir_propio)
 
-        # Si cambió el nombre o el padre, hay que propagar a los hijos
-        if self.pk and old_parent_id is not None and (old_parent_id != self.padre_id or old_nombre != self.nombre):
-            self._update_descendant_codes()
-    
     def eliminar_seguro(self):
         """
         Elimina el componente de forma segura usando soft delete.
@@ -342,6 +364,26 @@ class Componente(models.Model):
             return True  # Se eliminó físicamente
 
 
+class ComponenteAncestro(models.Model):
+    """
+    Tabla de cierre de la jerarquía de Componente (ver arbol_componentes.py).
+    Una fila por cada par ancestro → descendiente, incluida la del propio componente
+    (profundidad 0).
+    """
+    ancestro = models.ForeignKey(Componente, on_delete=models.CASCADE, related_name='cierre_descendientes')
+    descendiente = models.ForeignKey(Componente, on_delete=models.CASCADE, related_name='cierre_ancestros')
+    profundidad = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('ancestro', 'descendiente')
+        indexes = [
+            models.Index(fields=['descendiente', 'profundidad']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestro_id} → {self.descendiente_id} ({self.profundidad})"
+
+
 class Diagnostico(models.Model):
     ESTADOS = [
         ("pendiente", "Pendiente"),
@@ -388,48 +430,11 @@ class Diagnostico(models.Model):
     def aprobar_y_clonar(self):
         """
         Convierte un diagnóstico en un trabajo, clonando también
-        sus acciones y repuestos asociados.
+        sus acciones y repuestos asociados (en lote, ver lineas_diagnostico).
         """
-        with transaction.atomic():
-            # 🚗 Crear el trabajo
-            trabajo = Trabajo.objects.create(
-                diagnostico=self,
-                vehiculo=self.vehiculo,
-                estado="iniciado",
-                observaciones=self.descripcion_problema,
-            )
-
-            # 🔹 Clonar componentes (M2M)
-            trabajo.componentes.set(self.componentes.all())
-
-            # 🔹 Clonar Acciones asociadas
-            for dca in self.acciones_componentes.all():
-                TrabajoAccion.objects.create(
-                    trabajo=trabajo,
-                    componente=dca.componente,
-                    accion=dca.accion,
-                    precio_mano_obra=dca.precio_mano_obra,
-                    cantidad=dca.cantidad,  # Clonar cantidad también
-                    completado=False  # arranca pendiente
-                )
-
-            # 🔹 Clonar Repuestos asociados (incluyendo externos)
-            for dr in self.repuestos.all():
-                TrabajoRepuesto.objects.create(
-                    trabajo=trabajo,
-                    componente=getattr(dr, "componente", None),  # si no existe, queda None
-                    repuesto=dr.repuesto,  # Puede ser None si es externo
-                    repuesto_externo=dr.repuesto_externo,  # NUEVO: copiar repuesto externo
-                    cantidad=dr.cantidad,
-                    precio_unitario=dr.precio_unitario or 0,
-                    subtotal=dr.subtotal or 0,
-                )
-
-            # Cambiar estado del diagnóstico
-            self.estado = "aprobado"
-            self.save()
+        from .lineas_diagnostico import clonar_en_trabajo
 
-        return trabajo
+        return clonar_en_trabajo(self)
 
 
     
@@ -639,7 +644,24 @@ class Repuesto(models.Model):
         """Verifica si hay stock suficiente para la cantidad solicitada"""
         return self.stock_disponible >= cantidad
     
-    def actualizar_stock_y_precio(self, cantidad_entrada, precio_compra, precio_venta_nuevo=None, proveedor=''):
+    def precio_venta_con_margen(self, nuevo_precio_costo):
+        """
+        Precio de venta para un nuevo precio de costo: mantiene el factor de margen
+        actual (venta / costo) o aplica 30% si el repuesto no tiene stock o precios.
+        """
+        from decimal import Decimal
+
+        stock_anterior = self.stock or 0
+        precio_venta_anterior = self.precio_venta or Decimal('0')
+        precio_costo_anterior = self.precio_costo or Decimal('0')
+        if stock_anterior > 0 and precio_venta_anterior > 0 and precio_costo_anterior > 0:
+            # Aplicar el mismo factor de margen del producto existente al nuevo precio de costo
+            return nuevo_precio_costo * (precio_venta_anterior / precio_costo_anterior)
+        # Producto nuevo o sin datos anteriores: usar margen del 30% por defecto
+        return nuevo_precio_costo * Decimal('1.3')
+
+    def actualizar_stock_y_precio(self, cantidad_entrada, precio_compra, precio_venta_nuevo=None, proveedor='',
+                                  usuario=None, motivo='', referencia='', movimientos=None):
         """
         Actualiza stock y precio usando promedio ponderado con factor de margen automático
         
@@ -648,11 +670,14 @@ class Repuesto(models.Model):
             precio_compra: Precio de compra de la nueva mercancía
             precio_venta_nuevo: Precio de venta nuevo (opcional, si no se proporciona se calcula automáticamente)
             proveedor: Nombre del proveedor (opcional)
+            usuario / motivo / referencia: Datos del movimiento de stock registrado
+            movimientos: Lista para diferir el INSERT del movimiento (ver movimientos_stock)
         
         Returns:
             dict: Información del cambio realizado
         """
         from decimal import Decimal
+        from .movimientos_stock import mover_stock
         
         # Stock y precios actuales
         stock_anterior = self.stock or 0
@@ -669,24 +694,16 @@ class Repuesto(models.Model):
         if precio_venta_nuevo is not None:
             # Si se proporciona precio de venta específico, usarlo
             nuevo_precio_venta = precio_venta_nuevo
-        elif stock_anterior > 0 and precio_venta_anterior > 0 and precio_costo_anterior > 0:
-            # Calcular factor de margen del producto existente
-            factor_margen = precio_venta_anterior / precio_costo_anterior
-            
-            # Aplicar el mismo factor al nuevo precio de costo
-            nuevo_precio_venta = nuevo_precio_costo * factor_margen
         else:
-            # Producto nuevo o sin datos anteriores: usar margen del 30% por defecto
-            nuevo_precio_venta = nuevo_precio_costo * Decimal('1.3')
+            nuevo_precio_venta = self.precio_venta_con_margen(nuevo_precio_costo)
         
-        # Actualizar el repuesto
-        self.stock = nuevo_stock
-        self.precio_costo = nuevo_precio_costo
-        self.precio_venta = nuevo_precio_venta
-        self.save()
-        
-        # Sincronizar con RepuestoEnStock
-        self._sincronizar_con_stock_detallado(cantidad_entrada, precio_compra, proveedor)
+        # Stock, precios y bodega-principal en un solo movimiento del libro de stock
+        mover_stock(
+            self, cantidad_entrada, 'ingreso',
+            motivo=motivo, referencia=referencia, usuario=usuario,
+            precio_costo=nuevo_precio_costo, precio_venta=nuevo_precio_venta,
+            proveedor=proveedor, movimientos=movimientos,
+        )
         
         return {
             'stock_anterior': stock_anterior,
@@ -698,54 +715,23 @@ class Repuesto(models.Model):
             'cantidad_agregada': cantidad_entrada,
             'factor_margen_aplicado': float(nuevo_precio_venta / nuevo_precio_costo) if nuevo_precio_costo > 0 else 0
         }
-    
-    def _sincronizar_con_stock_detallado(self, cantidad_entrada, precio_compra, proveedor=''):
-        """Sincroniza con RepuestoEnStock para mantener consistencia"""
-        # 🔥 SIMPLIFICADO: Buscar SOLO por repuesto y depósito (sin proveedor como clave)
-        # Esto evita crear múltiples registros por proveedor
-        
-        # Primero, eliminar cualquier registro duplicado existente
-        registros_existentes = RepuestoEnStock.objects.filter(
-            repuesto=self,
-            deposito='bodega-principal'
-        )
-        
-        if registros_existentes.count() > 1:
-            print(f"⚠️ Encontrados {registros_existentes.count()} registros duplicados para {self.nombre}")
-            # Mantener solo el más reciente y eliminar los duplicados
-            registro_principal = registros_existentes.order_by('-id').first()
-            registros_duplicados = registros_existentes.exclude(id=registro_principal.id)
-            print(f"🗑️ Eliminando {registros_duplicados.count()} duplicados...")
-            registros_duplicados.delete()
-        
-        # 🔥 CAMBIO CLAVE: get_or_create solo por repuesto y deposito (no incluir proveedor)
-        stock_principal, created = RepuestoEnStock.objects.get_or_create(
-            repuesto=self,
-            deposito='bodega-principal',
-            defaults={
-                'stock': 0,
-                'reservado': 0,
-                'precio_compra': precio_compra,
-                'precio_venta': self.precio_venta,
-                'proveedor': proveedor  # Lo guardamos, pero no es clave de búsqueda
-            }
-        )
-        
-        if created:
-            print(f"✅ Creado nuevo registro RepuestoEnStock para {self.nombre}")
-        
-        # Actualizar el stock detallado para que coincida con el stock maestro
-        stock_principal.stock = self.stock
-        stock_principal.precio_compra = self.precio_costo
-        stock_principal.precio_venta = self.precio_venta
-        # Actualizar proveedor si viene uno nuevo (pero sin crear registro duplicado)
-        if proveedor:
-            stock_principal.proveedor = proveedor
-        stock_principal.save()
-        
-        print(f"🔄 Stock sincronizado: Repuesto.stock={self.stock} → RepuestoEnStock.stock={stock_principal.stock}")
 
 
+class RepuestoBusqueda(models.Model):
+    """
+    Documento de búsqueda desnormalizado de un repuesto.
+    Se mantiene sincronizado al guardar el Repuesto (ver busqueda_repuestos.py).
+    """
+    repuesto = models.OneToOneField(Repuesto, on_delete=models.CASCADE, primary_key=True, related_name='busqueda')
+    documento = models.TextField(blank=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Documento de Búsqueda de Repuesto"
+        verbose_name_plural = "Documentos de Búsqueda de Repuestos"
+
+    def __str__(self):
+        return f"Búsqueda {self.repuesto_id}"
 
 
 class VehiculoVersion(models.Model):
@@ -775,6 +761,77 @@ class ComponenteRepuesto(models.Model):
     class Meta:
         unique_together = ("componente", "repuesto")
 
+
+class ConversacionIA(models.Model):
+    """
+    Historial de los chats con IA (netgogo, netgogo2) por usuario.
+    Se guarda aquí y no en la sesión para que la sesión siga siendo pequeña.
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name="conversaciones_ia")
+    canal = models.CharField(max_length=30)  # 'netgogo', 'netgogo2'
+    mensajes = models.JSONField(default=list, blank=True)
+    estado = models.JSONField(default=dict, blank=True)  # datos auxiliares del canal
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("usuario", "canal")
+
+    def __str__(self):
+        return f"Conversación {self.canal} - {self.usuario}"
+
+
+class TareaSegundoPlano(models.Model):
+    """
+    Trabajo encolado para ejecutarse fuera del request (ver car/tareas.py).
+    Lo toma un proceso de `python manage.py run_worker`; la página consulta su
+    estado hasta que termina y luego muestra el resultado o descarga el archivo.
+    """
+    ESTADOS = [
+        ("pendiente", "Pendiente"),
+        ("ejecutando", "Ejecutando"),
+        ("completado", "Completado"),
+        ("error", "Error"),
+    ]
+
+    tipo = models.CharField(max_length=50)  # nombre registrado con @tarea
+    parametros = models.JSONField(default=dict, blank=True)
+    clave = models.CharField(max_length=100, blank=True, default="",
+                             help_text="Evita encolar dos veces la misma operación mientras está activa")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default="pendiente")
+    procesados = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    resultado = models.JSONField(blank=True, null=True)
+    archivo = models.FileField(upload_to="tareas/", blank=True, null=True)
+    error = models.TextField(blank=True)
+    intentos = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default="")
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    finalizado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creado']
+        verbose_name = "Tarea en segundo plano"
+        verbose_name_plural = "Tareas en segundo plano"
+        indexes = [
+            models.Index(fields=['estado', 'creado']),
+            models.Index(fields=['clave', 'estado']),
+        ]
+
+    def __str__(self):
+        return f"Tarea {self.tipo} #{self.id} ({self.estado})"
+
+    @property
+    def porcentaje(self):
+        if not self.total:
+            return 100 if self.estado == "completado" else 0
+        return int(self.procesados * 100 / self.total)
+
+    @property
+    def terminada(self):
+        return self.estado in ("completado", "error")
+
 class RepuestoAplicacion(models.Model):
     repuesto = models.ForeignKey(Repuesto, on_delete=models.CASCADE, related_name="aplicaciones")
     version = models.ForeignKey(VehiculoVersion, on_delete=models.CASCADE)
@@ -789,6 +846,43 @@ class RepuestoAplicacion(models.Model):
     class Meta:
         unique_together = ("repuesto", "version")
 
+
+class CompatibilidadRepuesto(models.Model):
+    """
+    Índice de compatibilidad repuesto ↔ vehículo (ver compatibilidad_repuestos.py).
+    Una fila general por repuesto (version=None) con sus características normalizadas
+    y una fila por cada RepuestoAplicacion con la versión y el rango de años.
+    """
+    repuesto = models.ForeignKey(Repuesto, on_delete=models.CASCADE, related_name='compatibilidades')
+    version = models.ForeignKey(VehiculoVersion, on_delete=models.CASCADE, null=True, blank=True, related_name='compatibilidades')
+    # Características del repuesto (minúsculas, sin acentos)
+    marca = models.CharField(max_length=100, blank=True)
+    motor = models.TextField(blank=True)
+    cilindrada = models.CharField(max_length=50, blank=True)
+    nro_valvulas = models.IntegerField(null=True, blank=True)
+    combustible = models.CharField(max_length=50, blank=True)
+    otro_especial = models.CharField(max_length=200, blank=True)
+    marca_general = models.BooleanField(default=False)  # 'general', 'xxx' o vacío
+    motor_general = models.BooleanField(default=False)  # 'zzzzzz' o vacío
+    # Versión de la aplicación (solo filas con version)
+    marca_version = models.CharField(max_length=80, blank=True)
+    modelo_version = models.CharField(max_length=120, blank=True)
+    anio_desde = models.IntegerField(null=True, blank=True)
+    anio_hasta = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Compatibilidad de Repuesto"
+        verbose_name_plural = "Compatibilidades de Repuestos"
+        unique_together = ('repuesto', 'version')
+        indexes = [
+            models.Index(fields=['marca_version', 'modelo_version', 'anio_desde', 'anio_hasta']),
+            models.Index(fields=['marca']),
+        ]
+
+    def __str__(self):
+        return f"{self.repuesto_id} → {self.version_id or 'general'}"
+
+
 class RepuestoEnStock(models.Model):
     repuesto = models.ForeignKey(Repuesto, on_delete=models.CASCADE, related_name='stocks')
     deposito = models.CharField(max_length=80, default='bodega-principal')  # o FK a un modelo Deposito
@@ -810,7 +904,13 @@ class RepuestoEnStock(models.Model):
         return f"{self.repuesto.nombre} (Stock: {self.stock})" 
 
 class StockMovimiento(models.Model):
-    repuesto_stock = models.ForeignKey(RepuestoEnStock, on_delete=models.CASCADE, related_name='movimientos')
+    """
+    Libro append-only de movimientos de stock (ver movimientos_stock.py).
+    Los movimientos nuevos referencian al Repuesto; repuesto_stock queda para el historial previo,
+    las reservas de diagnóstico y las ventas desde un depósito específico.
+    """
+    repuesto = models.ForeignKey(Repuesto, on_delete=models.CASCADE, null=True, blank=True, related_name='movimientos')
+    repuesto_stock = models.ForeignKey(RepuestoEnStock, on_delete=models.CASCADE, null=True, blank=True, related_name='movimientos')
     tipo = models.CharField(max_length=20, choices=(('ingreso','ingreso'),('salida','salida'),('reserva','reserva'),('liberacion','liberacion')))
     cantidad = models.IntegerField()
     motivo = models.CharField(max_length=200, blank=True)
@@ -818,6 +918,12 @@ class StockMovimiento(models.Model):
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
     fecha = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['repuesto', 'fecha']),
+            models.Index(fields=['tipo', 'fecha']),
+        ]
+
 class DiagnosticoRepuesto(models.Model):
     diagnostico = models.ForeignKey('Diagnostico', on_delete=models.CASCADE, related_name='repuestos')
     repuesto = models.ForeignKey(Repuesto, on_delete=models.PROTECT, null=True, blank=True)  # Ahora puede ser NULL
@@ -840,6 +946,68 @@ class DiagnosticoRepuesto(models.Model):
 # Trabajo (clonado desde Diagnóstico aprobado)
 # ========================
 
+class TrabajoQuerySet(models.QuerySet):
+    """QuerySet de Trabajo con totales calculados en SQL."""
+
+    def with_totales(self):
+        """
+        Anota totales financieros, abonos y conteos de avance en la misma consulta
+        (una subconsulta agregada por tabla relacionada). Las @property de Trabajo
+        usan estos valores cuando existen y evitan una consulta por fila.
+        """
+        from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Value
+        from django.db.models.functions import Coalesce
+
+        cuenta = self._cuenta
+        dinero = DecimalField(max_digits=14, decimal_places=2)
+
+        def suma(modelo, expresion, filtro=None):
+            filas = modelo.objects.filter(trabajo=OuterRef('pk'))
+            if filtro is not None:
+                filas = filas.filter(filtro)
+            subconsulta = filas.values('trabajo').annotate(total=Sum(expresion, output_field=dinero)).values('total')
+            return Coalesce(Subquery(subconsulta, output_field=dinero), Value(Decimal('0')), output_field=dinero)
+
+        mano_obra = ExpressionWrapper(F('precio_mano_obra') * F('cantidad'), output_field=dinero)
+        completado = Q(completado=True)
+
+        return self.annotate(
+            suma_mano_obra=suma(TrabajoAccion, mano_obra),
+            suma_mano_obra_realizada=suma(TrabajoAccion, mano_obra, completado),
+            suma_repuestos=suma(TrabajoRepuesto, 'subtotal'),
+            suma_repuestos_realizados=suma(TrabajoRepuesto, 'subtotal', completado),
+            suma_adicionales=suma(TrabajoAdicional, 'monto', Q(descuento=False)),
+            suma_descuentos=suma(TrabajoAdicional, 'monto', Q(descuento=True)),
+            suma_abonos=suma(TrabajoAbono, 'monto'),
+            items_total=cuenta(TrabajoAccion) + cuenta(TrabajoRepuesto),
+            items_completados=cuenta(TrabajoAccion, completado) + cuenta(TrabajoRepuesto, completado),
+        )
+
+    def with_conteos(self):
+        """Cantidad de acciones y repuestos (totales y completados) por separado, para ResumenTrabajo."""
+        from django.db.models import Q
+
+        completado = Q(completado=True)
+        return self.annotate(
+            conteo_acciones=self._cuenta(TrabajoAccion),
+            conteo_acciones_completadas=self._cuenta(TrabajoAccion, completado),
+            conteo_repuestos=self._cuenta(TrabajoRepuesto),
+            conteo_repuestos_instalados=self._cuenta(TrabajoRepuesto, completado),
+        )
+
+    @staticmethod
+    def _cuenta(modelo, filtro=None):
+        """Subconsulta COUNT de `modelo` para el trabajo de cada fila (0 si no hay)."""
+        from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+        from django.db.models.functions import Coalesce
+
+        filas = modelo.objects.filter(trabajo=OuterRef('pk'))
+        if filtro is not None:
+            filas = filas.filter(filtro)
+        subconsulta = filas.values('trabajo').annotate(total=Count('pk')).values('total')
+        return Coalesce(Subquery(subconsulta, output_field=IntegerField()), Value(0))
+
+
 class Trabajo(models.Model):
     ESTADOS = [
         ("iniciado", "Iniciado"),
@@ -861,30 +1029,44 @@ class Trabajo(models.Model):
     # 🔹 Nuevo: relacionar con componentes (igual que Diagnostico)
     componentes = models.ManyToManyField("Componente", related_name="trabajos", blank=True)
 
+    objects = TrabajoQuerySet.as_manager()
+
     def __str__(self):
         return f"Trabajo #{self.id} - {self.vehiculo}"
 
+    def _anotado(self, nombre):
+        """Valor anotado por TrabajoQuerySet.with_totales(), o None si no se anotó."""
+        return self.__dict__.get(nombre)
+
     # ========================
     # TOTALES PRESUPUESTADOS (TODO)
     # ========================
     @property
     def total_mano_obra(self):
         """Total de mano de obra presupuestada (TODAS las acciones, considerando cantidad)"""
+        if self._anotado('suma_mano_obra') is not None:
+            return self.suma_mano_obra
         return sum(a.subtotal for a in self.acciones.all())
 
     @property
     def total_repuestos(self):
         """Total de repuestos presupuestados (TODOS los repuestos)"""
+        if self._anotado('suma_repuestos') is not None:
+            return self.suma_repuestos
         return sum(r.subtotal or 0 for r in self.repuestos.all())
 
     @property
     def total_adicionales(self):
         """Total de conceptos adicionales agregados al trabajo (solo los que NO son descuentos)"""
+        if self._anotado('suma_adicionales') is not None:
+            return self.suma_adicionales
         return sum(ad.monto for ad in self.adicionales.filter(descuento=False))
 
     @property
     def total_descuentos(self):
         """Total de descuentos aplicados al trabajo"""
+        if self._anotado('suma_descuentos') is not None:
+            return self.suma_descuentos
         return sum(ad.monto for ad in self.adicionales.filter(descuento=True))
 
     @property
@@ -904,6 +1086,8 @@ class Trabajo(models.Model):
     @property
     def total_realizado_mano_obra(self):
         """Total de mano de obra REALIZADA (solo acciones completadas, considerando cantidad)"""
+        if self._anotado('suma_mano_obra_realizada') is not None:
+            return self.suma_mano_obra_realizada
         return sum(
             a.subtotal 
             for a in self.acciones.filter(completado=True)
@@ -912,6 +1096,8 @@ class Trabajo(models.Model):
     @property
     def total_realizado_repuestos(self):
         """Total de repuestos INSTALADOS (solo repuestos completados)"""
+        if self._anotado('suma_repuestos_realizados') is not None:
+            return self.suma_repuestos_realizados
         return sum(
             r.subtotal or 0 
             for r in self.repuestos.filter(completado=True)
@@ -920,12 +1106,12 @@ class Trabajo(models.Model):
     @property
     def total_realizado_adicionales(self):
         """Total de conceptos adicionales realizados (solo los que NO son descuentos)"""
-        return sum(ad.monto for ad in self.adicionales.filter(descuento=False))
+        return self.total_adicionales
     
     @property
     def total_realizado_descuentos(self):
         """Total de descuentos aplicados (siempre se consideran realizados)"""
-        return sum(ad.monto for ad in self.adicionales.filter(descuento=True))
+        return self.total_descuentos
     
     @property
     def total_realizado(self):
@@ -938,6 +1124,8 @@ class Trabajo(models.Model):
     @property
     def total_abonos(self):
         """Total de abonos/pagos parciales recibidos"""
+        if self._anotado('suma_abonos') is not None:
+            return self.suma_abonos
         return sum(abono.monto for abono in self.abonos.all())
     
     @property
@@ -956,6 +1144,11 @@ class Trabajo(models.Model):
     @property
     def porcentaje_avance(self):
         """Porcentaje de avance basado en items completados"""
+        if self._anotado('items_total') is not None:
+            if not self.items_total:
+                return 0
+            return int((self.items_completados / self.items_total) * 100)
+
         acciones_total = self.acciones.count()
         repuestos_total = self.repuestos.count()
         total_items = acciones_total + repuestos_total
@@ -1193,23 +1386,18 @@ def actualizar_stock_venta(venta):
     if not venta.pagado:
         return  # Solo actualizar stock si la venta está pagada
     
-    for item in venta.items.all():
-        # Verificar stock disponible antes de descontar
-        if not item.repuesto_stock.repuesto.tiene_stock_suficiente(item.cantidad):
-            raise ValueError(f"Stock insuficiente para {item.repuesto_stock.repuesto.nombre}")
-        
-        # Descontar stock
-        item.repuesto_stock.stock -= item.cantidad
-        item.repuesto_stock.save()
-        
-        # Registrar movimiento
-        StockMovimiento.objects.create(
-            repuesto_stock=item.repuesto_stock,
-            tipo="salida",
-            cantidad=item.cantidad,
-            motivo=f"Venta #{venta.id}",
-            usuario=venta.usuario
+    from .movimientos_stock import mover_stock, registrar_movimientos
+    
+    movimientos = []
+    for item in venta.items.select_related('repuesto_stock__repuesto'):
+        # Descuento del depósito del item, condicionado a su stock no reservado (lanza StockInsuficiente)
+        mover_stock(
+            item.repuesto_stock.repuesto, item.cantidad, 'salida',
+            motivo=f"Venta #{venta.id}", referencia=str(venta.id),
+            usuario=venta.usuario, validar=True, movimientos=movimientos,
+            deposito=item.repuesto_stock,
         )
+    registrar_movimientos(movimientos)
 
 # ========================
 # MÓDULO POS (Point of Sale)
@@ -1288,38 +1476,17 @@ def actualizar_stock_venta_pos(venta_pos):
     if not venta_pos.pagado:
         return  # Solo actualizar stock si la venta está pagada
     
-    for item in venta_pos.items.all():
-        # Verificar stock disponible antes de descontar
-        if not item.repuesto.tiene_stock_suficiente(item.cantidad):
-            raise ValueError(f"Stock insuficiente para {item.repuesto.nombre}")
-        
-        # 🔥 BÚSQUEDA CONSISTENTE: Buscar en bodega-principal
-        stock_disponible = RepuestoEnStock.objects.filter(
-            repuesto=item.repuesto,
-            deposito='bodega-principal',
-            stock__gte=item.cantidad
-        ).first()
-        
-        if stock_disponible:
-            # Descontar stock en RepuestoEnStock
-            stock_disponible.stock -= item.cantidad
-            stock_disponible.save()
-            
-            # 🔥 SINCRONIZAR: Descontar también en Repuesto.stock
-            repuesto_obj = item.repuesto
-            repuesto_obj.stock = (repuesto_obj.stock or 0) - item.cantidad
-            repuesto_obj.save()
-            
-            # Registrar movimiento
-            StockMovimiento.objects.create(
-                repuesto_stock=stock_disponible,
-                tipo="salida",
-                cantidad=item.cantidad,
-                motivo=f"Venta POS #{venta_pos.id}",
-                usuario=venta_pos.usuario
-            )
-        else:
-            raise ValueError(f"No hay stock disponible para {item.repuesto.nombre}")
+    from .movimientos_stock import mover_stock, registrar_movimientos
+    
+    movimientos = []
+    for item in venta_pos.items.select_related('repuesto'):
+        # Descuento condicionado a stock suficiente (lanza StockInsuficiente)
+        mover_stock(
+            item.repuesto, item.cantidad, 'salida',
+            motivo=f"Venta POS #{venta_pos.id}", referencia=str(venta_pos.id),
+            usuario=venta_pos.usuario, validar=True, movimientos=movimientos,
+        )
+    registrar_movimientos(movimientos)
 
 
 class ConfiguracionPOS(models.Model):
@@ -1526,15 +1693,9 @@ class AdministracionTaller(models.Model):
     
     @classmethod
     def get_configuracion_activa(cls):
-        """Obtiene la configuración activa del taller"""
-        config = cls.objects.first()
-        if not config:
-            # Crear configuración por defecto si no existe
-            config = cls.objects.create(
-                nombre_taller="Mi Taller Mecánico",
-                creado_por=None
-            )
-        return config
+        """Obtiene la configuración activa del taller (cacheada, ver cache_configuracion)"""
+        from .cache_configuracion import obtener_configuracion
+        return obtener_configuracion()
 
 
 # ========================
@@ -1571,39 +1732,69 @@ class Compra(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.numero_compra:
-            # Generar número de compra automático
-            from django.db.models import Max
-            
-            # Obtener el último número de compra
-            ultimo_numero = Compra.objects.aggregate(
-                max_numero=Max('numero_compra')
-            )['max_numero']
-            
-            if ultimo_numero:
-                try:
-                    # Extraer el número del formato COMP-0001
-                    numero_actual = int(ultimo_numero.split('-')[-1])
-                    nuevo_numero = numero_actual + 1
-                except (ValueError, IndexError):
-                    nuevo_numero = 1
-            else:
-                nuevo_numero = 1
-            
-            # Generar el número de compra
-            self.numero_compra = f"COMP-{nuevo_numero:04d}"
-        
+            # Número correlativo sin saltos: se toma de la secuencia dentro de la misma
+            # transacción que inserta la compra (si falla, el número no se consume)
+            with transaction.atomic():
+                numero = SecuenciaNumeracion.siguiente('compra', inicial=_ultimo_numero_compra)
+                self.numero_compra = f"COMP-{numero:04d}"
+                super().save(*args, **kwargs)
+            return
+
         super().save(*args, **kwargs)
     
     def calcular_total(self):
-        """Calcula el total de la compra sumando todos los items"""
+        """Calcula el total de la compra sumando todos los items (un aggregate y un UPDATE)"""
         total = self.items.aggregate(
             total=models.Sum(models.F('cantidad') * models.F('precio_unitario'))
         )['total'] or 0
         self.total = total
-        self.save(update_fields=['total'])
+        Compra.objects.filter(pk=self.pk).update(total=total)
         return total
 
 
+def _ultimo_numero_compra():
+    """Valor inicial de la secuencia 'compra': el mayor COMP-NNNN existente."""
+    ultimo = 0
+    for numero in Compra.objects.filter(numero_compra__startswith='COMP-').values_list('numero_compra', flat=True):
+        try:
+            ultimo = max(ultimo, int(numero.split('-')[-1]))
+        except (ValueError, IndexError):
+            continue
+    return ultimo
+
+
+class SecuenciaNumeracion(models.Model):
+    """
+    Contadores correlativos sin saltos (números de compra, etc.).
+    La fila se bloquea con SELECT ... FOR UPDATE mientras dura la transacción que usa el número.
+    """
+    nombre = models.CharField(max_length=50, unique=True)
+    ultimo = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Secuencia de Numeración"
+        verbose_name_plural = "Secuencias de Numeración"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ultimo}"
+
+    @classmethod
+    def siguiente(cls, nombre, inicial=None):
+        """
+        Devuelve el siguiente número de la secuencia. Debe llamarse dentro de la transacción
+        que guarda el registro numerado, para que un rollback devuelva el número.
+        `inicial` (callable) calcula el último número usado cuando la secuencia todavía no existe.
+        """
+        with transaction.atomic():
+            secuencia = cls.objects.select_for_update().filter(nombre=nombre).first()
+            if secuencia is None:
+                cls.objects.get_or_create(nombre=nombre, defaults={'ultimo': inicial() if inicial else 0})
+                secuencia = cls.objects.select_for_update().get(nombre=nombre)
+            secuencia.ultimo += 1
+            secuencia.save(update_fields=['ultimo'])
+            return secuencia.ultimo
+
+
 class CompraItem(models.Model):
     """Items de una compra"""
     compra = models.ForeignKey(Compra, on_delete=models.CASCADE, related_name='items')
@@ -1623,65 +1814,30 @@ class CompraItem(models.Model):
         return f"{self.repuesto.nombre} - {self.cantidad} unidades"
     
     def save(self, *args, **kwargs):
+        from .compras import programar_total
+
         # Calcular subtotal automáticamente
         self.subtotal = self.cantidad * self.precio_unitario
         super().save(*args, **kwargs)
         
-        # Actualizar total de la compra
-        self.compra.calcular_total()
+        # Actualizar total de la compra (una vez por transacción, al confirmar)
+        programar_total(self.compra_id)
+
+    def delete(self, *args, **kwargs):
+        from .compras import programar_total
+
+        compra_id = self.compra_id
+        resultado = super().delete(*args, **kwargs)
+        programar_total(compra_id)
+        return resultado
     
     def recibir_item(self, usuario=None):
-        """Marca el item como recibido y actualiza el stock usando precio promedio ponderado"""
+        """Marca el item como recibido y actualiza stock y precios (ver compras.recibir_items)"""
         if not self.recibido:
-            print(f"\n{'='*80}")
-            print(f"📦 RECIBIENDO COMPRA - Item: {self.repuesto.nombre} x{self.cantidad}")
-            print(f"{'='*80}")
-            
-            self.recibido = True
-            self.fecha_recibido = now()
-            self.save()
-            print(f"✅ Item marcado como recibido")
-            
-            # Actualizar stock del repuesto usando el nuevo sistema unificado
-            repuesto = self.repuesto
-            print(f"📊 Stock ANTES de actualizar:")
-            print(f"   - Repuesto.stock: {repuesto.stock}")
-            
-            # Usar el nuevo método de actualización con precio promedio ponderado
-            # Este método YA sincroniza con RepuestoEnStock internamente
-            resultado = repuesto.actualizar_stock_y_precio(
-                cantidad_entrada=self.cantidad,
-                precio_compra=self.precio_unitario,
-                proveedor=self.compra.proveedor
-            )
-            
-            print(f"📊 Stock DESPUÉS de actualizar:")
-            print(f"   - Stock anterior: {resultado['stock_anterior']}")
-            print(f"   - Stock nuevo: {resultado['stock_nuevo']}")
-            print(f"   - Precio costo: ${resultado['precio_costo_nuevo']}")
-            print(f"   - Precio venta: ${resultado['precio_venta_nuevo']}")
-            
-            # Crear movimiento de stock para auditoría
-            # 🔥 SIMPLIFICADO: Solo buscar por repuesto y deposito (ya sincronizado arriba)
-            stock_principal = RepuestoEnStock.objects.filter(
-                repuesto=self.repuesto,
-                deposito='bodega-principal'
-            ).first()
-            
-            if stock_principal:
-                StockMovimiento.objects.create(
-                    repuesto_stock=stock_principal,
-                    tipo='entrada',
-                    cantidad=self.cantidad,
-                    motivo=f'Compra #{self.compra.numero_compra}',
-                    referencia=f'COMPRA-{self.compra.id}',
-                    usuario=usuario
-                )
-                print(f"📝 Movimiento de stock registrado")
-            else:
-                print(f"⚠️ No se encontró RepuestoEnStock para registrar movimiento")
-            
-            print(f"{'='*80}\n")
+            from .compras import recibir_items
+
+            recibir_items(self.compra, usuario=usuario, item_ids=[self.pk])
+            self.refresh_from_db(fields=['recibido', 'fecha_recibido'])
 
 
 # ========================
@@ -2124,6 +2280,48 @@ class ResumenTrabajo(models.Model):
         return f"Trabajo #{self.trabajo_id} - {self.vehiculo_placa} - {estado_texto}"
 
 
+class EstadisticaAcumulada(models.Model):
+    """
+    Estadísticas pre-agregadas para la página de estadísticas de trabajos.
+    Se acumulan al registrar eventos de auditoría (ver estadisticas.py) y se
+    regeneran por completo con el comando reconstruir_estadisticas.
+
+    Cada fila es un contador por (periodo, inicio, dimensión, clave):
+    - periodo 'dia' / 'semana': inicio es la fecha del día o el lunes de la semana
+    - periodo 'total': acumulado histórico (inicio fijo)
+    """
+    PERIODO_CHOICES = [
+        ('dia', 'Día'),
+        ('semana', 'Semana'),
+        ('total', 'Total'),
+    ]
+
+    periodo = models.CharField(max_length=10, choices=PERIODO_CHOICES)
+    inicio = models.DateField()
+    dimension = models.CharField(max_length=20)  # estado, etapa, ingreso, entrega, accion, componente, repuesto...
+    clave = models.CharField(max_length=60)
+    nombre = models.CharField(max_length=200, blank=True, default='')
+    detalle = models.CharField(max_length=200, blank=True, default='')  # componente del par, sku del repuesto
+
+    cantidad = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    trabajos = models.IntegerField(default=0)
+    monto_mano_obra = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    monto_repuestos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    duracion = models.FloatField(default=0)  # días (etapa) u horas (respuesta) acumulados
+
+    class Meta:
+        verbose_name = "Estadística Acumulada"
+        verbose_name_plural = "Estadísticas Acumuladas"
+        unique_together = ('periodo', 'inicio', 'dimension', 'clave')
+        indexes = [
+            models.Index(fields=['dimension', 'periodo', 'inicio']),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}:{self.clave} {self.periodo} {self.inicio} ({self.cantidad})"
+
+
 # ========================
 # SISTEMA DE BONOS E INCENTIVOS PARA MECÁNICOS
 # ========================
@@ -2241,6 +2439,50 @@ class ExcepcionBonoTrabajo(models.Model):
         return f"Excepción - Trabajo #{self.trabajo.id}"
 
 
+class BonoGeneradoQuerySet(models.QuerySet):
+    """QuerySet de BonoGenerado con los totales del libro de bonos."""
+
+    def totales(self):
+        """
+        Total, pagado, pendiente y cantidad de los bonos del queryset con una sola
+        consulta (SUM condicionales).
+        """
+        from django.db.models import Count, Q
+
+        # Los alias no pueden llamarse 'pagado' (chocaría con el campo del filtro)
+        fila = self.aggregate(
+            suma_total=Sum('monto'),
+            suma_pagado=Sum('monto', filter=Q(pagado=True)),
+            suma_pendiente=Sum('monto', filter=Q(pagado=False)),
+            cantidad=Count('pk'),
+        )
+        return self._totales_de(fila)
+
+    def totales_por_mecanico(self):
+        """
+        {mecanico_id: totales} de los bonos del queryset con un solo GROUP BY
+        (mismas claves que totales()).
+        """
+        from django.db.models import Count, Q
+
+        filas = self.order_by().values('mecanico_id').annotate(
+            suma_total=Sum('monto'),
+            suma_pagado=Sum('monto', filter=Q(pagado=True)),
+            suma_pendiente=Sum('monto', filter=Q(pagado=False)),
+            cantidad=Count('pk'),
+        )
+        return {fila['mecanico_id']: self._totales_de(fila) for fila in filas}
+
+    @staticmethod
+    def _totales_de(fila):
+        return {
+            'total': fila['suma_total'] or Decimal('0'),
+            'pagado': fila['suma_pagado'] or Decimal('0'),
+            'pendiente': fila['suma_pendiente'] or Decimal('0'),
+            'cantidad': fila['cantidad'],
+        }
+
+
 class BonoGenerado(models.Model):
     """
     Historial de bonos generados cuando se entrega un trabajo.
@@ -2307,6 +2549,8 @@ class BonoGenerado(models.Model):
         verbose_name="Período Cerrado",
         help_text="Indica si este bono pertenece a un período cerrado"
     )
+
+    objects = BonoGeneradoQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Bono Generado"
@@ -2429,18 +2673,10 @@ class PagoMecanico(models.Model):
         """
         super().save(*args, **kwargs)
         
-        # Marcar bonos como pagados
+        # Marcar bonos como pagados (un solo UPDATE, ver bonos.aplicar_pago)
         if self.pk:
-            bonos = self.bonos_aplicados.all()
-            for bono in bonos:
-                bono.pagado = True
-                bono.fecha_pago = self.fecha_pago
-                # Sincronizar período del pago al bono si no tiene período
-                if not bono.periodo_mes or not bono.periodo_anio:
-                    if self.periodo_mes and self.periodo_anio:
-                        bono.periodo_mes = self.periodo_mes
-                        bono.periodo_anio = self.periodo_anio
-                bono.save()
+            from .bonos import aplicar_pago
+            aplicar_pago(self)
 
 
 class CierrePeriodo(models.Model):
@@ -2531,22 +2767,12 @@ class CierrePeriodo(models.Model):
             periodo_anio=self.periodo_anio
         )
         
-        self.total_bonos = bonos_periodo.aggregate(
-            total=Sum('monto')
-        )['total'] or Decimal('0')
-        
         # Total pagado: suma de bonos marcados como pagados (no de pagos registrados)
         # Esto es consistente con el cálculo en la vista cuenta_mecanico
-        bonos_pagados = bonos_periodo.filter(pagado=True)
-        self.total_pagado = bonos_pagados.aggregate(
-            total=Sum('monto')
-        )['total'] or Decimal('0')
-        
-        # Saldo pendiente
-        bonos_pendientes = bonos_periodo.filter(pagado=False)
-        self.saldo_pendiente = bonos_pendientes.aggregate(
-            total=Sum('monto')
-        )['total'] or Decimal('0')
+        totales = bonos_periodo.totales()
+        self.total_bonos = totales['total']
+        self.total_pagado = totales['pagado']
+        self.saldo_pendiente = totales['pendiente']
         
         self.save()
     
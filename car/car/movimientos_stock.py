@@ -0,0 +1,243 @@
+"""
+Libro de movimientos de stock (única vía de escritura del stock).
+
+Repuesto.stock es el stock autoritativo. Cada mutación pasa por mover_stock(), que:
+
+1. Aplica un UPDATE atómico con F() sobre Repuesto (condicionado a stock >= n
+   cuando se valida disponibilidad), sin leer la fila antes ni llamar a save().
+2. Refleja el mismo delta en una fila de RepuestoEnStock con otro UPDATE F(), para
+   las pantallas que todavía leen esa tabla: la del depósito indicado (ventas) o la
+   de 'bodega-principal'. Con depósito y validación el UPDATE exige además
+   stock - reservado >= n, así no se vende lo reservado por diagnósticos.
+3. Agrega un StockMovimiento (append-only), inmediato o diferido para bulk_create.
+
+Los tres pasos van en una transacción: si uno falla no queda stock movido sin su
+movimiento en el libro.
+
+No hay get_or_create, limpieza de duplicados ni saves encadenados en el camino normal.
+"""
+from django.db import transaction
+from django.db.models import F, Subquery
+
+from .models import Repuesto, RepuestoEnStock, StockMovimiento
+
+DEPOSITO_PRINCIPAL = 'bodega-principal'
+
+TIPOS_ENTRADA = ('ingreso',)
+TIPOS_SALIDA = ('salida',)
+
+
+class StockInsuficiente(ValueError):
+    """No hay stock suficiente para descontar la cantidad solicitada."""
+
+    def __init__(self, repuesto, cantidad, disponible=None):
+        self.repuesto = repuesto
+        self.cantidad = cantidad
+        if disponible is None:
+            disponible = repuesto.stock or 0
+        super().__init__(
+            f"Stock insuficiente para {repuesto.nombre}. "
+            f"Disponible: {disponible}, Solicitado: {cantidad}"
+        )
+
+
+def _reflejar_en_deposito(repuesto, delta, precio_costo=None, precio_venta=None, proveedor='',
+                          deposito=None, validar=False):
+    """
+    Aplica el delta a la fila `deposito` (RepuestoEnStock) o, sin ella, a la más reciente
+    de bodega-principal (la crea si falta). Devuelve False si `validar` y la fila no
+    tenía stock - reservado suficiente para la salida.
+    """
+    cambios = {'stock': F('stock') + delta}
+    if precio_costo is not None:
+        cambios['precio_compra'] = precio_costo
+    if precio_venta is not None:
+        cambios['precio_venta'] = precio_venta
+    if proveedor:
+        cambios['proveedor'] = proveedor
+
+    if deposito is not None:
+        filas = RepuestoEnStock.objects.filter(pk=deposito.pk)
+        if validar and delta < 0:
+            filas = filas.filter(stock__gte=F('reservado') - delta)
+        return bool(filas.update(**cambios))
+
+    fila = RepuestoEnStock.objects.filter(
+        repuesto_id=repuesto.pk, deposito=DEPOSITO_PRINCIPAL
+    ).order_by('-id').values('pk')[:1]
+    if RepuestoEnStock.objects.filter(pk=Subquery(fila)).update(**cambios):
+        return True
+
+    # Primera vez: crear la fila con el stock autoritativo ya actualizado
+    stock_actual = Repuesto.objects.filter(pk=repuesto.pk).values_list('stock', flat=True).get()
+    RepuestoEnStock.objects.create(
+        repuesto_id=repuesto.pk,
+        deposito=DEPOSITO_PRINCIPAL,
+        proveedor=proveedor,
+        stock=stock_actual,
+        reservado=0,
+        precio_compra=precio_costo if precio_costo is not None else repuesto.precio_costo,
+        precio_venta=precio_venta if precio_venta is not None else repuesto.precio_venta,
+    )
+    return True
+
+
+def mover_stock(repuesto, cantidad, tipo, motivo='', referencia='', usuario=None,
+                validar=False, precio_costo=None, precio_venta=None, proveedor='',
+                movimientos=None, deposito=None):
+    """
+    Aplica un movimiento de stock sobre un repuesto.
+
+    Args:
+        repuesto: Repuesto afectado (su atributo stock se ajusta en memoria)
+        cantidad: Cantidad positiva a mover
+        tipo: 'ingreso' suma, 'salida' resta
+        validar: Si es True, una salida sin stock suficiente lanza StockInsuficiente
+            (con `deposito`, también si supera su stock - reservado)
+        precio_costo / precio_venta / proveedor: Se actualizan en el mismo UPDATE (compras)
+        movimientos: Lista donde acumular el StockMovimiento sin guardarlo, para
+            registrarlos después con registrar_movimientos() (un solo INSERT)
+        deposito: RepuestoEnStock de donde sale o entra el stock (p. ej. el elegido en
+            una venta); por defecto, la fila de bodega-principal
+
+    Returns:
+        StockMovimiento: El movimiento creado (o pendiente si se pasó `movimientos`)
+    """
+    if tipo in TIPOS_ENTRADA:
+        delta = cantidad
+    elif tipo in TIPOS_SALIDA:
+        delta = -cantidad
+    else:
+        raise ValueError(f"Tipo de movimiento no soporta cambio de stock: {tipo}")
+
+    filas = Repuesto.objects.filter(pk=repuesto.pk)
+    if validar and delta < 0:
+        filas = filas.filter(stock__gte=cantidad)
+
+    cambios = {'stock': F('stock') + delta}
+    if precio_costo is not None:
+        cambios['precio_costo'] = precio_costo
+    if precio_venta is not None:
+        cambios['precio_venta'] = precio_venta
+
+    with transaction.atomic():
+        if not filas.update(**cambios):
+            raise StockInsuficiente(repuesto, cantidad)
+
+        if not _reflejar_en_deposito(
+            repuesto, delta, precio_costo, precio_venta, proveedor, deposito=deposito, validar=validar
+        ):
+            # Revierte también el UPDATE de Repuesto (sale del atomic con la excepción)
+            disponible = RepuestoEnStock.objects.filter(pk=deposito.pk).values_list(
+                F('stock') - F('reservado'), flat=True
+            ).first()
+            raise StockInsuficiente(repuesto, cantidad, disponible=disponible or 0)
+
+        movimiento = StockMovimiento(
+            repuesto=repuesto,
+            repuesto_stock=deposito,
+            tipo=tipo,
+            cantidad=cantidad,
+            motivo=motivo,
+            referencia=referencia,
+            usuario=usuario,
+        )
+        if movimientos is None:
+            movimiento.save()
+        else:
+            movimientos.append(movimiento)
+
+    # Mantener las instancias coherentes para quien las siga usando en la vista
+    repuesto.stock = (repuesto.stock or 0) + delta
+    if deposito is not None:
+        deposito.stock = (deposito.stock or 0) + delta
+    if precio_costo is not None:
+        repuesto.precio_costo = precio_costo
+    if precio_venta is not None:
+        repuesto.precio_venta = precio_venta
+    return movimiento
+
+
+def registrar_movimientos(movimientos):
+    """Inserta en un solo INSERT los movimientos acumulados por mover_stock()."""
+    if movimientos:
+        StockMovimiento.objects.bulk_create(movimientos)
+
+
+def igualar_deposito(repuesto, proveedor=''):
+    """
+    Copia stock y precios del Repuesto a su fila de bodega-principal.
+    Se usa tras editar el repuesto en el formulario; no toca el libro de movimientos.
+    """
+    fila = RepuestoEnStock.objects.filter(
+        repuesto_id=repuesto.pk, deposito=DEPOSITO_PRINCIPAL
+    ).order_by('-id').values('pk')[:1]
+    valores = {
+        'stock': repuesto.stock or 0,
+        'precio_compra': repuesto.precio_costo or 0,
+        'precio_venta': repuesto.precio_venta or 0,
+    }
+    if not RepuestoEnStock.objects.filter(pk=Subquery(fila)).update(**valores):
+        RepuestoEnStock.objects.create(
+            repuesto_id=repuesto.pk, deposito=DEPOSITO_PRINCIPAL,
+            proveedor=proveedor, reservado=0, **valores
+        )
+
+
+def conciliar_depositos():
+    """
+    Reparación única con consultas por conjunto:
+    - elimina filas duplicadas de bodega-principal (se conserva la más reciente),
+    - crea las filas faltantes,
+    - iguala su stock al de Repuesto,
+    - completa StockMovimiento.repuesto en movimientos antiguos.
+
+    Returns:
+        dict: Cantidad de filas afectadas por cada paso
+    """
+    from django.db import transaction
+    from django.db.models import Max, OuterRef
+
+    from .models import DiagnosticoRepuesto, VentaItem
+
+    resultado = {}
+    with transaction.atomic():
+        principales = RepuestoEnStock.objects.filter(deposito=DEPOSITO_PRINCIPAL)
+        ultimas = principales.values('repuesto_id').annotate(ultima=Max('id')).values('ultima')
+        # Los movimientos antiguos apuntan a filas que se van a borrar: rescatar el repuesto antes
+        resultado['movimientos'] = StockMovimiento.objects.filter(
+            repuesto__isnull=True, repuesto_stock__isnull=False
+        ).update(repuesto_id=Subquery(
+            RepuestoEnStock.objects.filter(pk=OuterRef('repuesto_stock_id')).values('repuesto_id')[:1]
+        ))
+        duplicadas = principales.exclude(id__in=Subquery(ultimas))
+        # Reapuntar ventas, diagnósticos y movimientos a la fila que se conserva
+        conservada = principales.filter(
+            repuesto_id=Subquery(
+                RepuestoEnStock.objects.filter(pk=OuterRef(OuterRef('repuesto_stock_id'))).values('repuesto_id')[:1]
+            )
+        ).order_by('-id').values('id')[:1]
+        for modelo in (StockMovimiento, DiagnosticoRepuesto, VentaItem):
+            modelo.objects.filter(repuesto_stock__in=duplicadas).update(repuesto_stock_id=Subquery(conservada))
+        _, borrados = duplicadas.delete()
+        resultado['duplicados'] = borrados.get(RepuestoEnStock._meta.label, 0)
+
+        faltantes = Repuesto.objects.exclude(
+            pk__in=principales.values('repuesto_id')
+        ).only('pk', 'stock', 'precio_costo', 'precio_venta')
+        nuevas = [
+            RepuestoEnStock(
+                repuesto_id=r.pk, deposito=DEPOSITO_PRINCIPAL, proveedor='', reservado=0,
+                stock=r.stock or 0, precio_compra=r.precio_costo or 0,
+                precio_venta=r.precio_venta or 0,
+            )
+            for r in faltantes.iterator()
+        ]
+        RepuestoEnStock.objects.bulk_create(nuevas, batch_size=500)
+        resultado['creados'] = len(nuevas)
+
+        stock_real = Repuesto.objects.filter(pk=OuterRef('repuesto_id')).values('stock')[:1]
+        resultado['igualados'] = principales.exclude(
+            stock=Subquery(stock_real)
+        ).update(stock=Subquery(stock_real))
+    return resultado
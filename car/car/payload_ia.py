@@ -0,0 +1,304 @@
+"""
+Resultado de las herramientas de Netgogo en el formato que se le manda al modelo.
+
+Los listado_*_data devuelven filas completas como dicts anidados (y listado_inventario
+llegaba a traer todo el catálogo): cada nombre de campo se repetía en cada fila, el
+prompt crecía con la tabla y con él la latencia y el costo de cada turno. Aquí el
+resultado se reescribe solo para el modelo (la vista y el navegador siguen recibiendo
+el dict original):
+
+- Tabla columnar: cada lista de dicts pasa a {"columnas": [...], "filas": [[...]]}.
+  Los dicts anidados se aplanan ("vehiculo.placa"), las listas de dicts dentro de
+  una fila (acciones, repuestos...) guardan sus columnas una sola vez en
+  "subcolumnas", los "N/A"/vacíos quedan en null, las columnas siempre vacías se
+  quitan y las de valor único pasan a "constantes". Los textos largos se cortan.
+- Resumen calculado aquí y no por el modelo: cantidad de filas, suma/mín/máx de las
+  columnas numéricas y conteo por valor de las categóricas (estado, marca...), sobre
+  todas las filas aunque no se muestren.
+- Presupuesto: estimar_tokens() aproxima los tokens del JSON (caracteres /
+  PAYLOAD_IA_CARACTERES_POR_TOKEN); si el resultado pasa PAYLOAD_IA_MAX_TOKENS se
+  muestran las primeras filas que caben y el resto queda en la caché bajo un
+  "cursor". El modelo pide la siguiente página con la herramienta siguiente_pagina,
+  que puede llegar a otro worker: la caché (PAYLOAD_IA_CURSOR_CACHE) tiene que ser
+  compartida. Si es local del proceso no se entregan cursores y la tabla solo indica
+  cuántas filas quedaron fuera.
+"""
+import datetime
+import json
+import logging
+import math
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+CLAVE_CURSOR = 'payload_ia:cursor:{cursor}'
+
+VACIOS = ('', 'N/A', 'n/a', 'Sin especificar')
+MAX_CATEGORIAS = 8  # columnas de texto con más valores distintos no se resumen por conteo
+
+
+def _cache():
+    return caches[getattr(settings, 'PAYLOAD_IA_CURSOR_CACHE', 'default')]
+
+
+def _cursores_compartidos():
+    """Con una caché por proceso un cursor creado en un worker no existe en los demás."""
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def _max_tokens():
+    return getattr(settings, 'PAYLOAD_IA_MAX_TOKENS', 2500)
+
+
+def _serializar(valor):
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def estimar_tokens(valor):
+    """Tokens aproximados del JSON compacto de `valor` (sin tokenizador: caracteres / razón)."""
+    caracteres = len(valor) if isinstance(valor, str) else len(_serializar(valor))
+    return math.ceil(caracteres / getattr(settings, 'PAYLOAD_IA_CARACTERES_POR_TOKEN', 4))
+
+
+# ========================
+# TABLAS COLUMNARES
+# ========================
+
+def _es_tabla(valor):
+    return isinstance(valor, list) and bool(valor) and all(isinstance(v, dict) for v in valor)
+
+
+def _aplanar(fila, prefijo=''):
+    """{"vehiculo": {"placa": X}} -> {"vehiculo.placa": X} (las listas quedan como están)."""
+    plana = {}
+    for clave, valor in fila.items():
+        if isinstance(valor, dict):
+            plana.update(_aplanar(valor, f"{prefijo}{clave}."))
+        else:
+            plana[f"{prefijo}{clave}"] = valor
+    return plana
+
+
+def _columnas(filas):
+    """Unión de las claves de las filas, en orden de aparición."""
+    columnas = {}
+    for fila in filas:
+        columnas.update(dict.fromkeys(fila))
+    return list(columnas)
+
+
+def _valor(valor):
+    """Celda lista para JSON: vacíos a null, números y fechas simples, textos acotados."""
+    if isinstance(valor, str):
+        valor = valor.strip()
+        if valor in VACIOS:
+            return None
+        max_texto = getattr(settings, 'PAYLOAD_IA_MAX_TEXTO', 200)
+        return valor if len(valor) <= max_texto else valor[:max_texto] + '…'
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, (list, tuple)):
+        return [_valor(v) for v in valor] or None
+    return valor
+
+
+def _es_numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def _es_id(columna):
+    nombre = columna.rsplit('.', 1)[-1]
+    return nombre == 'id' or nombre.endswith('_id')
+
+
+def _resumen(filas, columnas, subcolumnas):
+    """Agregados de la tabla completa; el modelo no necesita sumar fila por fila."""
+    resumen = {'filas': len(filas)}
+    numericas, categorias, items = {}, {}, {}
+    for i, columna in enumerate(columnas):
+        valores = [fila[i] for fila in filas if fila[i] is not None]
+        if not valores:
+            continue
+        if columna in subcolumnas:
+            items[columna] = sum(len(v) for v in valores if isinstance(v, list))
+        elif all(_es_numero(v) for v in valores) and not _es_id(columna):
+            numericas[columna] = {
+                'suma': round(sum(valores), 2),
+                'min': min(valores),
+                'max': max(valores),
+            }
+        elif all(isinstance(v, (str, bool)) for v in valores):
+            conteo = {}
+            for v in valores:
+                conteo[str(v)] = conteo.get(str(v), 0) + 1
+            if len(conteo) <= MAX_CATEGORIAS and len(conteo) < len(valores):
+                categorias[columna] = dict(sorted(conteo.items(), key=lambda par: -par[1]))
+    if numericas:
+        resumen['numericas'] = numericas
+    if categorias:
+        resumen['por_valor'] = categorias
+    if items:
+        resumen['items'] = items
+    return resumen
+
+
+def tabla(registros):
+    """
+    Lista de dicts -> tabla columnar completa (todas las filas, sin presupuesto):
+    {"columnas", "filas", "subcolumnas"?, "constantes"?, "resumen"}.
+    """
+    planas = [_aplanar(r) for r in registros]
+    columnas = _columnas(planas)
+
+    subcolumnas = {}
+    for columna in columnas:
+        anidadas = [
+            _aplanar(sub) for fila in planas if _es_tabla(fila.get(columna))
+            for sub in fila[columna]
+        ]
+        if anidadas:
+            subcolumnas[columna] = _columnas(anidadas)
+
+    def celda(fila, columna):
+        valor = fila.get(columna)
+        if columna in subcolumnas and isinstance(valor, list):
+            return [
+                [_valor(sub.get(c)) for c in subcolumnas[columna]]
+                for sub in map(_aplanar, (v for v in valor if isinstance(v, dict)))
+            ] or None
+        return _valor(valor)
+
+    filas = [[celda(fila, c) for c in columnas] for fila in planas]
+
+    # Columnas siempre vacías fuera; las de un único valor, una sola vez en "constantes"
+    constantes = {}
+    quedan = []
+    for i, columna in enumerate(columnas):
+        valores = {_serializar(fila[i]) for fila in filas}
+        if valores == {'null'}:
+            continue
+        if len(filas) > 1 and len(valores) == 1 and columna not in subcolumnas:
+            constantes[columna] = filas[0][i]
+            continue
+        quedan.append(i)
+    columnas = [columnas[i] for i in quedan]
+    filas = [[fila[i] for i in quedan] for fila in filas]
+    subcolumnas = {c: v for c, v in subcolumnas.items() if c in columnas}
+
+    resultado = {'columnas': columnas, 'filas': filas}
+    if subcolumnas:
+        resultado['subcolumnas'] = subcolumnas
+    if constantes:
+        resultado['constantes'] = constantes
+    if len(filas) > 1:
+        resultado['resumen'] = _resumen(filas, columnas, subcolumnas)
+    return resultado
+
+
+# ========================
+# PRESUPUESTO Y CURSORES
+# ========================
+
+def _filas_que_caben(filas, presupuesto):
+    """Cuántas filas del inicio caben en `presupuesto` tokens (al menos una)."""
+    usados = 0
+    for n, fila in enumerate(filas):
+        usados += estimar_tokens(fila) + 1  # la coma que las separa
+        if usados > presupuesto:
+            return max(1, n)
+    return len(filas)
+
+
+def _guardar_cursor(nombre, plantilla, filas, mostradas):
+    cursor = secrets.token_urlsafe(9)
+    _cache().set(
+        CLAVE_CURSOR.format(cursor=cursor),
+        {'nombre': nombre, 'plantilla': plantilla, 'filas': filas, 'mostradas': mostradas},
+        getattr(settings, 'PAYLOAD_IA_CURSOR_TIMEOUT', 1800),
+    )
+    return cursor
+
+
+def _paginar(nombre, datos, presupuesto, mostradas=0):
+    """Deja en `datos` las filas que caben en el presupuesto y un cursor para el resto."""
+    filas = datos['filas']
+    n = _filas_que_caben(filas, presupuesto)
+    if n >= len(filas):
+        return
+    plantilla = {k: v for k, v in datos.items() if k in ('columnas', 'subcolumnas', 'constantes')}
+    datos['filas'] = filas[:n]
+    datos['desde'] = mostradas + 1
+    datos['filas_restantes'] = len(filas) - n
+    if _cursores_compartidos():
+        datos['cursor'] = _guardar_cursor(nombre, plantilla, filas[n:], mostradas + n)
+    else:
+        datos['nota'] = "Para ver el resto usa un filtro más específico o un límite menor."
+
+
+def _compactar_valor(valor, tablas, ruta):
+    if _es_tabla(valor):
+        datos = tabla(valor)
+        tablas.append((ruta, datos))
+        return datos
+    if isinstance(valor, dict):
+        return {k: _compactar_valor(v, tablas, k) for k, v in valor.items()}
+    return _valor(valor)
+
+
+def compactar(result):
+    """
+    Resultado de una herramienta -> versión compacta para el modelo (tablas
+    columnares, resumen y, si no cabe en PAYLOAD_IA_MAX_TOKENS, paginado con cursor).
+    Los errores y los resultados ya compactos se devuelven tal cual.
+    """
+    if not isinstance(result, dict) or result.get('compacto') or result.get('success') is False:
+        return result
+
+    tablas = []
+    compacto = _compactar_valor(result, tablas, 'result')
+    if not tablas:
+        return result
+    compacto['compacto'] = True
+
+    presupuesto = _max_tokens()
+    total = estimar_tokens(compacto)
+    if total > presupuesto:
+        # Lo que no son filas (escalares, columnas, resúmenes) se manda siempre;
+        # el resto del presupuesto se reparte entre las tablas según su tamaño
+        tamanos = [estimar_tokens(datos['filas']) for _, datos in tablas]
+        base = total - sum(tamanos)
+        disponible = max(presupuesto - base, 0)
+        for (nombre, datos), tamano in zip(tablas, tamanos):
+            _paginar(nombre, datos, disponible * tamano / max(sum(tamanos), 1))
+        logger.info(f"📦 Resultado de ~{total} tokens recortado a ~{estimar_tokens(compacto)} (presupuesto {presupuesto})")
+    return compacto
+
+
+def pagina(cursor):
+    """Siguiente página de una tabla recortada por compactar() (o error si el cursor ya no existe)."""
+    guardado = _cache().get(CLAVE_CURSOR.format(cursor=cursor or ''))
+    if guardado is None:
+        return {
+            "error": "El cursor no existe o expiró. Vuelve a ejecutar el listado original.",
+            "success": False
+        }
+    nombre = guardado['nombre']
+    datos = dict(guardado['plantilla'], filas=guardado['filas'])
+    _paginar(nombre, datos, _max_tokens() - estimar_tokens(guardado['plantilla']), guardado['mostradas'])
+    datos.setdefault('desde', guardado['mostradas'] + 1)
+    return {"compacto": True, "tabla": nombre, nombre: datos}
+
+
+def salida_para_modelo(result):
+    """JSON del function_call_output: {"result": <resultado compacto>}."""
+    return _serializar({"result": compactar(result)})
@@ -0,0 +1,239 @@
+"""
+Pizarra en vivo: feed de cambios de los trabajos en vez de recargar la página.
+
+pizarra_view y panel_principal arman las cuatro columnas (iniciado, trabajando,
+completado, entregado) una vez; después la pantalla consulta `pizarra/cambios/`
+y solo redibuja las tarjetas que cambiaron.
+
+- Los signals de Trabajo, TrabajoAccion y TrabajoRepuesto llaman a marcar_cambio();
+  al confirmar la transacción publicar() avanza una secuencia global, guarda qué
+  trabajo cambió bajo ese número y sube la versión de las columnas afectadas.
+- cambios_desde(n): trabajos que cambiaron después de la secuencia n, leídos de la
+  caché sin tocar la base. Si el registro ya no cubre n (se reinició la caché o el
+  cliente se atrasó más de PIZARRA_LIMITE_CAMBIOS) la respuesta es la pizarra completa.
+- esperar_cambio(): long-polling asíncrono; la petición queda abierta (asyncio.sleep,
+  sin ocupar un hilo ni un worker bajo ASGI) hasta que la secuencia avanza o vence la
+  espera, así una pizarra sin cambios no consulta la base.
+
+Con varios procesos la caché (PIZARRA_CACHE) tiene que ser compartida para que todos
+vean la misma secuencia. Si es local del proceso (LocMemCache) compartida() es False y
+la vista responde siempre la pizarra completa, sin esperar ni feed de cambios.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import al_confirmar
+
+logger = logging.getLogger(__name__)
+
+CLAVE_SECUENCIA = 'pizarra:secuencia'
+CLAVE_CAMBIO = 'pizarra:cambio:{secuencia}'
+CLAVE_VERSION = 'pizarra:version:{estado}'
+CLAVE_ESTADO = 'pizarra:estado:{trabajo_id}'
+
+# Columnas de la pizarra: estado -> nombre del contexto en las vistas
+COLUMNAS = {
+    'iniciado': 'iniciados',
+    'trabajando': 'trabajando',
+    'completado': 'completados',
+    'entregado': 'entregados',
+}
+
+# Vista -> plantilla de una tarjeta
+TARJETAS = {
+    'pizarra': 'car/partials/pizarra_tarjeta.html',
+    'panel': 'car/partials/panel_tarjeta.html',
+}
+
+
+
+def _cache():
+    return caches[getattr(settings, 'PIZARRA_CACHE', 'default')]
+
+
+def compartida():
+    """False si la caché es local del proceso: cada worker tendría su propia secuencia."""
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def _limite_cambios():
+    return getattr(settings, 'PIZARRA_LIMITE_CAMBIOS', 500)
+
+
+def _timeout():
+    return getattr(settings, 'PIZARRA_CACHE_TIMEOUT', 3600)
+
+
+# ========================
+# TRABAJOS DE LA PIZARRA
+# ========================
+
+def trabajos_pizarra(vista='pizarra', ids=None):
+    """
+    Trabajos que muestra la vista, con totales anotados y ordenados por id.
+    'pizarra' oculta los entregados hace más de 3 días; 'panel' oculta los
+    marcados como no visibles (igual que antes en cada vista).
+    """
+    from .helpers_auditoria import filtrar_trabajos_entregados_por_dias
+    from .models import Trabajo
+
+    trabajos = (
+        Trabajo.objects.filter(estado__in=COLUMNAS)
+        .select_related('vehiculo', 'vehiculo__cliente')
+        .with_totales()
+        .order_by('pk')
+    )
+    if vista == 'panel':
+        trabajos = trabajos.filter(visible=True)
+    else:
+        trabajos = filtrar_trabajos_entregados_por_dias(trabajos, dias_desde_entrega=3)
+    if ids is not None:
+        trabajos = trabajos.filter(pk__in=ids)
+    return trabajos
+
+
+def columnas(vista='pizarra'):
+    """{'iniciados': [...], 'trabajando': [...], ...} con una sola consulta."""
+    contexto = {nombre: [] for nombre in COLUMNAS.values()}
+    for trabajo in trabajos_pizarra(vista):
+        contexto[COLUMNAS[trabajo.estado]].append(trabajo)
+    return contexto
+
+
+# ========================
+# SECUENCIA Y VERSIONES
+# ========================
+
+def secuencia():
+    """
+    Número del último cambio publicado. Si la caché no lo tiene arranca desde los
+    milisegundos actuales: nunca retrocede, así que un cliente con un número viejo
+    recibe la pizarra completa en vez de perder cambios.
+    """
+    cache = _cache()
+    actual = cache.get(CLAVE_SECUENCIA)
+    if actual is None:
+        cache.add(CLAVE_SECUENCIA, time.time_ns() // 1_000_000, None)
+        actual = cache.get(CLAVE_SECUENCIA)
+    return actual
+
+
+def versiones():
+    """Versión de cada columna: cambia cuando una tarjeta entra, sale o se modifica en ella."""
+    claves = {CLAVE_VERSION.format(estado=estado): estado for estado in COLUMNAS}
+    valores = _cache().get_many(list(claves))
+    return {estado: valores.get(clave, 0) for clave, estado in claves.items()}
+
+
+def _subir_version(cache, estado):
+    clave = CLAVE_VERSION.format(estado=estado)
+    cache.add(clave, 0, None)
+    cache.incr(clave)
+
+
+def _siguiente(cache):
+    try:
+        return cache.incr(CLAVE_SECUENCIA)
+    except ValueError:  # la clave no existe (caché reiniciada)
+        secuencia()
+        return cache.incr(CLAVE_SECUENCIA)
+
+
+def _registrar_cambio(cache, trabajo_id):
+    """
+    Guarda el trabajo bajo el siguiente número libre. incr() no es atómico en todos los
+    backends (DatabaseCache lee y escribe): si dos procesos obtienen el mismo número,
+    add() falla para uno de ellos y este toma el siguiente en vez de pisar el cambio.
+    """
+    for _ in range(10):
+        numero = _siguiente(cache)
+        if cache.add(CLAVE_CAMBIO.format(secuencia=numero), trabajo_id, _timeout()):
+            return numero
+    logger.warning(f"⚠️ No se pudo registrar el cambio de pizarra del trabajo {trabajo_id}")
+
+
+def publicar(trabajo_ids):
+    """Registra un cambio por trabajo y sube la versión de sus columnas (anterior y actual)."""
+    from .models import Trabajo
+
+    trabajo_ids = sorted(set(trabajo_ids))
+    if not trabajo_ids:
+        return
+    cache = _cache()
+    estados = dict(Trabajo.objects.filter(pk__in=trabajo_ids).values_list('pk', 'estado'))
+    anteriores = cache.get_many([CLAVE_ESTADO.format(trabajo_id=pk) for pk in trabajo_ids])
+
+    for trabajo_id in trabajo_ids:
+        _registrar_cambio(cache, trabajo_id)
+
+        clave_estado = CLAVE_ESTADO.format(trabajo_id=trabajo_id)
+        estado = estados.get(trabajo_id)
+        for afectado in {anteriores.get(clave_estado), estado} & set(COLUMNAS):
+            _subir_version(cache, afectado)
+        if estado is None:
+            cache.delete(clave_estado)
+        else:
+            cache.set(clave_estado, estado, None)
+
+
+def _publicar_pendientes(trabajo_ids):
+    trabajo_ids = list(trabajo_ids)
+    try:
+        publicar(trabajo_ids)
+    except Exception:
+        # La pizarra se corrige con la próxima resincronización completa del cliente
+        logger.exception(f"❌ Error publicando cambios de pizarra {trabajo_ids}")
+
+
+def marcar_cambio(trabajo_id):
+    """
+    Anota que la tarjeta del trabajo cambió; se publica al confirmar la transacción
+    (una vez por trabajo aunque cambien varias filas).
+    """
+    if not trabajo_id:
+        return
+    al_confirmar.acumular('pizarra:cambios', _publicar_pendientes, trabajo_id)
+
+
+# ========================
+# LECTURA DEL FEED
+# ========================
+
+def cambios_desde(desde):
+    """
+    (secuencia actual, ids de trabajos que cambiaron después de `desde`).
+    Los ids son None cuando hay que mandar la pizarra completa.
+    """
+    actual = secuencia()
+    if desde is None or desde > actual or actual - desde > _limite_cambios():
+        return actual, None
+    if desde == actual:
+        return actual, []
+
+    claves = [CLAVE_CAMBIO.format(secuencia=numero) for numero in range(desde + 1, actual + 1)]
+    valores = _cache().get_many(claves)
+    if len(valores) < len(claves):
+        return actual, None  # parte del registro expiró o aún se está escribiendo
+    return actual, sorted(set(valores.values()))
+
+
+async def esperar_cambio(desde, segundos):
+    """
+    Espera hasta `segundos` a que la secuencia pase de `desde`; devuelve la secuencia
+    vigente. Entre consultas cede el event loop (asyncio.sleep), no bloquea un hilo.
+    """
+    intervalo = getattr(settings, 'PIZARRA_INTERVALO_SEGUNDOS', 1)
+    limite = time.monotonic() + segundos
+    leer = sync_to_async(secuencia)
+    actual = await leer()
+    while actual == desde and time.monotonic() < limite:
+        await asyncio.sleep(intervalo)
+        actual = await leer()
+    return actual
@@ -0,0 +1,165 @@
+"""
+Refresco diferido y agrupado de ResumenTrabajo.
+
+Antes cada evento de auditoría recalculaba el resumen de su trabajo con ~10 consultas
+(conteos, totales, abonos, avance), y un mismo POST de trabajo_detalle suele registrar
+varios eventos. Ahora:
+
+- marcar_pendiente(): el evento solo anota el trabajo como pendiente; al confirmar la
+  transacción se hace un único refresco por trabajo (como compras.programar_total)
+- actualizar(): recalcula los resúmenes de muchos trabajos con una consulta anotada
+  (TrabajoQuerySet.with_totales + with_conteos, en calcular()) y los escribe con un
+  solo upsert (guardar())
+
+Con RESUMENES_MODO = 'tarea' el refresco se encola para el worker (tareas.py) en vez
+de correr al confirmar. `manage.py rebuild_resumenes` recalcula todos los trabajos.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import al_confirmar
+
+logger = logging.getLogger(__name__)
+
+# Campos que se reescriben en cada refresco (todos salvo trabajo_id)
+CAMPOS_RESUMEN = (
+    'vehiculo_placa', 'vehiculo_marca', 'vehiculo_modelo', 'cliente_nombre',
+    'fecha_ingreso', 'fecha_ultimo_estado', 'fecha_entrega', 'estado_actual',
+    'total_acciones', 'acciones_completadas', 'cantidad_repuestos', 'repuestos_instalados',
+    'total_mano_obra', 'total_repuestos', 'total_general', 'total_abonos',
+    'porcentaje_avance', 'porcentaje_cobrado', 'dias_en_taller', 'dias_desde_entrega',
+    'mecanicos_asignados', 'ultima_actualizacion',
+)
+
+
+def _modo():
+    return getattr(settings, 'RESUMENES_MODO', 'commit')
+
+
+# ========================
+# MARCADO DIFERIDO
+# ========================
+
+def _procesar_pendientes(trabajo_ids):
+    trabajo_ids = sorted(trabajo_ids)
+    try:
+        if _modo() == 'tarea':
+            from .tareas import encolar
+            encolar('actualizar_resumenes', {'trabajo_ids': trabajo_ids})
+        else:
+            actualizar(trabajo_ids)
+    except Exception:
+        # Los datos del trabajo ya están confirmados: el resumen se corrige en el próximo
+        # evento o con rebuild_resumenes
+        logger.exception(f"❌ Error actualizando resúmenes de trabajos {trabajo_ids}")
+
+
+def marcar_pendiente(trabajo_id):
+    """
+    Anota el trabajo para refrescar su resumen al confirmar la transacción en curso
+    (de inmediato si no hay transacción). Varios eventos del mismo trabajo en una
+    transacción producen un solo refresco.
+    """
+    al_confirmar.acumular('resumenes:pendientes', _procesar_pendientes, trabajo_id)
+
+
+# ========================
+# RECÁLCULO EN LOTE
+# ========================
+
+def _datos_resumen(trabajo, ahora):
+    """Valores del resumen a partir de un Trabajo con with_totales() y with_conteos()."""
+    vehiculo = trabajo.vehiculo
+    cliente = getattr(vehiculo, 'cliente', None)
+    mecanicos_ids = sorted(m.pk for m in trabajo.mecanicos.all())
+
+    dias_desde_entrega = None
+    if trabajo.estado == 'entregado' and trabajo.fecha_fin:
+        dias_desde_entrega = (ahora - trabajo.fecha_fin).days
+
+    return {
+        'vehiculo_placa': vehiculo.placa,
+        'vehiculo_marca': vehiculo.marca,
+        'vehiculo_modelo': vehiculo.modelo,
+        'cliente_nombre': cliente.nombre if cliente else None,
+        'fecha_ingreso': trabajo.fecha_inicio,
+        'fecha_ultimo_estado': ahora,
+        'fecha_entrega': trabajo.fecha_fin if trabajo.estado == 'entregado' else None,
+        'estado_actual': trabajo.estado,
+        'total_acciones': trabajo.conteo_acciones,
+        'acciones_completadas': trabajo.conteo_acciones_completadas,
+        'cantidad_repuestos': trabajo.conteo_repuestos,
+        'repuestos_instalados': trabajo.conteo_repuestos_instalados,
+        'total_mano_obra': trabajo.total_mano_obra or 0,
+        'total_repuestos': trabajo.total_repuestos or 0,
+        'total_general': trabajo.total_general or 0,
+        'total_abonos': trabajo.total_abonos,
+        'porcentaje_avance': trabajo.porcentaje_avance,
+        'porcentaje_cobrado': trabajo.porcentaje_cobrado,
+        'dias_en_taller': trabajo.dias_en_taller,
+        'dias_desde_entrega': dias_desde_entrega,
+        'mecanicos_asignados': ','.join(map(str, mecanicos_ids)) or None,
+        'ultima_actualizacion': ahora,
+    }
+
+
+def calcular(trabajo_ids):
+    """
+    Datos de resumen (dicts con trabajo_id) de los trabajos indicados; los que ya no
+    existen se omiten. Una consulta anotada más la de mecánicos.
+    """
+    from django.db.models import Prefetch
+
+    from .models import Mecanico, Trabajo
+
+    ahora = timezone.now()
+    trabajos = (
+        Trabajo.objects.filter(pk__in=list(trabajo_ids))
+        .with_totales()
+        .with_conteos()
+        .select_related('vehiculo__cliente')
+        .prefetch_related(Prefetch('mecanicos', queryset=Mecanico.objects.only('pk')))
+    )
+    return [{'trabajo_id': t.pk, **_datos_resumen(t, ahora)} for t in trabajos]
+
+
+def guardar(datos):
+    """
+    Escribe los resúmenes calculados con un solo upsert y mueve los conteos por
+    estado de las estadísticas. Devuelve la cantidad escrita.
+    """
+    from .estadisticas import mover_estado
+    from .models import ResumenTrabajo
+
+    if not datos:
+        return 0
+
+    with transaction.atomic():
+        estados_anteriores = dict(
+            ResumenTrabajo.objects.filter(trabajo_id__in=[d['trabajo_id'] for d in datos])
+            .values_list('trabajo_id', 'estado_actual')
+        )
+        ResumenTrabajo.objects.bulk_create(
+            [ResumenTrabajo(**d) for d in datos],
+            update_conflicts=True,
+            unique_fields=['trabajo_id'],
+            update_fields=list(CAMPOS_RESUMEN),
+        )
+
+        # Conteo de trabajos por estado en las estadísticas acumuladas
+        for d in datos:
+            mover_estado(estados_anteriores.get(d['trabajo_id']), d['estado_actual'])
+
+    return len(datos)
+
+
+def actualizar(trabajo_ids):
+    """Recalcula y guarda los resúmenes de los trabajos indicados (consultas fijas)."""
+    trabajo_ids = list(trabajo_ids)
+    if not trabajo_ids:
+        return 0
+    with transaction.atomic():
+        return guardar(calcular(trabajo_ids))
@@ -0,0 +1,37 @@
+"""
+Expiración deslizante de sesiones sin escribir en cada request.
+
+Con SESSION_SAVE_EVERY_REQUEST = False la sesión solo se guarda cuando cambia.
+Este middleware la marca como modificada únicamente cuando le queda menos de
+SESION_RENOVAR_SEGUNDOS de vida, de modo que una sesión activa se extiende
+(nueva expiración en el backend y en la cookie) unas pocas veces al día en lugar
+de hacer un UPDATE por cada página o búsqueda AJAX.
+"""
+import time
+
+from django.conf import settings
+
+CLAVE_EXPIRA = '_expira'
+
+
+class SesionDeslizanteMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        session = getattr(request, 'session', None)
+        # Solo sesiones existentes (no crear una para cada visitante anónimo)
+        if session is None or not session.session_key:
+            return response
+
+        ahora = int(time.time())
+        duracion = settings.SESSION_COOKIE_AGE
+        ventana = getattr(settings, 'SESION_RENOVAR_SEGUNDOS', duracion // 4)
+        expira = session.get(CLAVE_EXPIRA)
+
+        if expira is None or expira - ahora < ventana:
+            # Modificar la sesión hace que SessionMiddleware la guarde y renueve la cookie
+            session[CLAVE_EXPIRA] = ahora + duracion
+        return response
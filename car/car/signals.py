@@ -0,0 +1,126 @@
+"""
+Señales del módulo car.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Repuesto, AdministracionTaller, Mecanico, RepuestoAplicacion, VehiculoVersion, Componente,
+    Trabajo, TrabajoAccion, TrabajoRepuesto, TrabajoAbono, Cliente_Taller, Vehiculo, Diagnostico,
+    Accion, ComponenteAccion, Compra, CompraItem, RepuestoEnStock, BonoGenerado, PagoMecanico,
+    ConfiguracionBonoMecanico,
+)
+from . import (
+    arbol_componentes, busqueda_repuestos, compatibilidad_repuestos, herramientas_ia, pizarra,
+    similitud_diagnosticos,
+)
+from .cache_configuracion import invalidar_configuracion
+from .middleware import invalidar_permisos
+
+
+@receiver(post_save, sender=Repuesto)
+def sincronizar_documento_busqueda(sender, instance, update_fields=None, **kwargs):
+    """Mantiene el documento de búsqueda al día cuando cambia un campo buscable."""
+    if update_fields is not None and not set(update_fields) & set(busqueda_repuestos.CAMPOS_BUSQUEDA):
+        return
+    busqueda_repuestos.actualizar_documento(instance)
+
+
+def crear_indices_busqueda(sender, **kwargs):
+    """Crea el índice FTS5 / pg_trgm y puebla los índices derivados después de migrar."""
+    busqueda_repuestos.asegurar_indice()
+    compatibilidad_repuestos.poblar_si_vacio()
+    arbol_componentes.poblar_si_vacio()
+    similitud_diagnosticos.poblar_si_vacio()
+
+
+@receiver(post_save, sender=Repuesto)
+def sincronizar_compatibilidad_repuesto(sender, instance, update_fields=None, **kwargs):
+    """Mantiene el índice de compatibilidad al día cuando cambian las características del repuesto."""
+    if update_fields is not None and not set(update_fields) & set(compatibilidad_repuestos.CAMPOS_COMPATIBILIDAD):
+        return
+    compatibilidad_repuestos.actualizar_repuesto(instance)
+
+
+@receiver(post_save, sender=RepuestoAplicacion)
+def sincronizar_compatibilidad_aplicacion(sender, instance, **kwargs):
+    compatibilidad_repuestos.actualizar_aplicacion(instance)
+
+
+@receiver(post_delete, sender=RepuestoAplicacion)
+def quitar_compatibilidad_aplicacion(sender, instance, **kwargs):
+    compatibilidad_repuestos.quitar_aplicacion(instance)
+
+
+@receiver(post_save, sender=VehiculoVersion)
+def sincronizar_compatibilidad_version(sender, instance, created=False, **kwargs):
+    if not created:
+        compatibilidad_repuestos.actualizar_version(instance)
+
+
+@receiver(post_save, sender=AdministracionTaller)
+@receiver(post_delete, sender=AdministracionTaller)
+def invalidar_cache_configuracion(sender, **kwargs):
+    """Publica una nueva versión de la configuración del taller."""
+    invalidar_configuracion()
+
+
+@receiver(post_save, sender=Mecanico)
+@receiver(post_delete, sender=Mecanico)
+def invalidar_cache_permisos(sender, instance, **kwargs):
+    """Cambió el rol o un permiso: el usuario recalcula su mapa de permisos."""
+    invalidar_permisos(instance.user_id)
+
+
+@receiver(post_save, sender=Componente)
+@receiver(post_delete, sender=Componente)
+def invalidar_arbol_componentes(sender, **kwargs):
+    """Cambió un componente: todos los procesos recargan el árbol serializado."""
+    arbol_componentes.invalidar_arbol()
+
+
+@receiver(post_save, sender=Trabajo)
+@receiver(post_delete, sender=Trabajo)
+def publicar_cambio_trabajo(sender, instance, **kwargs):
+    """Estado, visibilidad o datos del trabajo: la pizarra en vivo redibuja su tarjeta."""
+    pizarra.marcar_cambio(instance.pk)
+
+
+@receiver(post_save, sender=TrabajoAccion)
+@receiver(post_delete, sender=TrabajoAccion)
+@receiver(post_save, sender=TrabajoRepuesto)
+@receiver(post_delete, sender=TrabajoRepuesto)
+def publicar_cambio_avance(sender, instance, **kwargs):
+    """Cambió una línea del trabajo: puede haber cambiado el avance de la tarjeta."""
+    pizarra.marcar_cambio(instance.trabajo_id)
+
+
+@receiver(post_save, sender=Diagnostico)
+def sincronizar_similitud_diagnostico(sender, instance, update_fields=None, **kwargs):
+    """Nueva descripción o visibilidad: el índice de diagnósticos parecidos recibe el vector."""
+    if update_fields is not None and not set(update_fields) & set(similitud_diagnosticos.CAMPOS_INDICE):
+        return
+    similitud_diagnosticos.actualizar(instance)
+
+
+@receiver(post_delete, sender=Diagnostico)
+def quitar_similitud_diagnostico(sender, instance, **kwargs):
+    similitud_diagnosticos.actualizar(instance, borrado=True)
+
+
+# Modelos que leen las herramientas de Netgogo (listados y query_sistema de views_ia)
+MODELOS_HERRAMIENTAS_IA = (
+    Trabajo, TrabajoAccion, TrabajoRepuesto, TrabajoAbono, Cliente_Taller, Vehiculo, VehiculoVersion,
+    Repuesto, RepuestoAplicacion, RepuestoEnStock, Diagnostico, Mecanico, BonoGenerado, PagoMecanico,
+    ConfiguracionBonoMecanico, Componente, Accion, ComponenteAccion, Compra, CompraItem,
+)
+
+
+def invalidar_herramientas_ia(sender, **kwargs):
+    """Cambiaron datos que muestra Netgogo: los resultados cacheados de sus herramientas caducan."""
+    herramientas_ia.invalidar()
+
+
+for _modelo in MODELOS_HERRAMIENTAS_IA:
+    post_save.connect(invalidar_herramientas_ia, sender=_modelo)
+    post_delete.connect(invalidar_herramientas_ia, sender=_modelo)
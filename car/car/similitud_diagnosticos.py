@@ -0,0 +1,382 @@
+"""
+Diagnósticos históricos parecidos a una descripción del problema (TF-IDF).
+
+Antes se partía la descripción en 5 palabras y se hacía un OR de icontains sobre
+Diagnostico.descripcion_problema: sin ranking, sin acentos ni plurales, y un
+recorrido completo de la tabla por consulta. Ahora:
+
+- Texto: normalizado como el índice de repuestos (minúsculas, sin acentos), sin
+  palabras vacías del español, con plurales recortados y raíz de 7 letras
+  ("frenos"/"frenado" -> "freno"/"frenado"). Cada término va a una columna por
+  hashing (crc32), así no hay vocabulario que mantener entre procesos.
+- Segmento base: índice invertido en arrays de NumPy (indptr/filas/pesos por
+  término, normas e ids por documento, df por término) guardado en
+  SIMILITUD_DIAGNOSTICOS_DIR y abierto con mmap: los procesos comparten las
+  páginas y una consulta solo toca las listas de sus términos.
+- Delta: al confirmar un save/delete de Diagnostico se agrega una línea a
+  delta.jsonl con su vector (o su baja) y se publica un sello de versión en la
+  caché; cada proceso relee el delta al notarlo (como arbol_componentes). Con más
+  de SIMILITUD_DIAGNOSTICOS_MAX_DELTA líneas se encola la reconstrucción del
+  segmento, que se publica de forma atómica (archivo ACTUAL).
+- Puntaje: coseno entre los vectores tf-idf (tf sublineal, idf suavizado).
+
+`manage.py reconstruir_indice_diagnosticos` regenera el segmento completo.
+"""
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .busqueda_repuestos import tokenizar
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos del archivo delta
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = 'similitud_diagnosticos:version'
+DIMENSION = 1 << 18
+LARGO_RAIZ = 7
+CAMPOS_INDICE = ('descripcion_problema', 'visible')
+
+PALABRAS_VACIAS = {
+    'al', 'algo', 'con', 'cuando', 'de', 'del', 'desde', 'el', 'en', 'entre', 'es', 'esta', 'este',
+    'esto', 'hace', 'hay', 'la', 'las', 'le', 'lo', 'los', 'mas', 'muy', 'no', 'para', 'pero',
+    'por', 'que', 'se', 'sin', 'sobre', 'su', 'sus', 'tiene', 'un', 'una', 'uno', 'y', 'ya',
+    'cliente', 'indica', 'vehiculo', 'auto', 'presenta', 'favor', 'revisar',
+}
+
+_memoria = None  # (version, indice, verificado_en)
+_lock = threading.Lock()
+
+
+def _directorio():
+    return Path(getattr(settings, 'SIMILITUD_DIAGNOSTICOS_DIR', Path(settings.BASE_DIR) / 'indices' / 'diagnosticos'))
+
+
+def _cache():
+    return caches[getattr(settings, 'SIMILITUD_DIAGNOSTICOS_CACHE', 'default')]
+
+
+# ========================
+# TEXTO -> VECTOR
+# ========================
+
+def terminos(texto):
+    """Raíces del texto (sin palabras vacías ni tokens de menos de 3 letras)."""
+    raices = []
+    for token in tokenizar(texto):
+        if token in PALABRAS_VACIAS or (len(token) < 3 and not token.isdigit()):
+            continue
+        if len(token) > 5 and token.endswith('es'):
+            token = token[:-2]
+        elif len(token) > 4 and token.endswith('s'):
+            token = token[:-1]
+        raices.append(token[:LARGO_RAIZ])
+    return raices
+
+
+def vector(texto):
+    """{columna: 1 + log(tf)} del texto."""
+    conteo = {}
+    for termino in terminos(texto):
+        columna = zlib.crc32(termino.encode('utf-8')) & (DIMENSION - 1)
+        conteo[columna] = conteo.get(columna, 0) + 1
+    return {columna: 1 + math.log(tf) for columna, tf in conteo.items()}
+
+
+def _idf(df, documentos):
+    return np.log((documentos + 1) / (df + 1)) + 1
+
+
+# ========================
+# SEGMENTO BASE
+# ========================
+
+class _Segmento:
+    """Arrays del índice invertido (mmap) de un directorio segmento-<ns>."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        meta = json.loads((ruta / 'meta.json').read_text())
+        self.documentos = meta['documentos']
+        self.construido_en = meta['construido_en']
+        for nombre in ('indptr', 'filas', 'pesos', 'ids', 'normas', 'df'):
+            setattr(self, nombre, np.load(ruta / f'{nombre}.npy', mmap_mode='r'))
+
+
+def _segmento_actual():
+    puntero = _directorio() / 'ACTUAL'
+    try:
+        nombre = puntero.read_text().strip()
+    except FileNotFoundError:
+        return None
+    return _Segmento(_directorio() / nombre)
+
+
+def _guardar_segmento(ids, filas_por_doc, construido_en):
+    """Escribe un segmento nuevo y lo deja como ACTUAL (reemplazo atómico del puntero)."""
+    directorio = _directorio()
+    directorio.mkdir(parents=True, exist_ok=True)
+    nombre = f'segmento-{construido_en}'
+    temporal = directorio / f'.{nombre}'
+    shutil.rmtree(temporal, ignore_errors=True)
+    temporal.mkdir()
+
+    largos = np.fromiter((len(v) for v in filas_por_doc), dtype=np.int64, count=len(filas_por_doc))
+    columnas = np.fromiter((c for v in filas_por_doc for c in v), dtype=np.int64, count=int(largos.sum()))
+    pesos = np.fromiter((p for v in filas_por_doc for p in v.values()), dtype=np.float32, count=len(columnas))
+    filas = np.repeat(np.arange(len(ids), dtype=np.int32), largos)
+
+    df = np.bincount(columnas, minlength=DIMENSION).astype(np.int32)
+    idf = _idf(df, len(ids))
+    normas = np.sqrt(np.bincount(filas, weights=(pesos * idf[columnas]) ** 2, minlength=len(ids))).astype(np.float32)
+
+    orden = np.argsort(columnas, kind='stable')
+    indptr = np.zeros(DIMENSION + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+
+    arrays = {
+        'indptr': indptr,
+        'filas': filas[orden],
+        'pesos': pesos[orden],
+        'ids': np.asarray(ids, dtype=np.int64),
+        'normas': normas,
+        'df': df,
+    }
+    for clave, array in arrays.items():
+        np.save(temporal / f'{clave}.npy', array)
+    (temporal / 'meta.json').write_text(json.dumps({'documentos': len(ids), 'construido_en': construido_en}))
+    os.replace(temporal, directorio / nombre)
+
+    puntero = directorio / '.ACTUAL'
+    puntero.write_text(nombre)
+    os.replace(puntero, directorio / 'ACTUAL')
+
+    # Se conserva el anterior para quien acaba de leer el puntero viejo; los que ya
+    # tienen abierto un segmento borrado conservan su mmap
+    segmentos = sorted(directorio.glob('segmento-*'), key=lambda ruta: int(ruta.name.split('-')[1]))
+    for viejo in segmentos[:-2]:
+        shutil.rmtree(viejo, ignore_errors=True)
+
+
+def reconstruir():
+    """Regenera el segmento con todos los diagnósticos visibles. Devuelve cuántos indexó."""
+    from .models import Diagnostico
+
+    construido_en = time.time_ns()
+    ids, vectores = [], []
+    filas = Diagnostico.objects.filter(visible=True).values_list('id', 'descripcion_problema')
+    for diagnostico_id, descripcion in filas.iterator(chunk_size=2000):
+        ids.append(diagnostico_id)
+        vectores.append(vector(descripcion))
+
+    with _lock:
+        _guardar_segmento(ids, vectores, construido_en)
+        # El segmento ya incluye todo lo confirmado antes de construido_en
+        _reescribir_delta(lambda entrada: entrada['ns'] >= construido_en)
+    _publicar_version()
+    logger.info(f"🧭 Índice de diagnósticos reconstruido: {len(ids)} documentos")
+    return len(ids)
+
+
+def poblar_si_vacio():
+    """Construye el segmento la primera vez (post_migrate)."""
+    try:
+        if _segmento_actual() is None:
+            reconstruir()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo construir el índice de diagnósticos: {e}")
+
+
+# ========================
+# DELTA (cambios desde el último segmento)
+# ========================
+
+def _ruta_delta():
+    return _directorio() / 'delta.jsonl'
+
+
+class _Bloqueo:
+    """flock exclusivo del delta entre procesos (sin fcntl solo protege el hilo)."""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+
+    def __enter__(self):
+        if fcntl:
+            fcntl.flock(self.archivo.fileno(), fcntl.LOCK_EX)
+        return self.archivo
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.archivo.fileno(), fcntl.LOCK_UN)
+
+
+def _leer_delta():
+    try:
+        with open(_ruta_delta(), encoding='utf-8') as archivo:
+            return [json.loads(linea) for linea in archivo if linea.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _reescribir_delta(conservar):
+    ruta = _ruta_delta()
+    if not ruta.exists():
+        return
+    with open(ruta, 'r+', encoding='utf-8') as archivo, _Bloqueo(archivo):
+        entradas = [json.loads(linea) for linea in archivo if linea.strip()]
+        archivo.seek(0)
+        archivo.truncate()
+        for entrada in entradas:
+            if conservar(entrada):
+                archivo.write(json.dumps(entrada) + '\n')
+
+
+def _agregar_delta(diagnostico_id, vector_doc):
+    _directorio().mkdir(parents=True, exist_ok=True)
+    entrada = {'ns': time.time_ns(), 'id': diagnostico_id, 'vector': vector_doc}
+    with open(_ruta_delta(), 'a', encoding='utf-8') as archivo, _Bloqueo(archivo):
+        archivo.write(json.dumps(entrada) + '\n')
+        archivo.flush()
+    _publicar_version()
+
+    with open(_ruta_delta(), encoding='utf-8') as archivo:
+        lineas = sum(1 for _ in archivo)
+    if lineas > getattr(settings, 'SIMILITUD_DIAGNOSTICOS_MAX_DELTA', 500):
+        from .tareas import encolar
+        encolar('reconstruir_indice_diagnosticos', clave='reconstruir_indice_diagnosticos')
+
+
+def actualizar(diagnostico, borrado=False):
+    """
+    Save/delete de un Diagnostico: al confirmar la transacción su vector (o su baja si
+    se borró o dejó de ser visible) queda en el delta y los procesos lo recargan.
+    """
+    vector_doc = None if borrado or not diagnostico.visible else vector(diagnostico.descripcion_problema)
+    diagnostico_id = diagnostico.pk
+    transaction.on_commit(lambda: _agregar_delta(diagnostico_id, vector_doc))
+
+
+# ========================
+# ÍNDICE EN MEMORIA Y CONSULTA
+# ========================
+
+class _Indice:
+    def __init__(self, segmento, entradas):
+        self.segmento = segmento
+        self.delta = {}
+        for entrada in entradas:
+            if segmento is None or entrada['ns'] >= segmento.construido_en:
+                vector_doc = entrada['vector']
+                self.delta[entrada['id']] = {int(c): p for c, p in vector_doc.items()} if vector_doc else None
+        self.ids_delta = np.fromiter(self.delta, dtype=np.int64, count=len(self.delta))
+
+        # df del delta (aproximado: un documento actualizado cuenta en ambos lados)
+        self.df_delta = {}
+        for vector_doc in self.delta.values():
+            for columna in vector_doc or ():
+                self.df_delta[columna] = self.df_delta.get(columna, 0) + 1
+        self.documentos = (segmento.documentos if segmento else 0) + sum(1 for v in self.delta.values() if v)
+
+    def idf(self, columna):
+        df = (int(self.segmento.df[columna]) if self.segmento else 0) + self.df_delta.get(columna, 0)
+        return math.log((self.documentos + 1) / (df + 1)) + 1
+
+    def buscar(self, consulta, limite, excluir=()):
+        """[(diagnostico_id, similitud), ...] de mayor a menor."""
+        idf = {columna: self.idf(columna) for columna in consulta}
+        norma_consulta = math.sqrt(sum((peso * idf[c]) ** 2 for c, peso in consulta.items()))
+        if not norma_consulta:
+            return []
+
+        ids, similitudes = [], []
+        segmento = self.segmento
+        if segmento is not None and segmento.documentos:
+            puntajes = np.zeros(segmento.documentos, dtype=np.float32)
+            for columna, peso in consulta.items():
+                inicio, fin = segmento.indptr[columna], segmento.indptr[columna + 1]
+                if fin > inicio:
+                    puntajes[segmento.filas[inicio:fin]] += peso * idf[columna] ** 2 * segmento.pesos[inicio:fin]
+            candidatos = np.flatnonzero(puntajes)
+            candidatos = candidatos[~np.isin(segmento.ids[candidatos], self.ids_delta)]
+            ids.extend(segmento.ids[candidatos].tolist())
+            similitudes.extend((puntajes[candidatos] / (segmento.normas[candidatos] * norma_consulta)).tolist())
+
+        for diagnostico_id, vector_doc in self.delta.items():
+            if not vector_doc:
+                continue
+            producto = sum(peso * idf[c] ** 2 * vector_doc[c] for c, peso in consulta.items() if c in vector_doc)
+            if producto:
+                norma = math.sqrt(sum((p * self.idf(c)) ** 2 for c, p in vector_doc.items()))
+                ids.append(diagnostico_id)
+                similitudes.append(producto / (norma * norma_consulta))
+
+        minima = getattr(settings, 'SIMILITUD_DIAGNOSTICOS_MINIMA', 0.1)
+        resultado = [(i, s) for i, s in zip(ids, similitudes) if s >= minima and i not in excluir]
+        if len(resultado) > limite:
+            puntajes = np.fromiter((s for _, s in resultado), dtype=np.float64, count=len(resultado))
+            resultado = [resultado[i] for i in np.argpartition(-puntajes, limite)[:limite]]
+        return sorted(resultado, key=lambda par: (-par[1], -par[0]))  # empates: el más reciente
+
+
+def _version_vigente(cache):
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _publicar_version():
+    _cache().set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def _indice():
+    """Índice del proceso; se recarga cuando otro proceso publica una versión nueva."""
+    global _memoria
+    ahora = time.monotonic()
+    memoria = _memoria
+    if memoria and ahora - memoria[2] < getattr(settings, 'SIMILITUD_DIAGNOSTICOS_VERIFICAR_SEGUNDOS', 5):
+        return memoria[1]
+
+    version = _version_vigente(_cache())
+    if memoria and memoria[0] == version:
+        _memoria = (version, memoria[1], ahora)
+        return memoria[1]
+
+    with _lock:
+        segmento = _segmento_actual()
+        if segmento is None:
+            pass  # sin segmento todavía: se construye fuera del lock
+        elif memoria and memoria[1].segmento and memoria[1].segmento.ruta == segmento.ruta:
+            segmento = memoria[1].segmento  # mismo segmento: conservar los mmap abiertos
+    if segmento is None:
+        reconstruir()
+        segmento = _segmento_actual()
+        version = _version_vigente(_cache())
+
+    indice = _Indice(segmento, _leer_delta())
+    _memoria = (version, indice, ahora)
+    return indice
+
+
+def similares(texto, limite=5, excluir=()):
+    """IDs de los diagnósticos más parecidos a `texto` con su similitud (0-1), de mayor a menor."""
+    consulta = vector(texto)
+    if not consulta:
+        return []
+    return _indice().buscar(consulta, limite, excluir=set(excluir))
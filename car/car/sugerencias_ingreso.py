@@ -0,0 +1,279 @@
+"""
+Sugerencias para el ingreso aprendidas del historial: "con estas palabras y estos
+componentes, ¿qué acciones y repuestos suelen venir después?".
+
+sugerir_componentes_por_descripcion buscaba en cada request palabras clave fijas
+contra los nombres de Accion y ComponenteAccion (varias consultas icontains por
+palabra) y no sabía nada de lo que el taller realmente hizo. Aquí:
+
+- entrenar() (offline: `manage.py entrenar_sugerencias_ingreso` o la tarea del
+  mismo nombre) recorre cada diagnóstico con su trabajo. Rasgos del caso: los
+  términos de la descripción (los mismos de similitud_diagnosticos) y los
+  componentes marcados. Objetivos: los pares componente+acción de
+  DiagnosticoComponenteAccion/TrabajoAccion, los repuestos de
+  DiagnosticoRepuesto/TrabajoRepuesto y los componentes involucrados.
+- Con los conteos de co-ocurrencia arma una matriz dispersa rasgo -> objetivo (CSR
+  en arrays de NumPy) cuyo peso es P(objetivo | rasgo) suavizada por el idf del
+  rasgo, y la guarda en SUGERENCIAS_INGRESO_ARCHIVO (reemplazo atómico).
+- sugerir() carga el archivo la primera vez que se usa (y lo recarga si cambió
+  en disco) y suma las filas de los rasgos de la consulta: alrededor de un
+  décimo de milisegundo, sin tocar la base.
+
+La confianza de cada sugerencia es su puntaje sobre la suma de los idf de los
+rasgos reconocidos (1 = siempre apareció junto a todos ellos).
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .similitud_diagnosticos import DIMENSION, vector
+
+logger = logging.getLogger(__name__)
+
+ACCION, REPUESTO, COMPONENTE = 0, 1, 2
+TIPOS = {ACCION: 'acciones', REPUESTO: 'repuestos', COMPONENTE: 'componentes'}
+ALFA = 1.0  # suavizado de P(objetivo | rasgo): un rasgo visto una vez no da certeza
+
+_memoria = None  # (modelo, mtime, verificado_en)
+_lock = threading.Lock()
+
+
+def _archivo():
+    return Path(getattr(
+        settings, 'SUGERENCIAS_INGRESO_ARCHIVO', Path(settings.BASE_DIR) / 'indices' / 'sugerencias_ingreso.npz'
+    ))
+
+
+def rasgos(texto='', componentes=()):
+    """Claves de rasgo: columnas de los términos del texto y DIMENSION + id de cada componente."""
+    claves = set(vector(texto)) if texto else set()
+    claves.update(DIMENSION + int(c) for c in componentes)
+    return claves
+
+
+# ========================
+# ENTRENAMIENTO
+# ========================
+
+def _casos():
+    """{diagnostico_id: (texto, componentes marcados, objetivos)} del historial completo."""
+    from .models import (
+        Diagnostico, DiagnosticoComponenteAccion, DiagnosticoRepuesto, TrabajoAccion, TrabajoRepuesto,
+    )
+
+    casos = {
+        diagnostico_id: (texto, set(), set())
+        for diagnostico_id, texto in Diagnostico.objects.values_list('id', 'descripcion_problema').iterator(chunk_size=2000)
+    }
+
+    def agregar(filas, objetivos):
+        for fila in filas.iterator(chunk_size=5000):
+            caso = casos.get(fila[0])
+            if caso is not None:
+                caso[2].update(objetivos(*fila[1:]))
+
+    marcados = Diagnostico.componentes.through.objects.values_list('diagnostico_id', 'componente_id')
+    for diagnostico_id, componente_id in marcados.iterator(chunk_size=5000):
+        if diagnostico_id in casos:
+            casos[diagnostico_id][1].add(componente_id)
+            casos[diagnostico_id][2].add((COMPONENTE, componente_id, 0))
+
+    def accion(componente_id, accion_id):
+        return ((ACCION, componente_id, accion_id), (COMPONENTE, componente_id, 0))
+
+    def repuesto(repuesto_id, componente_id=None):
+        objetivos = [(REPUESTO, repuesto_id, 0)] if repuesto_id else []
+        if componente_id:
+            objetivos.append((COMPONENTE, componente_id, 0))
+        return objetivos
+
+    agregar(DiagnosticoComponenteAccion.objects.values_list('diagnostico_id', 'componente_id', 'accion_id'), accion)
+    agregar(TrabajoAccion.objects.values_list('trabajo__diagnostico_id', 'componente_id', 'accion_id'), accion)
+    agregar(DiagnosticoRepuesto.objects.values_list('diagnostico_id', 'repuesto_id'), repuesto)
+    agregar(TrabajoRepuesto.objects.values_list('trabajo__diagnostico_id', 'repuesto_id', 'componente_id'), repuesto)
+    return casos
+
+
+def entrenar():
+    """Recalcula el modelo desde el historial y lo guarda en disco. Devuelve un resumen."""
+    inicio = time.perf_counter()
+    minimo = getattr(settings, 'SUGERENCIAS_INGRESO_MIN_SOPORTE', 2)
+
+    indice_rasgo, indice_objetivo = {}, {}
+    pares_rasgo, pares_objetivo, rasgos_por_caso = [], [], []
+    casos = 0
+    for texto, marcados, objetivos in _casos().values():
+        if not objetivos:
+            continue  # sin acciones ni repuestos no enseña nada
+        claves = rasgos(texto, marcados)
+        if not claves:
+            continue
+        casos += 1
+        filas = [indice_rasgo.setdefault(clave, len(indice_rasgo)) for clave in claves]
+        columnas = [indice_objetivo.setdefault(objetivo, len(indice_objetivo)) for objetivo in objetivos]
+        rasgos_por_caso.append(filas)
+        pares_rasgo.append(np.repeat(np.asarray(filas, dtype=np.int64), len(columnas)))
+        pares_objetivo.append(np.tile(np.asarray(columnas, dtype=np.int64), len(filas)))
+
+    n_objetivos = len(indice_objetivo)
+    if pares_rasgo:
+        claves_pares = np.concatenate(pares_rasgo) * n_objetivos + np.concatenate(pares_objetivo)
+        unicos, conteos = np.unique(claves_pares, return_counts=True)
+    else:
+        unicos = conteos = np.zeros(0, dtype=np.int64)
+    fila_par, columna_par = np.divmod(unicos, max(n_objetivos, 1))
+
+    # Casos en que aparece cada rasgo
+    soporte = np.bincount(
+        np.fromiter((f for filas in rasgos_por_caso for f in filas), dtype=np.int64),
+        minlength=len(indice_rasgo),
+    )
+    idf = np.log((casos + 1) / (soporte + 1)) + 1
+
+    # Rasgos poco vistos fuera: ruido y tamaño
+    conservar = soporte[fila_par] >= minimo
+    fila_par, columna_par, conteos = fila_par[conservar], columna_par[conservar], conteos[conservar]
+    pesos = (conteos / (soporte[fila_par] + ALFA) * idf[fila_par]).astype(np.float32)
+
+    # Re-numerar rasgos en el orden de sus claves para buscarlos con searchsorted
+    claves_rasgo = np.fromiter(indice_rasgo, dtype=np.int64, count=len(indice_rasgo))
+    usados = np.unique(fila_par)
+    orden_claves = np.argsort(claves_rasgo[usados])
+    usados = usados[orden_claves]
+    nueva_fila = np.full(len(indice_rasgo), -1, dtype=np.int64)
+    nueva_fila[usados] = np.arange(len(usados))
+    fila_par = nueva_fila[fila_par]
+    orden = np.lexsort((columna_par, fila_par))
+    indptr = np.zeros(len(usados) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(fila_par, minlength=len(usados)), out=indptr[1:])
+
+    objetivos = np.array(list(indice_objetivo), dtype=np.int64).reshape(-1, 3)
+    archivo = _archivo()
+    archivo.parent.mkdir(parents=True, exist_ok=True)
+    temporal = archivo.with_name(f'.{archivo.name}')
+    with open(temporal, 'wb') as salida:
+        np.savez(
+            salida,
+            claves=claves_rasgo[usados],
+            idf=idf[usados].astype(np.float32),
+            indptr=indptr,
+            columnas=columna_par[orden].astype(np.int32),
+            pesos=pesos[orden],
+            objetivos=objetivos,
+        )
+    os.replace(temporal, archivo)
+
+    resumen = {
+        'casos': casos,
+        'rasgos': len(usados),
+        'objetivos': n_objetivos,
+        'pares': int(len(pesos)),
+        'segundos': round(time.perf_counter() - inicio, 2),
+    }
+    logger.info(f"🧠 Modelo de sugerencias de ingreso entrenado: {resumen}")
+    return resumen
+
+
+# ========================
+# CONSULTA
+# ========================
+
+class _Modelo:
+    def __init__(self, ruta):
+        with np.load(ruta) as datos:
+            self.claves = datos['claves']
+            self.idf = datos['idf']
+            self.indptr = datos['indptr']
+            self.columnas = datos['columnas']
+            self.pesos = datos['pesos']
+            objetivos = datos['objetivos']
+        self.tipo = objetivos[:, 0]
+        self.id_a = objetivos[:, 1]
+        self.id_b = objetivos[:, 2]
+        self.por_tipo = {tipo: np.flatnonzero(self.tipo == tipo) for tipo in TIPOS}
+
+    def puntajes(self, claves):
+        """(puntaje por objetivo, suma de idf de los rasgos reconocidos)."""
+        consulta = np.fromiter(claves, dtype=np.int64, count=len(claves))
+        posiciones = np.searchsorted(self.claves, consulta)
+        dentro = posiciones < len(self.claves)
+        posiciones, consulta = posiciones[dentro], consulta[dentro]
+        posiciones = posiciones[self.claves[posiciones] == consulta]
+        puntajes = np.zeros(len(self.tipo), dtype=np.float32)
+        for fila in posiciones:
+            inicio, fin = self.indptr[fila], self.indptr[fila + 1]
+            puntajes[self.columnas[inicio:fin]] += self.pesos[inicio:fin]
+        return puntajes, float(self.idf[posiciones].sum())
+
+
+def _modelo():
+    """Modelo del proceso: se carga al primer uso y se recarga si el archivo cambió."""
+    global _memoria
+    ahora = time.monotonic()
+    memoria = _memoria
+    if memoria and ahora - memoria[2] < getattr(settings, 'SUGERENCIAS_INGRESO_VERIFICAR_SEGUNDOS', 30):
+        return memoria[0]
+
+    try:
+        mtime = _archivo().stat().st_mtime_ns
+    except FileNotFoundError:
+        _memoria = (None, None, ahora)
+        return None
+    if memoria and memoria[1] == mtime:
+        _memoria = (memoria[0], mtime, ahora)
+        return memoria[0]
+
+    with _lock:
+        modelo = _Modelo(_archivo())
+        _memoria = (modelo, mtime, ahora)
+    return modelo
+
+
+def disponible():
+    return _modelo() is not None
+
+
+def sugerir(texto='', componentes=(), limite=10):
+    """
+    Acciones, repuestos y componentes que suelen seguir a la descripción y los
+    componentes dados, de más a menos probable:
+
+        {'acciones': [(componente_id, accion_id, confianza)],
+         'repuestos': [(repuesto_id, confianza)],
+         'componentes': [(componente_id, confianza)]}
+
+    Los componentes de la consulta no se vuelven a sugerir. Sin modelo entrenado
+    (o sin rasgos conocidos) las listas quedan vacías.
+    """
+    vacio = {nombre: [] for nombre in TIPOS.values()}
+    modelo = _modelo()
+    componentes = {int(c) for c in componentes}
+    claves = rasgos(texto, componentes)
+    if modelo is None or not claves:
+        return vacio
+
+    puntajes, total_idf = modelo.puntajes(claves)
+    if not total_idf:
+        return vacio
+
+    minima = getattr(settings, 'SUGERENCIAS_INGRESO_CONFIANZA_MINIMA', 0.05)
+    resultado = {}
+    for tipo, nombre in TIPOS.items():
+        columnas = modelo.por_tipo[tipo]
+        columnas = columnas[puntajes[columnas] / total_idf >= minima]
+        if tipo == COMPONENTE and componentes:
+            columnas = columnas[~np.isin(modelo.id_a[columnas], list(componentes))]
+        if len(columnas) > limite:
+            columnas = columnas[np.argpartition(-puntajes[columnas], limite)[:limite]]
+        columnas = columnas[np.argsort(-puntajes[columnas], kind='stable')]
+        confianzas = np.minimum(puntajes[columnas] / total_idf, 1.0).astype(np.float64).round(3).tolist()
+        if tipo == ACCION:
+            resultado[nombre] = list(zip(modelo.id_a[columnas].tolist(), modelo.id_b[columnas].tolist(), confianzas))
+        else:
+            resultado[nombre] = list(zip(modelo.id_a[columnas].tolist(), confianzas))
+    return resultado
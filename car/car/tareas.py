@@ -0,0 +1,194 @@
+"""
+Cola de tareas en segundo plano respaldada por la base de datos (TareaSegundoPlano).
+
+Las operaciones lentas (PDF, Excel, algoritmo de relación, recepción de compras) se
+registran con @tarea('nombre') en tareas_registradas.py. La vista llama a encolar()
+y responde de inmediato; la página de estado consulta el progreso hasta que termina.
+
+Modos (settings.TAREAS_MODO):
+- 'worker' (defecto): la tarea queda pendiente hasta que la toma `manage.py run_worker`
+- 'hilo': se ejecuta en un hilo del proceso web (instalaciones sin worker)
+- 'inmediato': se ejecuta dentro del mismo request (depuración)
+
+Un worker reclama una tarea con un UPDATE condicionado a estado='pendiente', por lo
+que varios procesos pueden consultar la misma tabla sin tomar dos veces la misma tarea
+(funciona igual en SQLite y PostgreSQL).
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TareaSegundoPlano
+
+logger = logging.getLogger(__name__)
+
+REGISTRO = {}
+ACTIVAS = ("pendiente", "ejecutando")
+
+
+def tarea(nombre):
+    """Registra una función como tarea. Recibe (contexto, **parametros) y devuelve un dict."""
+    def decorador(funcion):
+        REGISTRO[nombre] = funcion
+        return funcion
+    return decorador
+
+
+def _modo():
+    return getattr(settings, "TAREAS_MODO", "worker")
+
+
+def nombre_worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Contexto:
+    """Lo que recibe cada tarea para informar su avance y guardar el archivo generado."""
+
+    def __init__(self, tarea):
+        self.tarea = tarea
+        self.usuario = tarea.usuario
+
+    def progreso(self, procesados, total=None):
+        cambios = {"procesados": procesados}
+        if total is not None:
+            cambios["total"] = total
+        TareaSegundoPlano.objects.filter(pk=self.tarea.pk).update(**cambios)
+
+    def guardar_archivo(self, nombre, contenido):
+        """
+        Guarda el archivo resultado en MEDIA_ROOT/tareas/ y lo asocia a la tarea.
+        `contenido` puede ser bytes o un archivo abierto (se copia por bloques).
+        """
+        archivo = ContentFile(contenido) if isinstance(contenido, (bytes, str)) else File(contenido)
+        self.tarea.archivo.save(nombre, archivo, save=False)
+        TareaSegundoPlano.objects.filter(pk=self.tarea.pk).update(archivo=self.tarea.archivo.name)
+
+
+def encolar(tipo, parametros=None, usuario=None, clave=""):
+    """
+    Crea una tarea pendiente y la deja lista para el worker.
+
+    Args:
+        tipo: Nombre registrado con @tarea
+        parametros: dict serializable a JSON con los argumentos de la tarea
+        usuario: Usuario que la solicita (solo él y el staff ven su resultado)
+        clave: Si hay una tarea activa con la misma clave se devuelve esa (doble clic)
+
+    Returns:
+        TareaSegundoPlano
+    """
+    if tipo not in REGISTRO:
+        raise ValueError(f"Tarea no registrada: {tipo}")
+
+    if clave:
+        existente = TareaSegundoPlano.objects.filter(clave=clave, estado__in=ACTIVAS).first()
+        if existente:
+            return existente
+
+    nueva = TareaSegundoPlano.objects.create(
+        tipo=tipo, parametros=parametros or {}, usuario=usuario, clave=clave
+    )
+
+    modo = _modo()
+    if modo == "inmediato":
+        if reclamar(nueva.pk, "inmediato"):
+            ejecutar(TareaSegundoPlano.objects.get(pk=nueva.pk))
+        nueva.refresh_from_db()
+    elif modo == "hilo":
+        transaction.on_commit(lambda: threading.Thread(
+            target=_ejecutar_en_hilo, args=(nueva.pk,), daemon=True
+        ).start())
+    return nueva
+
+
+def _ejecutar_en_hilo(pk):
+    close_old_connections()
+    try:
+        if reclamar(pk, f"hilo:{nombre_worker()}"):
+            ejecutar(TareaSegundoPlano.objects.get(pk=pk))
+    finally:
+        close_old_connections()
+
+
+def reclamar(pk, worker):
+    """Marca la tarea como 'ejecutando' si sigue pendiente. Devuelve True si la tomó este worker."""
+    return bool(TareaSegundoPlano.objects.filter(pk=pk, estado="pendiente").update(
+        estado="ejecutando", worker=worker[:100], iniciado=timezone.now(),
+        intentos=F("intentos") + 1,
+    ))
+
+
+def tomar_siguiente(worker):
+    """Reclama la tarea pendiente más antigua (o None si no hay)."""
+    candidatas = TareaSegundoPlano.objects.filter(estado="pendiente").order_by("creado", "pk")
+    for pk in candidatas.values_list("pk", flat=True)[:10]:
+        if reclamar(pk, worker):
+            return TareaSegundoPlano.objects.select_related("usuario").get(pk=pk)
+    return None
+
+
+def ejecutar(tarea):
+    """Ejecuta una tarea ya reclamada y guarda su resultado o el error."""
+    funcion = REGISTRO.get(tarea.tipo)
+    try:
+        if funcion is None:
+            raise LookupError(f"Tarea no registrada: {tarea.tipo}")
+        resultado = funcion(Contexto(tarea), **tarea.parametros)
+        TareaSegundoPlano.objects.filter(pk=tarea.pk).update(
+            estado="completado", resultado=resultado, finalizado=timezone.now(),
+        )
+    except Exception as e:
+        logger.exception(f"❌ Error en tarea {tarea.tipo} #{tarea.pk}")
+        TareaSegundoPlano.objects.filter(pk=tarea.pk).update(
+            estado="error", error=str(e), finalizado=timezone.now(),
+        )
+
+
+def procesar_pendientes(worker, limite=None):
+    """Ejecuta tareas pendientes hasta vaciar la cola (o hasta `limite`). Devuelve cuántas corrió."""
+    ejecutadas = 0
+    while limite is None or ejecutadas < limite:
+        siguiente = tomar_siguiente(worker)
+        if siguiente is None:
+            break
+        ejecutar(siguiente)
+        ejecutadas += 1
+    return ejecutadas
+
+
+def liberar_abandonadas(minutos=None, max_intentos=None):
+    """
+    Devuelve a 'pendiente' las tareas que quedaron 'ejecutando' por un worker caído.
+    Las que ya agotaron sus intentos pasan a 'error'.
+    """
+    minutos = minutos or getattr(settings, "TAREAS_TIMEOUT_MINUTOS", 30)
+    max_intentos = max_intentos or getattr(settings, "TAREAS_MAX_INTENTOS", 3)
+    vencidas = TareaSegundoPlano.objects.filter(
+        estado="ejecutando", iniciado__lt=timezone.now() - timedelta(minutes=minutos)
+    )
+    fallidas = vencidas.filter(intentos__gte=max_intentos).update(
+        estado="error", error="El worker no terminó la tarea", finalizado=timezone.now(),
+    )
+    reintentadas = vencidas.update(estado="pendiente", worker="")
+    return reintentadas, fallidas
+
+
+def limpiar_terminadas(dias=None):
+    """Elimina tareas terminadas (y sus archivos) con más de `dias` de antigüedad."""
+    dias = dias or getattr(settings, "TAREAS_CONSERVAR_DIAS", 7)
+    antiguas = TareaSegundoPlano.objects.filter(
+        estado__in=("completado", "error"), finalizado__lt=timezone.now() - timedelta(days=dias)
+    )
+    for tarea_antigua in antiguas.exclude(archivo="").exclude(archivo__isnull=True).only("archivo"):
+        tarea_antigua.archivo.delete(save=False)
+    borradas, _ = antiguas.delete()
+    return borradas
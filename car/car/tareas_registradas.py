@@ -0,0 +1,242 @@
+"""
+Tareas en segundo plano del taller (ver tareas.py).
+Se importa desde CarConfig.ready() para que el registro exista en la web y en el worker.
+"""
+import logging
+import os
+import tempfile
+
+from django.utils import timezone
+
+from .tareas import tarea
+
+logger = logging.getLogger(__name__)
+
+
+# ========================
+# ORDEN DE TRABAJO EN PDF
+# ========================
+
+CSS_TRABAJO_PDF = '''
+    @page {
+        size: A4;
+        margin: 1cm;
+    }
+    body {
+        font-family: Arial, sans-serif;
+        font-size: 12px;
+    }
+    .header {
+        text-align: center;
+        border-bottom: 2px solid #333;
+        padding-bottom: 10px;
+        margin-bottom: 20px;
+    }
+    .section {
+        margin-bottom: 15px;
+    }
+    .section h3 {
+        background: #f0f0f0;
+        padding: 5px;
+        margin: 0 0 10px 0;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+        margin-bottom: 10px;
+    }
+    th, td {
+        border: 1px solid #ddd;
+        padding: 5px;
+        text-align: left;
+    }
+    th {
+        background: #f0f0f0;
+    }
+    img {
+        max-width: 100%;
+        height: auto;
+    }
+'''
+
+
+def _logo_trabajo_pdf(config):
+    """Ruta local del logo (WeasyPrint necesita acceso directo al archivo)"""
+    from django.conf import settings
+
+    if config.logo_principal_png and os.path.exists(config.logo_principal_png.path):
+        return f"file://{config.logo_principal_png.path}"
+    if config.logo_principal_svg and os.path.exists(config.logo_principal_svg.path):
+        return f"file://{config.logo_principal_svg.path}"
+    # Usar logo por defecto desde static files
+    default_logo_path = os.path.join(settings.STATIC_ROOT or settings.STATICFILES_DIRS[0], 'images', 'Logo1.svg')
+    if os.path.exists(default_logo_path):
+        return f"file://{default_logo_path}"
+    logger.warning("⚠️ No se encontró ningún logo disponible")
+    return None
+
+
+def _trabajo_en_texto(trabajo):
+    """Alternativa en texto plano cuando WeasyPrint no está disponible"""
+    fecha_inicio = timezone.localtime(trabajo.fecha_inicio).strftime('%d/%m/%Y %H:%M') if trabajo.fecha_inicio else "No iniciado"
+    fecha_fin = timezone.localtime(trabajo.fecha_fin).strftime('%d/%m/%Y %H:%M') if trabajo.fecha_fin else "En progreso"
+    content = f"""
+ORDEN DE TRABAJO #{trabajo.id}
+===============================
+
+Cliente: {trabajo.vehiculo.cliente.nombre}
+Teléfono: {trabajo.vehiculo.cliente.telefono}
+Vehículo: {trabajo.vehiculo.marca} {trabajo.vehiculo.modelo} {trabajo.vehiculo.anio}
+Placa: {trabajo.vehiculo.placa}
+
+Estado: {trabajo.get_estado_display()}
+Progreso: {trabajo.porcentaje_avance}%
+
+Fecha Inicio: {fecha_inicio}
+Fecha Fin: {fecha_fin}
+
+Observaciones:
+{trabajo.observaciones or "Sin observaciones"}
+
+Mecánicos Asignados:
+"""
+    for mec in trabajo.mecanicos.all():
+        content += f"- {mec.user.get_full_name() or mec.user.first_name} ({mec.especialidad or 'Sin especialidad'})\n"
+
+    content += "\nAcciones:\n"
+    for accion in trabajo.acciones.all():
+        estado = "✅ Completado" if accion.completado else "⏳ Pendiente"
+        content += f"- {accion.componente.nombre}: {accion.accion.nombre} - {estado}\n"
+
+    content += "\nRepuestos:\n"
+    for repuesto in trabajo.repuestos.all():
+        estado = "✅ Completado" if repuesto.completado else "⏳ Pendiente"
+        nombre = repuesto.repuesto.nombre if repuesto.repuesto else (
+            repuesto.repuesto_externo.nombre if repuesto.repuesto_externo else "Repuesto"
+        )
+        content += f"- {nombre} (x{repuesto.cantidad}) - {estado}\n"
+
+    content += f"\nTotal: ${trabajo.total_general or 0}\n"
+    content += f"\nGenerado el: {timezone.localtime().strftime('%d/%m/%Y %H:%M')}"
+    return content
+
+
+@tarea('trabajo_pdf')
+def trabajo_pdf(contexto, trabajo_id):
+    """Genera el PDF de la orden de trabajo y lo deja como archivo de la tarea"""
+    from django.template.loader import get_template
+    from .models import AdministracionTaller, Trabajo
+
+    trabajo = Trabajo.objects.select_related('vehiculo', 'vehiculo__cliente').get(pk=trabajo_id)
+    logger.info(f"🔍 INICIANDO GENERACIÓN PDF - Trabajo ID: {trabajo_id}")
+
+    try:
+        from weasyprint import HTML, CSS
+        from weasyprint.text.fonts import FontConfiguration
+    except (ImportError, OSError) as e:
+        # OSError: WeasyPrint instalado pero faltan las librerías del sistema (pango)
+        logger.error(f"❌ ERROR: WeasyPrint no está disponible: {str(e)}")
+        nombre = f"orden_trabajo_{trabajo.id}.txt"
+        contexto.guardar_archivo(nombre, _trabajo_en_texto(trabajo).encode('utf-8'))
+        return {'nombre': nombre}
+
+    config = AdministracionTaller.get_configuracion_activa()
+    html_content = get_template('car/trabajo_pdf.html').render({
+        'trabajo': trabajo,
+        'config': config,  # Configuración del taller para el logo
+        'logo_path': _logo_trabajo_pdf(config),  # Ruta local del logo para WeasyPrint
+    })
+    logger.info(f"✅ HTML renderizado - Tamaño: {len(html_content)} caracteres")
+
+    font_config = FontConfiguration()
+    css = CSS(string=CSS_TRABAJO_PDF, font_config=font_config)
+    pdf_file = HTML(string=html_content).write_pdf(stylesheets=[css], font_config=font_config)
+    logger.info(f"✅ PDF generado exitosamente - Tamaño: {len(pdf_file)} bytes")
+
+    nombre = f"orden_trabajo_{trabajo.id}.pdf"
+    contexto.guardar_archivo(nombre, pdf_file)
+    return {'nombre': nombre}
+
+
+# ========================
+# EXPORTACIÓN DE DIAGNÓSTICOS A EXCEL
+# ========================
+
+@tarea('exportar_diagnosticos_excel')
+def exportar_diagnosticos_excel(contexto):
+    """Excel en modo write-only sobre un archivo temporal (memoria constante)"""
+    from .exportaciones import ENCABEZADOS_DIAGNOSTICOS, contar_diagnosticos, escribir_xlsx, filas_diagnosticos
+
+    total = contar_diagnosticos()
+    contexto.progreso(0, total)
+
+    with tempfile.TemporaryFile(suffix='.xlsx') as archivo:
+        escribir_xlsx(archivo, "Diagnósticos", ENCABEZADOS_DIAGNOSTICOS, filas_diagnosticos(contexto.progreso))
+        archivo.seek(0)
+        contexto.guardar_archivo("diagnosticos.xlsx", archivo)
+    contexto.progreso(total)
+    return {'nombre': "diagnosticos.xlsx", 'filas': total}
+
+
+# ========================
+# ALGORITMO DE RELACIÓN REPUESTO ↔ COMPONENTE
+# ========================
+
+@tarea('relacionar_repuestos')
+def relacionar_repuestos(contexto, umbral=0.6, ejecutar=False):
+    from .algoritmo_relacion import algoritmo_relacion_inteligente
+
+    return algoritmo_relacion_inteligente(
+        umbral, solo_analizar=not ejecutar, ejecutar=ejecutar, progreso=contexto.progreso,
+    )
+
+
+# ========================
+# RECEPCIÓN DE COMPRAS
+# ========================
+
+@tarea('recibir_compra')
+def recibir_compra(contexto, compra_id):
+    """Recibe todos los items pendientes de una compra y actualiza el stock"""
+    from .compras import recibir_items
+    from .models import Compra
+
+    compra = Compra.objects.get(pk=compra_id)
+    recibidos = recibir_items(compra, usuario=contexto.usuario)['recibidos']
+    contexto.progreso(recibidos, recibidos)
+
+    if recibidos:
+        mensaje = f'{recibidos} items recibidos y stock actualizado.'
+    else:
+        mensaje = 'No hay items pendientes de recibir.'
+    return {'recibidos': recibidos, 'mensaje': mensaje}
+
+
+@tarea('actualizar_resumenes')
+def actualizar_resumenes(contexto, trabajo_ids):
+    """Refresco diferido de ResumenTrabajo (RESUMENES_MODO = 'tarea')"""
+    from .resumenes import actualizar
+
+    escritos = actualizar(trabajo_ids)
+    contexto.progreso(escritos, len(trabajo_ids))
+    return {'resumenes': escritos, 'mensaje': f'{escritos} resúmenes actualizados.'}
+
+
+@tarea('reconstruir_indice_diagnosticos')
+def reconstruir_indice_diagnosticos(contexto):
+    """Compacta el delta del índice de diagnósticos parecidos en un segmento nuevo"""
+    from .similitud_diagnosticos import reconstruir
+
+    total = reconstruir()
+    contexto.progreso(total, total)
+    return {'documentos': total, 'mensaje': f'{total} diagnósticos indexados.'}
+
+
+@tarea('entrenar_sugerencias_ingreso')
+def entrenar_sugerencias_ingreso(contexto):
+    """Reentrena el modelo de co-ocurrencias de sugerencias del ingreso"""
+    from .sugerencias_ingreso import entrenar
+
+    resumen = entrenar()
+    contexto.progreso(resumen['casos'], resumen['casos'])
+    return {**resumen, 'mensaje': f"Modelo entrenado con {resumen['casos']} casos."}
@@ -1,3 +1,352 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from . import bonos, compras, payload_ia, pizarra
+from .models import (
+    BonoGenerado, CierrePeriodo, Cliente_Taller, Compra, CompraItem, Diagnostico, Mecanico,
+    PagoMecanico, Repuesto, RepuestoEnStock, SecuenciaNumeracion, StockMovimiento, Trabajo,
+    Vehiculo, _ultimo_numero_compra,
+)
+from .movimientos_stock import DEPOSITO_PRINCIPAL, StockInsuficiente, mover_stock
+
+_INDICES = tempfile.mkdtemp(prefix='car-tests-')
+
+
+def tearDownModule():
+    shutil.rmtree(_INDICES, ignore_errors=True)
+
+
+def crear_repuesto(nombre='Pastilla de freno', stock=0, **kwargs):
+    return Repuesto.objects.create(nombre=nombre, stock=stock, **kwargs)
+
+
+def crear_trabajo(placa='ABCD12'):
+    cliente = Cliente_Taller.objects.create(rut='11111111-1', nombre='Cliente Prueba')
+    vehiculo = Vehiculo.objects.create(cliente=cliente, marca='Toyota', modelo='Yaris', anio=2015, placa=placa)
+    diagnostico = Diagnostico.objects.create(vehiculo=vehiculo, descripcion_problema='Ruido al frenar')
+    return Trabajo.objects.create(diagnostico=diagnostico, vehiculo=vehiculo)
+
+
+def crear_mecanico(username):
+    user = User.objects.create_user(username=username, password='x')
+    return Mecanico.objects.create(user=user)
+
+
+@override_settings(SIMILITUD_DIAGNOSTICOS_DIR=_INDICES)
+class MoverStockTests(TestCase):
+
+    def setUp(self):
+        self.repuesto = crear_repuesto(stock=5)
+
+    def test_ingreso_suma_en_repuesto_y_bodega_principal(self):
+        mover_stock(self.repuesto, 3, 'ingreso', motivo='Ajuste')
+
+        self.repuesto.refresh_from_db()
+        self.assertEqual(self.repuesto.stock, 8)
+        # La fila de bodega se crea con el stock de Repuesto ya actualizado
+        fila = RepuestoEnStock.objects.get(repuesto=self.repuesto, deposito=DEPOSITO_PRINCIPAL)
+        self.assertEqual(fila.stock, 8)
+
+        mover_stock(self.repuesto, 2, 'salida', validar=True)
+        fila.refresh_from_db()
+        self.assertEqual(fila.stock, 6)
+        self.assertEqual(StockMovimiento.objects.filter(repuesto=self.repuesto, tipo='ingreso').count(), 1)
+
+    def test_salida_sin_stock_lanza_stock_insuficiente(self):
+        with self.assertRaises(StockInsuficiente):
+            mover_stock(self.repuesto, 6, 'salida', validar=True)
+
+        self.repuesto.refresh_from_db()
+        self.assertEqual(self.repuesto.stock, 5)
+        self.assertFalse(StockMovimiento.objects.filter(repuesto=self.repuesto).exists())
+
+    def test_salida_de_deposito_valida_contra_reservado(self):
+        deposito = RepuestoEnStock.objects.create(
+            repuesto=self.repuesto, deposito='local', stock=5, reservado=3,
+        )
+
+        with self.assertRaises(StockInsuficiente) as contexto:
+            mover_stock(self.repuesto, 3, 'salida', validar=True, deposito=deposito)
+        self.assertIn('Disponible: 2', str(contexto.exception))
+
+        # El UPDATE de Repuesto se revierte junto con el del depósito
+        self.repuesto.refresh_from_db()
+        deposito.refresh_from_db()
+        self.assertEqual((self.repuesto.stock, deposito.stock), (5, 5))
+
+        mover_stock(self.repuesto, 2, 'salida', validar=True, deposito=deposito)
+        self.repuesto.refresh_from_db()
+        deposito.refresh_from_db()
+        self.assertEqual((self.repuesto.stock, deposito.stock), (3, 3))
+        self.assertEqual(StockMovimiento.objects.get(repuesto=self.repuesto).repuesto_stock, deposito)
+
+
+@override_settings(SIMILITUD_DIAGNOSTICOS_DIR=_INDICES)
+class ComprasTests(TestCase):
+
+    def setUp(self):
+        self.compra = Compra.objects.create(proveedor='Proveedor Uno')
+        self.filtro = crear_repuesto('Filtro de aceite', stock=2, precio_costo=Decimal('100'), precio_venta=Decimal('150'))
+        self.bujia = crear_repuesto('Bujía')
+
+    def test_guardar_items_agrupa_lineas_repetidas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = compras.guardar_items(self.compra, [
+                {'repuesto_id': self.filtro.pk, 'cantidad': 2, 'precio_unitario': '100'},
+                {'repuesto_id': self.filtro.pk, 'cantidad': 3, 'precio_unitario': '120'},
+                {'repuesto_id': self.bujia.pk, 'cantidad': 4, 'precio_unitario': '10'},
+            ])
+
+        self.assertEqual(resultado, {'creados': 2, 'actualizados': 0})
+        item = CompraItem.objects.get(compra=self.compra, repuesto=self.filtro)
+        self.assertEqual((item.cantidad, item.precio_unitario, item.subtotal), (5, Decimal('120'), Decimal('600')))
+        self.compra.refresh_from_db()
+        self.assertEqual(self.compra.total, Decimal('640'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = compras.guardar_items(self.compra, [
+                {'repuesto_id': self.filtro.pk, 'cantidad': 1, 'precio_unitario': '120'},
+            ])
+        self.assertEqual(resultado, {'creados': 0, 'actualizados': 1})
+        self.assertEqual(CompraItem.objects.get(compra=self.compra, repuesto=self.filtro).cantidad, 6)
+
+    def test_guardar_items_rechaza_compra_recibida(self):
+        self.compra.estado = 'recibida'
+        with self.assertRaises(ValueError):
+            compras.guardar_items(self.compra, [
+                {'repuesto_id': self.filtro.pk, 'cantidad': 1, 'precio_unitario': '10'},
+            ])
+
+    def test_recibir_items_suma_stock_y_cierra_la_compra(self):
+        RepuestoEnStock.objects.create(repuesto=self.filtro, deposito=DEPOSITO_PRINCIPAL, stock=2)
+        compras.guardar_items(self.compra, [
+            {'repuesto_id': self.filtro.pk, 'cantidad': 3, 'precio_unitario': '110'},
+            {'repuesto_id': self.bujia.pk, 'cantidad': 4, 'precio_unitario': '10'},
+        ])
+        precio_venta_con_margen = Repuesto.precio_venta_con_margen
+
+        def con_venta_concurrente(repuesto, precio_costo):
+            # Una venta descuenta stock después de leer el repuesto: F() no la pisa
+            if repuesto.pk == self.filtro.pk:
+                Repuesto.objects.filter(pk=repuesto.pk).update(stock=F('stock') - 1)
+            return precio_venta_con_margen(repuesto, precio_costo)
+
+        with mock.patch.object(Repuesto, 'precio_venta_con_margen', autospec=True, side_effect=con_venta_concurrente):
+            resultado = compras.recibir_items(self.compra)
+
+        self.assertEqual(resultado['recibidos'], 2)
+        self.filtro.refresh_from_db()
+        self.assertEqual(self.filtro.stock, 4)
+        # Mantiene el factor de margen anterior (150 / 100)
+        self.assertEqual((self.filtro.precio_costo, self.filtro.precio_venta), (Decimal('110'), Decimal('165')))
+        self.assertEqual(
+            RepuestoEnStock.objects.get(repuesto=self.filtro, deposito=DEPOSITO_PRINCIPAL).stock, 5,
+        )
+        # Repuesto sin fila de bodega: se crea con el stock recibido
+        fila = RepuestoEnStock.objects.get(repuesto=self.bujia, deposito=DEPOSITO_PRINCIPAL)
+        self.assertEqual((fila.stock, fila.proveedor), (4, 'Proveedor Uno'))
+        self.assertEqual(fila.precio_venta, Decimal('13.00'))
+
+        self.compra.refresh_from_db()
+        self.assertEqual(self.compra.estado, 'recibida')
+        self.assertFalse(CompraItem.objects.filter(compra=self.compra, recibido=False).exists())
+        self.assertEqual(StockMovimiento.objects.filter(referencia=f'COMPRA-{self.compra.pk}').count(), 2)
+
+        self.assertEqual(compras.recibir_items(self.compra), {'recibidos': 0, 'items': []})
+
+
+class SecuenciaNumeracionTests(TestCase):
+
+    def test_inicia_desde_el_ultimo_numero_existente(self):
+        Compra.objects.create(proveedor='Proveedor', numero_compra='COMP-0007')
+
+        self.assertEqual(SecuenciaNumeracion.siguiente('compra', inicial=_ultimo_numero_compra), 8)
+        self.assertEqual(SecuenciaNumeracion.siguiente('compra', inicial=_ultimo_numero_compra), 9)
+
+    def test_rollback_devuelve_el_numero(self):
+        self.assertEqual(SecuenciaNumeracion.siguiente('pruebas'), 1)
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.assertEqual(SecuenciaNumeracion.siguiente('pruebas'), 2)
+                raise RuntimeError
+
+        self.assertEqual(SecuenciaNumeracion.siguiente('pruebas'), 2)
+
+    def test_compra_toma_numero_correlativo(self):
+        primera = Compra.objects.create(proveedor='Proveedor')
+        segunda = Compra.objects.create(proveedor='Proveedor')
+
+        self.assertEqual((primera.numero_compra, segunda.numero_compra), ('COMP-0001', 'COMP-0002'))
+
+
+@override_settings(SIMILITUD_DIAGNOSTICOS_DIR=_INDICES)
+class BonosTests(TestCase):
+
+    def setUp(self):
+        self.trabajo = crear_trabajo()
+        self.uno = crear_mecanico('uno')
+        self.dos = crear_mecanico('dos')
+
+    def crear_bono(self, mecanico, monto, **kwargs):
+        return BonoGenerado.objects.create(
+            mecanico=mecanico, trabajo=self.trabajo, monto=Decimal(monto), tipo_bono='fijo',
+            total_mano_obra=Decimal('0'), **kwargs
+        )
+
+    def test_aplicar_pago_marca_bonos_y_completa_periodo(self):
+        sin_periodo = self.crear_bono(self.uno, '100')
+        con_periodo = self.crear_bono(self.uno, '50', periodo_mes=2, periodo_anio=2025)
+        pago = PagoMecanico.objects.create(mecanico=self.uno, monto=Decimal('150'), periodo_mes=3, periodo_anio=2025)
+
+        self.assertEqual(bonos.aplicar_pago(pago, bonos=[sin_periodo.pk, con_periodo.pk]), 2)
+
+        sin_periodo.refresh_from_db()
+        con_periodo.refresh_from_db()
+        self.assertTrue(sin_periodo.pagado and con_periodo.pagado)
+        self.assertEqual((sin_periodo.periodo_mes, sin_periodo.periodo_anio), (3, 2025))
+        self.assertEqual((con_periodo.periodo_mes, con_periodo.periodo_anio), (2, 2025))
+
+    def test_cerrar_periodos_calcula_totales_por_mecanico(self):
+        self.crear_bono(self.uno, '100', periodo_mes=5, periodo_anio=2025, pagado=True)
+        self.crear_bono(self.uno, '40', periodo_mes=5, periodo_anio=2025)
+        self.crear_bono(self.dos, '30', periodo_mes=5, periodo_anio=2025)
+        otro_mes = self.crear_bono(self.dos, '999', periodo_mes=6, periodo_anio=2025)
+
+        cierres = bonos.cerrar_periodos(5, 2025)
+
+        self.assertEqual([c.mecanico_id for c in cierres], [self.uno.pk, self.dos.pk])
+        cierre = CierrePeriodo.objects.get(mecanico=self.uno, periodo_mes=5, periodo_anio=2025)
+        self.assertEqual(
+            (cierre.total_bonos, cierre.total_pagado, cierre.saldo_pendiente),
+            (Decimal('140'), Decimal('100'), Decimal('40')),
+        )
+        self.assertEqual(BonoGenerado.objects.filter(periodo_mes=5, cerrado=True).count(), 3)
+        otro_mes.refresh_from_db()
+        self.assertFalse(otro_mes.cerrado)
+
+        # Ya cerrado para todos: no queda nadie por cerrar
+        self.assertEqual(bonos.cerrar_periodos(5, 2025), [])
+
+    def test_cerrar_periodos_mecanico_indicado_sin_bonos(self):
+        cierres = bonos.cerrar_periodos(7, 2025, mecanicos=[self.dos])
+
+        self.assertEqual(len(cierres), 1)
+        self.assertEqual(cierres[0].total_bonos, Decimal('0'))
+
+    def test_cerrar_periodos_mes_invalido(self):
+        with self.assertRaises(ValueError):
+            bonos.cerrar_periodos(13, 2025)
+
+
+@override_settings(SIMILITUD_DIAGNOSTICOS_DIR=_INDICES)
+class PizarraTests(TestCase):
+
+    def test_cambios_desde_devuelve_trabajos_publicados(self):
+        trabajo = crear_trabajo()
+        desde = pizarra.secuencia()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trabajo.estado = 'trabajando'
+            trabajo.save()
+            trabajo.save()
+
+        actual, trabajo_ids = pizarra.cambios_desde(desde)
+        self.assertEqual(actual, desde + 1)
+        self.assertEqual(trabajo_ids, [trabajo.pk])
+        self.assertEqual(pizarra.cambios_desde(actual), (actual, []))
+
+    def test_cambios_desde_pide_pizarra_completa(self):
+        actual = pizarra.secuencia()
+
+        self.assertEqual(pizarra.cambios_desde(None), (actual, None))
+        self.assertEqual(pizarra.cambios_desde(actual + 1), (actual, None))
+        with override_settings(PIZARRA_LIMITE_CAMBIOS=2):
+            self.assertEqual(pizarra.cambios_desde(actual - 3), (actual, None))
+
+
+class PayloadIATests(TestCase):
+
+    def registros(self, cantidad):
+        return [
+            {'id': i, 'estado': 'iniciado' if i % 2 else 'entregado', 'total': i * 10,
+             'vehiculo': {'placa': f'AB{i:04d}', 'marca': 'Toyota'}}
+            for i in range(1, cantidad + 1)
+        ]
+
+    def test_compactar_arma_tabla_columnar(self):
+        compacto = payload_ia.compactar({'success': True, 'trabajos': self.registros(3)})
+
+        tabla = compacto['trabajos']
+        self.assertTrue(compacto['compacto'])
+        self.assertEqual(tabla['columnas'], ['id', 'estado', 'total', 'vehiculo.placa'])
+        self.assertEqual(tabla['constantes'], {'vehiculo.marca': 'Toyota'})
+        self.assertEqual(tabla['filas'][0], [1, 'iniciado', 10, 'AB0001'])
+        self.assertEqual(tabla['resumen']['filas'], 3)
+
+    def test_compactar_deja_errores_sin_cambios(self):
+        error = {'success': False, 'error': 'x'}
+        self.assertIs(payload_ia.compactar(error), error)
+
+    @override_settings(PAYLOAD_IA_MAX_TOKENS=200)
+    def test_pagina_entrega_las_filas_restantes(self):
+        compacto = payload_ia.compactar({'success': True, 'trabajos': self.registros(60)})
+
+        tabla = compacto['trabajos']
+        mostradas = len(tabla['filas'])
+        self.assertLess(mostradas, 60)
+        self.assertEqual(tabla['filas_restantes'], 60 - mostradas)
+
+        vistas = [fila[0] for fila in tabla['filas']]
+        cursor = tabla['cursor']
+        while cursor:
+            siguiente = payload_ia.pagina(cursor)
+            datos = siguiente['trabajos']
+            self.assertEqual(datos['desde'], len(vistas) + 1)
+            vistas.extend(fila[0] for fila in datos['filas'])
+            cursor = datos.get('cursor')
+        self.assertEqual(vistas, list(range(1, 61)))
+
+    def test_pagina_cursor_inexistente(self):
+        self.assertFalse(payload_ia.pagina('no-existe')['success'])
+
+
+@override_settings(SIMILITUD_DIAGNOSTICOS_DIR=_INDICES)
+class ComandosTests(TestCase):
+
+    def setUp(self):
+        crear_repuesto('Amortiguador', stock=3)
+        crear_trabajo()
+
+    def ejecutar(self, nombre, *args, **kwargs):
+        salida = StringIO()
+        call_command(nombre, *args, stdout=salida, **kwargs)
+        return salida.getvalue()
+
+    def test_limpiar_datos_indefinidos(self):
+        self.assertIn('DRY-RUN', self.ejecutar('limpiar_datos_indefinidos', dry_run=True))
+
+        with mock.patch('builtins.input', return_value='y'):
+            self.ejecutar('limpiar_datos_indefinidos')
+        repuesto = Repuesto.objects.get(nombre='Amortiguador')
+        self.assertIsNone(repuesto.oem)
+        self.assertEqual(repuesto.marca, '')
+        self.assertEqual(RepuestoEnStock.objects.get(repuesto=repuesto, deposito=DEPOSITO_PRINCIPAL).stock, 3)
+
+    def test_reconstrucciones(self):
+        for nombre in (
+            'conciliar_stock', 'reconstruir_indice_busqueda', 'reconstruir_compatibilidad',
+            'reconstruir_arbol_componentes', 'reconstruir_estadisticas', 'reconstruir_indice_diagnosticos',
+        ):
+            with self.subTest(comando=nombre):
+                self.ejecutar(nombre)
+        self.ejecutar('rebuild_resumenes', procesos=1)
@@ -5,7 +5,8 @@ from django.utils.timezone import now
 from django.shortcuts import redirect
 from .import views
 from .views_api import vehiculo_lookup, openai_response
-from .views_ia import netgogo_console, netgogo_chat, netgogo2_console, netgogo2_chat
+from .views_ia import netgogo_console, netgogo_chat, netgogo2_console, netgogo2_chat, diagnosticos_similares
+from .views_ia_stream import netgogo_chat_stream, netgogo2_chat_stream
 from .views import ClienteListView, ClienteTallerListView, ClienteTallerCreateView, ClienteTallerUpdateView, ClienteTallerDeleteView, cliente_taller_lookup, VehiculoListView,\
                    VehiculoCreateView,VehiculoUpdateView,\
                    VehiculoDeleteView,MecanicoListView,\
@@ -16,6 +17,7 @@ from .views import ClienteListView, ClienteTallerListView, ClienteTallerCreateVi
 from . import views_pos
 from . import views_compras
 from . import views_algoritmo
+from . import views_tareas
 from . import views_vehiculos
 from . import views_estadisticas
 from . import views_bonos 
@@ -58,8 +60,11 @@ urlpatterns = [
     path("api/openai/response/", openai_response, name="openai_response"),
     path("netgogo/", netgogo_console, name="netgogo_console"),
     path("api/netgogo/chat/", netgogo_chat, name="netgogo_chat"),
+    path("api/netgogo/chat/stream/", netgogo_chat_stream, name="netgogo_chat_stream"),
     path("netgogo2/", netgogo2_console, name="netgogo2_console"),
     path("api/netgogo2/chat/", netgogo2_chat, name="netgogo2_chat"),
+    path("api/netgogo2/chat/stream/", netgogo2_chat_stream, name="netgogo2_chat_stream"),
+    path("api/diagnosticos/similares/", diagnosticos_similares, name="diagnosticos_similares"),
 
     # === Componente + Acción (precios) ===
     path('componente-acciones/', views.comp_accion_list, name='comp_accion_list'),
@@ -130,11 +135,13 @@ urlpatterns = [
     path("bonos/cierres/", views_bonos.lista_cierres_periodo, name="lista_cierres_periodo"),
     path("bonos/cierres/mecanico/<int:mecanico_id>/", views_bonos.lista_cierres_periodo, name="lista_cierres_periodo_mecanico"),
     path("bonos/cierre/crear/<int:mecanico_id>/<int:mes>/<int:anio>/", views_bonos.crear_cierre_periodo, name="crear_cierre_periodo"),
+    path("bonos/cierre/crear-todos/", views_bonos.cerrar_periodo_todos, name="cerrar_periodo_todos"),
     path("bonos/cierre/<int:cierre_id>/eliminar/", views_bonos.eliminar_cierre_periodo, name="eliminar_cierre_periodo"),
     path("bonos/bono/<int:bono_id>/eliminar/", views_bonos.eliminar_bono, name="eliminar_bono"),
     path("bonos/pago/<int:pago_id>/eliminar/", views_bonos.eliminar_pago, name="eliminar_pago"),
     # Pizarra
     path("pizarra/", views.pizarra_view, name="pizarra"),
+    path("pizarra/cambios/", views.pizarra_cambios, name="pizarra_cambios"),
     # Ventas
     path("crear/", views.venta_crear, name="venta_crear"),
     path("<int:pk>/", views.venta_detalle, name="venta_detalle"),
@@ -192,6 +199,7 @@ urlpatterns = [
     path("compras/<int:pk>/confirmar/", views_compras.compra_confirmar, name="compra_confirmar"),
     path("compras/<int:pk>/cancelar/", views_compras.compra_cancelar, name="compra_cancelar"),
     path("compras/<int:pk>/recibir/", views_compras.compra_recibir, name="compra_recibir"),
+    path("compras/<int:pk>/items/lote/", views_compras.compra_items_lote, name="compra_items_lote"),
     path("compras/item/<int:pk>/editar/", views_compras.compra_item_edit, name="compra_item_edit"),
     path("compras/item/<int:pk>/eliminar/", views_compras.compra_item_delete, name="compra_item_delete"),
     path("compras/item/<int:pk>/recibir/", views_compras.compra_item_recibir, name="compra_item_recibir"),
@@ -202,6 +210,11 @@ urlpatterns = [
     # === Algoritmo de Relación Inteligente ===
     path('algoritmo/relacionar/', views_algoritmo.relacionar_repuestos_componentes, name='relacionar_repuestos_componentes'),
     
+    # === Tareas en segundo plano ===
+    path('tareas/<int:pk>/', views_tareas.tarea_estado, name='tarea_estado'),
+    path('tareas/<int:pk>/estado/', views_tareas.estado_tarea, name='estado_tarea'),
+    path('tareas/<int:pk>/descargar/', views_tareas.descargar_tarea, name='descargar_tarea'),
+    
     # === Gestión de Compatibilidad de Vehículos ===
     path("vehiculos-compatibilidad/", views_vehiculos.vehiculo_list, name="vehiculo_compatibilidad_list"),
     path("vehiculos-compatibilidad/crear/", views_vehiculos.vehiculo_create, name="vehiculo_compatibilidad_create"),
@@ -7,46 +7,19 @@ todos los eventos importantes del sistema.
 from django.utils import timezone
 from django.db import transaction
 from .models import RegistroEvento, ResumenTrabajo, Trabajo, Diagnostico
+from .cola_auditoria import agregar as encolar_evento
+from .resumenes import actualizar as actualizar_resumenes, marcar_pendiente
 
 
-def _obtener_datos_vehiculo(obj):
+def _obtener_datos_usuario(request, usuario=None):
     """
-    Extrae los datos del vehículo y cliente de un trabajo o diagnóstico.
+    Extrae los datos del usuario de la request (o del usuario indicado).
     """
-    vehiculo = obj.vehiculo
-    cliente = vehiculo.cliente if hasattr(vehiculo, 'cliente') else None
-    
-    return {
-        'vehiculo_id': vehiculo.id,
-        'vehiculo_placa': vehiculo.placa,
-        'vehiculo_marca': vehiculo.marca if hasattr(vehiculo, 'marca') else None,
-        'vehiculo_modelo': vehiculo.modelo if hasattr(vehiculo, 'modelo') else None,
-        'cliente_nombre': cliente.nombre if cliente else None,
-    }
-
-
-def _obtener_datos_trabajo(trabajo):
-    """
-    Extrae los totales y estadísticas actuales del trabajo.
-    """
-    return {
-        'fecha_ingreso': trabajo.fecha_inicio,
-        'fecha_entrega': trabajo.fecha_fin if trabajo.estado == 'entregado' else None,
-        'dias_en_taller': trabajo.dias_en_taller,
-        'total_mano_obra': trabajo.total_mano_obra or 0,
-        'total_repuestos': trabajo.total_repuestos or 0,
-        'total_general': trabajo.total_general or 0,
-    }
-
-
-def _obtener_datos_usuario(request):
-    """
-    Extrae los datos del usuario de la request.
-    """
-    if request and hasattr(request, 'user') and request.user.is_authenticated:
+    usuario = usuario or (request.user if request and hasattr(request, 'user') else None)
+    if usuario and usuario.is_authenticated:
         return {
-            'usuario_id': request.user.id,
-            'usuario_nombre': request.user.username,
+            'usuario_id': usuario.id,
+            'usuario_nombre': usuario.username,
         }
     return {
         'usuario_id': None,
@@ -54,7 +27,6 @@ def _obtener_datos_usuario(request):
     }
 
 
-@transaction.atomic
 def registrar_evento(
     trabajo=None,
     diagnostico=None,
@@ -70,10 +42,15 @@ def registrar_evento(
     mecanico=None,
     descripcion=None,
     request=None,
+    usuario=None,
 ):
     """
     Registra un evento en el sistema de auditoría.
     
+    El evento se arma en memoria y se escribe en lote después de confirmar la
+    transacción (ver cola_auditoria): los datos del vehículo y los totales del
+    trabajo se completan en ese momento con una sola consulta por lote.
+    
     Args:
         trabajo: Instancia de Trabajo (opcional si es diagnóstico)
         diagnostico: Instancia de Diagnostico (opcional si es trabajo)
@@ -89,71 +66,39 @@ def registrar_evento(
         mecanico: Instancia de Mecanico (opcional)
         descripcion: Descripción adicional (opcional)
         request: Request object para obtener usuario (opcional)
+        usuario: User (opcional, alternativo a request)
     
     Returns:
-        RegistroEvento: El registro creado
+        RegistroEvento: El registro encolado (tiene pk una vez escrito)
     """
     if fecha_evento is None:
         fecha_evento = timezone.now()
     
     # Determinar si es trabajo o diagnóstico
     if trabajo:
-        obj = trabajo
-        diagnostico_obj = trabajo.diagnostico if hasattr(trabajo, 'diagnostico') else None
-        trabajo_id = trabajo.id
+        diagnostico_id = trabajo.diagnostico_id
+        vehiculo_id = trabajo.vehiculo_id
+        estado_actual = estado_nuevo or trabajo.estado
     elif diagnostico:
-        obj = diagnostico
-        diagnostico_obj = diagnostico
-        trabajo_id = None
+        diagnostico_id = diagnostico.id
+        vehiculo_id = diagnostico.vehiculo_id
+        estado_actual = estado_nuevo or diagnostico.estado
     else:
         raise ValueError("Debe proporcionar 'trabajo' o 'diagnostico'")
     
-    # Obtener datos del vehículo
-    datos_vehiculo = _obtener_datos_vehiculo(obj)
-    
-    # Obtener datos del trabajo (si existe)
-    if trabajo:
-        datos_trabajo = _obtener_datos_trabajo(trabajo)
-    else:
-        # Para diagnósticos, no tenemos datos de trabajo
-        datos_trabajo = {
-            'fecha_ingreso': None,
-            'fecha_entrega': None,
-            'dias_en_taller': None,
-            'total_mano_obra': 0,
-            'total_repuestos': 0,
-            'total_general': 0,
-        }
-    
     # Obtener datos del usuario
-    datos_usuario = _obtener_datos_usuario(request)
+    datos_usuario = _obtener_datos_usuario(request, usuario)
     
-    # Estado actual (del trabajo o diagnóstico)
-    estado_actual = None
-    if trabajo:
-        estado_actual = estado_nuevo or trabajo.estado
-    elif diagnostico:
-        estado_actual = estado_nuevo or diagnostico.estado
-    
-    # Preparar datos del evento
+    # Preparar datos del evento (vehículo y totales se completan al escribir)
     evento_data = {
-        'trabajo_id': trabajo_id,
-        'diagnostico_id': diagnostico_obj.id if diagnostico_obj else None,
-        'vehiculo_id': datos_vehiculo['vehiculo_id'],
+        'trabajo_id': trabajo.id if trabajo else None,
+        'diagnostico_id': diagnostico_id,
+        'vehiculo_id': vehiculo_id,
+        'vehiculo_placa': '',
         'tipo_evento': tipo_evento,
         'fecha_evento': fecha_evento,
-        'vehiculo_placa': datos_vehiculo['vehiculo_placa'],
-        'vehiculo_marca': datos_vehiculo['vehiculo_marca'],
-        'vehiculo_modelo': datos_vehiculo['vehiculo_modelo'],
-        'cliente_nombre': datos_vehiculo['cliente_nombre'],
         'estado_anterior': estado_anterior,
         'estado_nuevo': estado_actual,
-        'fecha_ingreso': datos_trabajo['fecha_ingreso'],
-        'fecha_entrega': datos_trabajo['fecha_entrega'],
-        'dias_en_taller': datos_trabajo['dias_en_taller'],
-        'total_mano_obra': datos_trabajo['total_mano_obra'],
-        'total_repuestos': datos_trabajo['total_repuestos'],
-        'total_general': datos_trabajo['total_general'],
         'usuario_id': datos_usuario['usuario_id'],
         'usuario_nombre': datos_usuario['usuario_nombre'],
         'descripcion': descripcion,
@@ -211,12 +156,15 @@ def registrar_evento(
         else:
             evento_data['mecanico_nombre'] = str(mecanico)
     
-    # Crear el registro
-    registro = RegistroEvento.objects.create(**evento_data)
+    registro = RegistroEvento(**evento_data)
+    encolar_evento(
+        registro, trabajo=trabajo, diagnostico=None if trabajo else diagnostico,
+        accion=accion, repuesto=repuesto,
+    )
     
-    # Actualizar el resumen del trabajo (solo si existe trabajo)
+    # El resumen del trabajo se refresca una sola vez al confirmar la transacción
     if trabajo:
-        actualizar_resumen_trabajo(trabajo)
+        marcar_pendiente(trabajo.id)
     
     return registro
 
@@ -398,47 +346,9 @@ def registrar_observacion(trabajo, observacion, request=None):
 @transaction.atomic
 def actualizar_resumen_trabajo(trabajo):
     """
-    Actualiza o crea el resumen de un trabajo.
+    Actualiza o crea el resumen de un trabajo en el momento (los eventos usan
+    resumenes.marcar_pendiente para refrescarlo una sola vez al confirmar).
     """
-    datos_vehiculo = _obtener_datos_vehiculo(trabajo)
-    datos_trabajo = _obtener_datos_trabajo(trabajo)
-    
-    # Obtener mecánicos asignados
-    mecanicos_ids = list(trabajo.mecanicos.values_list('id', flat=True))
-    mecanicos_str = ','.join(map(str, mecanicos_ids)) if mecanicos_ids else None
-    
-    # Calcular días desde entrega
-    dias_desde_entrega = None
-    if trabajo.estado == 'entregado' and trabajo.fecha_fin:
-        delta = timezone.now() - trabajo.fecha_fin
-        dias_desde_entrega = delta.days
-    
-    resumen, created = ResumenTrabajo.objects.update_or_create(
-        trabajo_id=trabajo.id,
-        defaults={
-            'vehiculo_placa': datos_vehiculo['vehiculo_placa'],
-            'vehiculo_marca': datos_vehiculo['vehiculo_marca'],
-            'vehiculo_modelo': datos_vehiculo['vehiculo_modelo'],
-            'cliente_nombre': datos_vehiculo['cliente_nombre'],
-            'fecha_ingreso': datos_trabajo['fecha_ingreso'],
-            'fecha_ultimo_estado': timezone.now(),
-            'fecha_entrega': datos_trabajo['fecha_entrega'],
-            'estado_actual': trabajo.estado,
-            'total_acciones': trabajo.acciones.count(),
-            'acciones_completadas': trabajo.acciones.filter(completado=True).count(),
-            'cantidad_repuestos': trabajo.repuestos.count(),
-            'repuestos_instalados': trabajo.repuestos.filter(completado=True).count(),
-            'total_mano_obra': datos_trabajo['total_mano_obra'],
-            'total_repuestos': datos_trabajo['total_repuestos'],
-            'total_general': datos_trabajo['total_general'],
-            'total_abonos': trabajo.total_abonos,
-            'porcentaje_avance': trabajo.porcentaje_avance,
-            'porcentaje_cobrado': trabajo.porcentaje_cobrado,
-            'dias_en_taller': datos_trabajo['dias_en_taller'],
-            'dias_desde_entrega': dias_desde_entrega,
-            'mecanicos_asignados': mecanicos_str,
-        }
-    )
-    
-    return resumen
+    actualizar_resumenes([trabajo.id])
+    return ResumenTrabajo.objects.filter(trabajo_id=trabajo.id).first()
 
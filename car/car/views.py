@@ -11,14 +11,17 @@ from django.http import JsonResponse
 from django.templatetags.static import static
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.contrib.staticfiles import finders
 from django.contrib.staticfiles.storage import staticfiles_storage
 from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.db.models import Sum
 from django.db.models import Q
-from urllib.parse import unquote
+from urllib.parse import unquote, urlencode
 
 # NUEVOS IMPORTS PARA PERMISOS
 from .decorators import (
@@ -26,7 +29,11 @@ from .decorators import (
     solo_mecanicos_y_admin, solo_vendedores_y_admin
 )
 from .forms import RepuestoForm
-import pandas as pd
+from .busqueda_repuestos import buscar_repuesto_ids, ordenar_por_ranking
+from .movimientos_stock import mover_stock, igualar_deposito, conciliar_depositos
+from .tareas import encolar
+from . import arbol_componentes, compatibilidad_repuestos, pizarra
+from .lineas_diagnostico import guardar_lineas, registrar_aprobacion
 from io import BytesIO
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -37,7 +44,7 @@ from difflib import SequenceMatcher
 import re
 from collections import defaultdict
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from reportlab.lib.styles import ParagraphStyle
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
@@ -57,7 +64,7 @@ from django.contrib.auth.models import User
 from django.forms import modelformset_factory
 from django.forms import inlineformset_factory
 from .utils_auditoria import (
-    registrar_diagnostico_creado, registrar_diagnostico_aprobado, registrar_ingreso,
+    registrar_diagnostico_creado,
     registrar_cambio_estado, registrar_accion_completada, registrar_accion_pendiente,
     registrar_repuesto_instalado, registrar_repuesto_pendiente, registrar_entrega,
     registrar_abono, registrar_foto_agregada, registrar_mecanico_asignado,
@@ -231,132 +238,10 @@ def ingreso_view(request):
             diagnostico.componentes.set(selected_componentes_ids)
 
             # ====================================================
-            # 🔹 Acciones por componente desde hidden JSON
-            acciones_json = (request.POST.get("acciones_componentes_json") or "").strip()
-            if acciones_json:
-                try:
-                    items = json.loads(acciones_json)
-                    for it in items:
-                        try:
-                            comp_id = int(it.get("componente_id"))
-                            acc_id = int(it.get("accion_id"))
-                        except (TypeError, ValueError):
-                            continue
-
-                        precio_mano_obra = (it.get("precio_mano_obra") or "").strip()
-                        cantidad = int(it.get("cantidad", 1)) if it.get("cantidad") else 1
-
-                        if not diagnostico.componentes.filter(id=comp_id).exists():
-                            continue  # ignora acciones de componentes no seleccionados
-
-                        dca = DiagnosticoComponenteAccion(
-                            diagnostico=diagnostico,
-                            componente_id=comp_id,
-                            accion_id=acc_id,
-                            cantidad=cantidad
-                        )
-                        if precio_mano_obra and precio_mano_obra not in ("0", "0.00"):
-                            dca.precio_mano_obra = precio_mano_obra
-                        dca.save()
-                except json.JSONDecodeError:
-                    pass
-            
-            # ====================================================
-
-            # ====================================================
-            # 🔹 Repuestos seleccionados desde hidden JSON
-            # ====================================================
-            repuestos_json = (request.POST.get("repuestos_json") or "").strip()
-            print("=" * 80)
-            print("📦 DEBUG REPUESTOS_JSON EN BACKEND")
-            print("=" * 80)
-            print(f"📋 repuestos_json recibido: {repr(repuestos_json)}")
-            print(f"📋 Longitud: {len(repuestos_json) if repuestos_json else 0}")
-            if repuestos_json:
-                try:
-                    repuestos_data = json.loads(repuestos_json)
-                    print(f"📦 Total repuestos parseados: {len(repuestos_data)}")
-                    print(f"📦 Datos completos: {repuestos_data}")
-                    
-                    for idx, r in enumerate(repuestos_data, 1):
-                        try:
-                            repuesto_id = int(r.get("id"))
-                            repuesto = Repuesto.objects.get(pk=repuesto_id)
-                            print(f"✅ [{idx}/{len(repuestos_data)}] Procesando: {repuesto.nombre} (ID: {repuesto_id})")
-
-                            stock_id_raw = r.get("repuesto_stock_id")
-                            repuesto_stock = None
-                            if stock_id_raw:
-                                try:
-                                    repuesto_stock = RepuestoEnStock.objects.get(pk=int(stock_id_raw))
-                                except (ValueError, RepuestoEnStock.DoesNotExist):
-                                    repuesto_stock = None
-
-                            cantidad = int(r.get("cantidad", 1))
-                            precio = float(r.get("precio_unitario", repuesto.precio_venta or 0))
-
-                            DiagnosticoRepuesto.objects.create(
-                                diagnostico=diagnostico,
-                                repuesto=repuesto,
-                                repuesto_stock=repuesto_stock,
-                                cantidad=cantidad,
-                                precio_unitario=precio,
-                                subtotal=cantidad * precio
-                            )
-                            print(f"   ✅ DiagnosticoRepuesto creado: {repuesto.nombre} x{cantidad}")
-                        except (ValueError, Repuesto.DoesNotExist, KeyError) as e:
-                            print(f"   ❌ Error procesando repuesto: {e}")
-                            continue
-                    print("=" * 80)
-                except json.JSONDecodeError as e:
-                    print(f"❌ Error decodificando JSON de repuestos: {e}")
-                    print("=" * 80)
-                    pass
-            else:
-                print("⚠️ repuestos_json está vacío o es None")
-                print("=" * 80)
-            # ====================================================
-
-            # ====================================================
-            # 🌐 Repuestos Externos (Referencias)
-            # ====================================================
-            repuestos_externos_json = (request.POST.get("repuestos_externos_json") or "").strip()
-            if repuestos_externos_json:
-                try:
-                    from .models import RepuestoExterno
-                    repuestos_externos_data = json.loads(repuestos_externos_json)
-                    for r_ext in repuestos_externos_data:
-                        try:
-                            repuesto_ext_id = int(r_ext.get("id"))
-                            repuesto_externo = RepuestoExterno.objects.get(pk=repuesto_ext_id)
-                            
-                            cantidad = int(r_ext.get("cantidad", 1))
-                            precio = float(r_ext.get("precio", repuesto_externo.precio_referencial))
-                            
-                            # Crear el DiagnosticoRepuesto con referencia externa
-                            DiagnosticoRepuesto.objects.create(
-                                diagnostico=diagnostico,
-                                repuesto=None,  # Sin repuesto del inventario
-                                repuesto_externo=repuesto_externo,  # NUEVO: Referencia al repuesto externo
-                                repuesto_stock=None,
-                                cantidad=cantidad,
-                                precio_unitario=precio,
-                                subtotal=cantidad * precio
-                            )
-                            
-                            # Incrementar contador de uso
-                            repuesto_externo.incrementar_uso()
-                            
-                        except (ValueError, RepuestoExterno.DoesNotExist, KeyError) as e:
-                            print(f"Error procesando repuesto externo: {e}")
-                            continue
-                except json.JSONDecodeError as e:
-                    print(f"Error decodificando JSON de repuestos externos: {e}")
-                    pass
-            # ====================================================
-            # 🧰 Nota: Los insumos ahora se agregan directamente a repuestos_json
-            # desde el frontend, por lo que ya fueron procesados arriba ⬆️
+            # 🔹 Acciones, repuestos y repuestos externos desde los hidden JSON
+            # (los insumos llegan dentro de repuestos_json desde el frontend)
             # ====================================================
+            guardar_lineas(diagnostico, request.POST, selected_componentes_ids)
 
             config = AdministracionTaller.get_configuracion_activa()
             if config.ver_mensajes:
@@ -406,7 +291,7 @@ def ingreso_view(request):
         'vehiculos_existentes': vehiculos_existentes,
         'selected_cliente': selected_cliente,
         'selected_vehiculo': selected_vehiculo,
-        'componentes': Componente.objects.filter(padre__isnull=True, activo=True).order_by('nombre'),
+        'componentes': arbol_componentes.arbol(),
         'selected_componentes_ids': selected_componentes_ids,
         'svg': svg_content,
     })
@@ -527,6 +412,13 @@ def mostrar_plano(request):
     
     return render(request, 'car/plano_interactivo.html', {'svg': svg_content, 'config': config})
 
+def _url_imagen_componente(codigo):
+    try:
+        return staticfiles_storage.url(f'images/{codigo}.svg')
+    except Exception:
+        return settings.STATIC_URL + f'images/{codigo}.svg'
+
+
 @login_required
 def componentes_lookup(request):
     part = (request.GET.get('part') or '').strip()
@@ -549,22 +441,15 @@ def componentes_lookup(request):
 
     hijos = list(comp.hijos.values('id', 'nombre', 'codigo'))
 
-    # 🔹 buscar imagen en este componente o en su cadena de padres
+    # 🔹 buscar imagen en este componente o en su cadena de padres (una consulta)
     imagen_url = None
-    current = comp
-    while current and not imagen_url:
-        try:
-            if hasattr(current, 'imagen') and current.imagen:
-                imagen_url = current.imagen.url
-            else:
-                imagen_url = staticfiles_storage.url(f'images/{current.codigo}.svg')
-        except Exception:
-            imagen_url = settings.STATIC_URL + f'images/{current.codigo}.svg'
-
-        # si tampoco existe, subir al padre
-        if not current.padre_id:  
+    cadena = [comp.codigo] + list(reversed(comp.ancestros().values_list('codigo', flat=True)))
+    for codigo in cadena:
+        if finders.find(f'images/{codigo}.svg'):
+            imagen_url = _url_imagen_componente(codigo)
             break
-        current = current.padre
+    if not imagen_url:
+        imagen_url = _url_imagen_componente(comp.codigo)
 
     parent = {
         'id': comp.id,
@@ -825,8 +710,8 @@ def editar_diagnostico(request, pk):
     from django.db.models import Q
     acciones_disponibles = Accion.objects.all()
     
-    # 🔹 COMPONENTES DISPONIBLES (solo componentes padre con sus hijos)
-    componentes = Componente.objects.filter(padre__isnull=True, activo=True).prefetch_related('hijos')
+    # 🔹 COMPONENTES DISPONIBLES (solo componentes padre con sus hijos, árbol en caché)
+    componentes = arbol_componentes.arbol()
     
     # 🔹 FILTRO INTELIGENTE DE REPUESTOS basado en el vehículo del diagnóstico
     repuestos_disponibles = Repuesto.objects.all()
@@ -1539,9 +1424,8 @@ def sugerir_repuestos(request, diagnostico_id=None):
     2) Compatibilidad exacta con la versión del vehículo (VehiculoVersion + RepuestoAplicacion)
     3) Filtro inteligente por características del vehículo (marca_veh, tipo_de_motor)
     4) Priorizar filas con stock disponible en RepuestoEnStock
+    Todo se resuelve sobre el índice CompatibilidadRepuesto (ver compatibilidad_repuestos.py).
     """
-    from django.db.models import Q
-    
     componentes_ids = []
     veh_marca = veh_modelo = veh_anio = None
     veh_motor = veh_cilindrada = veh_nro_valvulas = veh_combustible = veh_otro_especial = None
@@ -1572,85 +1456,18 @@ def sugerir_repuestos(request, diagnostico_id=None):
         except ValueError:
             veh_anio = None
 
-    # 1) Repuestos ligados a los componentes
-    repuestos_comp = (
-        Repuesto.objects
-        .filter(componenterepuesto__componente_id__in=componentes_ids)
-        .distinct()
+    # Componentes + versión + características + puntaje en una consulta sobre el índice
+    filas = compatibilidad_repuestos.sugerir(
+        componentes_ids, marca=veh_marca, modelo=veh_modelo, anio=veh_anio, motor=veh_motor,
+        cilindrada=veh_cilindrada, nro_valvulas=veh_nro_valvulas, combustible=veh_combustible,
+        otro_especial=veh_otro_especial, limite=80,
     )
+    stocks = compatibilidad_repuestos.mejores_stocks([fila.repuesto_id for fila in filas])
 
-    # 2) Compatibilidad exacta por versión (INTERSECCIÓN)
-    candidates = repuestos_comp
-    if veh_marca and veh_modelo and veh_anio:
-        version = (
-            VehiculoVersion.objects
-            .filter(
-                marca__iexact=veh_marca,
-                modelo__iexact=veh_modelo,
-                anio_desde__lte=veh_anio,
-                anio_hasta__gte=veh_anio
-            )
-            .first()
-        )
-        if version:
-            candidates = repuestos_comp.filter(aplicaciones__version=version).distinct()
-
-    # 3) FILTRO INTELIGENTE POR CARACTERÍSTICAS DEL VEHÍCULO
-    if veh_marca or veh_motor or veh_cilindrada or veh_nro_valvulas or veh_combustible or veh_otro_especial:
-        filtro_vehiculo = Q()
-        
-        # Filtrar por marca del vehículo
-        if veh_marca:
-            # Buscar repuestos que coincidan con la marca del vehículo
-            filtro_vehiculo |= Q(marca_veh__icontains=veh_marca)
-            # También buscar por marca general si no hay marca específica
-            filtro_vehiculo |= Q(marca_veh__in=['general', 'xxx', ''])
-        
-        # Filtrar por tipo de motor
-        if veh_motor:
-            # Buscar repuestos que coincidan con el tipo de motor
-            filtro_vehiculo |= Q(tipo_de_motor__icontains=veh_motor)
-            # También incluir repuestos generales
-            filtro_vehiculo |= Q(tipo_de_motor__in=['zzzzzz', ''])
-        
-        # Filtrar por cilindrada
-        if veh_cilindrada:
-            filtro_vehiculo |= Q(cilindrada__icontains=veh_cilindrada)
-            filtro_vehiculo |= Q(cilindrada__isnull=True) | Q(cilindrada='')
-        
-        # Filtrar por número de válvulas
-        if veh_nro_valvulas:
-            try:
-                nro_valvulas_int = int(veh_nro_valvulas)
-                filtro_vehiculo |= Q(nro_valvulas=nro_valvulas_int)
-                filtro_vehiculo |= Q(nro_valvulas__isnull=True)
-            except ValueError:
-                pass
-        
-        # Filtrar por combustible
-        if veh_combustible:
-            filtro_vehiculo |= Q(combustible__icontains=veh_combustible)
-            filtro_vehiculo |= Q(combustible__isnull=True) | Q(combustible='')
-        
-        # Filtrar por otro especial
-        if veh_otro_especial:
-            filtro_vehiculo |= Q(otro_especial__icontains=veh_otro_especial)
-            filtro_vehiculo |= Q(otro_especial__isnull=True) | Q(otro_especial='')
-        
-        # Aplicar filtro de vehículo
-        candidates = candidates.filter(filtro_vehiculo).distinct()
-
-    # 4) Enriquecer con stock y calcular compatibilidad
     resultados = []
-    for r in candidates.select_related().order_by("nombre")[:80]:
-        stock_obj = (
-            r.stocks.filter(stock__gt=0).order_by('-ultima_actualizacion').first()
-            or r.stocks.order_by('-ultima_actualizacion').first()
-        )
-        
-        # Calcular nivel de compatibilidad
-        compatibilidad = calcular_compatibilidad_repuesto(r, veh_marca, veh_motor)
-        
+    for fila in filas:
+        r = fila.repuesto
+        stock_obj = stocks.get(r.id)
         resultados.append({
             "id": r.id,
             "sku": r.sku,
@@ -1663,52 +1480,13 @@ def sugerir_repuestos(request, diagnostico_id=None):
             "stock": stock_obj.stock if stock_obj else 0,
             "disponible": stock_obj.disponible if stock_obj else 0,
             "repuesto_stock_id": stock_obj.id if stock_obj else None,
-            "compatibilidad": compatibilidad,
-            "compatibilidad_texto": obtener_texto_compatibilidad(compatibilidad),
+            "compatibilidad": fila.puntaje,
+            "compatibilidad_texto": obtener_texto_compatibilidad(fila.puntaje),
         })
 
-    # Orden: primero por compatibilidad, luego por stock disponible
-    resultados.sort(key=lambda x: (x["compatibilidad"], x["disponible"] > 0, x["stock"]), reverse=True)
-
     return JsonResponse({"repuestos": resultados})
 
 
-def calcular_compatibilidad_repuesto(repuesto, veh_marca, veh_motor):
-    """
-    Calcula el nivel de compatibilidad de un repuesto con el vehículo
-    Retorna un score de 0-100
-    """
-    score = 0
-    
-    # Compatibilidad por marca del vehículo (40 puntos)
-    if veh_marca and repuesto.marca_veh:
-        if repuesto.marca_veh.lower() == veh_marca.lower():
-            score += 40  # Coincidencia exacta
-        elif veh_marca.lower() in repuesto.marca_veh.lower():
-            score += 30  # Contiene la marca
-        elif repuesto.marca_veh in ['general', 'xxx', '']:
-            score += 20  # Repuesto general
-    
-    # Compatibilidad por tipo de motor (30 puntos)
-    if veh_motor and repuesto.tipo_de_motor:
-        if repuesto.tipo_de_motor.lower() == veh_motor.lower():
-            score += 30  # Coincidencia exacta
-        elif veh_motor.lower() in repuesto.tipo_de_motor.lower():
-            score += 20  # Contiene el tipo de motor
-        elif repuesto.tipo_de_motor in ['zzzzzz', '']:
-            score += 15  # Repuesto general
-    
-    # Bonus por tener stock (20 puntos)
-    if repuesto.stock_total > 0:
-        score += 20
-    
-    # Bonus por tener precio (10 puntos)
-    if repuesto.precio_venta and repuesto.precio_venta > 0:
-        score += 10
-    
-    return min(score, 100)  # Máximo 100
-
-
 def obtener_texto_compatibilidad(score):
     """Convierte el score de compatibilidad en texto descriptivo"""
     if score >= 80:
@@ -1848,43 +1626,20 @@ def listar_repuestos_diagnostico(request, diagnostico_id):
 
 @login_required
 def exportar_diagnosticos_excel(request):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Diagnósticos"
-
-    # Encabezados
-    ws.append([
-        "Fecha", "Cliente", "Teléfono", "Vehículo", "Diagnóstico",
-        "Acciones", "Total Mano de Obra",
-        "Repuestos", "Total Repuestos",
-        "Total Presupuesto"
-    ])
-
-    for diag in Diagnostico.objects.all():
-        acciones = ", ".join([f"{dca.componente.nombre} - {dca.accion.nombre}" for dca in diag.acciones_componentes.all()])
-        repuestos = ", ".join([f"{dr.repuesto.nombre} (x{dr.cantidad})" for dr in diag.repuestos.all()])
-        total_mo = diag.total_mano_obra or 0
-        total_repuestos = sum([dr.subtotal for dr in diag.repuestos.all()])
-        total = total_mo + total_repuestos
-
-        ws.append([
-            diag.fecha.strftime("%d-%m-%Y"),
-            diag.vehiculo.cliente.nombre,
-            diag.vehiculo.cliente.telefono,
-            str(diag.vehiculo),
-            diag.descripcion_problema,
-            acciones,
-            total_mo,
-            repuestos,
-            total_repuestos,
-            total
-        ])
+    """
+    Exportación completa de diagnósticos. El Excel se arma en el worker (la página de
+    espera lo descarga); con ?formato=csv se envía en streaming directamente.
+    """
+    if request.GET.get('formato') == 'csv':
+        from .exportaciones import ENCABEZADOS_DIAGNOSTICOS, filas_diagnosticos, respuesta_csv
+        return respuesta_csv("diagnosticos", ENCABEZADOS_DIAGNOSTICOS, filas_diagnosticos())
 
-    # Preparar respuesta HTTP
-    response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    response["Content-Disposition"] = 'attachment; filename="diagnosticos.xlsx"'
-    wb.save(response)
-    return response
+    tarea = encolar(
+        'exportar_diagnosticos_excel', usuario=request.user,
+        clave=f'exportar_diagnosticos_excel:{request.user.pk}',
+    )
+    siguiente = request.META.get('HTTP_REFERER', '')
+    return redirect(f"{reverse('tarea_estado', args=[tarea.pk])}?{urlencode({'siguiente': siguiente})}")
 
 
 @login_required
@@ -2378,103 +2133,9 @@ def guardar_aprobar_y_crear_ot(request):
             diagnostico.componentes.set(selected_componentes_ids)
             
             # ====================================================
-            # 🔹 Acciones por componente desde hidden JSON
-            acciones_json = (request.POST.get("acciones_componentes_json") or "").strip()
-            if acciones_json:
-                try:
-                    items = json.loads(acciones_json)
-                    for it in items:
-                        try:
-                            comp_id = int(it.get("componente_id"))
-                            acc_id = int(it.get("accion_id"))
-                        except (TypeError, ValueError):
-                            continue
-                        
-                        precio_mano_obra = (it.get("precio_mano_obra") or "").strip()
-                        cantidad = int(it.get("cantidad", 1)) if it.get("cantidad") else 1
-                        
-                        if not diagnostico.componentes.filter(id=comp_id).exists():
-                            continue
-                        
-                        dca = DiagnosticoComponenteAccion(
-                            diagnostico=diagnostico,
-                            componente_id=comp_id,
-                            accion_id=acc_id,
-                            cantidad=cantidad
-                        )
-                        if precio_mano_obra and precio_mano_obra not in ("0", "0.00"):
-                            dca.precio_mano_obra = precio_mano_obra
-                        dca.save()
-                except json.JSONDecodeError:
-                    pass
-            
-            # ====================================================
-            # 🔹 Repuestos seleccionados desde hidden JSON
+            # 🔹 Acciones, repuestos y repuestos externos desde los hidden JSON
             # ====================================================
-            repuestos_json = (request.POST.get("repuestos_json") or "").strip()
-            if repuestos_json:
-                try:
-                    repuestos_data = json.loads(repuestos_json)
-                    for r in repuestos_data:
-                        try:
-                            repuesto_id = int(r.get("id"))
-                            repuesto = Repuesto.objects.get(pk=repuesto_id)
-                            
-                            stock_id_raw = r.get("repuesto_stock_id")
-                            repuesto_stock = None
-                            if stock_id_raw:
-                                try:
-                                    repuesto_stock = RepuestoEnStock.objects.get(pk=int(stock_id_raw))
-                                except (ValueError, RepuestoEnStock.DoesNotExist):
-                                    repuesto_stock = None
-                            
-                            cantidad = int(r.get("cantidad", 1))
-                            precio = float(r.get("precio_unitario", repuesto.precio_venta or 0))
-                            
-                            DiagnosticoRepuesto.objects.create(
-                                diagnostico=diagnostico,
-                                repuesto=repuesto,
-                                repuesto_stock=repuesto_stock,
-                                cantidad=cantidad,
-                                precio_unitario=precio,
-                                subtotal=cantidad * precio
-                            )
-                        except (ValueError, Repuesto.DoesNotExist, KeyError):
-                            continue
-                except json.JSONDecodeError:
-                    pass
-            
-            # ====================================================
-            # 🌐 Repuestos Externos (Referencias)
-            # ====================================================
-            repuestos_externos_json = (request.POST.get("repuestos_externos_json") or "").strip()
-            if repuestos_externos_json:
-                try:
-                    from .models import RepuestoExterno
-                    repuestos_externos_data = json.loads(repuestos_externos_json)
-                    for r_ext in repuestos_externos_data:
-                        try:
-                            repuesto_ext_id = int(r_ext.get("id"))
-                            repuesto_externo = RepuestoExterno.objects.get(pk=repuesto_ext_id)
-                            
-                            cantidad = int(r_ext.get("cantidad", 1))
-                            precio = float(r_ext.get("precio", repuesto_externo.precio_referencial))
-                            
-                            DiagnosticoRepuesto.objects.create(
-                                diagnostico=diagnostico,
-                                repuesto=None,
-                                repuesto_externo=repuesto_externo,
-                                repuesto_stock=None,
-                                cantidad=cantidad,
-                                precio_unitario=precio,
-                                subtotal=cantidad * precio
-                            )
-                            
-                            repuesto_externo.incrementar_uso()
-                        except (ValueError, RepuestoExterno.DoesNotExist, KeyError):
-                            continue
-                except json.JSONDecodeError:
-                    pass
+            guardar_lineas(diagnostico, request.POST, selected_componentes_ids)
             
             # ====================================================
             # 🚀 APROBAR Y CREAR TRABAJO
@@ -2482,11 +2143,8 @@ def guardar_aprobar_y_crear_ot(request):
             if diagnostico.estado != "aprobado":
                 trabajo = diagnostico.aprobar_y_clonar()
                 
-                # Registrar evento de diagnóstico aprobado
-                registrar_diagnostico_aprobado(diagnostico, trabajo, request=request)
-                
-                # Registrar evento de ingreso
-                registrar_ingreso(trabajo, request=request)
+                # Eventos de aprobación e ingreso (al confirmar la transacción)
+                registrar_aprobacion(diagnostico, trabajo, request=request)
                 
                 if config.ver_mensajes:
                     messages.success(request, f"✅ Diagnóstico guardado, aprobado y trabajo #{trabajo.id} creado.")
@@ -2529,11 +2187,8 @@ def aprobar_diagnostico(request, pk):
     if diagnostico.estado != "aprobado":
         trabajo = diagnostico.aprobar_y_clonar()
         
-        # Registrar evento de diagnóstico aprobado (con días de diferencia)
-        registrar_diagnostico_aprobado(diagnostico, trabajo, request=request)
-        
-        # Registrar evento de ingreso
-        registrar_ingreso(trabajo, request=request)
+        # Eventos de aprobación (con días de diferencia) e ingreso, al confirmar
+        registrar_aprobacion(diagnostico, trabajo, request=request)
         config = AdministracionTaller.get_configuracion_activa()
         if config.ver_mensajes:
             messages.success(request, f"✅ Diagnóstico aprobado y trabajo #{trabajo.id} creado.")
@@ -2578,10 +2233,9 @@ def lista_trabajos(request):
         'acciones__accion',
         'acciones__componente',
         'repuestos__repuesto'
-    ).order_by('-fecha_inicio')
+    ).with_totales().order_by('-fecha_inicio')
 
-    # Los totales se calculan automáticamente mediante las @property del modelo
-    # No necesitamos asignarlos manualmente
+    # Los totales vienen anotados en la consulta; las @property del modelo los reutilizan
 
     return render(request, 'car/trabajo_lista.html', {
         'trabajos': trabajos,
@@ -2604,7 +2258,7 @@ def historial_trabajos(request):
         'acciones__componente',
         'repuestos__repuesto',
         'mecanicos__user'
-    ).order_by('-fecha_inicio')
+    ).with_totales().order_by('-fecha_inicio')
     
     # Búsqueda AJAX
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -2660,19 +2314,11 @@ def _descontar_stock_repuesto_trabajo(repuesto_trabajo):
     """Descuenta del stock la cantidad del TrabajoRepuesto (inventario propio, bodega-principal)."""
     if not repuesto_trabajo.repuesto:
         return False
-    from .models import RepuestoEnStock
-    stock_item = RepuestoEnStock.objects.filter(
-        repuesto=repuesto_trabajo.repuesto,
-        deposito='bodega-principal'
-    ).first()
-    if not stock_item:
-        return False
-    cantidad = repuesto_trabajo.cantidad or 0
-    stock_item.stock = (stock_item.stock or 0) - cantidad
-    stock_item.save()
-    repuesto_obj = repuesto_trabajo.repuesto
-    repuesto_obj.stock = (repuesto_obj.stock or 0) - cantidad
-    repuesto_obj.save()
+    mover_stock(
+        repuesto_trabajo.repuesto, repuesto_trabajo.cantidad or 0, 'salida',
+        motivo=f"Trabajo #{repuesto_trabajo.trabajo_id}",
+        referencia=f"TRABAJO-{repuesto_trabajo.trabajo_id}",
+    )
     return True
 
 
@@ -2680,19 +2326,11 @@ def _devolver_stock_repuesto_trabajo(repuesto_trabajo):
     """Devuelve al stock la cantidad del TrabajoRepuesto (inventario propio, bodega-principal)."""
     if not repuesto_trabajo.repuesto:
         return False
-    from .models import RepuestoEnStock
-    stock_item = RepuestoEnStock.objects.filter(
-        repuesto=repuesto_trabajo.repuesto,
-        deposito='bodega-principal'
-    ).first()
-    if not stock_item:
-        return False
-    cantidad = repuesto_trabajo.cantidad or 0
-    stock_item.stock = (stock_item.stock or 0) + cantidad
-    stock_item.save()
-    repuesto_obj = repuesto_trabajo.repuesto
-    repuesto_obj.stock = (repuesto_obj.stock or 0) + cantidad
-    repuesto_obj.save()
+    mover_stock(
+        repuesto_trabajo.repuesto, repuesto_trabajo.cantidad or 0, 'ingreso',
+        motivo=f"Devolución Trabajo #{repuesto_trabajo.trabajo_id}",
+        referencia=f"TRABAJO-{repuesto_trabajo.trabajo_id}",
+    )
     return True
 
 
@@ -2716,19 +2354,9 @@ def trabajo_detalle(request, pk):
     acciones_disponibles = Accion.objects.all()
     
     # 🔹 COMPONENTES DISPONIBLES (igual que en ingreso.html - solo componentes padre)
-    # Los componentes no tienen compatibilidad específica por vehículo, son genéricos
-    # Ordenar alfabéticamente por nombre y pre-cargar hijos ordenados alfabéticamente
-    from django.db.models import Prefetch
-    componentes = Componente.objects.filter(
-        padre__isnull=True, 
-        activo=True
-    ).prefetch_related(
-        Prefetch(
-            'hijos',
-            queryset=Componente.objects.filter(activo=True).order_by('nombre'),
-            to_attr='hijos_ordenados'
-        )
-    ).order_by('nombre')
+    # Los componentes no tienen compatibilidad específica por vehículo, son genéricos.
+    # Árbol en caché, ordenado alfabéticamente por nombre en cada nivel
+    componentes = arbol_componentes.arbol()
     
     # 🔹 FILTRO INTELIGENTE DE REPUESTOS basado en el vehículo del trabajo
     repuestos_disponibles = Repuesto.objects.all()
@@ -3209,86 +2837,37 @@ def trabajo_detalle(request, pk):
                 
                 # ACTUALIZAR STOCK SOLO SI ES REPUESTO DEL INVENTARIO PROPIO
                 if repuesto_trabajo.repuesto:  # Solo si es del inventario, no externo
-                    from .models import RepuestoEnStock
-                    
-                    print(f"🔍 Buscando stock para repuesto ID: {repuesto_trabajo.repuesto.id}")
-                    print(f"🔍 Nombre del repuesto: {repuesto_trabajo.repuesto.nombre}")
-                    
                     try:
-                        # 🔥 BÚSQUEDA CONSISTENTE: Solo por repuesto y depósito principal
-                        stock_item = RepuestoEnStock.objects.filter(
-                            repuesto=repuesto_trabajo.repuesto,
-                            deposito='bodega-principal'
-                        ).first()
-                        
-                        print(f"🔍 Buscando stock en bodega-principal...")
-                        if stock_item:
-                            print(f"   ✅ Stock encontrado - ID: {stock_item.id}, Stock: {stock_item.stock}, Reservado: {stock_item.reservado}")
+                        repuesto_obj = repuesto_trabajo.repuesto
+                        repuesto_stock_anterior = repuesto_obj.stock
                         
-                        if stock_item:
-                            stock_anterior = stock_item.stock
-                            repuesto_stock_anterior = repuesto_trabajo.repuesto.stock
-                            print(f"✅ Stock encontrado - Depósito: {stock_item.deposito}")
-                            print(f"📊 Stock en RepuestoEnStock ANTES: {stock_anterior}")
-                            print(f"📊 Stock en Repuesto ANTES: {repuesto_stock_anterior}")
-                            
-                            cantidad = repuesto_trabajo.cantidad or 0
-                            print(f"📦 Cantidad a procesar: {cantidad}")
-                            
-                            if repuesto_trabajo.completado and not estado_anterior:
-                                # Se marcó como completado: DESCONTAR del stock
-                                stock_item.stock = (stock_item.stock or 0) - cantidad
-                                stock_item.save()
-                                
-                                # 🔥 SINCRONIZAR con Repuesto.stock
-                                repuesto_obj = repuesto_trabajo.repuesto
-                                repuesto_obj.stock = (repuesto_obj.stock or 0) - cantidad
-                                repuesto_obj.save()
-                                
-                                print(f"➖ DESCUENTO APLICADO en RepuestoEnStock: {stock_anterior} - {cantidad} = {stock_item.stock}")
-                                print(f"➖ DESCUENTO APLICADO en Repuesto: {repuesto_stock_anterior} - {cantidad} = {repuesto_obj.stock}")
-                                print(f"✅ Stock actualizado en AMBAS tablas (RepuestoEnStock Y Repuesto)")
-                                config = AdministracionTaller.get_configuracion_activa()
-                                if config.ver_mensajes:
-                                    messages.success(
-                                        request, 
-                                        f"✅ Repuesto completado. Stock descontado: {stock_item.repuesto.nombre} (Stock anterior: {repuesto_stock_anterior}, Stock actual: {repuesto_obj.stock})"
-                                    )
-                            elif not repuesto_trabajo.completado and estado_anterior:
-                                # Se desmarcó: DEVOLVER al stock
-                                stock_item.stock = (stock_item.stock or 0) + cantidad
-                                stock_item.save()
-                                
-                                # 🔥 SINCRONIZAR con Repuesto.stock
-                                repuesto_obj = repuesto_trabajo.repuesto
-                                repuesto_obj.stock = (repuesto_obj.stock or 0) + cantidad
-                                repuesto_obj.save()
-                                
-                                print(f"➕ DEVOLUCIÓN APLICADA en RepuestoEnStock: {stock_anterior} + {cantidad} = {stock_item.stock}")
-                                print(f"➕ DEVOLUCIÓN APLICADA en Repuesto: {repuesto_stock_anterior} + {cantidad} = {repuesto_obj.stock}")
-                                print(f"✅ Stock restaurado en AMBAS tablas (RepuestoEnStock Y Repuesto)")
-                                config = AdministracionTaller.get_configuracion_activa()
-                                if config.ver_mensajes:
-                                    messages.success(
-                                        request, 
-                                        f"↩️ Repuesto desmarcado. Stock restaurado: {stock_item.repuesto.nombre} (Stock anterior: {repuesto_stock_anterior}, Stock actual: {repuesto_obj.stock})"
-                                    )
-                            else:
-                                print(f"⚠️ No se requiere cambio de stock (estado no cambió de pendiente→completado o viceversa)")
-                                config = AdministracionTaller.get_configuracion_activa()
-                                if config.ver_mensajes:
-                                    messages.info(
-                                        request, 
-                                        f"Estado del repuesto actualizado."
-                                    )
+                        if repuesto_trabajo.completado and not estado_anterior:
+                            # Se marcó como completado: DESCONTAR del stock (libro de stock)
+                            _descontar_stock_repuesto_trabajo(repuesto_trabajo)
+                            print(f"➖ DESCUENTO APLICADO: {repuesto_stock_anterior} → {repuesto_obj.stock}")
+                            config = AdministracionTaller.get_configuracion_activa()
+                            if config.ver_mensajes:
+                                messages.success(
+                                    request, 
+                                    f"✅ Repuesto completado. Stock descontado: {repuesto_obj.nombre} (Stock anterior: {repuesto_stock_anterior}, Stock actual: {repuesto_obj.stock})"
+                                )
+                        elif not repuesto_trabajo.completado and estado_anterior:
+                            # Se desmarcó: DEVOLVER al stock (libro de stock)
+                            _devolver_stock_repuesto_trabajo(repuesto_trabajo)
+                            print(f"➕ DEVOLUCIÓN APLICADA: {repuesto_stock_anterior} → {repuesto_obj.stock}")
+                            config = AdministracionTaller.get_configuracion_activa()
+                            if config.ver_mensajes:
+                                messages.success(
+                                    request, 
+                                    f"↩️ Repuesto desmarcado. Stock restaurado: {repuesto_obj.nombre} (Stock anterior: {repuesto_stock_anterior}, Stock actual: {repuesto_obj.stock})"
+                                )
                         else:
-                            # No hay stock registrado, solo cambiar estado sin actualizar inventario
-                            print(f"⚠️ NO SE ENCONTRÓ STOCK para repuesto ID: {repuesto_trabajo.repuesto.id}")
+                            print(f"⚠️ No se requiere cambio de stock (estado no cambió de pendiente→completado o viceversa)")
                             config = AdministracionTaller.get_configuracion_activa()
                             if config.ver_mensajes:
-                                messages.warning(
+                                messages.info(
                                     request, 
-                                    f"⚠️ Estado cambiado a {'completado' if repuesto_trabajo.completado else 'pendiente'}. No se encontró stock del repuesto '{repuesto_trabajo.repuesto.nombre}' en RepuestoEnStock."
+                                    f"Estado del repuesto actualizado."
                                 )
                     except Exception as e:
                         print(f"❌ ERROR actualizando stock: {str(e)}")
@@ -3338,44 +2917,18 @@ def trabajo_detalle(request, pk):
                 
                 # Si el repuesto estaba completado, devolver al stock antes de eliminar
                 if repuesto_trabajo.completado and repuesto_trabajo.repuesto:
-                    from .models import RepuestoEnStock
-                    
                     print(f"↩️ Repuesto completado detectado, devolviendo stock...")
                     
                     try:
-                        # 🔥 BÚSQUEDA CONSISTENTE: Solo por repuesto y depósito principal
-                        stock_item = RepuestoEnStock.objects.filter(
-                            repuesto=repuesto_trabajo.repuesto,
-                            deposito='bodega-principal'
-                        ).first()
+                        _devolver_stock_repuesto_trabajo(repuesto_trabajo)
+                        repuesto_obj = repuesto_trabajo.repuesto
+                        print(f"➕ Stock devuelto: {repuesto_obj.nombre} (Stock: {repuesto_obj.stock})")
                         
-                        if stock_item:
-                            cantidad = repuesto_trabajo.cantidad or 0
-                            stock_anterior_enstock = stock_item.stock
-                            stock_anterior_repuesto = repuesto_trabajo.repuesto.stock
-                            
-                            # Devolver a RepuestoEnStock
-                            stock_item.stock = (stock_item.stock or 0) + cantidad
-                            stock_item.save()
-                            
-                            # 🔥 SINCRONIZAR con Repuesto.stock
-                            repuesto_obj = repuesto_trabajo.repuesto
-                            repuesto_obj.stock = (repuesto_obj.stock or 0) + cantidad
-                            repuesto_obj.save()
-                            
-                            print(f"➕ Stock devuelto en RepuestoEnStock: {stock_anterior_enstock} + {cantidad} = {stock_item.stock}")
-                            print(f"➕ Stock devuelto en Repuesto: {stock_anterior_repuesto} + {cantidad} = {repuesto_obj.stock}")
-                            print(f"✅ Stock restaurado en AMBAS tablas")
-                            
-                            if config.ver_mensajes:
-                                messages.success(
-                                    request, 
-                                    f"🗑️ Repuesto eliminado. Stock devuelto: {stock_item.repuesto.nombre} (Stock: {repuesto_obj.stock})"
-                                )
-                        else:
-                            print(f"⚠️ No se encontró stock para devolver")
-                            if config.ver_mensajes:
-                                messages.success(request, "🗑️ Repuesto eliminado (sin stock para devolver).")
+                        if config.ver_mensajes:
+                            messages.success(
+                                request, 
+                                f"🗑️ Repuesto eliminado. Stock devuelto: {repuesto_obj.nombre} (Stock: {repuesto_obj.stock})"
+                            )
                     except Exception as e:
                         print(f"❌ Error devolviendo stock: {str(e)}")
                         import traceback
@@ -3812,197 +3365,14 @@ def trabajo_detalle(request, pk):
 
 @login_required
 def trabajo_pdf(request, pk):
-    """Generar PDF de la orden de trabajo"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    from django.http import HttpResponse
-    from django.template.loader import get_template
-    from django.conf import settings
-    import os
-    
-    logger.info(f"🔍 INICIANDO GENERACIÓN PDF - Trabajo ID: {pk}")
-    
+    """Generar PDF de la orden de trabajo (en el worker; la página de espera lo descarga)"""
     trabajo = get_object_or_404(Trabajo, pk=pk)
-    logger.info(f"✅ Trabajo encontrado: {trabajo.vehiculo} - Estado: {trabajo.estado}")
-    
-    # Crear el PDF usando weasyprint o reportlab
-    try:
-        from weasyprint import HTML, CSS
-        from weasyprint.text.fonts import FontConfiguration
-        logger.info("✅ WeasyPrint importado correctamente")
-        
-        # Template para el PDF
-        template = get_template('car/trabajo_pdf.html')
-        logger.info("✅ Template cargado correctamente")
-        
-        # Preparar contexto con URLs absolutas para las imágenes
-        config = AdministracionTaller.get_configuracion_activa()
-        
-        # Generar rutas de archivos locales para los logos (WeasyPrint necesita acceso directo)
-        logo_path = None
-        if config.logo_principal_png and os.path.exists(config.logo_principal_png.path):
-            logo_path = f"file://{config.logo_principal_png.path}"
-            logger.info(f"🖼️ Logo PNG disponible: {logo_path}")
-        elif config.logo_principal_svg and os.path.exists(config.logo_principal_svg.path):
-            logo_path = f"file://{config.logo_principal_svg.path}"
-            logger.info(f"🖼️ Logo SVG disponible: {logo_path}")
-        else:
-            # Usar logo por defecto desde static files
-            default_logo_path = os.path.join(settings.STATIC_ROOT or settings.STATICFILES_DIRS[0], 'images', 'Logo1.svg')
-            if os.path.exists(default_logo_path):
-                logo_path = f"file://{default_logo_path}"
-                logger.info(f"🖼️ Usando logo por defecto: {logo_path}")
-            else:
-                logger.warning("⚠️ No se encontró ningún logo disponible")
-        
-        context = {
-            'trabajo': trabajo,
-            'request': request,  # Para generar URLs absolutas
-            'config': config,  # Configuración del taller para el logo
-            'logo_path': logo_path,  # Ruta local del logo para WeasyPrint
-        }
-        
-        # Log de fotos del trabajo
-        fotos_count = trabajo.fotos.count()
-        logger.info(f"📷 Fotos encontradas en el trabajo: {fotos_count}")
-        
-        if fotos_count > 0:
-            for i, foto in enumerate(trabajo.fotos.all()):
-                logger.info(f"📷 Foto {i+1}: {foto.imagen.name} - URL: {foto.imagen.url}")
-                # Verificar si el archivo existe físicamente
-                if os.path.exists(foto.imagen.path):
-                    logger.info(f"✅ Archivo físico existe: {foto.imagen.path}")
-                else:
-                    logger.error(f"❌ Archivo físico NO existe: {foto.imagen.path}")
-        
-        html_content = template.render(context)
-        logger.info(f"✅ HTML renderizado - Tamaño: {len(html_content)} caracteres")
-        
-        # Configuración de fuentes
-        font_config = FontConfiguration()
-        logger.info("✅ Configuración de fuentes creada")
-        
-        # Crear el PDF
-        logger.info("🔄 Creando documento HTML para WeasyPrint...")
-        html_doc = HTML(string=html_content)
-        logger.info("✅ Documento HTML creado")
-        
-        css = CSS(string='''
-            @page {
-                size: A4;
-                margin: 1cm;
-            }
-            body {
-                font-family: Arial, sans-serif;
-                font-size: 12px;
-            }
-            .header {
-                text-align: center;
-                border-bottom: 2px solid #333;
-                padding-bottom: 10px;
-                margin-bottom: 20px;
-            }
-            .section {
-                margin-bottom: 15px;
-            }
-            .section h3 {
-                background: #f0f0f0;
-                padding: 5px;
-                margin: 0 0 10px 0;
-            }
-            table {
-                width: 100%;
-                border-collapse: collapse;
-                margin-bottom: 10px;
-            }
-            th, td {
-                border: 1px solid #ddd;
-                padding: 5px;
-                text-align: left;
-            }
-            th {
-                background: #f0f0f0;
-            }
-            img {
-                max-width: 100%;
-                height: auto;
-            }
-        ''', font_config=font_config)
-        logger.info("✅ CSS aplicado")
-        
-        logger.info("🔄 Generando PDF con WeasyPrint...")
-        pdf_file = html_doc.write_pdf(stylesheets=[css], font_config=font_config)
-        logger.info(f"✅ PDF generado exitosamente - Tamaño: {len(pdf_file)} bytes")
-        
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'inline; filename="orden_trabajo_{trabajo.id}.pdf"'
-        response['Content-Length'] = str(len(pdf_file))
-        response['X-Content-Type-Options'] = 'nosniff'
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
-        logger.info("✅ Respuesta HTTP creada")
-        return response
-        
-    except ImportError as e:
-        logger.error(f"❌ ERROR: WeasyPrint no está disponible: {str(e)}")
-        # Si weasyprint no está disponible, usar una alternativa simple
-        from django.http import HttpResponse
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="orden_trabajo_{trabajo.id}.txt"'
-            
-        content = f"""
-ORDEN DE TRABAJO #{trabajo.id}
-===============================
-
-Cliente: {trabajo.vehiculo.cliente.nombre}
-Teléfono: {trabajo.vehiculo.cliente.telefono}
-Vehículo: {trabajo.vehiculo.marca} {trabajo.vehiculo.modelo} {trabajo.vehiculo.anio}
-Placa: {trabajo.vehiculo.placa}
-
-Estado: {trabajo.get_estado_display()}
-Progreso: {trabajo.porcentaje_avance}%
-
-Fecha Inicio: {trabajo.fecha_inicio|date:"d/m/Y H:i" if trabajo.fecha_inicio else "No iniciado"}
-Fecha Fin: {trabajo.fecha_fin|date:"d/m/Y H:i" if trabajo.fecha_fin else "En progreso"}
-
-Observaciones:
-{trabajo.observaciones or "Sin observaciones"}
-
-Mecánicos Asignados:
-"""
-        for mec in trabajo.mecanicos.all():
-            content += f"- {mec.user.get_full_name() or mec.user.first_name} ({mec.especialidad or 'Sin especialidad'})\n"
-        
-        content += "\nAcciones:\n"
-        for accion in trabajo.acciones.all():
-            estado = "✅ Completado" if accion.completado else "⏳ Pendiente"
-            content += f"- {accion.componente.nombre}: {accion.accion.nombre} - {estado}\n"
-        
-        content += "\nRepuestos:\n"
-        for repuesto in trabajo.repuestos.all():
-            estado = "✅ Completado" if repuesto.completado else "⏳ Pendiente"
-            content += f"- {repuesto.repuesto.nombre} (x{repuesto.cantidad}) - {estado}\n"
-        
-        content += f"\nTotal: ${trabajo.total_general or 0}\n"
-        content += f"\nGenerado el: {timezone.now().strftime('%d/%m/%Y %H:%M')}"
-        
-        response.write(content)
-        return response
-        
-    except Exception as e:
-        logger.error(f"❌ ERROR GENERAL generando PDF: {str(e)}")
-        logger.error(f"❌ Tipo de error: {type(e).__name__}")
-        import traceback
-        logger.error(f"❌ Traceback completo: {traceback.format_exc()}")
-        
-        # Respuesta de error
-        from django.http import HttpResponse
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="error_trabajo_{trabajo.id}.txt"'
-        response.write(f"Error generando PDF: {str(e)}")
-        return response
+    tarea = encolar(
+        'trabajo_pdf', {'trabajo_id': trabajo.pk},
+        usuario=request.user, clave=f'trabajo_pdf:{trabajo.pk}:{request.user.pk}',
+    )
+    siguiente = reverse('trabajo_detalle', args=[trabajo.pk])
+    return redirect(f"{reverse('tarea_estado', args=[tarea.pk])}?{urlencode({'siguiente': siguiente})}")
 
 
 
@@ -4011,20 +3381,94 @@ def pizarra_view(request):
     # Obtener configuración del taller
     config = AdministracionTaller.get_configuracion_activa()
     
-    trabajos = Trabajo.objects.select_related("vehiculo", "vehiculo__cliente")
-    
-    # Filtrar trabajos entregados que tienen más de 3 días (no mostrar en pizarra)
-    trabajos_visibles = filtrar_trabajos_entregados_por_dias(trabajos, dias_desde_entrega=3)
-
+    # Las cuatro columnas en una consulta (entregados solo los últimos 3 días);
+    # después la página se actualiza con pizarra_cambios
     context = {
-        "iniciados": trabajos_visibles.filter(estado="iniciado"),
-        "trabajando": trabajos_visibles.filter(estado="trabajando"),
-        "completados": trabajos_visibles.filter(estado="completado"),
-        "entregados": trabajos_visibles.filter(estado="entregado"),  # Solo los recientes (últimos 3 días)
+        **pizarra.columnas('pizarra'),
+        "pizarra_vista": "pizarra",
+        "pizarra_secuencia": pizarra.secuencia(),
         "config": config,
     }
     return render(request, "car/pizarra_page.html", context)
 
+
+@login_required
+@require_GET
+async def pizarra_cambios(request):
+    """
+    Feed de la pizarra en vivo (long-polling, vista async).
+
+    GET vista=pizarra|panel, desde=<secuencia>, espera=<segundos>. Si no hubo cambios
+    después de `desde` espera hasta `espera` segundos y responde 304; si los hubo
+    devuelve solo las tarjetas de los trabajos que cambiaron (estado null = quitarla).
+    Sin `desde`, o si el registro ya no lo cubre, devuelve la pizarra completa.
+
+    La espera es asyncio.sleep: bajo ASGI una pantalla abierta no ocupa un worker ni el
+    hilo de las vistas síncronas. Bajo WSGI (donde sí lo ocuparía) o con una caché no
+    compartida no se espera; la cabecera X-Pizarra-Espera le indica al cliente cuánto
+    esperó el servidor para que, si fue 0, consulte a intervalos.
+    """
+    vista = request.GET.get("vista") if request.GET.get("vista") in pizarra.TARJETAS else "pizarra"
+    try:
+        desde = int(request.GET["desde"])
+    except (KeyError, ValueError):
+        desde = None
+    try:
+        espera = max(0, min(int(request.GET.get("espera", 0)), settings.PIZARRA_ESPERA_MAXIMA))
+    except ValueError:
+        espera = 0
+
+    if not pizarra.compartida():
+        # Cada proceso tendría su propia secuencia: siempre la pizarra completa
+        desde = None
+    if desde is None or not isinstance(request, ASGIRequest):
+        espera = 0
+
+    if espera:
+        actual = await pizarra.esperar_cambio(desde, espera)
+    else:
+        actual = await sync_to_async(pizarra.secuencia)()
+    etag = f'"pizarra-{vista}-{actual}"'
+    if desde is not None and (actual == desde or request.headers.get("If-None-Match") == etag):
+        respuesta = HttpResponseNotModified()
+        respuesta["ETag"] = etag
+    else:
+        respuesta = await sync_to_async(_respuesta_pizarra)(request, vista, desde)
+    respuesta["X-Pizarra-Espera"] = str(espera)
+    return respuesta
+
+
+def _respuesta_pizarra(request, vista, desde):
+    """Tarjetas que cambiaron después de `desde` (o todas) renderizadas para pizarra_cambios."""
+    actual, ids = pizarra.cambios_desde(desde)
+    if not pizarra.compartida():
+        ids = None
+    plantilla = pizarra.TARJETAS[vista]
+    variable = "trabajo" if vista == "panel" else "t"
+    tarjetas = {
+        t.pk: {
+            "id": t.pk,
+            "estado": t.estado,
+            "html": render_to_string(plantilla, {variable: t}, request=request),
+        }
+        for t in pizarra.trabajos_pizarra(vista, ids=ids)
+    }
+    # Los que cambiaron pero ya no se muestran (borrados, ocultos, fuera de columna)
+    if ids is None:
+        cambios = list(tarjetas.values())
+    else:
+        cambios = [tarjetas.get(pk, {"id": pk, "estado": None, "html": None}) for pk in ids]
+
+    respuesta = JsonResponse({
+        "secuencia": actual,
+        "completo": ids is None,
+        "versiones": pizarra.versiones(),
+        "cambios": cambios,
+    })
+    respuesta["ETag"] = f'"pizarra-{vista}-{actual}"'
+    respuesta["Cache-Control"] = "no-cache"
+    return respuesta
+
 @login_required
 def panel_principal(request):
     """Vista principal que incluye todo el contenido del dashboard"""
@@ -4098,11 +3542,10 @@ def panel_principal(request):
     subtotal_pos = sum(item.subtotal for item in carrito_items)
     
     context = {
-        # Trabajos para la pizarra
-        "iniciados": trabajos.filter(estado="iniciado"),
-        "trabajando": trabajos.filter(estado="trabajando"),
-        "completados": trabajos.filter(estado="completado"),
-        "entregados": trabajos.filter(estado="entregado"),
+        # Trabajos para la pizarra (se actualizan en vivo con pizarra_cambios)
+        **pizarra.columnas('panel'),
+        "pizarra_vista": "panel",
+        "pizarra_secuencia": pizarra.secuencia(),
         
         # Estadísticas del dashboard
         'hoy': hoy,
@@ -4169,11 +3612,7 @@ def venta_crear(request):
                     except (ValueError, TypeError, InvalidOperation) as e:
                         raise ValueError(f"Datos inválidos en item #{idx+1}: {e}")
 
-                    rs = get_object_or_404(RepuestoEnStock, pk=repuesto_stock_id)
-
-                    # validar stock disponible
-                    if rs.disponible < cantidad:
-                        raise ValueError(f"Stock insuficiente para {rs.repuesto.nombre} (Disponible: {rs.disponible})")
+                    rs = get_object_or_404(RepuestoEnStock.objects.select_related("repuesto"), pk=repuesto_stock_id)
 
                     subtotal = precio_unitario * cantidad
 
@@ -4185,16 +3624,15 @@ def venta_crear(request):
                         subtotal=subtotal
                     )
 
-                    # actualizar stock y movimiento
-                    rs.stock = rs.stock - cantidad
-                    rs.save(update_fields=["stock", "ultima_actualizacion"])
-                    StockMovimiento.objects.create(
-                        repuesto_stock=rs,
-                        tipo="salida",
-                        cantidad=cantidad,
+                    # actualizar stock y movimiento: sale del depósito elegido y solo
+                    # si le alcanza lo no reservado (stock - reservado >= cantidad)
+                    mover_stock(
+                        rs.repuesto, cantidad, "salida",
                         motivo=f"Venta #{venta.id}",
                         referencia=str(venta.id),
-                        usuario=request.user
+                        usuario=request.user,
+                        validar=True,
+                        deposito=rs,
                     )
 
                     total += subtotal
@@ -4248,32 +3686,12 @@ def repuesto_lookup(request):
     results = []
 
     if q:
-        # Búsqueda básica
-        repuestos = RepuestoEnStock.objects.select_related("repuesto").filter(
-            Q(repuesto__nombre__icontains=q) |
-            Q(repuesto__sku__icontains=q) |
-            Q(repuesto__oem__icontains=q) |
-            Q(repuesto__codigo_barra__icontains=q) |
-            Q(repuesto__marca__icontains=q) |
-            Q(repuesto__descripcion__icontains=q) |
-            Q(repuesto__marca_veh__icontains=q) |
-            Q(repuesto__tipo_de_motor__icontains=q) |
-            Q(repuesto__cod_prov__icontains=q) |
-            Q(repuesto__origen_repuesto__icontains=q)
-        )[:20]  # limitar a 20 resultados para que sea rápido
-        
-        # Si no hay resultados y el término contiene guiones, buscar por partes del SKU
-        if not repuestos.exists() and '-' in q:
-            partes = q.split('-')
-            if len(partes) > 1:
-                # Buscar SKUs que contengan todas las partes
-                sku_filter = Q()
-                for parte in partes:
-                    if parte.strip():  # Ignorar partes vacías
-                        sku_filter &= Q(repuesto__sku__icontains=parte.strip())
-                
-                if sku_filter:
-                    repuestos = RepuestoEnStock.objects.select_related("repuesto").filter(sku_filter)[:20]
+        # Índice de búsqueda compartido (FTS5 / pg_trgm), resultados ordenados por relevancia
+        ids = buscar_repuesto_ids(q, limite=20)
+        repuestos = ordenar_por_ranking(
+            RepuestoEnStock.objects.select_related("repuesto").filter(repuesto_id__in=ids)[:20],
+            ids, clave=lambda r: r.repuesto_id
+        )
 
         for r in repuestos:
             text = f"{r.repuesto.sku or '-'} | {r.repuesto.nombre} | {r.repuesto.marca or ''} | Stock: {r.stock}"
@@ -4299,41 +3717,13 @@ def buscar_insumos(request):
         return JsonResponse({'insumos': []})
     
     try:
-        from django.db.models import Q
-        from .models import RepuestoEnStock
-        
-        # Búsqueda amplia en RepuestoEnStock (tabla por defecto)
-        repuestos_stock = RepuestoEnStock.objects.select_related("repuesto").filter(
-            Q(repuesto__nombre__icontains=query) |
-            Q(repuesto__sku__icontains=query) |
-            Q(repuesto__oem__icontains=query) |
-            Q(repuesto__codigo_barra__icontains=query) |
-            Q(repuesto__marca__icontains=query) |
-            Q(repuesto__descripcion__icontains=query) |
-            Q(repuesto__marca_veh__icontains=query) |
-            Q(repuesto__tipo_de_motor__icontains=query) |
-            Q(repuesto__cod_prov__icontains=query) |
-            Q(repuesto__origen_repuesto__icontains=query) |
-            Q(repuesto__carroceria__icontains=query) |
-            Q(repuesto__referencia__icontains=query)
+        # Búsqueda amplia usando el índice compartido (FTS5 / pg_trgm)
+        ids = buscar_repuesto_ids(query, limite=20)
+        repuestos_stock = ordenar_por_ranking(
+            RepuestoEnStock.objects.select_related("repuesto").filter(repuesto_id__in=ids)[:20],
+            ids, clave=lambda r: r.repuesto_id
         )
         
-        # Si no hay resultados y el término contiene guiones, buscar por partes del SKU
-        if not repuestos_stock.exists() and '-' in query:
-            partes = query.split('-')
-            if len(partes) > 1:
-                # Buscar SKUs que contengan todas las partes
-                sku_filter = Q()
-                for parte in partes:
-                    if parte.strip():  # Ignorar partes vacías
-                        sku_filter &= Q(repuesto__sku__icontains=parte.strip())
-                
-                if sku_filter:
-                    repuestos_stock = RepuestoEnStock.objects.select_related("repuesto").filter(sku_filter)
-        
-        # Ordenar por nombre y limitar resultados
-        repuestos_stock = repuestos_stock.order_by('repuesto__nombre')[:20]
-        
         # Convertir a formato JSON
         insumos = []
         for stock_item in repuestos_stock:
@@ -4421,14 +3811,14 @@ class RepuestoListView(ListView):
         # Último repuesto ingresado/actualizado (desde StockMovimiento o RepuestoEnStock)
         ultimo_repuesto_ingresado = None
         ultimo_movimiento_ingreso = StockMovimiento.objects.filter(
-            tipo='ingreso'
-        ).select_related('repuesto_stock__repuesto').order_by('-fecha').first()
+            tipo='ingreso', repuesto__isnull=False
+        ).select_related('repuesto').order_by('-fecha').first()
         
         ultimo_stock_actualizado = RepuestoEnStock.objects.select_related('repuesto').order_by('-ultima_actualizacion').first()
         
         if ultimo_movimiento_ingreso and (not ultimo_stock_actualizado or ultimo_movimiento_ingreso.fecha > ultimo_stock_actualizado.ultima_actualizacion):
             ultimo_repuesto_ingresado = {
-                'nombre': ultimo_movimiento_ingreso.repuesto_stock.repuesto.nombre,
+                'nombre': ultimo_movimiento_ingreso.repuesto.nombre,
                 'fecha': ultimo_movimiento_ingreso.fecha,
                 'cantidad': ultimo_movimiento_ingreso.cantidad
             }
@@ -4603,91 +3993,25 @@ def tracking_publico_preview(request):
 
 
 
-# === Utilidad temporal: clonar Repuesto → RepuestoEnStock ===
+# === Utilidad: reflejar Repuesto → RepuestoEnStock (bodega-principal) ===
 def clone_repuesto_to_stock(repuesto: Repuesto, deposito: str = "bodega-principal", proveedor: str = "") -> RepuestoEnStock:
     """
-    Crea o actualiza una fila en RepuestoEnStock para el `repuesto` dado.
-    - depósito por defecto: "bodega-principal"
-    - proveedor por defecto: "" (vacío)
-    Copia: stock, precio_compra, precio_venta desde Repuesto.
-    Retorna la instancia de RepuestoEnStock creada/actualizada.
+    Iguala la fila de bodega-principal con el stock y precios del `repuesto`
+    (un UPDATE; la crea si no existe). Repuesto.stock es el valor autoritativo.
+    Retorna la instancia de RepuestoEnStock.
     """
-    from django.db import transaction
-    
-    with transaction.atomic():
-        # Primero, eliminar cualquier registro duplicado existente
-        registros_existentes = RepuestoEnStock.objects.filter(
-            repuesto=repuesto,
-            deposito=deposito
-        )
-        
-        if registros_existentes.count() > 1:
-            # Mantener solo el más reciente y eliminar los duplicados
-            registro_principal = registros_existentes.order_by('-id').first()
-            registros_duplicados = registros_existentes.exclude(id=registro_principal.id)
-            registros_duplicados.delete()
-        
-        defaults = {
-            "stock": repuesto.stock or 0,  # Usar el stock del repuesto, o 0 si es None
-            "reservado": 0,
-            "precio_compra": repuesto.precio_costo or 0,
-            "precio_venta": repuesto.precio_venta or 0,
-        }
-
-        repstk, created = RepuestoEnStock.objects.get_or_create(
-            repuesto=repuesto,
-            deposito=deposito,
-            proveedor=proveedor,
-            defaults=defaults,
-        )
-
-        if not created:
-            # Actualizar precios si han cambiado
-            if repuesto.precio_costo is not None:
-                repstk.precio_compra = repuesto.precio_costo
-            if repuesto.precio_venta is not None:
-                repstk.precio_venta = repuesto.precio_venta
-            
-            # SIEMPRE sincronizar el stock - esto es lo que queremos para simplificar
-            if repuesto.stock is not None:
-                repstk.stock = repuesto.stock
-                
-            repstk.save()
-
-        return repstk
+    igualar_deposito(repuesto, proveedor=proveedor)
+    return RepuestoEnStock.objects.filter(repuesto=repuesto, deposito=deposito).order_by('-id').first()
 
 
 def sincronizar_stock_repuestos():
     """
-    Función para sincronizar el stock de repuestos existentes que no tienen
-    registro en RepuestoEnStock o que tienen stock diferente.
+    Crea las filas faltantes en RepuestoEnStock y corrige las desincronizadas,
+    usando consultas por conjunto (ver movimientos_stock.conciliar_depositos).
     """
-    repuestos_sin_stock = Repuesto.objects.filter(stocks__isnull=True)
-    repuestos_con_stock_diferente = []
-    
-    for repuesto in Repuesto.objects.all():
-        if repuesto.stocks.exists():
-            from django.db.models import Sum
-            stock_total = repuesto.stocks.aggregate(total=Sum('stock'))['total'] or 0
-            if repuesto.stock != stock_total:
-                repuestos_con_stock_diferente.append(repuesto)
-    
-    print(f"Repuestos sin registro en RepuestoEnStock: {repuestos_sin_stock.count()}")
-    print(f"Repuestos con stock desincronizado: {len(repuestos_con_stock_diferente)}")
-    
-    # Crear registros faltantes
-    for repuesto in repuestos_sin_stock:
-        if repuesto.stock and repuesto.stock > 0:
-            clone_repuesto_to_stock(repuesto)
-            print(f"Creado RepuestoEnStock para: {repuesto.nombre} (stock: {repuesto.stock})")
-    
-    # Sincronizar stocks diferentes
-    for repuesto in repuestos_con_stock_diferente:
-        stock_obj = repuesto.stocks.first()
-        if stock_obj:
-            stock_obj.stock = repuesto.stock
-            stock_obj.save()
-            print(f"Sincronizado stock para: {repuesto.nombre} (stock: {repuesto.stock})")
+    resultado = conciliar_depositos()
+    print(f"Conciliación de stock: {resultado}")
+    return resultado
 
 
 # === Vistas: crear/editar Repuesto clonando a RepuestoEnStock ===
@@ -4931,28 +4255,10 @@ def selector_test_view(request):
 
 @login_required
 def exportar_componentes_excel(request):
-    """Exportar lista de componentes a Excel"""
-    componentes = Componente.objects.filter(padre__isnull=True).order_by('padre__nombre', 'nombre')
-    
-    data = []
-    for comp in componentes:
-        data.append({
-            'Código': comp.codigo or '',
-            'Nombre': comp.nombre,
-            'Estado': 'Activo' if comp.activo else 'Inactivo',
-            'Familia': comp.padre.nombre if comp.padre else 'Principal',
-            'Hijos': comp.hijos.count(),
-        })
-    
-    df = pd.DataFrame(data)
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="componentes.xlsx"'
-    
-    with pd.ExcelWriter(response, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Componentes', index=False)
-    
-    return response
+    """Exportar lista de componentes a Excel (o CSV con ?formato=csv)"""
+    from .exportaciones import ENCABEZADOS_COMPONENTES, filas_componentes, respuesta_exportacion
+
+    return respuesta_exportacion(request, "componentes", "Componentes", ENCABEZADOS_COMPONENTES, filas_componentes())
 
 @login_required
 def exportar_componentes_pdf(request):
@@ -5004,26 +4310,10 @@ def exportar_componentes_pdf(request):
 
 @login_required
 def exportar_acciones_excel(request):
-    """Exportar lista de acciones a Excel"""
-    acciones = Accion.objects.all().order_by('nombre')
-    
-    data = []
-    for accion in acciones:
-        data.append({
-            'Nombre': accion.nombre,
-            'ID': accion.id,
-            'Usos': accion.componenteaccion_set.count(),
-        })
-    
-    df = pd.DataFrame(data)
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="acciones.xlsx"'
-    
-    with pd.ExcelWriter(response, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Acciones', index=False)
-    
-    return response
+    """Exportar lista de acciones a Excel (o CSV con ?formato=csv)"""
+    from .exportaciones import ENCABEZADOS_ACCIONES, filas_acciones, respuesta_exportacion
+
+    return respuesta_exportacion(request, "acciones", "Acciones", ENCABEZADOS_ACCIONES, filas_acciones())
 
 @login_required
 def exportar_acciones_pdf(request):
@@ -5073,28 +4363,10 @@ def exportar_acciones_pdf(request):
 
 @login_required
 def exportar_precios_excel(request):
-    """Exportar lista de precios (ComponenteAccion) a Excel"""
-    items = ComponenteAccion.objects.select_related("componente", "accion").order_by("componente__padre__nombre", "componente__nombre", "accion__nombre")
-    
-    data = []
-    for item in items:
-        data.append({
-            'Componente': item.componente.nombre,
-            'Acción': item.accion.nombre,
-            'Precio Mano de Obra': f"${item.precio_mano_obra:,.0f}" if item.precio_mano_obra else '$0',
-            'Familia': item.componente.padre.nombre if item.componente.padre else 'Principal',
-            'ID': item.id,
-        })
-    
-    df = pd.DataFrame(data)
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="lista_precios.xlsx"'
-    
-    with pd.ExcelWriter(response, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Lista de Precios', index=False)
-    
-    return response
+    """Exportar lista de precios (ComponenteAccion) a Excel (o CSV con ?formato=csv)"""
+    from .exportaciones import ENCABEZADOS_PRECIOS, filas_precios, respuesta_exportacion
+
+    return respuesta_exportacion(request, "lista_precios", "Lista de Precios", ENCABEZADOS_PRECIOS, filas_precios())
 
 @login_required
 def exportar_precios_pdf(request):
@@ -5331,7 +4603,7 @@ def gestion_usuarios(request):
             
             try:
                 user = User.objects.get(id=user_id)
-                mecanico = user.mecanico
+                mecanico, _ = Mecanico.objects.get_or_create(user=user, defaults={'rol': 'mecanico'})
                 mecanico.rol = nuevo_rol
                 mecanico.save()
                 config = AdministracionTaller.get_configuracion_activa()
@@ -5349,7 +4621,7 @@ def gestion_usuarios(request):
             
             try:
                 user = User.objects.get(id=user_id)
-                mecanico = user.mecanico
+                mecanico, _ = Mecanico.objects.get_or_create(user=user, defaults={'rol': 'mecanico'})
                 setattr(mecanico, permiso, activo)
                 mecanico.save()
                 config = AdministracionTaller.get_configuracion_activa()
@@ -5441,7 +4713,7 @@ def toggle_permiso_usuario(request):
         
         try:
             user = User.objects.get(id=user_id)
-            mecanico = user.mecanico
+            mecanico, _ = Mecanico.objects.get_or_create(user=user, defaults={'rol': 'mecanico'})
             setattr(mecanico, permiso, activo)
             mecanico.save()
             
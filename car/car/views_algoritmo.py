@@ -1,6 +1,8 @@
-from django.shortcuts import render
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .algoritmo_relacion import algoritmo_relacion_inteligente
+from django.urls import reverse
+from .models import TareaSegundoPlano
+from .tareas import encolar
 
 @login_required
 def relacionar_repuestos_componentes(request):
@@ -8,53 +10,33 @@ def relacionar_repuestos_componentes(request):
     if request.method == 'POST':
         umbral = float(request.POST.get('umbral', 0.6))
         ejecutar = request.POST.get('ejecutar') == 'true'
-        
-        if ejecutar:
-            return ejecutar_algoritmo_relacion(request, umbral)
-        else:
-            return analizar_relaciones(request, umbral)
-    
-    # Vista inicial
-    return render(request, 'car/relacionar_repuestos.html', {
-        'umbral_default': 0.6
-    })
 
-def analizar_relaciones(request, umbral=0.6):
-    """Analiza las relaciones posibles sin ejecutarlas"""
-    resultados = algoritmo_relacion_inteligente(umbral, solo_analizar=True)
-    
-    return render(request, 'car/relacionar_repuestos.html', {
-        'resultados': resultados,
-        'umbral': umbral,
-        'solo_analisis': True
-    })
+        # El algoritmo corre en el worker; la página consulta el progreso
+        tarea = encolar(
+            'relacionar_repuestos', {'umbral': umbral, 'ejecutar': ejecutar},
+            usuario=request.user, clave='relacionar_repuestos',
+        )
+        return redirect(f"{reverse('relacionar_repuestos_componentes')}?tarea={tarea.pk}")
+
+    tarea_id = request.GET.get('tarea')
+    if tarea_id:
+        tarea = get_object_or_404(TareaSegundoPlano, pk=tarea_id, tipo='relacionar_repuestos')
+        umbral = tarea.parametros.get('umbral', 0.6)
+        ejecutar = tarea.parametros.get('ejecutar', False)
+        if tarea.estado == 'completado':
+            return render(request, 'car/relacionar_repuestos.html', {
+                'resultados': tarea.resultado,
+                'umbral': umbral,
+                'ejecutado': ejecutar,
+                'solo_analisis': not ejecutar,
+            })
+        return render(request, 'car/relacionar_repuestos.html', {
+            'tarea': tarea,
+            'ejecutar': ejecutar,
+            'umbral_default': umbral,
+        })
 
-def ejecutar_algoritmo_relacion(request, umbral=0.6):
-    """Ejecuta el algoritmo y crea las relaciones"""
-    resultados = algoritmo_relacion_inteligente(umbral, ejecutar=True)
-    
+    # Vista inicial
     return render(request, 'car/relacionar_repuestos.html', {
-        'resultados': resultados,
-        'umbral': umbral,
-        'ejecutado': True
+        'umbral_default': 0.6
     })
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
@@ -1,7 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Q, Count
+from django.db.models import Q, Count
 from django.utils import timezone
 from django.core.paginator import Paginator
 from decimal import Decimal
@@ -11,6 +11,7 @@ from .models import (
     BonoGenerado, PagoMecanico, ExcepcionBonoTrabajo, CierrePeriodo
 )
 from .decorators import requiere_permiso
+from .bonos import aplicar_pago, cerrar_periodos
 
 
 def generar_bonos_trabajo_entregado(trabajo):
@@ -239,18 +240,13 @@ def cuenta_mecanico(request, mecanico_id):
     # Pagos realizados
     pagos = pagos_query.prefetch_related('bonos_aplicados').order_by('-fecha_pago')
     
-    # Estadísticas (totales si no hay filtro, del período si hay filtro)
-    if periodo_mes and periodo_anio:
-        saldo_pendiente = bonos_pendientes.aggregate(total=Sum('monto'))['total'] or Decimal('0')
-        total_generado = bonos_query.aggregate(total=Sum('monto'))['total'] or Decimal('0')
-        # Total pagado debe ser la suma de los BONOS marcados como pagados, no de los pagos registrados
-        # Esto es más preciso porque un pago puede ser parcial o cubrir múltiples bonos
-        total_pagado = bonos_query.filter(pagado=True).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-    else:
-        saldo_pendiente = mecanico.saldo_bonos_pendiente
-        total_generado = mecanico.saldo_bonos_total
-        # Total pagado: suma de los bonos marcados como pagados (no de los pagos registrados)
-        total_pagado = BonoGenerado.objects.filter(mecanico=mecanico, pagado=True).aggregate(total=Sum('monto'))['total'] or Decimal('0')
+    # Estadísticas (totales si no hay filtro, del período si hay filtro), en una consulta.
+    # Total pagado es la suma de los BONOS marcados como pagados, no de los pagos registrados:
+    # es más preciso porque un pago puede ser parcial o cubrir múltiples bonos
+    totales = bonos_query.totales()
+    saldo_pendiente = totales['pendiente']
+    total_generado = totales['total']
+    total_pagado = totales['pagado']
     
     # Cierres de períodos
     cierres = CierrePeriodo.objects.filter(
@@ -360,11 +356,8 @@ def registrar_pago_mecanico(request, mecanico_id):
             )
             pago.bonos_aplicados.set(bonos)
             
-            # Marcar bonos como pagados
-            for bono in bonos:
-                bono.pagado = True
-                bono.fecha_pago = pago.fecha_pago
-                bono.save()
+            # Marcar bonos como pagados (un solo UPDATE)
+            aplicar_pago(pago)
         from .models import AdministracionTaller
         config_taller = AdministracionTaller.get_configuracion_activa()
         if config_taller.ver_mensajes:
@@ -386,7 +379,8 @@ def lista_mecanicos_bonos(request):
     """
     Vista para listar todos los mecánicos con sus saldos de bonos.
     """
-    mecanicos = Mecanico.objects.filter(activo=True).select_related('user')
+    # Saldos de todos los mecánicos en la misma consulta (MecanicoQuerySet.with_saldos_bonos)
+    mecanicos = Mecanico.objects.filter(activo=True).select_related('user').with_saldos_bonos()
     
     # Agregar información de saldos
     mecanicos_con_saldos = []
@@ -550,14 +544,47 @@ def lista_cierres_periodo(request, mecanico_id=None):
     # Ordenar por año y mes descendente
     cierres = cierres.order_by('-periodo_anio', '-periodo_mes')
     
+    hoy = timezone.localdate()
     context = {
         'cierres': cierres,
         'mecanico': mecanico,
+        'mes_actual': hoy.month,
+        'anio_actual': hoy.year,
     }
     
     return render(request, 'car/bonos/lista_cierres_periodo.html', context)
 
 
+@login_required
+@requiere_permiso('trabajos')
+def cerrar_periodo_todos(request):
+    """
+    Cierra un mes para todos los mecánicos con bonos en ese período (POST mes, anio).
+    Los que ya tienen cierre se omiten.
+    """
+    from .models import AdministracionTaller
+    config_taller = AdministracionTaller.get_configuracion_activa()
+
+    if request.method != 'POST':
+        return redirect('lista_cierres_periodo')
+
+    try:
+        mes = int(request.POST.get('mes'))
+        anio = int(request.POST.get('anio'))
+        cierres = cerrar_periodos(mes, anio, usuario=request.user, notas=request.POST.get('notas', ''))
+    except (ValueError, TypeError):
+        if config_taller.ver_mensajes:
+            messages.error(request, "Período inválido")
+        return redirect('lista_cierres_periodo')
+
+    if config_taller.ver_mensajes:
+        if cierres:
+            messages.success(request, f"Período {cierres[0].periodo_texto} cerrado para {len(cierres)} mecánicos")
+        else:
+            messages.info(request, "No hay mecánicos con bonos pendientes de cierre en ese período")
+    return redirect('lista_cierres_periodo')
+
+
 @login_required
 @requiere_permiso('trabajos')
 def crear_cierre_periodo(request, mecanico_id, mes, anio):
@@ -596,23 +623,17 @@ def crear_cierre_periodo(request, mecanico_id, mes, anio):
     if request.method == 'POST':
         notas = request.POST.get('notas', '')
         
-        # Crear el cierre
-        cierre = CierrePeriodo.objects.create(
-            mecanico=mecanico,
-            periodo_mes=mes,
-            periodo_anio=anio,
-            cerrado_por=request.user,
-            notas=notas
-        )
-        
-        # Calcular totales y cerrar período
-        cierre.calcular_totales()
-        cierre.cerrar_periodo(usuario=request.user)
+        # Crear el cierre con sus totales y cerrar los bonos del período
+        cierres = cerrar_periodos(mes, anio, usuario=request.user, notas=notas, mecanicos=[mecanico])
         
         from .models import AdministracionTaller
         config_taller = AdministracionTaller.get_configuracion_activa()
         if config_taller.ver_mensajes:
-            messages.success(request, f"Cierre de período {cierre.periodo_texto} creado exitosamente")
+            if cierres:
+                messages.success(request, f"Cierre de período {cierres[0].periodo_texto} creado exitosamente")
+            else:
+                # Otra petición lo cerró entre la verificación de arriba y este POST
+                messages.warning(request, "Ya existe un cierre para este período")
         return redirect('cuenta_mecanico', mecanico_id=mecanico_id)
     
     # Obtener estadísticas del período antes de cerrar
@@ -622,10 +643,11 @@ def crear_cierre_periodo(request, mecanico_id, mes, anio):
         periodo_anio=anio
     )
     
-    total_bonos = bonos_periodo.aggregate(total=Sum('monto'))['total'] or Decimal('0')
-    total_pagado = bonos_periodo.filter(pagado=True).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-    saldo_pendiente = bonos_periodo.filter(pagado=False).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-    cantidad_bonos = bonos_periodo.count()
+    totales = bonos_periodo.totales()
+    total_bonos = totales['total']
+    total_pagado = totales['pagado']
+    saldo_pendiente = totales['pendiente']
+    cantidad_bonos = totales['cantidad']
     
     meses = ['', 'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
              'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
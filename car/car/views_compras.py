@@ -1,3 +1,5 @@
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
@@ -6,8 +8,13 @@ from django.db import transaction
 from django.core.paginator import Paginator
 from django.db.models import Q, Sum
 from django.utils import timezone
+from django.urls import reverse
+from urllib.parse import urlencode
 from .models import Compra, CompraItem, Repuesto, RepuestoEnStock, StockMovimiento
 from .forms import CompraForm, CompraItemForm
+from .busqueda_repuestos import buscar_repuesto_ids, ordenar_por_ranking
+from .tareas import encolar
+from .compras import guardar_items
 
 
 @login_required
@@ -158,6 +165,34 @@ def compra_edit(request, pk):
     })
 
 
+@login_required
+def compra_items_lote(request, pk):
+    """
+    API para agregar/actualizar muchos items en una sola petición.
+    POST JSON: {"items": [{"repuesto_id": 1, "cantidad": 2, "precio_unitario": 1500}, ...],
+                "reemplazar": false}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
+
+    compra = get_object_or_404(Compra, pk=pk)
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        lineas = data['items']
+        if not isinstance(lineas, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'JSON inválido: se espera {"items": [...]}'}, status=400)
+
+    try:
+        resultado = guardar_items(compra, lineas, reemplazar=bool(data.get('reemplazar')))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    compra.refresh_from_db(fields=['total'])
+    return JsonResponse({'success': True, **resultado, 'total': float(compra.total)})
+
+
 @login_required
 def compra_item_delete(request, pk):
     """Eliminar item de compra"""
@@ -219,31 +254,13 @@ def compra_recibir(request, pk):
     compra = get_object_or_404(Compra, pk=pk)
     
     if request.method == 'POST':
-        with transaction.atomic():
-            # Recibir todos los items pendientes
-            items_pendientes = compra.items.filter(recibido=False)
-            items_recibidos = 0
-            
-            for item in items_pendientes:
-                item.recibir_item(usuario=request.user)
-                items_recibidos += 1
-            
-            # Actualizar estado de la compra
-            if items_recibidos > 0:
-                compra.estado = 'recibida'
-                compra.fecha_recibida = timezone.now().date()
-                compra.save()
-                from .models import AdministracionTaller
-                config = AdministracionTaller.get_configuracion_activa()
-                if config.ver_mensajes:
-                    messages.success(request, f'{items_recibidos} items recibidos y stock actualizado.')
-            else:
-                from .models import AdministracionTaller
-                config = AdministracionTaller.get_configuracion_activa()
-                if config.ver_mensajes:
-                    messages.info(request, 'No hay items pendientes de recibir.')
-        
-        return redirect('compra_detail', pk=compra.pk)
+        # La recepción (stock, precios y movimientos de cada item) corre en el worker
+        tarea = encolar(
+            'recibir_compra', {'compra_id': compra.pk},
+            usuario=request.user, clave=f'recibir_compra:{compra.pk}',
+        )
+        siguiente = reverse('compra_detail', args=[compra.pk])
+        return redirect(f"{reverse('tarea_estado', args=[tarea.pk])}?{urlencode({'siguiente': siguiente})}")
     
     return render(request, 'car/compras/compra_recibir.html', {
         'compra': compra
@@ -324,17 +341,8 @@ def buscar_repuestos_compra(request):
     if len(query) < 2:
         return JsonResponse({'repuestos': []})
     
-    repuestos = Repuesto.objects.filter(
-        Q(nombre__icontains=query) |
-        Q(sku__icontains=query) |
-        Q(codigo_barra__icontains=query) |
-        Q(oem__icontains=query) |
-        Q(referencia__icontains=query) |
-        Q(marca__icontains=query) |
-        Q(marca_veh__icontains=query) |
-        Q(tipo_de_motor__icontains=query) |
-        Q(carroceria__icontains=query)
-    ).order_by('nombre')[:10]
+    ids = buscar_repuesto_ids(query, limite=10)
+    repuestos = ordenar_por_ranking(Repuesto.objects.filter(id__in=ids), ids)
     
     resultados = []
     for repuesto in repuestos:
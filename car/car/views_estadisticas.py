@@ -1,11 +1,12 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.db.models import Count, Avg, Sum, Q
-from datetime import timedelta, datetime
+from django.db.models import Count, Avg, Sum, Max, Q
+from datetime import timedelta
 from decimal import Decimal
 
-from .models import Trabajo, Diagnostico, AdministracionTaller, ResumenTrabajo, RegistroEvento, TrabajoAccion, TrabajoRepuesto, Componente, Accion, Repuesto
+from .models import AdministracionTaller, ResumenTrabajo, EstadisticaAcumulada
+from .estadisticas import inicio_periodo, filtro_ventana
 from .decorators import requiere_permiso
 
 
@@ -22,172 +23,101 @@ def estadisticas_trabajos(request):
     
     # Fechas para cálculos
     ahora = timezone.now()
+    hoy = timezone.localdate()
     inicio_semana = ahora - timedelta(days=7)
     inicio_mes = ahora - timedelta(days=30)
+    lunes_actual = inicio_periodo('semana', hoy)
     
     # ========================
-    # 1. ESTADÍSTICAS GENERALES (desde ResumenTrabajo - datos históricos persistentes)
+    # 1. ESTADÍSTICAS GENERALES (desde EstadisticaAcumulada - conteo por estado)
     # ========================
-    total_trabajos = ResumenTrabajo.objects.count()
-    trabajos_activos = ResumenTrabajo.objects.exclude(estado_actual='entregado').count()
-    trabajos_completados = ResumenTrabajo.objects.filter(estado_actual='completado').count()
-    trabajos_entregados = ResumenTrabajo.objects.filter(estado_actual='entregado').count()
-    
-    # Trabajos por estado con porcentajes (desde ResumenTrabajo)
-    trabajos_por_estado_raw = ResumenTrabajo.objects.values('estado_actual').annotate(
-        cantidad=Count('trabajo_id')
-    ).order_by('estado_actual')
+    por_estado = {
+        fila['clave']: fila['cantidad']
+        for fila in EstadisticaAcumulada.objects.filter(
+            dimension='estado', periodo='total', cantidad__gt=0
+        ).values('clave', 'cantidad').order_by('clave')
+    }
+    total_trabajos = sum(por_estado.values())
+    trabajos_completados = por_estado.get('completado', 0)
+    trabajos_entregados = por_estado.get('entregado', 0)
+    trabajos_activos = total_trabajos - trabajos_entregados
     
     trabajos_por_estado = []
-    for estado_data in trabajos_por_estado_raw:
-        porcentaje = (estado_data['cantidad'] / total_trabajos * 100) if total_trabajos > 0 else 0
+    for estado, cantidad in por_estado.items():
+        porcentaje = (cantidad / total_trabajos * 100) if total_trabajos > 0 else 0
         trabajos_por_estado.append({
-            'estado': estado_data['estado_actual'],
-            'cantidad': estado_data['cantidad'],
+            'estado': estado,
+            'cantidad': cantidad,
             'porcentaje': round(porcentaje, 1)
         })
     
     # ========================
-    # 2. TIEMPOS DE RESPUESTA (desde RegistroEvento - datos históricos persistentes)
-    # ========================
-    # Tiempo desde diagnóstico creado hasta aprobado usando eventos
-    eventos_diagnostico_creado = RegistroEvento.objects.filter(
-        tipo_evento='diagnostico_creado'
-    ).select_related().order_by('diagnostico_id', 'fecha_evento')
-    
-    eventos_diagnostico_aprobado = RegistroEvento.objects.filter(
-        tipo_evento='diagnostico_aprobado'
-    ).select_related().order_by('diagnostico_id', 'fecha_evento')
-    
-    tiempos_respuesta = []
-    # Crear diccionario de diagnósticos aprobados por ID
-    aprobados_dict = {e.diagnostico_id: e.fecha_evento for e in eventos_diagnostico_aprobado if e.diagnostico_id}
-    
-    for evento_creado in eventos_diagnostico_creado:
-        if evento_creado.diagnostico_id and evento_creado.diagnostico_id in aprobados_dict:
-            fecha_creado = evento_creado.fecha_evento
-            fecha_aprobado = aprobados_dict[evento_creado.diagnostico_id]
-            delta = fecha_aprobado - fecha_creado
-            tiempos_respuesta.append(delta.total_seconds() / 3600)  # En horas
-    
-    tiempo_respuesta_promedio = sum(tiempos_respuesta) / len(tiempos_respuesta) if tiempos_respuesta else 0
-    
-    # ========================
-    # 3. TIEMPO EN CADA ETAPA (desde RegistroEvento - datos históricos persistentes)
+    # 2 y 3. TIEMPOS DE RESPUESTA Y TIEMPO EN CADA ETAPA (acumulados al registrar eventos)
     # ========================
-    # Calcular tiempo en cada etapa usando eventos de cambio_estado e ingreso
-    tiempos_etapas = {
-        'iniciado': [],
-        'trabajando': [],
-        'completado': [],
-        'entregado': []
+    tiempos = {
+        (fila['dimension'], fila['clave']): fila
+        for fila in EstadisticaAcumulada.objects.filter(
+            dimension__in=('respuesta', 'etapa'), periodo='total'
+        ).values('dimension', 'clave', 'cantidad', 'duracion')
     }
     
-    # Obtener todos los eventos de ingreso y cambios de estado ordenados por trabajo y fecha
-    eventos_ingreso = RegistroEvento.objects.filter(
-        tipo_evento='ingreso',
-        trabajo_id__isnull=False
-    ).order_by('trabajo_id', 'fecha_evento')
-    
-    cambios_estado = RegistroEvento.objects.filter(
-        tipo_evento='cambio_estado',
-        estado_anterior__isnull=False,
-        estado_nuevo__isnull=False,
-        trabajo_id__isnull=False
-    ).order_by('trabajo_id', 'fecha_evento')
-    
-    # Crear diccionario de eventos por trabajo
-    trabajos_eventos = {}
-    for ingreso in eventos_ingreso:
-        if ingreso.trabajo_id:
-            if ingreso.trabajo_id not in trabajos_eventos:
-                trabajos_eventos[ingreso.trabajo_id] = []
-            trabajos_eventos[ingreso.trabajo_id].append({
-                'tipo': 'ingreso',
-                'estado': 'iniciado',
-                'fecha': ingreso.fecha_evento
-            })
-    
-    for cambio in cambios_estado:
-        if cambio.trabajo_id:
-            if cambio.trabajo_id not in trabajos_eventos:
-                trabajos_eventos[cambio.trabajo_id] = []
-            trabajos_eventos[cambio.trabajo_id].append({
-                'tipo': 'cambio',
-                'estado_anterior': cambio.estado_anterior,
-                'estado_nuevo': cambio.estado_nuevo,
-                'fecha': cambio.fecha_evento
-            })
-    
-    # Calcular tiempos en cada etapa
-    for trabajo_id, eventos in trabajos_eventos.items():
-        eventos_ordenados = sorted(eventos, key=lambda x: x['fecha'])
-        estado_actual = None
-        fecha_inicio_estado = None
-        
-        for evento in eventos_ordenados:
-            if evento['tipo'] == 'ingreso':
-                estado_actual = 'iniciado'
-                fecha_inicio_estado = evento['fecha']
-            elif evento['tipo'] == 'cambio':
-                # Si había un estado previo, calcular tiempo en ese estado
-                if estado_actual and fecha_inicio_estado and estado_actual in tiempos_etapas:
-                    delta = evento['fecha'] - fecha_inicio_estado
-                    tiempos_etapas[estado_actual].append(delta.days)
-                
-                # Actualizar al nuevo estado
-                estado_actual = evento['estado_nuevo']
-                fecha_inicio_estado = evento['fecha']
-    
-    # Si un trabajo terminó en un estado, usar fecha actual o fecha_entrega del resumen
-    # (esto se puede mejorar con eventos de entrega)
+    def _promedio(dimension, clave):
+        fila = tiempos.get((dimension, clave))
+        return fila['duracion'] / fila['cantidad'] if fila and fila['cantidad'] else 0
     
+    tiempo_respuesta_promedio = _promedio('respuesta', 'diagnostico')  # En horas
     dias_promedio_por_etapa = {
-        estado: sum(tiempos) / len(tiempos) if tiempos else 0
-        for estado, tiempos in tiempos_etapas.items()
+        estado: _promedio('etapa', estado)
+        for estado in ('iniciado', 'trabajando', 'completado', 'entregado')
     }
     
-    # Días promedio en el taller (desde ResumenTrabajo - campo almacenado históricamente)
-    dias_promedio_taller = ResumenTrabajo.objects.aggregate(
-        promedio=Avg('dias_en_taller')
-    )['promedio'] or 0
-    
     # ========================
-    # 4. VEHÍCULOS INGRESADOS (desde ResumenTrabajo y RegistroEvento - datos históricos)
+    # 4 a 6. PROMEDIOS, FINANCIERO Y AVANCE (desde ResumenTrabajo, una sola consulta)
     # ========================
-    # Contar ingresos desde ResumenTrabajo (fecha_ingreso almacenada)
-    vehiculos_semana = ResumenTrabajo.objects.filter(
-        fecha_ingreso__gte=inicio_semana
-    ).count()
-    
-    vehiculos_mes = ResumenTrabajo.objects.filter(
-        fecha_ingreso__gte=inicio_mes
-    ).count()
-    
-    # Promedio semanal (últimas 4 semanas) - desde ResumenTrabajo
-    semanas_anteriores = []
-    for i in range(4):
-        inicio_sem = inicio_semana - timedelta(weeks=i+1)
-        fin_sem = inicio_semana - timedelta(weeks=i)
-        vehiculos_sem = ResumenTrabajo.objects.filter(
-            fecha_ingreso__gte=inicio_sem,
-            fecha_ingreso__lt=fin_sem
-        ).count()
-        semanas_anteriores.append(vehiculos_sem)
-    
-    promedio_semanal = sum(semanas_anteriores) / len(semanas_anteriores) if semanas_anteriores else 0
-    
-    # ========================
-    # 5. UTILIDAD Y FINANCIERO (desde ResumenTrabajo - datos históricos persistentes)
-    # ========================
-    # Totales financieros desde ResumenTrabajo (campos almacenados)
-    totales_financieros = ResumenTrabajo.objects.aggregate(
+    resumen = ResumenTrabajo.objects.aggregate(
+        dias_promedio=Avg('dias_en_taller'),
         total_mano_obra=Sum('total_mano_obra'),
-        total_repuestos=Sum('total_repuestos')
+        total_repuestos=Sum('total_repuestos'),
+        promedio_avance=Avg('porcentaje_avance'),
+        avance_0_25=Count('pk', filter=Q(porcentaje_avance__gte=0, porcentaje_avance__lt=25)),
+        avance_25_50=Count('pk', filter=Q(porcentaje_avance__gte=25, porcentaje_avance__lt=50)),
+        avance_50_75=Count('pk', filter=Q(porcentaje_avance__gte=50, porcentaje_avance__lt=75)),
+        avance_75_100=Count('pk', filter=Q(porcentaje_avance__gte=75, porcentaje_avance__lte=100)),
     )
+    dias_promedio_taller = resumen['dias_promedio'] or 0
+    
+    # Vehículos ingresados y entregas: filas diarias del último mes y semanales de las 4 semanas previas
+    movimientos = EstadisticaAcumulada.objects.filter(
+        Q(periodo='dia', inicio__gte=timezone.localdate(inicio_mes)) |
+        Q(periodo='semana', inicio__gte=lunes_actual - timedelta(weeks=4), inicio__lt=lunes_actual),
+        dimension__in=('ingreso', 'entrega'),
+    ).values('dimension', 'periodo', 'inicio', 'cantidad', 'monto_mano_obra', 'monto_repuestos')
+    
+    desde_semana = timezone.localdate(inicio_semana)
+    vehiculos_semana = vehiculos_mes = 0
+    semanas_anteriores = [0, 0, 0, 0]
+    trabajos_completados_semana = 0
+    ingresos_semana_mano_obra = Decimal('0')
+    ingresos_semana_repuestos = Decimal('0')
+    for fila in movimientos:
+        if fila['periodo'] == 'semana':
+            if fila['dimension'] == 'ingreso':
+                semanas_anteriores[(lunes_actual - fila['inicio']).days // 7 - 1] += fila['cantidad']
+        elif fila['dimension'] == 'ingreso':
+            vehiculos_mes += fila['cantidad']
+            if fila['inicio'] >= desde_semana:
+                vehiculos_semana += fila['cantidad']
+        elif fila['inicio'] >= desde_semana:
+            trabajos_completados_semana += fila['cantidad']
+            ingresos_semana_mano_obra += fila['monto_mano_obra']
+            ingresos_semana_repuestos += fila['monto_repuestos']
+    
+    # Promedio semanal (últimas 4 semanas completas)
+    promedio_semanal = sum(semanas_anteriores) / len(semanas_anteriores)
     
-    total_mano_obra = totales_financieros['total_mano_obra'] or Decimal('0')
-    total_repuestos = totales_financieros['total_repuestos'] or Decimal('0')
+    # Totales financieros desde ResumenTrabajo (campos almacenados)
+    total_mano_obra = resumen['total_mano_obra'] or Decimal('0')
+    total_repuestos = resumen['total_repuestos'] or Decimal('0')
     total_ingresos = total_mano_obra + total_repuestos
     
     # Promedio por trabajo
@@ -195,63 +125,14 @@ def estadisticas_trabajos(request):
     promedio_repuestos = total_repuestos / total_trabajos if total_trabajos > 0 else Decimal('0')
     promedio_ingresos = total_ingresos / total_trabajos if total_trabajos > 0 else Decimal('0')
     
-    # Trabajos completados esta semana (usando eventos de entrega desde RegistroEvento)
-    trabajos_completados_semana = RegistroEvento.objects.filter(
-        tipo_evento='entrega',
-        fecha_evento__gte=inicio_semana
-    ).values('trabajo_id').distinct().count()
-    
-    # Ingresos de la semana (desde eventos de entrega con total_general almacenado)
-    ingresos_semana_totales = RegistroEvento.objects.filter(
-        tipo_evento='entrega',
-        fecha_evento__gte=inicio_semana,
-        total_general__isnull=False
-    ).aggregate(total=Sum('total_general'))['total'] or Decimal('0')
-    
-    # Dividir ingresos de la semana entre mano de obra y repuestos usando proporciones
-    # O usar eventos individuales con montos almacenados
-    ingresos_semana_mano_obra = RegistroEvento.objects.filter(
-        tipo_evento='entrega',
-        fecha_evento__gte=inicio_semana,
-        total_mano_obra__isnull=False
-    ).aggregate(total=Sum('total_mano_obra'))['total'] or Decimal('0')
-    
-    ingresos_semana_repuestos = RegistroEvento.objects.filter(
-        tipo_evento='entrega',
-        fecha_evento__gte=inicio_semana,
-        total_repuestos__isnull=False
-    ).aggregate(total=Sum('total_repuestos'))['total'] or Decimal('0')
-    
     ingresos_semana = ingresos_semana_mano_obra + ingresos_semana_repuestos
     
-    # ========================
-    # 6. PORCENTAJE DE AVANCE (desde ResumenTrabajo - campo almacenado)
-    # ========================
-    # Promedio de avance desde ResumenTrabajo
-    promedio_avance = ResumenTrabajo.objects.aggregate(
-        promedio=Avg('porcentaje_avance')
-    )['promedio'] or 0
-    
-    # Trabajos por rango de avance con porcentajes (usando consultas agregadas)
-    avance_0_25 = ResumenTrabajo.objects.filter(
-        porcentaje_avance__gte=0,
-        porcentaje_avance__lt=25
-    ).count()
-    
-    avance_25_50 = ResumenTrabajo.objects.filter(
-        porcentaje_avance__gte=25,
-        porcentaje_avance__lt=50
-    ).count()
-    
-    avance_50_75 = ResumenTrabajo.objects.filter(
-        porcentaje_avance__gte=50,
-        porcentaje_avance__lt=75
-    ).count()
-    
-    avance_75_100 = ResumenTrabajo.objects.filter(
-        porcentaje_avance__gte=75,
-        porcentaje_avance__lte=100
-    ).count()
+    # Porcentaje de avance
+    promedio_avance = resumen['promedio_avance'] or 0
+    avance_0_25 = resumen['avance_0_25']
+    avance_25_50 = resumen['avance_25_50']
+    avance_50_75 = resumen['avance_50_75']
+    avance_75_100 = resumen['avance_75_100']
     
     # Calcular porcentajes de distribución
     porcentaje_avance_0_25 = (avance_0_25 / total_trabajos * 100) if total_trabajos > 0 else 0
@@ -272,207 +153,92 @@ def estadisticas_trabajos(request):
     completados_vs_promedio = trabajos_completados_semana - (promedio_semanal * 0.7)  # Asumiendo 70% se completan
     
     # ========================
-    # 8. ACCIONES RESUELTAS EN EL PERÍODO (NUEVO)
+    # 8 a 11. ACCIONES, COMPONENTES Y REPUESTOS DEL PERÍODO
     # ========================
     # Obtener período desde request (por defecto: último mes)
     periodo_dias = int(request.GET.get('periodo', 30))
     fecha_inicio_periodo = ahora - timedelta(days=periodo_dias)
     
-    # Obtener trabajos iniciados o finalizados en el período
-    # Esto captura todos los trabajos activos en el período
-    trabajos_periodo = Trabajo.objects.filter(
-        Q(fecha_inicio__gte=fecha_inicio_periodo) |
-        Q(fecha_fin__gte=fecha_inicio_periodo)
-    )
-    
-    # Acciones completadas de esos trabajos (sin filtrar por fecha de la acción)
-    # Esto captura todas las acciones completadas de trabajos en el período
-    acciones_completadas = TrabajoAccion.objects.filter(
-        completado=True,
-        trabajo__in=trabajos_periodo
-    ).select_related('accion', 'componente', 'trabajo')
-    
-    # Obtener todas las acciones con sus datos para calcular subtotales
-    acciones_detalle = list(acciones_completadas.values(
-        'accion__nombre', 
-        'componente__nombre',
-        'accion_id',
-        'componente_id',
-        'precio_mano_obra',
-        'cantidad'
-    ))
-    
-    # Agrupar y calcular en Python
-    acciones_agrupadas = {}
-    for acc in acciones_detalle:
-        clave = (acc['accion_id'], acc['componente_id'])
-        if clave not in acciones_agrupadas:
-            acciones_agrupadas[clave] = {
-                'accion_nombre': acc['accion__nombre'],
-                'componente_nombre': acc['componente__nombre'],
-                'accion_id': acc['accion_id'],
-                'componente_id': acc['componente_id'],
-                'recurrencias': 0,
-                'cantidad_total': 0,
-                'total_ingresos': Decimal('0')
-            }
-        
-        subtotal = Decimal(str(acc['precio_mano_obra'])) * Decimal(str(acc['cantidad']))
-        acciones_agrupadas[clave]['recurrencias'] += 1
-        acciones_agrupadas[clave]['cantidad_total'] += acc['cantidad']
-        acciones_agrupadas[clave]['total_ingresos'] += subtotal
-    
-    # Convertir a lista y ordenar
-    acciones_resueltas_lista = sorted(
-        acciones_agrupadas.values(),
-        key=lambda x: x['recurrencias'],
-        reverse=True
-    )
-    
-    # ========================
-    # 9. INGRESOS POR ACCIÓN (MÁS RENTABLE A MENOS RENTABLE) (NUEVO)
-    # ========================
-    # Obtener datos de acciones con trabajos para calcular ingresos
-    acciones_con_trabajos = list(acciones_completadas.values(
-        'accion__nombre',
-        'accion_id',
-        'trabajo_id',
-        'precio_mano_obra',
-        'cantidad'
-    ))
-    
-    # Agrupar por acción y calcular en Python
-    ingresos_agrupados = {}
-    trabajos_por_accion = {}
-    
-    for acc in acciones_con_trabajos:
-        accion_id = acc['accion_id']
-        trabajo_id = acc['trabajo_id']
-        
-        if accion_id not in ingresos_agrupados:
-            ingresos_agrupados[accion_id] = {
-                'accion_nombre': acc['accion__nombre'],
-                'total_ingresos': Decimal('0'),
-                'cantidad_veces': 0,
-                'cantidad_total': 0
-            }
-            trabajos_por_accion[accion_id] = set()
-        
-        subtotal = Decimal(str(acc['precio_mano_obra'])) * Decimal(str(acc['cantidad']))
-        ingresos_agrupados[accion_id]['total_ingresos'] += subtotal
-        ingresos_agrupados[accion_id]['cantidad_veces'] += 1
-        ingresos_agrupados[accion_id]['cantidad_total'] += acc['cantidad']
-        trabajos_por_accion[accion_id].add(trabajo_id)
+    # Ítems completados en el período: semanas completas + días de los bordes.
+    # Los trabajos distintos se cuentan por día/semana y se suman entre ellos.
+    items = EstadisticaAcumulada.objects.filter(
+        filtro_ventana(timezone.localdate(fecha_inicio_periodo), hoy),
+        dimension__in=('accion', 'componente', 'par', 'repuesto', 'actividad'),
+    ).values('dimension', 'clave').annotate(
+        nombre_item=Max('nombre'),
+        detalle_item=Max('detalle'),
+        veces=Sum('cantidad'),
+        unidades_total=Sum('unidades'),
+        trabajos_total=Sum('trabajos'),
+        mano_obra=Sum('monto_mano_obra'),
+        repuestos=Sum('monto_repuestos'),
+    ).filter(veces__gt=0)
+    
+    por_dimension = {}
+    for fila in items:
+        por_dimension.setdefault(fila['dimension'], []).append(fila)
+    
+    actividad = por_dimension.get('actividad', [])
+    total_trabajos_periodo = actividad[0]['trabajos_total'] if actividad else 0
+    
+    acciones_resueltas_lista = []
+    for fila in por_dimension.get('par', []):
+        accion_id, componente_id = fila['clave'].split(':')
+        acciones_resueltas_lista.append({
+            'accion_nombre': fila['nombre_item'],
+            'componente_nombre': fila['detalle_item'],
+            'accion_id': int(accion_id),
+            'componente_id': int(componente_id),
+            'recurrencias': fila['veces'],
+            'cantidad_total': fila['unidades_total'],
+            'total_ingresos': fila['mano_obra'] or Decimal('0'),
+        })
+    acciones_resueltas_lista.sort(key=lambda x: x['recurrencias'], reverse=True)
     
-    # Formatear para el template
     ingresos_por_accion_lista = []
-    for accion_id, datos in ingresos_agrupados.items():
-        cantidad_trabajos = len(trabajos_por_accion[accion_id])
+    for fila in por_dimension.get('accion', []):
+        cantidad_trabajos = fila['trabajos_total']
+        total = fila['mano_obra'] or Decimal('0')
         ingresos_por_accion_lista.append({
-            'accion_nombre': datos['accion_nombre'],
-            'total_ingresos': datos['total_ingresos'],
+            'accion_nombre': fila['nombre_item'],
+            'total_ingresos': total,
             'cantidad_trabajos': cantidad_trabajos,
-            'cantidad_veces': datos['cantidad_veces'],
-            'cantidad_total': datos['cantidad_total'],
-            'promedio_por_trabajo': (datos['total_ingresos'] / cantidad_trabajos) if cantidad_trabajos > 0 else Decimal('0')
+            'cantidad_veces': fila['veces'],
+            'cantidad_total': fila['unidades_total'],
+            'promedio_por_trabajo': (total / cantidad_trabajos) if cantidad_trabajos > 0 else Decimal('0')
         })
-    
     # Ordenar por total_ingresos descendente
     ingresos_por_accion_lista.sort(key=lambda x: x['total_ingresos'], reverse=True)
     
-    # ========================
-    # 10. CONCENTRACIÓN DE REPARACIONES POR COMPONENTE (NUEVO)
-    # ========================
-    # Obtener datos de componentes con trabajos
-    componentes_con_trabajos = list(acciones_completadas.values(
-        'componente__nombre',
-        'componente_id',
-        'trabajo_id',
-        'precio_mano_obra',
-        'cantidad'
-    ))
-    
-    # Agrupar por componente y calcular en Python
-    componentes_agrupados = {}
-    trabajos_por_componente = {}
-    
-    for comp in componentes_con_trabajos:
-        componente_id = comp['componente_id']
-        trabajo_id = comp['trabajo_id']
-        
-        if componente_id not in componentes_agrupados:
-            componentes_agrupados[componente_id] = {
-                'componente_nombre': comp['componente__nombre'],
-                'cantidad_acciones': 0,
-                'total_ingresos': Decimal('0')
-            }
-            trabajos_por_componente[componente_id] = set()
-        
-        subtotal = Decimal(str(comp['precio_mano_obra'])) * Decimal(str(comp['cantidad']))
-        componentes_agrupados[componente_id]['cantidad_acciones'] += 1
-        componentes_agrupados[componente_id]['total_ingresos'] += subtotal
-        trabajos_por_componente[componente_id].add(trabajo_id)
-    
-    # Calcular total de trabajos únicos en el período
-    total_trabajos_periodo = len(set(comp['trabajo_id'] for comp in componentes_con_trabajos))
-    
-    # Formatear para el template
     reparaciones_por_componente_lista = []
-    for componente_id, datos in componentes_agrupados.items():
-        cantidad_trabajos = len(trabajos_por_componente[componente_id])
+    for fila in por_dimension.get('componente', []):
+        cantidad_trabajos = fila['trabajos_total']
         porcentaje = (cantidad_trabajos / total_trabajos_periodo * 100) if total_trabajos_periodo > 0 else 0
         reparaciones_por_componente_lista.append({
-            'componente_nombre': datos['componente_nombre'],
+            'componente_nombre': fila['nombre_item'],
             'cantidad_trabajos': cantidad_trabajos,
-            'cantidad_acciones': datos['cantidad_acciones'],
-            'total_ingresos': datos['total_ingresos'],
+            'cantidad_acciones': fila['veces'],
+            'total_ingresos': fila['mano_obra'] or Decimal('0'),
             'porcentaje': round(porcentaje, 1),
-            'componente_id': componente_id
+            'componente_id': int(fila['clave'])
         })
-    
     # Ordenar por cantidad_trabajos descendente
     reparaciones_por_componente_lista.sort(key=lambda x: x['cantidad_trabajos'], reverse=True)
     
-    # ========================
-    # 11. REPUESTOS MÁS USADOS Y RECURRENTES (NUEVO)
-    # ========================
-    # Repuestos completados de trabajos en el período
-    repuestos_completados = TrabajoRepuesto.objects.filter(
-        completado=True,
-        trabajo__in=trabajos_periodo
-    ).select_related('repuesto', 'repuesto_externo', 'componente', 'trabajo')
-    
-    # Agrupar por repuesto (tanto internos como externos)
-    repuestos_usados = repuestos_completados.values(
-        'repuesto__nombre',
-        'repuesto__sku',
-        'repuesto_id',
-        'repuesto_externo__nombre',
-        'repuesto_externo_id'
-    ).annotate(
-        cantidad_veces=Count('id'),
-        cantidad_total=Sum('cantidad'),
-        total_ingresos=Sum('subtotal'),
-        cantidad_trabajos=Count('trabajo_id', distinct=True)
-    ).order_by('-cantidad_veces')
-    
     repuestos_usados_lista = []
-    for rep in repuestos_usados:
-        nombre = rep['repuesto__nombre'] if rep['repuesto__nombre'] else rep['repuesto_externo__nombre'] or 'Repuesto Externo'
-        sku = rep['repuesto__sku'] or 'N/A'
-        repuesto_id = rep['repuesto_id'] or rep['repuesto_externo_id']
-        
+    for fila in por_dimension.get('repuesto', []):
+        cantidad_trabajos = fila['trabajos_total']
+        total = fila['repuestos'] or Decimal('0')
         repuestos_usados_lista.append({
-            'nombre': nombre,
-            'sku': sku,
-            'cantidad_veces': rep['cantidad_veces'],
-            'cantidad_total': rep['cantidad_total'],
-            'total_ingresos': rep['total_ingresos'] or Decimal('0'),
-            'cantidad_trabajos': rep['cantidad_trabajos'],
-            'promedio_por_trabajo': (rep['total_ingresos'] / rep['cantidad_trabajos']) if rep['cantidad_trabajos'] > 0 else Decimal('0'),
-            'repuesto_id': repuesto_id
+            'nombre': fila['nombre_item'] or 'Repuesto Externo',
+            'sku': fila['detalle_item'] or 'N/A',
+            'cantidad_veces': fila['veces'],
+            'cantidad_total': fila['unidades_total'],
+            'total_ingresos': total,
+            'cantidad_trabajos': cantidad_trabajos,
+            'promedio_por_trabajo': (total / cantidad_trabajos) if cantidad_trabajos > 0 else Decimal('0'),
+            'repuesto_id': int(fila['clave'][1:])
         })
-    
     # Ordenar por recurrencia (cantidad_veces) y luego por ingresos
     repuestos_usados_lista.sort(key=lambda x: (x['cantidad_veces'], x['total_ingresos']), reverse=True)
     
@@ -9,7 +9,9 @@ import requests
 import json
 import logging
 from functools import wraps
+from . import herramientas_ia, payload_ia
 from .agent import Agent
+from .historial_chat import obtener_conversacion, guardar_conversacion
 from .models import Trabajo, Cliente_Taller, Vehiculo, Repuesto, Diagnostico, TrabajoAccion, TrabajoRepuesto, TrabajoAbono, Mecanico, BonoGenerado, PagoMecanico, ConfiguracionBonoMecanico, Componente, Accion, ComponenteAccion, Compra, CompraItem, VehiculoVersion, RepuestoAplicacion, RepuestoEnStock
 
 # Configurar logging
@@ -434,7 +436,7 @@ def listado_mecanicos_data(activo=None, limite=50):
         from django.db import connection
         # Verificar conexión a la base de datos
         connection.ensure_connection()
-        mecanicos = Mecanico.objects.all()
+        mecanicos = Mecanico.objects.with_saldos_bonos()
         
         # Aplicar filtro por estado activo
         if activo is not None:
@@ -1141,7 +1143,7 @@ def listado_inventario_data(limite=200, filtro=None, stock_minimo=None):
     Lista el inventario de repuestos con información de stock
     
     Args:
-        limite: Número máximo de repuestos a listar (default: 200 para cubrir todos los registros)
+        limite: Número máximo de repuestos a listar (default: 200)
         filtro: Filtro de búsqueda por nombre, SKU, código o marca
         stock_minimo: Filtrar solo repuestos con stock menor o igual a este valor
     
@@ -1154,28 +1156,26 @@ def listado_inventario_data(limite=200, filtro=None, stock_minimo=None):
         repuestos = Repuesto.objects.all()
         
         if filtro:
-            # Búsqueda más amplia: nombre, SKU, código de barras, marca, referencia, descripción
-            repuestos = repuestos.filter(
-                Q(nombre__icontains=filtro) | 
-                Q(sku__icontains=filtro) | 
-                Q(codigo_barra__icontains=filtro) |
-                Q(marca__icontains=filtro) |
-                Q(referencia__icontains=filtro) |
-                Q(descripcion__icontains=filtro)
-            )
-        
-        # Obtener el total REAL de registros ANTES de aplicar límite
-        total_real_registros = repuestos.count()
-        
-        # Asegurar que el límite cubra TODOS los registros si no hay filtro
-        if not filtro:
-            # Usar el total real + margen para asegurar que se procesen todos
-            limite = max(limite, total_real_registros + 100)  # +100 para margen de seguridad
-        elif limite < 200:
-            limite = 200
-        
-        # Ordenar correctamente: primero por nombre, luego por id como desempate
-        repuestos_ordenados = repuestos.order_by('nombre', 'id')[:limite]
+            # Búsqueda con el índice compartido de repuestos: solo los `limite` más relevantes
+            # (lista IN acotada) y en el orden del ranking; el total se cuenta en el índice
+            from django.db.models import Case, When
+            from .busqueda_repuestos import buscar_repuesto_ids, contar_repuestos
+            ids = buscar_repuesto_ids(filtro, limite=limite)
+            total_real_registros = len(ids) if len(ids) < limite else contar_repuestos(filtro)
+            repuestos_ordenados = repuestos.filter(id__in=ids)
+            if ids:
+                repuestos_ordenados = repuestos_ordenados.order_by(
+                    Case(*[When(pk=pk, then=posicion) for posicion, pk in enumerate(ids)])
+                )
+        else:
+            # Obtener el total REAL de registros ANTES de aplicar límite
+            total_real_registros = repuestos.count()
+            
+            # El límite se respeta: total_real_registros le dice a la IA cuántos hay en total,
+            # y lo que no cabe en el prompt se pagina (payload_ia)
+            
+            # Ordenar correctamente: primero por nombre, luego por id como desempate
+            repuestos_ordenados = repuestos.order_by('nombre', 'id')[:limite]
         
         # Forzar evaluación del queryset ANTES de convertirlo a lista
         # Usar iterator() para procesar en lotes y evitar problemas de memoria
@@ -1187,9 +1187,11 @@ def listado_inventario_data(limite=200, filtro=None, stock_minimo=None):
         errores_procesamiento = 0
         procesados = 0
         
-        # Optimizar: Pre-cargar todos los stocks de una vez usando prefetch_related
+        # Stocks de los repuestos listados en una sola consulta agrupada
         from django.db.models import Sum, Q as Q_stock
-        repuestos_con_stock = RepuestoEnStock.objects.values('repuesto').annotate(
+        repuestos_con_stock = RepuestoEnStock.objects.filter(
+            repuesto__in=[r.id for r in repuestos_lista]
+        ).values('repuesto').annotate(
             stock_total=Sum('stock'),
             stock_reservado=Sum('reservado')
         )
@@ -1268,7 +1270,7 @@ def listado_inventario_data(limite=200, filtro=None, stock_minimo=None):
         logger.info(f"listado_inventario_data: procesados={procesados}, agregados={len(lista_inventario)}, errores={errores_procesamiento}, stock_minimo={stock_minimo}")
         
         # Si no se agregaron todos los registros esperados y no hay filtro, hay un problema
-        if len(lista_inventario) < total_real_registros and not filtro and stock_minimo is None:
+        if len(lista_inventario) < min(total_real_registros, limite) and not filtro and stock_minimo is None:
             logger.warning(f"ADVERTENCIA: Se procesaron {procesados} repuestos pero solo se agregaron {len(lista_inventario)}. Esperados: {total_real_registros}")
         
         return {
@@ -1441,6 +1443,271 @@ def test2_function_call_data():
         }
 
 
+# ========================
+# NETGOGO: HERRAMIENTAS Y MENSAJES
+# ========================
+# Compartido por netgogo_chat / netgogo2_chat y sus versiones en streaming (views_ia_stream.py)
+
+# Herramientas que atiende cada consola y el límite por defecto de sus listados
+# (netgogo2 pide menos filas porque solo sugiere datos para el formulario)
+HERRAMIENTAS_CONSOLA = {
+    'netgogo': {
+        'listado_trabajos': 20,
+        'listado_mecanicos': 50,
+        'query_sistema': None,
+        'list_files_in_dir': None,
+        'read_file': None,
+        'edit_file': None,
+        'test_function_call': None,
+        'test2': None,
+        'netgogo': None,
+        'listado_clientes': 50,
+        'listado_vehiculos': 50,
+        'listado_componentes': 100,
+        'listado_acciones': 100,
+        'listado_diagnosticos': 50,
+        'listado_compatibilidad': 50,
+        'listado_compras': 50,
+        'listado_inventario': 200,
+        'buscar_diagnosticos_similares': 10,
+        'siguiente_pagina': None,
+    },
+    'netgogo2': {
+        'listado_clientes': 10,
+        'listado_vehiculos': 10,
+        'listado_diagnosticos': 10,
+        'listado_componentes': 20,
+        'sugerir_componentes_por_descripcion': 20,
+        'buscar_diagnosticos_similares': 5,
+        'query_sistema': None,
+        'list_files_in_dir': None,
+        'read_file': None,
+        'edit_file': None,
+    },
+}
+
+# Instrucción que acompaña al resultado de la herramienta en la segunda llamada
+INSTRUCCION_CONTINUACION = {
+    'netgogo': (
+        "Procesa el resultado de la función '{fn_name}' que acabas de ejecutar. "
+        "Responde al usuario de forma clara y amigable, extrayendo la información relevante del resultado. "
+        "NO muestres el JSON crudo, sino presenta los datos de manera legible. "
+        "Si el usuario pidió información específica, extrae solo esos campos. "
+        "Las listas vienen como tablas {columnas, filas} con un 'resumen' de todas las filas; "
+        "si una tabla trae 'cursor' hay 'filas_restantes' sin mostrar: avísale al usuario que puede pedir más."
+    ),
+    'netgogo2': (
+        "Procesa el resultado de la función '{fn_name}' que acabas de ejecutar. "
+        "Responde al usuario de forma clara y amigable, extrayendo la información relevante del resultado. "
+        "NO muestres el JSON crudo, sino presenta los datos de manera legible. "
+        "Si encontraste clientes, vehículos o diagnósticos similares, sugiérelos al usuario. "
+        "También indica qué sección del formulario debe mostrarse y qué campos faltan."
+    ),
+}
+
+
+def ejecutar_herramienta(fn_name, args, agent, consola='netgogo'):
+    """
+    Ejecuta la function call pedida por la IA y devuelve siempre un dict
+    (los errores también: se le devuelven a la IA como resultado).
+    """
+    herramientas = HERRAMIENTAS_CONSOLA[consola]
+    limite = args.get('limite', herramientas.get(fn_name))
+    if isinstance(limite, int):
+        # Techo de filas por listado: lo que no cabe en el prompt se pagina (payload_ia)
+        limite = min(limite, getattr(settings, 'PAYLOAD_IA_MAX_FILAS', 500))
+    try:
+        if fn_name not in herramientas:
+            result = {"error": f"Función desconocida: {fn_name}", "success": False}
+        elif fn_name == 'listado_trabajos':
+            result = listado_trabajos_data(estado=args.get('estado', 'todos'), limite=limite)
+        elif fn_name == 'listado_mecanicos':
+            result = listado_mecanicos_data(activo=args.get('activo'), limite=limite)
+        elif fn_name == 'query_sistema':
+            result = query_sistema_data(
+                tipo=args.get('tipo'),
+                filtro=args.get('filtro'),
+                detalle=args.get('detalle', False)
+            )
+        elif fn_name == 'list_files_in_dir':
+            result = agent.list_files_in_dir(**args)
+        elif fn_name == 'read_file':
+            result = agent.read_file(**args)
+        elif fn_name == 'edit_file':
+            result = agent.edit_file(**args)
+        elif fn_name == 'test_function_call':
+            result = test_function_call_data()
+        elif fn_name == 'test2':
+            result = test2_function_call_data()
+        elif fn_name == 'netgogo':
+            result = agent.activate_netgogo_mode()
+        elif fn_name == 'listado_clientes':
+            result = listado_clientes_data(activo=args.get('activo'), limite=limite, filtro=args.get('filtro'))
+        elif fn_name == 'listado_vehiculos':
+            result = listado_vehiculos_data(limite=limite, filtro=args.get('filtro'))
+        elif fn_name == 'listado_componentes':
+            result = listado_componentes_data(activo=args.get('activo'), limite=limite, filtro=args.get('filtro'))
+        elif fn_name == 'sugerir_componentes_por_descripcion':
+            result = sugerir_componentes_por_descripcion(descripcion=args.get('descripcion', ''), limite=limite)
+        elif fn_name == 'buscar_diagnosticos_similares':
+            result = buscar_diagnosticos_similares(descripcion=args.get('descripcion', ''), limite=limite)
+        elif fn_name == 'listado_acciones':
+            result = listado_acciones_data(limite=limite, filtro=args.get('filtro'))
+        elif fn_name == 'listado_diagnosticos':
+            result = listado_diagnosticos_data(estado=args.get('estado'), limite=limite, filtro=args.get('filtro'))
+        elif fn_name == 'listado_compatibilidad':
+            result = listado_compatibilidad_data(
+                repuesto_id=args.get('repuesto_id'),
+                vehiculo_id=args.get('vehiculo_id'),
+                limite=limite
+            )
+        elif fn_name == 'listado_compras':
+            result = listado_compras_data(estado=args.get('estado'), limite=limite, filtro=args.get('filtro'))
+        elif fn_name == 'listado_inventario':
+            result = listado_inventario_data(
+                limite=limite,
+                filtro=args.get('filtro'),
+                stock_minimo=args.get('stock_minimo')
+            )
+        elif fn_name == 'siguiente_pagina':
+            result = payload_ia.pagina(args.get('cursor'))
+
+        # Asegurar que result siempre sea un dict
+        if not isinstance(result, dict):
+            result = {"result": result, "success": True}
+
+    except Exception as func_error:
+        error_msg = str(func_error)
+        error_type = type(func_error).__name__
+        logger.error(f"Error ejecutando función {fn_name}: {error_type}: {error_msg}", exc_info=True)
+        result = {
+            "error": f"Error ejecutando {fn_name}: {error_msg}",
+            "error_type": error_type,
+            "success": False
+        }
+    return result
+
+
+def _resultados_herramientas(outputs, agent, consola):
+    """
+    Ejecuta de una vez todas las function calls de la respuesta (en paralelo y con
+    caché, ver herramientas_ia) y devuelve un iterador con sus resultados en orden.
+    """
+    llamadas = [
+        (output.get('name'), argumentos_function_call(output))
+        for output in outputs
+        if isinstance(output, dict) and output.get('type') == 'function_call'
+    ]
+    return iter(herramientas_ia.ejecutar_llamadas(llamadas, agent, consola))
+
+
+def argumentos_function_call(output):
+    """Argumentos de un item function_call de la respuesta (dict vacío si no son JSON válido)."""
+    args_str = output.get('arguments', '{}')
+    try:
+        args = json.loads(args_str) if isinstance(args_str, str) else args_str
+    except (TypeError, ValueError):
+        args = {}
+    return args if isinstance(args, dict) else {}
+
+
+def mensajes_para_api(mensajes, user_input):
+    """
+    Historial del agente en el formato que acepta la API: {role, content} y los
+    function_call_output como mensajes 'function'. Sin mensajes válidos queda solo
+    el último mensaje del usuario.
+    """
+    messages_for_api = []
+    for msg in mensajes:
+        if not isinstance(msg, dict):
+            continue
+        if 'role' in msg and 'content' in msg:
+            content = msg['content']
+            messages_for_api.append({
+                "role": msg['role'],
+                "content": content if isinstance(content, str) else str(content)
+            })
+        elif msg.get('type') == 'function_call_output':
+            output_content = msg.get('output', '')
+            if isinstance(output_content, str):
+                try:
+                    output_content = json.loads(output_content)
+                except ValueError:
+                    pass
+            messages_for_api.append({
+                "role": "function",
+                "name": "function_output",
+                "content": output_content if isinstance(output_content, str) else json.dumps(output_content)
+            })
+    return messages_for_api or [{"role": "user", "content": user_input}]
+
+
+def mensajes_continuacion(mensajes, fn_name, consola='netgogo'):
+    """Mensajes de la segunda llamada: historial con el resultado más la instrucción de procesarlo."""
+    continuation_messages = []
+    for msg in mensajes:
+        if not isinstance(msg, dict):
+            continue
+        if 'role' in msg and 'content' in msg:
+            continuation_messages.append({"role": msg['role'], "content": str(msg['content'])})
+        elif msg.get('type') == 'function_call_output':
+            output_content = msg.get('output', '')
+            continuation_messages.append({
+                "role": "function",
+                "name": "function_output",
+                "content": output_content if isinstance(output_content, str) else json.dumps(output_content)
+            })
+    continuation_messages.append({
+        "role": "user",
+        "content": INSTRUCCION_CONTINUACION[consola].format(fn_name=fn_name)
+    })
+    return continuation_messages
+
+
+def texto_de_mensaje(output):
+    """Texto de un item 'message' de la respuesta (None si no trae texto)."""
+    content = output.get('content', [])
+    if isinstance(content, str):
+        return content
+    message_parts = []
+    for part in content if isinstance(content, list) else []:
+        if isinstance(part, dict) and part.get('type') == 'output_text':
+            if part.get('text'):
+                message_parts.append(part['text'])
+        elif isinstance(part, str):
+            message_parts.append(part)
+    return '\n'.join(message_parts) if message_parts else None
+
+
+def texto_de_respuesta(response_data):
+    """Texto del primer item 'message' de una respuesta de la API."""
+    for output in (response_data or {}).get('output', []):
+        if isinstance(output, dict) and output.get('type') == 'message':
+            return texto_de_mensaje(output)
+    return None
+
+
+def mensaje_por_defecto(result, consola='netgogo'):
+    """Mensaje cuando la continuación no devolvió texto, armado desde el resultado."""
+    if not isinstance(result, dict) or 'error' in result:
+        return "Datos obtenidos correctamente." if consola == 'netgogo' else "Información obtenida correctamente."
+    total = result.get('total_encontrados', 0)
+    if consola == 'netgogo':
+        for clave, nombre in (('compras', 'compras'), ('clientes', 'clientes'), ('vehiculos', 'vehículos'),
+                              ('trabajos', 'trabajos'), ('mecanicos', 'mecánicos')):
+            if clave in result:
+                return f"Se encontraron {total} {nombre}."
+        return "Datos obtenidos correctamente."
+    if 'clientes' in result:
+        return f"Encontré {total} cliente(s) que coinciden con tu búsqueda."
+    if 'vehiculos' in result:
+        return f"Encontré {total} vehículo(s) que coinciden con tu búsqueda."
+    if 'diagnosticos' in result:
+        return f"Encontré {total} diagnóstico(s) similar(es) que pueden ayudarte."
+    return "Información obtenida correctamente."
+
+
+
 @login_required
 def netgogo_console(request):
     """Vista para renderizar la consola de IA Netgogo - Solo accesible para maxgonpe temporalmente"""
@@ -1492,15 +1759,11 @@ def netgogo_chat(request):
                 "reset": True
             })
         
-        # Obtener o crear agente en la sesión
-        if reset_session or 'netgogo_agent' not in request.session:
-            agent = Agent()
-            request.session['netgogo_agent'] = {
-                'messages': agent.messages.copy()
-            }
-        else:
-            agent = Agent()
-            agent.messages = request.session['netgogo_agent']['messages'].copy()
+        # Obtener o crear el historial del agente (guardado fuera de la sesión)
+        agent = Agent()
+        conversacion = None if reset_session else obtener_conversacion(request.user, 'netgogo')
+        if conversacion and conversacion.mensajes:
+            agent.messages = list(conversacion.mensajes)
         
         # Agregar mensaje del usuario al historial
         agent.messages.append({"role": "user", "content": user_input})
@@ -1508,74 +1771,8 @@ def netgogo_chat(request):
         # Importar función de conexión a la API desde views_api
         from .views_api import call_openai_api
         
-        # Preparar mensajes para la API
-        # La API espera mensajes en formato estándar: {role, content}
-        # Limpiar y filtrar mensajes para formato compatible
-        messages_for_api = []
-        for msg in agent.messages:
-            if isinstance(msg, dict):
-                # Solo incluir mensajes con role y content (formato estándar)
-                if 'role' in msg and 'content' in msg:
-                    # Asegurar que content sea string
-                    content = msg['content']
-                    if not isinstance(content, str):
-                        content = str(content)
-                    
-                    # Crear mensaje limpio solo con role y content
-                    clean_msg = {
-                        "role": msg['role'],
-                        "content": content
-                    }
-                    messages_for_api.append(clean_msg)
-                
-                # Convertir function_call_output a formato de mensaje function
-                elif msg.get('type') == 'function_call_output':
-                    # Convertir output de función a formato compatible
-                    output_content = msg.get('output', '')
-                    if isinstance(output_content, str):
-                        try:
-                            # Intentar parsear JSON si es string JSON
-                            output_content = json.loads(output_content)
-                        except:
-                            pass
-                    
-                    # Formato para mensaje de función
-                    function_msg = {
-                        "role": "function",
-                        "name": "function_output",
-                        "content": json.dumps(output_content) if not isinstance(output_content, str) else output_content
-                    }
-                    messages_for_api.append(function_msg)
-        
-        # Si no hay mensajes válidos, usar solo el último mensaje del usuario
-        if not messages_for_api:
-            messages_for_api = [{"role": "user", "content": user_input}]
-        
-        # Validar que todos los mensajes tengan el formato correcto
-        validated_messages = []
-        for msg in messages_for_api:
-            if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                # Asegurar que content sea string
-                if not isinstance(msg['content'], str):
-                    msg['content'] = str(msg['content'])
-                validated_messages.append({
-                    "role": msg['role'],
-                    "content": msg['content']
-                })
-            elif isinstance(msg, dict) and msg.get('role') == 'function':
-                # Mensaje de función con name
-                validated_messages.append({
-                    "role": "function",
-                    "name": msg.get('name', 'function_output'),
-                    "content": str(msg.get('content', ''))
-                })
-        
-        messages_for_api = validated_messages if validated_messages else [{"role": "user", "content": user_input}]
-        
-        # Construir el historial completo para mantener contexto
-        # Intentar primero con lista de mensajes (formato estándar de chat)
-        # Si la API no lo acepta, construiremos un string con el contexto
-        input_for_api = messages_for_api  # Intentar con lista completa primero
+        # Preparar mensajes para la API (historial completo para mantener contexto)
+        input_for_api = mensajes_para_api(agent.messages, user_input)
         
         # Llamar a la API usando la función de conexión
         # ACTIVAR herramientas para que la IA pueda usar function_calls
@@ -1596,6 +1793,7 @@ def netgogo_chat(request):
         # La respuesta viene en formato: {"output": [{"type": "message" o "function_call", ...}]}
         if 'output' in response_data:
             outputs = response_data.get('output', [])
+            resultados = _resultados_herramientas(outputs, agent, 'netgogo')
             for output in outputs:
                 if isinstance(output, dict):
                     output_type = output.get('type')
@@ -1603,12 +1801,7 @@ def netgogo_chat(request):
                     # Si es function_call, ejecutarla
                     if output_type == 'function_call':
                         fn_name = output.get('name')
-                        args_str = output.get('arguments', '{}')
-                        
-                        try:
-                            args = json.loads(args_str) if isinstance(args_str, str) else args_str
-                        except:
-                            args = {}
+                        args = argumentos_function_call(output)
                         
                         called_tool = True
                         tool_info = {
@@ -1617,88 +1810,8 @@ def netgogo_chat(request):
                             'call_id': output.get('call_id', '')
                         }
                         
-                        # Ejecutar la función correspondiente
-                        try:
-                            if fn_name == 'listado_trabajos':
-                                estado = args.get('estado', 'todos')
-                                limite = args.get('limite', 20)
-                                result = listado_trabajos_data(estado=estado, limite=limite)
-                            elif fn_name == 'listado_mecanicos':
-                                activo = args.get('activo')
-                                limite = args.get('limite', 50)
-                                result = listado_mecanicos_data(activo=activo, limite=limite)
-                            elif fn_name == 'query_sistema':
-                                result = query_sistema_data(
-                                    tipo=args.get('tipo'),
-                                    filtro=args.get('filtro'),
-                                    detalle=args.get('detalle', False)
-                                )
-                            elif fn_name == 'list_files_in_dir':
-                                result = agent.list_files_in_dir(**args)
-                            elif fn_name == 'read_file':
-                                result = agent.read_file(**args)
-                            elif fn_name == 'edit_file':
-                                result = agent.edit_file(**args)
-                            elif fn_name == 'test_function_call':
-                                result = test_function_call_data()
-                            elif fn_name == 'test2':
-                                result = test2_function_call_data()
-                            elif fn_name == 'netgogo':
-                                result = agent.activate_netgogo_mode()
-                            elif fn_name == 'listado_clientes':
-                                activo = args.get('activo')
-                                limite = args.get('limite', 50)
-                                filtro = args.get('filtro')
-                                result = listado_clientes_data(activo=activo, limite=limite, filtro=filtro)
-                            elif fn_name == 'listado_vehiculos':
-                                limite = args.get('limite', 50)
-                                filtro = args.get('filtro')
-                                result = listado_vehiculos_data(limite=limite, filtro=filtro)
-                            elif fn_name == 'listado_componentes':
-                                activo = args.get('activo')
-                                limite = args.get('limite', 100)
-                                filtro = args.get('filtro')
-                                result = listado_componentes_data(activo=activo, limite=limite, filtro=filtro)
-                            elif fn_name == 'listado_acciones':
-                                limite = args.get('limite', 100)
-                                filtro = args.get('filtro')
-                                result = listado_acciones_data(limite=limite, filtro=filtro)
-                            elif fn_name == 'listado_diagnosticos':
-                                estado = args.get('estado')
-                                limite = args.get('limite', 50)
-                                filtro = args.get('filtro')
-                                result = listado_diagnosticos_data(estado=estado, limite=limite, filtro=filtro)
-                            elif fn_name == 'listado_compatibilidad':
-                                repuesto_id = args.get('repuesto_id')
-                                vehiculo_id = args.get('vehiculo_id')
-                                limite = args.get('limite', 50)
-                                result = listado_compatibilidad_data(repuesto_id=repuesto_id, vehiculo_id=vehiculo_id, limite=limite)
-                            elif fn_name == 'listado_compras':
-                                estado = args.get('estado')
-                                limite = args.get('limite', 50)
-                                filtro = args.get('filtro')
-                                result = listado_compras_data(estado=estado, limite=limite, filtro=filtro)
-                            elif fn_name == 'listado_inventario':
-                                limite = args.get('limite', 200)
-                                filtro = args.get('filtro')
-                                stock_minimo = args.get('stock_minimo')
-                                result = listado_inventario_data(limite=limite, filtro=filtro, stock_minimo=stock_minimo)
-                            else:
-                                result = {"error": f"Función desconocida: {fn_name}", "success": False}
-                            
-                            # Asegurar que result siempre sea un dict
-                            if not isinstance(result, dict):
-                                result = {"result": result, "success": True}
-                                
-                        except Exception as func_error:
-                            error_msg = str(func_error)
-                            error_type = type(func_error).__name__
-                            logger.error(f"Error ejecutando función {fn_name}: {error_type}: {error_msg}", exc_info=True)
-                            result = {
-                                "error": f"Error ejecutando {fn_name}: {error_msg}",
-                                "error_type": error_type,
-                                "success": False
-                            }
+                        # Resultado de la función (ya ejecutada junto a las demás)
+                        result = next(resultados)
                         
                         tool_info['result'] = result
                         
@@ -1706,87 +1819,23 @@ def netgogo_chat(request):
                         agent.messages.append({
                             "type": "function_call_output",
                             "call_id": output.get('call_id', ''),
-                            "output": json.dumps({
-                                "result": result
-                            })
+                            "output": payload_ia.salida_para_modelo(result)
                         })
                         
                         # Continuar conversación para obtener respuesta final
                         try:
-                            continuation_messages = []
-                            for msg in agent.messages:
-                                if isinstance(msg, dict):
-                                    if 'role' in msg and 'content' in msg:
-                                        continuation_messages.append({
-                                            "role": msg['role'],
-                                            "content": str(msg['content'])
-                                        })
-                                    elif msg.get('type') == 'function_call_output':
-                                        output_content = msg.get('output', '')
-                                        continuation_messages.append({
-                                            "role": "function",
-                                            "name": "function_output",
-                                            "content": output_content if isinstance(output_content, str) else json.dumps(output_content)
-                                        })
-                            
-                            # Agregar mensaje explícito pidiendo que procese el resultado
-                            continuation_messages.append({
-                                "role": "user",
-                                "content": (
-                                    f"Procesa el resultado de la función '{fn_name}' que acabas de ejecutar. "
-                                    f"Responde al usuario de forma clara y amigable, extrayendo la información relevante del resultado. "
-                                    f"NO muestres el JSON crudo, sino presenta los datos de manera legible. "
-                                    f"Si el usuario pidió información específica, extrae solo esos campos."
-                                )
-                            })
-                            
                             continuation_response = call_openai_api(
-                                input_data=continuation_messages,
+                                input_data=mensajes_continuacion(agent.messages, fn_name, 'netgogo'),
                                 model="gpt-5-nano",
                                 tools=None,  # No necesitamos herramientas en la continuación
                                 store=True,
                                 timeout=60
                             )
-                            
-                            # Procesar respuesta de continuación
-                            if 'output' in continuation_response:
-                                cont_outputs = continuation_response.get('output', [])
-                                for cont_output in cont_outputs:
-                                    if isinstance(cont_output, dict) and cont_output.get('type') == 'message':
-                                        content = cont_output.get('content', [])
-                                        if isinstance(content, list):
-                                            message_parts = []
-                                            for part in content:
-                                                if isinstance(part, dict) and part.get('type') == 'output_text':
-                                                    text = part.get('text', '')
-                                                    if text:
-                                                        message_parts.append(text)
-                                            final_message = '\n'.join(message_parts) if message_parts else None
-                                        elif isinstance(content, str):
-                                            final_message = content
-                                        break
+                            final_message = texto_de_respuesta(continuation_response)
                             
                             # Si no se obtuvo mensaje de la continuación, crear uno básico desde el resultado
                             if not final_message:
-                                # Intentar extraer información básica del resultado para crear un mensaje
-                                if isinstance(result, dict) and 'error' not in result:
-                                    try:
-                                        if 'compras' in result:
-                                            final_message = f"Se encontraron {result.get('total_encontrados', 0)} compras."
-                                        elif 'clientes' in result:
-                                            final_message = f"Se encontraron {result.get('total_encontrados', 0)} clientes."
-                                        elif 'vehiculos' in result:
-                                            final_message = f"Se encontraron {result.get('total_encontrados', 0)} vehículos."
-                                        elif 'trabajos' in result:
-                                            final_message = f"Se encontraron {result.get('total_encontrados', 0)} trabajos."
-                                        elif 'mecanicos' in result:
-                                            final_message = f"Se encontraron {result.get('total_encontrados', 0)} mecánicos."
-                                        else:
-                                            final_message = "Datos obtenidos correctamente."
-                                    except:
-                                        final_message = "Datos obtenidos correctamente."
-                                else:
-                                    final_message = "Datos obtenidos correctamente."
+                                final_message = mensaje_por_defecto(result, 'netgogo')
                             
                             # Agregar respuesta al historial
                             if final_message:
@@ -1807,19 +1856,7 @@ def netgogo_chat(request):
                     
                     # Si es message, extraer el texto
                     elif output_type == 'message':
-                        content = output.get('content', [])
-                        if isinstance(content, list):
-                            message_parts = []
-                            for part in content:
-                                if isinstance(part, dict) and part.get('type') == 'output_text':
-                                    text = part.get('text', '')
-                                    if text:
-                                        message_parts.append(text)
-                                elif isinstance(part, str):
-                                    message_parts.append(part)
-                            final_message = '\n'.join(message_parts) if message_parts else None
-                        elif isinstance(content, str):
-                            final_message = content
+                        final_message = texto_de_mensaje(output)
             
             # Si no se encontró mensaje, intentar usar el campo 'text' de la respuesta
             if not final_message and 'text' in response_data:
@@ -1841,11 +1878,8 @@ def netgogo_chat(request):
             # Intentar extraer mensaje de la estructura
             final_message = str(response_data) if response_data else "No se recibió respuesta"
         
-        # Guardar estado del agente en sesión (SIEMPRE actualizar con el historial completo)
-        request.session['netgogo_agent'] = {
-            'messages': agent.messages.copy()
-        }
-        request.session.modified = True
+        # Guardar el historial completo del agente
+        guardar_conversacion(request.user, 'netgogo', mensajes=agent.messages)
         
         # Preparar respuesta
         result = {
@@ -1933,6 +1967,110 @@ def netgogo_chat(request):
         return JsonResponse(error_response, status=500)
 
 
+def estado_netgogo2(usuario):
+    """Estado guardado de Netgogo2 (mensaje del sistema y último análisis); lo crea si no existe."""
+    conversacion = obtener_conversacion(usuario, 'netgogo2')
+    estado_agente = conversacion.estado if conversacion and conversacion.estado.get('system_message') else None
+    if estado_agente is None:
+        # Crear mensaje del sistema específico para diagnóstico
+        system_message = {
+            "role": "system",
+            "content": (
+                "Eres un asistente experto en diagnóstico automotriz que ayuda a ingresar diagnósticos en un taller mecánico. "
+                "Tu tarea es guiar al usuario paso a paso para completar un formulario de diagnóstico. "
+                "\n\n"
+                "IMPORTANTE: Cuando tengas información parcial (como RUT, placa, o descripción del problema), "
+                "DEBES usar las function calls disponibles para buscar información en el sistema:\n"
+                "- Si el usuario ingresa un RUT o nombre de cliente, usa 'listado_clientes' con filtro para buscarlo\n"
+                "- Si el usuario ingresa una placa, usa 'listado_vehiculos' con filtro para buscarlo\n"
+                "- Si el usuario describe un problema, usa 'buscar_diagnosticos_similares' con la descripción para encontrar diagnósticos parecidos (con sus componentes y acciones)\n"
+                "- Si necesitas sugerir componentes, usa 'listado_componentes' para listar componentes relevantes\n"
+                "- Usa 'query_sistema' para consultas generales sobre el estado del taller\n"
+                "\n"
+                "Cuando ejecutes una función y recibas su resultado, SIEMPRE debes procesar ese resultado y responder "
+                "al usuario de forma clara y amigable, extrayendo la información relevante. "
+                "NO muestres el JSON crudo, sino presenta los datos de manera legible y útil.\n"
+                "\n"
+                "Responde en español de forma amigable y profesional. "
+                "Sé conciso pero completo en tus respuestas."
+            )
+        }
+        estado_agente = {
+            'system_message': system_message,
+            'last_analysis': None,
+            'last_section': None
+        }
+        guardar_conversacion(usuario, 'netgogo2', estado=estado_agente)
+    return estado_agente
+
+
+def contexto_netgogo2(action, form_data, current_section):
+    """Prompt de Netgogo2 para el estado actual del formulario (sin historial)."""
+    if action == "analyze":
+        cliente_data = form_data.get('cliente', {})
+        vehiculo_data = form_data.get('vehiculo', {})
+        diagnostico_data = form_data.get('diagnostico', {})
+        
+        # Construir contexto para la IA según la sección
+        if current_section == "componentes":
+            descripcion = diagnostico_data.get('descripcion', '') or diagnostico_data.get('descripcion_problema', '')
+            if descripcion:
+                # En la sección de componentes, buscar componentes relevantes basados en acciones mencionadas
+                contexto = f"""Estás en la sección de selección de componentes afectados.
+
+Descripción del problema: {descripcion[:300]}
+
+Tu tarea CRÍTICA:
+1. DEBES usar 'sugerir_componentes_por_descripcion' con la descripción completa del problema
+2. Esta función analiza la descripción para identificar acciones mencionadas (como "cambio", "reparación", "falla", "ruido", etc.)
+3. Busca componentes que tienen esas acciones asociadas con tarifas en el sistema (ComponenteAccion)
+4. Si no encuentra componentes por acciones, busca por palabras clave en nombres de componentes
+5. Sugiere al usuario los componentes más relevantes basados en el problema descrito
+6. Proporciona un mensaje claro explicando qué componentes podrían estar afectados y por qué
+
+IMPORTANTE: Usa 'sugerir_componentes_por_descripcion' en lugar de 'listado_componentes' porque es más inteligente y busca basándose en acciones y componentes asociados que tienen tarifas.
+
+Ejemplos:
+- Si la descripción dice "cambio de bujías" → buscará componentes asociados a la acción "cambio" y que contengan "bujías"
+- Si dice "falla de frenos" → buscará componentes asociados a "falla" y que contengan "frenos"
+- Si dice "ruido en el motor" → buscará componentes asociados a acciones relacionadas con "ruido" y que contengan "motor"
+
+Responde de forma natural y amigable, sugiriendo componentes específicos con sus acciones disponibles."""
+            else:
+                contexto = f"""Estás en la sección de selección de componentes afectados.
+
+No hay descripción del problema disponible aún. Guía al usuario para que seleccione los componentes que requieren atención.
+
+Si el usuario necesita ayuda, puedes usar 'listado_componentes' para mostrar todos los componentes disponibles."""
+        else:
+            # Construir contexto para otras secciones
+            contexto = f"""Analiza el estado actual del formulario de ingreso de diagnóstico.
+
+Sección actual: {current_section}
+
+Datos del formulario:
+- Cliente: RUT={cliente_data.get('rut', 'N/A')}, Nombre={cliente_data.get('nombre', 'N/A')}, Existente={cliente_data.get('existente', False)}
+- Vehículo: Placa={vehiculo_data.get('placa', 'N/A')}, Marca={vehiculo_data.get('marca', 'N/A')}, Modelo={vehiculo_data.get('modelo', 'N/A')}, ID={vehiculo_data.get('id', 'N/A')}
+- Diagnóstico: Descripción={diagnostico_data.get('descripcion', 'N/A')[:100] if diagnostico_data.get('descripcion') else 'N/A'}
+
+Tu tarea:
+1. Si hay información parcial (RUT, placa, descripción), usa las function calls para buscar información en el sistema
+2. Determina qué sección debe mostrarse al usuario
+3. Identifica qué campos faltan o necesitan atención
+4. Proporciona un mensaje claro y amigable guiando al usuario
+5. Si encontraste información relevante (clientes, vehículos, diagnósticos similares), inclúyela en tu respuesta
+
+IMPORTANTE: Si el usuario ingresó un RUT o nombre de cliente pero no está completo, usa 'listado_clientes' con filtro para buscarlo.
+Si ingresó una placa, usa 'listado_vehiculos' con filtro para buscarla.
+Si describió un problema, usa 'buscar_diagnosticos_similares' con la descripción para encontrar diagnósticos parecidos que puedan ayudar.
+
+Responde de forma natural y amigable, no en formato JSON estructurado."""
+    else:
+        prompt = f"Acción: {action}. Datos: {json.dumps(form_data, ensure_ascii=False)}"
+        contexto = prompt
+    return contexto
+
+
 @login_required
 def netgogo2_console(request):
     """Vista para Netgogo2 - Interfaz guiada por IA para ingreso de diagnóstico - Solo accesible para maxgonpe"""
@@ -1944,12 +2082,13 @@ def netgogo2_console(request):
         return redirect('panel_principal')
     
     # Obtener datos necesarios para el formulario
-    from .models import Cliente_Taller, Componente, AdministracionTaller
+    from .models import Cliente_Taller, AdministracionTaller
     from .forms import ClienteTallerForm, VehiculoForm, DiagnosticoForm
+    from . import arbol_componentes
     
     config = AdministracionTaller.get_configuracion_activa()
     clientes_existentes = Cliente_Taller.objects.filter(activo=True).order_by('nombre')
-    componentes = Componente.objects.filter(padre__isnull=True, activo=True).order_by('nombre')
+    componentes = arbol_componentes.arbol()
     
     cliente_form = ClienteTallerForm(prefix='cliente')
     vehiculo_form = VehiculoForm(prefix='vehiculo')
@@ -1994,107 +2133,14 @@ def netgogo2_chat(request):
         form_data = data.get("form_data", {})
         current_section = data.get("current_section", "cliente")
         
-        # Obtener o crear agente en la sesión
-        # IMPORTANTE: Para Netgogo2, NO acumulamos historial para evitar loops y rate limits
-        # Solo mantenemos el mensaje del sistema y el último análisis
-        if 'netgogo2_agent' not in request.session:
-            agent = Agent()
-            # Crear mensaje del sistema específico para diagnóstico
-            system_message = {
-                "role": "system",
-                "content": (
-                    "Eres un asistente experto en diagnóstico automotriz que ayuda a ingresar diagnósticos en un taller mecánico. "
-                    "Tu tarea es guiar al usuario paso a paso para completar un formulario de diagnóstico. "
-                    "\n\n"
-                    "IMPORTANTE: Cuando tengas información parcial (como RUT, placa, o descripción del problema), "
-                    "DEBES usar las function calls disponibles para buscar información en el sistema:\n"
-                    "- Si el usuario ingresa un RUT o nombre de cliente, usa 'listado_clientes' con filtro para buscarlo\n"
-                    "- Si el usuario ingresa una placa, usa 'listado_vehiculos' con filtro para buscarlo\n"
-                    "- Si el usuario describe un problema, usa 'listado_diagnosticos' con filtro para encontrar diagnósticos similares\n"
-                    "- Si necesitas sugerir componentes, usa 'listado_componentes' para listar componentes relevantes\n"
-                    "- Usa 'query_sistema' para consultas generales sobre el estado del taller\n"
-                    "\n"
-                    "Cuando ejecutes una función y recibas su resultado, SIEMPRE debes procesar ese resultado y responder "
-                    "al usuario de forma clara y amigable, extrayendo la información relevante. "
-                    "NO muestres el JSON crudo, sino presenta los datos de manera legible y útil.\n"
-                    "\n"
-                    "Responde en español de forma amigable y profesional. "
-                    "Sé conciso pero completo en tus respuestas."
-                )
-            }
-            request.session['netgogo2_agent'] = {
-                'system_message': system_message,
-                'last_analysis': None,
-                'last_section': None
-            }
-        
-        # Construir prompt contextual (sin acumular historial)
-        if action == "analyze":
-            cliente_data = form_data.get('cliente', {})
-            vehiculo_data = form_data.get('vehiculo', {})
-            diagnostico_data = form_data.get('diagnostico', {})
-            
-            # Construir contexto para la IA según la sección
-            if current_section == "componentes":
-                descripcion = diagnostico_data.get('descripcion', '') or diagnostico_data.get('descripcion_problema', '')
-                if descripcion:
-                    # En la sección de componentes, buscar componentes relevantes basados en acciones mencionadas
-                    contexto = f"""Estás en la sección de selección de componentes afectados.
-
-Descripción del problema: {descripcion[:300]}
-
-Tu tarea CRÍTICA:
-1. DEBES usar 'sugerir_componentes_por_descripcion' con la descripción completa del problema
-2. Esta función analiza la descripción para identificar acciones mencionadas (como "cambio", "reparación", "falla", "ruido", etc.)
-3. Busca componentes que tienen esas acciones asociadas con tarifas en el sistema (ComponenteAccion)
-4. Si no encuentra componentes por acciones, busca por palabras clave en nombres de componentes
-5. Sugiere al usuario los componentes más relevantes basados en el problema descrito
-6. Proporciona un mensaje claro explicando qué componentes podrían estar afectados y por qué
-
-IMPORTANTE: Usa 'sugerir_componentes_por_descripcion' en lugar de 'listado_componentes' porque es más inteligente y busca basándose en acciones y componentes asociados que tienen tarifas.
-
-Ejemplos:
-- Si la descripción dice "cambio de bujías" → buscará componentes asociados a la acción "cambio" y que contengan "bujías"
-- Si dice "falla de frenos" → buscará componentes asociados a "falla" y que contengan "frenos"
-- Si dice "ruido en el motor" → buscará componentes asociados a acciones relacionadas con "ruido" y que contengan "motor"
-
-Responde de forma natural y amigable, sugiriendo componentes específicos con sus acciones disponibles."""
-                else:
-                    contexto = f"""Estás en la sección de selección de componentes afectados.
-
-No hay descripción del problema disponible aún. Guía al usuario para que seleccione los componentes que requieren atención.
-
-Si el usuario necesita ayuda, puedes usar 'listado_componentes' para mostrar todos los componentes disponibles."""
-            else:
-                # Construir contexto para otras secciones
-                contexto = f"""Analiza el estado actual del formulario de ingreso de diagnóstico.
-
-Sección actual: {current_section}
-
-Datos del formulario:
-- Cliente: RUT={cliente_data.get('rut', 'N/A')}, Nombre={cliente_data.get('nombre', 'N/A')}, Existente={cliente_data.get('existente', False)}
-- Vehículo: Placa={vehiculo_data.get('placa', 'N/A')}, Marca={vehiculo_data.get('marca', 'N/A')}, Modelo={vehiculo_data.get('modelo', 'N/A')}, ID={vehiculo_data.get('id', 'N/A')}
-- Diagnóstico: Descripción={diagnostico_data.get('descripcion', 'N/A')[:100] if diagnostico_data.get('descripcion') else 'N/A'}
-
-Tu tarea:
-1. Si hay información parcial (RUT, placa, descripción), usa las function calls para buscar información en el sistema
-2. Determina qué sección debe mostrarse al usuario
-3. Identifica qué campos faltan o necesitan atención
-4. Proporciona un mensaje claro y amigable guiando al usuario
-5. Si encontraste información relevante (clientes, vehículos, diagnósticos similares), inclúyela en tu respuesta
-
-IMPORTANTE: Si el usuario ingresó un RUT o nombre de cliente pero no está completo, usa 'listado_clientes' con filtro para buscarlo.
-Si ingresó una placa, usa 'listado_vehiculos' con filtro para buscarla.
-Si describió un problema, usa 'listado_diagnosticos' con filtro para encontrar diagnósticos similares que puedan ayudar.
-
-Responde de forma natural y amigable, no en formato JSON estructurado."""
-        else:
-            prompt = f"Acción: {action}. Datos: {json.dumps(form_data, ensure_ascii=False)}"
-            contexto = prompt
+        # Para Netgogo2 NO se acumula historial (evita loops y rate limits): solo el
+        # mensaje del sistema y el último análisis
+        estado_agente = estado_netgogo2(request.user)
+        contexto = contexto_netgogo2(action, form_data, current_section)
         
         # Crear mensajes frescos para cada petición (sin acumular historial)
         agent = Agent()
-        agent.messages = [request.session['netgogo2_agent']['system_message']]
+        agent.messages = [estado_agente['system_message']]
         agent.messages.append({"role": "user", "content": contexto})
         
         # Análisis local (siempre disponible como fallback)
@@ -2123,6 +2169,7 @@ Responde de forma natural y amigable, no en formato JSON estructurado."""
             # Procesar respuesta y detectar function calls
             if response_data and 'output' in response_data:
                 outputs = response_data.get('output', [])
+                resultados = _resultados_herramientas(outputs, agent, 'netgogo2')
                 for output in outputs:
                     if isinstance(output, dict):
                         output_type = output.get('type')
@@ -2130,12 +2177,7 @@ Responde de forma natural y amigable, no en formato JSON estructurado."""
                         # Si es function_call, ejecutarla
                         if output_type == 'function_call':
                             fn_name = output.get('name')
-                            args_str = output.get('arguments', '{}')
-                            
-                            try:
-                                args = json.loads(args_str) if isinstance(args_str, str) else args_str
-                            except:
-                                args = {}
+                            args = argumentos_function_call(output)
                             
                             tool_called = True
                             tool_info = {
@@ -2144,59 +2186,8 @@ Responde de forma natural y amigable, no en formato JSON estructurado."""
                                 'call_id': output.get('call_id', '')
                             }
                             
-                            # Ejecutar la función correspondiente
-                            try:
-                                if fn_name == 'listado_clientes':
-                                    activo = args.get('activo')
-                                    limite = args.get('limite', 10)
-                                    filtro = args.get('filtro')
-                                    result = listado_clientes_data(activo=activo, limite=limite, filtro=filtro)
-                                elif fn_name == 'listado_vehiculos':
-                                    limite = args.get('limite', 10)
-                                    filtro = args.get('filtro')
-                                    result = listado_vehiculos_data(limite=limite, filtro=filtro)
-                                elif fn_name == 'listado_diagnosticos':
-                                    estado = args.get('estado')
-                                    limite = args.get('limite', 10)
-                                    filtro = args.get('filtro')
-                                    result = listado_diagnosticos_data(estado=estado, limite=limite, filtro=filtro)
-                                elif fn_name == 'listado_componentes':
-                                    activo = args.get('activo')
-                                    limite = args.get('limite', 20)
-                                    filtro = args.get('filtro')
-                                    result = listado_componentes_data(activo=activo, limite=limite, filtro=filtro)
-                                elif fn_name == 'sugerir_componentes_por_descripcion':
-                                    descripcion = args.get('descripcion', '')
-                                    limite = args.get('limite', 20)
-                                    result = sugerir_componentes_por_descripcion(descripcion=descripcion, limite=limite)
-                                elif fn_name == 'query_sistema':
-                                    result = query_sistema_data(
-                                        tipo=args.get('tipo'),
-                                        filtro=args.get('filtro'),
-                                        detalle=args.get('detalle', False)
-                                    )
-                                elif fn_name == 'list_files_in_dir':
-                                    result = agent.list_files_in_dir(**args)
-                                elif fn_name == 'read_file':
-                                    result = agent.read_file(**args)
-                                elif fn_name == 'edit_file':
-                                    result = agent.edit_file(**args)
-                                else:
-                                    result = {"error": f"Función desconocida: {fn_name}", "success": False}
-                                
-                                # Asegurar que result siempre sea un dict
-                                if not isinstance(result, dict):
-                                    result = {"result": result, "success": True}
-                                    
-                            except Exception as func_error:
-                                error_msg = str(func_error)
-                                error_type = type(func_error).__name__
-                                logger.error(f"Error ejecutando función {fn_name}: {error_type}: {error_msg}", exc_info=True)
-                                result = {
-                                    "error": f"Error ejecutando {fn_name}: {error_msg}",
-                                    "error_type": error_type,
-                                    "success": False
-                                }
+                            # Resultado de la función (ya ejecutada junto a las demás)
+                            result = next(resultados)
                             
                             tool_info['result'] = result
                             search_results = result  # Guardar resultados para enviar al frontend
@@ -2205,86 +2196,23 @@ Responde de forma natural y amigable, no en formato JSON estructurado."""
                             agent.messages.append({
                                 "type": "function_call_output",
                                 "call_id": output.get('call_id', ''),
-                                "output": json.dumps({
-                                    "result": result
-                                })
+                                "output": payload_ia.salida_para_modelo(result)
                             })
                             
                             # Continuar conversación para obtener respuesta final
                             try:
-                                continuation_messages = []
-                                for msg in agent.messages:
-                                    if isinstance(msg, dict):
-                                        if 'role' in msg and 'content' in msg:
-                                            continuation_messages.append({
-                                                "role": msg['role'],
-                                                "content": str(msg['content'])
-                                            })
-                                        elif msg.get('type') == 'function_call_output':
-                                            output_content = msg.get('output', '')
-                                            continuation_messages.append({
-                                                "role": "function",
-                                                "name": "function_output",
-                                                "content": output_content if isinstance(output_content, str) else json.dumps(output_content)
-                                            })
-                                
-                                # Agregar mensaje explícito pidiendo que procese el resultado
-                                continuation_messages.append({
-                                    "role": "user",
-                                    "content": (
-                                        f"Procesa el resultado de la función '{fn_name}' que acabas de ejecutar. "
-                                        f"Responde al usuario de forma clara y amigable, extrayendo la información relevante del resultado. "
-                                        f"NO muestres el JSON crudo, sino presenta los datos de manera legible. "
-                                        f"Si encontraste clientes, vehículos o diagnósticos similares, sugiérelos al usuario. "
-                                        f"También indica qué sección del formulario debe mostrarse y qué campos faltan."
-                                    )
-                                })
-                                
                                 continuation_response = call_openai_api(
-                                    input_data=continuation_messages,
+                                    input_data=mensajes_continuacion(agent.messages, fn_name, 'netgogo2'),
                                     model="gpt-4o-mini",
                                     tools=None,  # No necesitamos herramientas en la continuación
                                     store=True,
                                     timeout=60
                                 )
-                                
-                                # Procesar respuesta de continuación
-                                if 'output' in continuation_response:
-                                    cont_outputs = continuation_response.get('output', [])
-                                    for cont_output in cont_outputs:
-                                        if isinstance(cont_output, dict) and cont_output.get('type') == 'message':
-                                            content = cont_output.get('content', [])
-                                            if isinstance(content, list):
-                                                message_parts = []
-                                                for part in content:
-                                                    if isinstance(part, dict) and part.get('type') == 'output_text':
-                                                        text = part.get('text', '')
-                                                        if text:
-                                                            message_parts.append(text)
-                                                final_message = '\n'.join(message_parts) if message_parts else None
-                                            elif isinstance(content, str):
-                                                final_message = content
-                                            break
+                                final_message = texto_de_respuesta(continuation_response)
                                 
                                 # Si no se obtuvo mensaje de la continuación, crear uno básico desde el resultado
                                 if not final_message:
-                                    if isinstance(result, dict) and 'error' not in result:
-                                        try:
-                                            if 'clientes' in result:
-                                                count = result.get('total_encontrados', 0)
-                                                final_message = f"Encontré {count} cliente(s) que coinciden con tu búsqueda."
-                                            elif 'vehiculos' in result:
-                                                count = result.get('total_encontrados', 0)
-                                                final_message = f"Encontré {count} vehículo(s) que coinciden con tu búsqueda."
-                                            elif 'diagnosticos' in result:
-                                                count = result.get('total_encontrados', 0)
-                                                final_message = f"Encontré {count} diagnóstico(s) similar(es) que pueden ayudarte."
-                                            else:
-                                                final_message = "Información obtenida correctamente."
-                                        except:
-                                            final_message = "Información obtenida correctamente."
-                                    else:
-                                        final_message = "Información obtenida correctamente."
+                                    final_message = mensaje_por_defecto(result, 'netgogo2')
                                 
                             except Exception as cont_error:
                                 logger.warning(f"Error en continuación de conversación: {str(cont_error)}")
@@ -2294,17 +2222,7 @@ Responde de forma natural y amigable, no en formato JSON estructurado."""
                         
                         elif output_type == 'message':
                             # Si es mensaje directo (sin function call)
-                            content = output.get('content', [])
-                            if isinstance(content, list):
-                                message_parts = []
-                                for part in content:
-                                    if isinstance(part, dict) and part.get('type') == 'output_text':
-                                        text = part.get('text', '')
-                                        if text:
-                                            message_parts.append(text)
-                                final_message = '\n'.join(message_parts) if message_parts else None
-                            elif isinstance(content, str):
-                                final_message = content
+                            final_message = texto_de_mensaje(output)
             
             # Actualizar mensaje si se obtuvo de la IA
                         if final_message:
@@ -2313,11 +2231,11 @@ Responde de forma natural y amigable, no en formato JSON estructurado."""
                             logger.info(f"Netgogo2: IA conectada exitosamente. Mensaje recibido: {final_message[:50]}...")
             
             # Guardar solo el último análisis (no todo el historial)
-            request.session['netgogo2_agent']['last_analysis'] = {
+            estado_agente['last_analysis'] = {
                 'section': current_section
             }
-            request.session['netgogo2_agent']['last_section'] = current_section
-            request.session.modified = True
+            estado_agente['last_section'] = current_section
+            guardar_conversacion(request.user, 'netgogo2', estado=estado_agente)
         except Exception as api_error:
             # Si falla la API, usar solo el análisis local
             logger.warning(f"Netgogo2: Error llamando a API de IA: {str(api_error)}")
@@ -2401,7 +2319,7 @@ def analizar_formulario_ingreso(form_data, current_section):
         message = f"✅ Perfecto. Has seleccionado {len(componentes_seleccionados) if componentes_seleccionados else 0} componente(s). Puedes finalizar el ingreso."
         missing = []
     
-    return {
+    analysis = {
         "section": next_section,
         "message": message,
         "missing_fields": missing,
@@ -2413,18 +2331,42 @@ def analizar_formulario_ingreso(form_data, current_section):
             "componentes": componentes_completo
         }
     }
+    
+    # En la sección de componentes: lo que el historial sugiere para esta descripción
+    # y los componentes ya elegidos (modelo precalculado, sin pasar por la IA)
+    if diagnostico_completo and next_section == "componentes":
+        ids_seleccionados = []
+        for c in componentes_seleccionados or []:
+            c = c.get('id') if isinstance(c, dict) else c
+            try:
+                ids_seleccionados.append(int(c))
+            except (TypeError, ValueError):
+                continue
+        try:
+            historial = sugerencias_del_historial(
+                diagnostico_data.get('descripcion') or diagnostico_data.get('descripcion_problema'),
+                ids_seleccionados,
+                limite=8
+            )
+            analysis["componentes_sugeridos"] = historial["componentes"]
+            analysis["repuestos_sugeridos"] = historial["repuestos"]
+        except Exception as e:
+            logger.warning(f"No se pudieron calcular sugerencias del historial: {str(e)}")
+    
+    return analysis
 
 
 def buscar_diagnosticos_similares(descripcion, limite=5):
     """
-    Busca diagnósticos similares basados en la descripción del problema
+    Busca diagnósticos históricos parecidos a la descripción del problema
+    (índice TF-IDF de similitud_diagnosticos), con sus componentes y acciones
     
     Args:
         descripcion: Texto de descripción del problema
         limite: Número máximo de diagnósticos a retornar
     
     Returns:
-        dict: Lista de diagnósticos similares con información relevante
+        dict: Diagnósticos ordenados por similitud con información relevante
     """
     try:
         if not descripcion or len(descripcion.strip()) < 3:
@@ -2434,55 +2376,63 @@ def buscar_diagnosticos_similares(descripcion, limite=5):
                 "message": "La descripción es muy corta para buscar diagnósticos similares"
             }
         
-        # Buscar diagnósticos que contengan palabras clave de la descripción
-        palabras_clave = descripcion.lower().split()
-        palabras_clave = [p.strip() for p in palabras_clave if len(p.strip()) > 2][:5]  # Máximo 5 palabras clave
-        
-        if not palabras_clave:
+        from .similitud_diagnosticos import similares, terminos
+        ranking = similares(descripcion, limite=limite)
+        if not ranking:
             return {
                 "total_encontrados": 0,
-                "diagnosticos": []
+                "diagnosticos": [],
+                "terminos_buscados": terminos(descripcion)
             }
         
-        # Construir query con OR para buscar cualquier palabra clave
-        query = Q()
-        for palabra in palabras_clave:
-            query |= Q(descripcion_problema__icontains=palabra)
-        
+        # Una consulta por relación para todos los resultados (antes dos count() por diagnóstico)
         diagnosticos = Diagnostico.objects.filter(
-            query,
+            id__in=[diagnostico_id for diagnostico_id, _ in ranking],
             visible=True
-        ).order_by('-fecha')[:limite]
+        ).select_related('vehiculo').prefetch_related(
+            'componentes',
+            'acciones_componentes__componente',
+            'acciones_componentes__accion',
+        ).in_bulk()
         
         lista_diagnosticos = []
-        for d in diagnosticos:
-            try:
-                vehiculo = d.vehiculo
-                componentes_count = d.componentes.count() if hasattr(d, 'componentes') else 0
-                acciones_count = d.acciones_componentes.count() if hasattr(d, 'acciones_componentes') else 0
-                
-                diagnostico_data = {
-                    "id": d.id,
-                    "vehiculo": {
-                        "placa": vehiculo.placa if vehiculo else "N/A",
-                        "marca": vehiculo.marca if vehiculo else "N/A",
-                        "modelo": vehiculo.modelo if vehiculo else "N/A"
-                    },
-                    "descripcion_problema": d.descripcion_problema or "",
-                    "fecha": d.fecha.strftime("%Y-%m-%d") if d.fecha else None,
-                    "estado": d.estado,
-                    "componentes_count": componentes_count,
-                    "acciones_count": acciones_count
+        for diagnostico_id, similitud in ranking:
+            d = diagnosticos.get(diagnostico_id)
+            if d is None:
+                continue  # borrado u oculto después de indexarse
+            vehiculo = d.vehiculo
+            componentes = [{"id": c.id, "nombre": c.nombre} for c in d.componentes.all()]
+            acciones = [
+                {
+                    "componente": dca.componente.nombre,
+                    "componente_id": dca.componente_id,
+                    "accion": dca.accion.nombre,
+                    "accion_id": dca.accion_id,
+                    "cantidad": dca.cantidad,
                 }
-                lista_diagnosticos.append(diagnostico_data)
-            except Exception as e_diag:
-                logger.warning(f"Error procesando diagnóstico {d.id}: {str(e_diag)}")
-                continue
+                for dca in d.acciones_componentes.all()
+            ]
+            lista_diagnosticos.append({
+                "id": d.id,
+                "similitud": round(similitud, 3),
+                "vehiculo": {
+                    "placa": vehiculo.placa if vehiculo else "N/A",
+                    "marca": vehiculo.marca if vehiculo else "N/A",
+                    "modelo": vehiculo.modelo if vehiculo else "N/A"
+                },
+                "descripcion_problema": d.descripcion_problema or "",
+                "fecha": d.fecha.strftime("%Y-%m-%d") if d.fecha else None,
+                "estado": d.estado,
+                "componentes_count": len(componentes),
+                "acciones_count": len(acciones),
+                "componentes": componentes,
+                "acciones": acciones
+            })
         
         return {
             "total_encontrados": len(lista_diagnosticos),
             "diagnosticos": lista_diagnosticos,
-            "palabras_buscadas": palabras_clave
+            "terminos_buscados": terminos(descripcion)
         }
     
     except Exception as e:
@@ -2498,11 +2448,91 @@ def buscar_diagnosticos_similares(descripcion, limite=5):
         }
 
 
+@ajax_login_required
+def diagnosticos_similares(request):
+    """Diagnósticos parecidos a ?q= para el formulario de ingreso (mismo JSON que la herramienta de Netgogo2)"""
+    try:
+        limite = min(max(int(request.GET.get('limite', 5)), 1), 20)
+    except ValueError:
+        limite = 5
+    return JsonResponse(buscar_diagnosticos_similares(request.GET.get('q', ''), limite=limite))
+
+
+def sugerencias_del_historial(descripcion, componentes_ids=(), limite=20):
+    """
+    Componentes (con sus acciones) y repuestos que el historial del taller asocia a la
+    descripción y a los componentes ya elegidos (modelo de sugerencias_ingreso).
+    Listas vacías si el modelo no está entrenado o no reconoce nada.
+    """
+    from .sugerencias_ingreso import sugerir
+    
+    sugerencias = sugerir(descripcion, componentes_ids, limite=limite)
+    acciones_sugeridas = sugerencias['acciones']
+    componentes_sugeridos = sugerencias['componentes']
+    if not componentes_sugeridos and not acciones_sugeridas and not sugerencias['repuestos']:
+        return {"componentes": [], "repuestos": []}
+    
+    # Un componente sugerido por sus acciones también cuenta aunque no venga en la lista propia
+    confianza_componente = dict((c, conf) for c, conf in componentes_sugeridos)
+    for componente_id, _, confianza in acciones_sugeridas:
+        if componente_id not in componentes_ids:
+            confianza_componente.setdefault(componente_id, confianza)
+    
+    componentes = Componente.objects.filter(id__in=confianza_componente, activo=True).in_bulk()
+    acciones = Accion.objects.in_bulk({accion_id for _, accion_id, _ in acciones_sugeridas})
+    precios = {
+        (ca.componente_id, ca.accion_id): float(ca.precio_mano_obra)
+        for ca in ComponenteAccion.objects.filter(
+            componente_id__in=confianza_componente,
+            accion_id__in=acciones
+        )
+    }
+    acciones_por_componente = {}
+    for componente_id, accion_id, confianza in acciones_sugeridas:
+        if accion_id in acciones:
+            acciones_por_componente.setdefault(componente_id, []).append({
+                "id": accion_id,
+                "nombre": acciones[accion_id].nombre,
+                "precio": precios.get((componente_id, accion_id), 0.0),
+                "confianza": confianza
+            })
+    
+    lista_componentes = []
+    for componente_id, confianza in sorted(confianza_componente.items(), key=lambda x: -x[1])[:limite]:
+        componente = componentes.get(componente_id)
+        if componente is None:
+            continue
+        acciones_componente = acciones_por_componente.get(componente_id, [])
+        lista_componentes.append({
+            "id": componente.id,
+            "nombre": componente.nombre or "N/A",
+            "codigo": componente.codigo or "N/A",
+            "activo": componente.activo,
+            "acciones_disponibles": acciones_componente,
+            "acciones_count": len(acciones_componente),
+            "confianza": confianza
+        })
+    
+    repuestos = Repuesto.objects.in_bulk([repuesto_id for repuesto_id, _ in sugerencias['repuestos']])
+    lista_repuestos = [
+        {
+            "id": repuesto_id,
+            "nombre": repuestos[repuesto_id].nombre,
+            "sku": repuestos[repuesto_id].sku,
+            "confianza": confianza
+        }
+        for repuesto_id, confianza in sugerencias['repuestos']
+        if repuesto_id in repuestos
+    ]
+    return {"componentes": lista_componentes, "repuestos": lista_repuestos}
+
+
 def sugerir_componentes_por_descripcion(descripcion, limite=20):
     """
-    Sugiere componentes relevantes basados en acciones mencionadas en la descripción.
-    Busca en ComponenteAccion para encontrar componentes que tienen acciones asociadas
-    que coinciden con palabras clave de la descripción.
+    Sugiere componentes relevantes para la descripción del problema.
+    Primero según el historial del taller (sugerencias_del_historial); si el modelo
+    no sugiere nada, busca en ComponenteAccion componentes que tienen acciones
+    asociadas que coinciden con palabras clave de la descripción.
     
     Args:
         descripcion: Texto de descripción del problema
@@ -2519,6 +2549,18 @@ def sugerir_componentes_por_descripcion(descripcion, limite=20):
                 "message": "La descripción es muy corta para sugerir componentes"
             }
         
+        historial = sugerencias_del_historial(descripcion, limite=limite)
+        if historial["componentes"]:
+            return {
+                "total_encontrados": len(historial["componentes"]),
+                "componentes": historial["componentes"],
+                "repuestos_sugeridos": historial["repuestos"],
+                "acciones_detectadas": list(dict.fromkeys(
+                    a["nombre"] for c in historial["componentes"] for a in c["acciones_disponibles"]
+                ))[:5],
+                "metodo": "historial"
+            }
+        
         descripcion_lower = descripcion.lower()
         
         # Palabras clave de acciones comunes (mapeo de términos del usuario a acciones en BD)
@@ -0,0 +1,244 @@
+"""
+Netgogo y Netgogo2 en streaming (vistas async).
+
+Misma conversación que netgogo_chat / netgogo2_chat, pero la llamada al LLM no
+bloquea un worker: bajo ASGI la vista espera la respuesta con car.llm (httpx
+asíncrono, conexión del pool) y le va mandando los tokens al navegador como
+Server-Sent Events:
+
+    event: delta         {"texto": "..."}            fragmento del mensaje
+    event: herramienta   {"name": ..., "arguments"}  la IA pidió una function call
+    event: fin           {...}                       el mismo JSON de la vista síncrona
+    event: error         {"error": ..., "error_type"}
+
+Las herramientas (listados, ORM) y el historial son código síncrono: corren con
+sync_to_async, fuera del event loop. Las vistas síncronas quedan igual como respaldo.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import herramientas_ia, llm, payload_ia
+from .agent import Agent
+from .historial_chat import guardar_conversacion, obtener_conversacion
+from .views_ia import (
+    analizar_formulario_ingreso,
+    argumentos_function_call,
+    contexto_netgogo2,
+    estado_netgogo2,
+    mensaje_por_defecto,
+    mensajes_continuacion,
+    mensajes_para_api,
+    texto_de_respuesta,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _evento(nombre, datos):
+    return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _cerrando_cliente(eventos):
+    """
+    Fuera de ASGI cada request consume el stream en un event loop propio que se descarta
+    al terminar: el AsyncClient que llm.cliente() creó en ese loop se cierra aquí.
+    """
+    try:
+        async for evento in eventos:
+            yield evento
+    finally:
+        await llm.cerrar()
+
+
+def _respuesta_sse(request, eventos):
+    if not isinstance(request, ASGIRequest):
+        eventos = _cerrando_cliente(eventos)
+    response = StreamingHttpResponse(eventos, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: enviar cada evento sin acumular
+    return response
+
+
+async def _validar(request, nombre_vista):
+    """(usuario, datos, None) o (None, None, JsonResponse de error), como las vistas síncronas."""
+    usuario = await request.auser()
+    if not usuario.is_authenticated:
+        return None, None, JsonResponse({"error": "No autenticado. Por favor inicia sesión."}, status=401)
+    # Restricción temporal: solo el usuario maxgonpe puede acceder
+    if usuario.username != 'maxgonpe':
+        return None, None, JsonResponse({"error": "Acceso restringido. Esta funcionalidad está en desarrollo."}, status=403)
+    if request.method != 'POST':
+        return None, None, JsonResponse({"error": "Método no permitido. Use POST."}, status=405)
+
+    if request.content_type == 'application/json':
+        try:
+            return usuario, json.loads(request.body), None
+        except json.JSONDecodeError as e:
+            logger.error(f"Error parseando JSON en {nombre_vista}: {str(e)}")
+            return None, None, JsonResponse({"error": "JSON inválido"}, status=400)
+    return usuario, request.POST, None
+
+
+async def _consultar(input_data, model, tools, salida):
+    """Transmite una llamada al LLM generando los eventos 'delta'; deja en `salida` el texto y la respuesta."""
+    partes = []
+    async for tipo, valor in llm.transmitir(input_data, model, tools=tools):
+        if tipo == 'delta':
+            partes.append(valor)
+            yield _evento('delta', {'texto': valor})
+        else:
+            salida['respuesta'] = valor
+    salida['texto'] = texto_de_respuesta(salida.get('respuesta')) or ''.join(partes) or None
+
+
+async def _turno(agent, input_data, model, consola, resultado):
+    """
+    Un turno de conversación: primera llamada con herramientas; si la IA pide
+    function calls se ejecutan y una segunda llamada (sin herramientas) redacta la
+    respuesta. Deja en `resultado` el mensaje final y la herramienta usada.
+    """
+    salida = {}
+    async for evento in _consultar(input_data, model, agent.tools, salida):
+        yield evento
+
+    llamadas = [
+        o for o in salida['respuesta'].get('output', [])
+        if isinstance(o, dict) and o.get('type') == 'function_call'
+    ]
+    if not llamadas:
+        resultado['message'] = salida['texto']
+        return
+
+    pedidas = [(llamada.get('name'), argumentos_function_call(llamada)) for llamada in llamadas]
+    for fn_name, args in pedidas:
+        yield _evento('herramienta', {'name': fn_name, 'arguments': args})
+
+    # Todas a la vez (en paralelo y con caché); el turno espera solo a la más lenta
+    resultados = await sync_to_async(herramientas_ia.ejecutar_llamadas)(pedidas, agent, consola)
+    for llamada, (fn_name, args), result in zip(llamadas, pedidas, resultados):
+        resultado['tool'] = {'name': fn_name, 'arguments': args, 'result': result}
+        agent.messages.append({
+            "type": "function_call_output",
+            "call_id": llamada.get('call_id', ''),
+            "output": payload_ia.salida_para_modelo(result)
+        })
+
+    # Continuación para que la IA procese el resultado
+    salida = {}
+    try:
+        async for evento in _consultar(mensajes_continuacion(agent.messages, fn_name, consola), model, None, salida):
+            yield evento
+        resultado['message'] = salida['texto']
+    except llm.ErrorLLM as e:
+        logger.warning(f"Error en continuación después de {fn_name}: {str(e)}")
+    if not resultado.get('message'):
+        resultado['message'] = mensaje_por_defecto(result, consola)
+
+
+@csrf_exempt
+async def netgogo_chat_stream(request):
+    """netgogo_chat con la respuesta del LLM transmitida por SSE."""
+    usuario, data, error = await _validar(request, 'netgogo_chat_stream')
+    if error:
+        return error
+
+    user_input = data.get("input", "").strip()
+    reset_session = data.get("reset", False)
+    if not user_input and not reset_session:
+        return JsonResponse({"error": "Falta parámetro 'input'"}, status=400)
+    if user_input.lower() in ("salir", "exit", "bye", "sayonara"):
+        return JsonResponse({"message": "Hasta luego!", "reset": True})
+
+    agent = Agent()
+    conversacion = None if reset_session else await sync_to_async(obtener_conversacion)(usuario, 'netgogo')
+    if conversacion and conversacion.mensajes:
+        agent.messages = list(conversacion.mensajes)
+    agent.messages.append({"role": "user", "content": user_input})
+
+    async def eventos():
+        resultado = {}
+        try:
+            input_for_api = mensajes_para_api(agent.messages, user_input)
+            async for evento in _turno(agent, input_for_api, "gpt-5-nano", 'netgogo', resultado):
+                yield evento
+
+            final_message = resultado.get('message')
+            if final_message:
+                agent.messages.append({"role": "assistant", "content": final_message})
+            await sync_to_async(guardar_conversacion)(usuario, 'netgogo', mensajes=agent.messages)
+
+            yield _evento('fin', {
+                "success": True,
+                "message": final_message or "Procesado correctamente",
+                "tool_called": 'tool' in resultado,
+                "tool": resultado.get('tool'),
+                "needs_continuation": False,
+            })
+        except Exception as e:
+            logger.error(f"Error en netgogo_chat_stream: {type(e).__name__}: {str(e)}", exc_info=True)
+            yield _evento('error', {
+                "error": f"Error interno del servidor: {str(e)}",
+                "error_type": type(e).__name__,
+                "success": False,
+            })
+
+    return _respuesta_sse(request, eventos())
+
+
+@csrf_exempt
+async def netgogo2_chat_stream(request):
+    """netgogo2_chat con la respuesta del LLM transmitida por SSE (análisis local como respaldo)."""
+    usuario, data, error = await _validar(request, 'netgogo2_chat_stream')
+    if error:
+        return error
+
+    action = data.get("action", "analyze")
+    form_data = data.get("form_data", {})
+    current_section = data.get("current_section", "cliente")
+
+    estado_agente = await sync_to_async(estado_netgogo2)(usuario)
+    agent = Agent()
+    agent.messages = [
+        estado_agente['system_message'],
+        {"role": "user", "content": contexto_netgogo2(action, form_data, current_section)},
+    ]
+    analysis = await sync_to_async(analizar_formulario_ingreso)(form_data, current_section)
+
+    async def eventos():
+        resultado = {}
+        ia_connected = False
+        try:
+            async for evento in _turno(agent, agent.messages, "gpt-4o-mini", 'netgogo2', resultado):
+                yield evento
+            if resultado.get('message'):
+                analysis['message'] = resultado['message']
+                ia_connected = True
+
+            # Guardar solo el último análisis (no todo el historial)
+            estado_agente['last_analysis'] = {'section': current_section}
+            estado_agente['last_section'] = current_section
+            await sync_to_async(guardar_conversacion)(usuario, 'netgogo2', estado=estado_agente)
+        except Exception as e:
+            # Si falla la API, se responde con el análisis local (fallback normal)
+            logger.warning(f"Netgogo2: Error llamando a API de IA: {str(e)}")
+
+        respuesta = {
+            "success": True,
+            "message": analysis.get("message", "Continuemos con el formulario"),
+            "analysis": analysis,
+            "ia_connected": ia_connected,
+        }
+        herramienta = resultado.get('tool')
+        if herramienta:
+            respuesta["tool_called"] = True
+            respuesta["tool"] = {"name": herramienta['name'], "arguments": herramienta['arguments']}
+            if herramienta['result']:
+                respuesta["search_results"] = herramienta['result']
+        yield _evento('fin', respuesta)
+
+    return _respuesta_sse(request, eventos())
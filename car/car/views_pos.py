@@ -19,6 +19,8 @@ from .models import (
     CarritoItem, VentaPOS, VentaPOSItem, ConfiguracionPOS,
     Cotizacion, CotizacionItem, StockMovimiento
 )
+from .busqueda_repuestos import buscar_repuesto_ids, ordenar_por_ranking
+from .movimientos_stock import mover_stock, registrar_movimientos
 from .forms import (
     BuscarRepuestoForm, CarritoItemForm, VentaPOSForm, 
     ConfiguracionPOSForm, ClienteRapidoForm, CotizacionForm
@@ -78,37 +80,9 @@ def buscar_repuestos_pos(request):
     if len(query) < 2:
         return JsonResponse({'repuestos': []})
     
-    # Usar la misma lógica de búsqueda que funciona en el módulo de repuestos
-    repuestos = Repuesto.objects.filter(
-        Q(nombre__icontains=query) |
-        Q(sku__icontains=query) |
-        Q(codigo_barra__icontains=query) |
-        Q(oem__icontains=query) |
-        Q(referencia__icontains=query) |
-        Q(marca__icontains=query) |
-        Q(descripcion__icontains=query) |
-        Q(marca_veh__icontains=query) |
-        Q(tipo_de_motor__icontains=query) |
-        Q(cod_prov__icontains=query) |
-        Q(origen_repuesto__icontains=query) |
-        Q(carroceria__icontains=query)
-    )
-    
-    # Si no hay resultados y el término contiene guiones, buscar por partes del SKU
-    if not repuestos.exists() and '-' in query:
-        partes = query.split('-')
-        if len(partes) > 1:
-            # Buscar SKUs que contengan todas las partes
-            sku_filter = Q()
-            for parte in partes:
-                if parte.strip():  # Ignorar partes vacías
-                    sku_filter &= Q(sku__icontains=parte.strip())
-            
-            if sku_filter:
-                repuestos = Repuesto.objects.filter(sku_filter)
-    
-    # Ordenar por nombre y limitar resultados
-    repuestos = repuestos.order_by('nombre')[:20]
+    # Índice de búsqueda compartido (FTS5 / pg_trgm), resultados ordenados por relevancia
+    ids = buscar_repuesto_ids(query, limite=20)
+    repuestos = ordenar_por_ranking(Repuesto.objects.filter(id__in=ids), ids)
     
     resultados = []
     for repuesto in repuestos:
@@ -286,59 +260,31 @@ def procesar_venta(request):
                 venta.total = subtotal - descuento
                 venta.save()
                 
-                # Crear items de la venta y actualizar stock
-                for carrito_item in sesion.carrito_items.all():
-                    VentaPOSItem.objects.create(
+                # Crear items de la venta y descontar stock (un UPDATE condicional por línea)
+                items_venta = []
+                movimientos = []
+                for carrito_item in sesion.carrito_items.select_related('repuesto'):
+                    items_venta.append(VentaPOSItem(
                         venta=venta,
                         repuesto=carrito_item.repuesto,
                         cantidad=carrito_item.cantidad,
                         precio_unitario=carrito_item.precio_unitario,
                         subtotal=carrito_item.subtotal
-                    )
-                    
-                    # Actualizar stock usando el sistema unificado
-                    repuesto = carrito_item.repuesto
-                    
-                    # Verificar stock suficiente
-                    if repuesto.stock_total < carrito_item.cantidad:
-                        raise ValueError(f"Stock insuficiente para {repuesto.nombre}. Disponible: {repuesto.stock_total}, Solicitado: {carrito_item.cantidad}")
+                    ))
                     
-                    # Actualizar stock en la tabla maestra
-                    repuesto.stock -= carrito_item.cantidad
-                    repuesto.save()
-                    
-                    # Sincronizar con RepuestoEnStock
-                    stock_disponible = RepuestoEnStock.objects.filter(
-                        repuesto=repuesto,
-                        deposito='bodega-principal'
-                    ).first()
-                    
-                    if stock_disponible:
-                        # Actualizar stock detallado para que coincida con el stock maestro
-                        stock_disponible.stock = repuesto.stock
-                        stock_disponible.save()
-                    else:
-                        # Crear registro si no existe
-                        RepuestoEnStock.objects.create(
-                            repuesto=repuesto,
-                            deposito='bodega-principal',
-                            stock=repuesto.stock,
-                            reservado=0,
-                            precio_compra=repuesto.precio_costo,
-                            precio_venta=repuesto.precio_venta,
-                            proveedor=''
-                        )
-                    
-                    # Registrar movimiento de stock
-                    StockMovimiento.objects.create(
-                        repuesto_stock=stock_disponible,
-                        tipo="salida",
-                        cantidad=carrito_item.cantidad,
+                    # Lanza StockInsuficiente (ValueError) y revierte la venta si no alcanza
+                    mover_stock(
+                        carrito_item.repuesto, carrito_item.cantidad, 'salida',
                         motivo=f"Venta POS #{venta.id}",
                         referencia=str(venta.id),
-                        usuario=request.user
+                        usuario=request.user,
+                        validar=True,
+                        movimientos=movimientos,
                     )
                 
+                VentaPOSItem.objects.bulk_create(items_venta)
+                registrar_movimientos(movimientos)
+                
                 # Limpiar carrito
                 sesion.carrito_items.all().delete()
                 
@@ -429,58 +375,17 @@ def anular_venta_pos(request, venta_id):
     
     try:
         with transaction.atomic():
-            # Revertir stock para cada item de la venta
-            for item in venta.items.all():
-                repuesto = item.repuesto
-                cantidad = item.cantidad
-                
-                # Buscar RepuestoEnStock en bodega-principal
-                stock_disponible = RepuestoEnStock.objects.filter(
-                    repuesto=repuesto,
-                    deposito='bodega-principal'
-                ).first()
-                
-                if stock_disponible:
-                    # Revertir stock en RepuestoEnStock
-                    stock_disponible.stock = (stock_disponible.stock or 0) + cantidad
-                    stock_disponible.save()
-                else:
-                    # Si no existe, crear el registro con el stock revertido
-                    stock_disponible = RepuestoEnStock.objects.create(
-                        repuesto=repuesto,
-                        deposito='bodega-principal',
-                        stock=cantidad,
-                        reservado=0,
-                        precio_compra=repuesto.precio_costo or 0,
-                        precio_venta=repuesto.precio_venta or 0,
-                        proveedor=''
-                    )
-                
-                # Revertir stock en Repuesto (tabla maestra)
-                repuesto.stock = (repuesto.stock or 0) + cantidad
-                repuesto.save()
-                
-                # Registrar movimiento de entrada para documentar la reversión
-                StockMovimiento.objects.create(
-                    repuesto_stock=stock_disponible,
-                    tipo="ingreso",
-                    cantidad=cantidad,
+            # Revertir stock para cada item de la venta (el libro conserva la salida original)
+            movimientos = []
+            for item in venta.items.select_related('repuesto'):
+                mover_stock(
+                    item.repuesto, item.cantidad, 'ingreso',
                     motivo=f"Anulación de Venta POS #{venta.id}",
                     referencia=str(venta.id),
-                    usuario=request.user
+                    usuario=request.user,
+                    movimientos=movimientos,
                 )
-            
-            # Eliminar movimientos de stock relacionados con la venta (tipo salida)
-            StockMovimiento.objects.filter(
-                motivo__contains=f"Venta POS #{venta.id}",
-                tipo="salida"
-            ).delete()
-            
-            # También eliminar por referencia si existe
-            StockMovimiento.objects.filter(
-                referencia=str(venta.id),
-                tipo="salida"
-            ).delete()
+            registrar_movimientos(movimientos)
             
             # Actualizar estadísticas de la sesión
             sesion = venta.sesion
@@ -844,59 +749,30 @@ def convertir_cotizacion_a_venta(request, cotizacion_id):
                 metodo_pago='efectivo'  # Por defecto, se puede cambiar
             )
             
-            # Crear items de la venta y actualizar stock
-            for item in cotizacion.items.all():
-                VentaPOSItem.objects.create(
+            # Crear items de la venta y descontar stock (un UPDATE condicional por línea)
+            items_venta = []
+            movimientos = []
+            for item in cotizacion.items.select_related('repuesto'):
+                items_venta.append(VentaPOSItem(
                     venta=venta,
                     repuesto=item.repuesto,
                     cantidad=item.cantidad,
                     precio_unitario=item.precio_unitario,
                     subtotal=item.subtotal
-                )
-                
-                # Actualizar stock usando el sistema unificado
-                repuesto = item.repuesto
+                ))
                 
-                # Verificar stock suficiente
-                if repuesto.stock_total < item.cantidad:
-                    raise ValueError(f"Stock insuficiente para {repuesto.nombre}. Disponible: {repuesto.stock_total}, Solicitado: {item.cantidad}")
-                
-                # Actualizar stock en la tabla maestra
-                repuesto.stock -= item.cantidad
-                repuesto.save()
-                
-                # Sincronizar con RepuestoEnStock
-                stock_disponible = RepuestoEnStock.objects.filter(
-                    repuesto=repuesto,
-                    deposito='bodega-principal'
-                ).first()
-                
-                if stock_disponible:
-                    # Actualizar stock detallado para que coincida con el stock maestro
-                    stock_disponible.stock = repuesto.stock
-                    stock_disponible.save()
-                else:
-                    # Crear registro si no existe
-                    RepuestoEnStock.objects.create(
-                        repuesto=repuesto,
-                        deposito='bodega-principal',
-                        stock=repuesto.stock,
-                        reservado=0,
-                        precio_compra=repuesto.precio_costo,
-                        precio_venta=repuesto.precio_venta,
-                        proveedor=''
-                    )
-                
-                # Registrar movimiento de stock
-                StockMovimiento.objects.create(
-                    repuesto_stock=stock_disponible,
-                    tipo="salida",
-                    cantidad=item.cantidad,
+                mover_stock(
+                    item.repuesto, item.cantidad, 'salida',
                     motivo=f"Venta POS #{venta.id} (desde cotización #{cotizacion.id})",
                     referencia=str(venta.id),
-                    usuario=request.user
+                    usuario=request.user,
+                    validar=True,
+                    movimientos=movimientos,
                 )
             
+            VentaPOSItem.objects.bulk_create(items_venta)
+            registrar_movimientos(movimientos)
+            
             # Actualizar estado de la cotización
             cotizacion.estado = 'convertida'
             cotizacion.save()
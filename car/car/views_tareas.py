@@ -0,0 +1,69 @@
+import mimetypes
+import os
+
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
+
+from .models import TareaSegundoPlano
+
+
+def _tarea_del_usuario(request, pk):
+    """Solo quien pidió la tarea (o el staff) puede ver su estado y su archivo"""
+    tarea = get_object_or_404(TareaSegundoPlano, pk=pk)
+    if tarea.usuario_id != request.user.pk and not request.user.is_staff:
+        raise Http404
+    return tarea
+
+
+def _siguiente(request):
+    siguiente = request.GET.get('siguiente', '')
+    if siguiente and url_has_allowed_host_and_scheme(siguiente, allowed_hosts={request.get_host()}):
+        return siguiente
+    return ''
+
+
+@login_required
+def tarea_estado(request, pk):
+    """Página de espera: consulta el estado y descarga el archivo o continúa al terminar"""
+    tarea = _tarea_del_usuario(request, pk)
+    return render(request, 'car/tarea_estado.html', {
+        'tarea': tarea,
+        'siguiente': _siguiente(request),
+    })
+
+
+@login_required
+def estado_tarea(request, pk):
+    """Estado de la tarea en JSON (consultado periódicamente por la página)"""
+    tarea = _tarea_del_usuario(request, pk)
+    resultado = tarea.resultado if isinstance(tarea.resultado, dict) else {}
+    return JsonResponse({
+        'estado': tarea.estado,
+        'procesados': tarea.procesados,
+        'total': tarea.total,
+        'porcentaje': tarea.porcentaje,
+        'error': tarea.error,
+        'mensaje': resultado.get('mensaje', ''),
+        'url_descarga': reverse('descargar_tarea', args=[tarea.pk]) if tarea.archivo else '',
+    })
+
+
+@login_required
+def descargar_tarea(request, pk):
+    """Entrega el archivo generado por la tarea (PDF inline, el resto como adjunto)"""
+    tarea = _tarea_del_usuario(request, pk)
+    if tarea.estado != 'completado' or not tarea.archivo:
+        raise Http404("El archivo todavía no está disponible")
+
+    resultado = tarea.resultado if isinstance(tarea.resultado, dict) else {}
+    nombre = resultado.get('nombre') or os.path.basename(tarea.archivo.name)
+    tipo = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+    response = FileResponse(
+        tarea.archivo.open('rb'), content_type=tipo, filename=nombre,
+        as_attachment=tipo != 'application/pdf',
+    )
+    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    return response
@@ -58,12 +58,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'car.sesiones.SesionDeslizanteMiddleware',  # Renueva la sesión solo cerca de expirar
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'car.middleware.PermisosMiddleware',  # NUEVO: Middleware de permisos
+    'car.cola_auditoria.AuditoriaMiddleware',  # Escribe los eventos de auditoría del request en lote
 ]
 
 ROOT_URLCONF = 'myproject.urls'
@@ -160,12 +162,139 @@ MEDIA_ROOT = BASE_DIR / 'media'  # Ruta en el sistema de archivos
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caché compartida por todos los workers: sellos de versión (configuración, permisos, árbol de
+# componentes, herramientas IA), feed de la pizarra y cursores de payload_ia. Una LocMemCache
+# por proceso haría que cada worker tuviera su propia revisión/secuencia. Por defecto vive en
+# la base (tabla creada por `manage.py createcachetable` en start.sh); con REDIS_URL se usa
+# Redis (requiere `pip install redis`)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'car_cache',
+            'OPTIONS': {
+                'MAX_ENTRIES': 20000,      # cambios de pizarra, cursores y resultados de herramientas
+                'CULL_FREQUENCY': 4,
+            },
+        }
+    }
+
+# Caché de la configuración del taller (car/cache_configuracion.py)
+CONFIG_TALLER_CACHE = 'default'
+CONFIG_TALLER_VERIFICAR_SEGUNDOS = 5   # reutilizar la copia en memoria sin consultar la caché
+CONFIG_TALLER_CACHE_TIMEOUT = 60       # máximo tiempo de una copia sin recargar
+
+# Permisos por usuario (car/middleware.py): el mapa vive en la sesión y se recalcula
+# cuando cambia la revisión del usuario guardada en esta caché (compartida: una sola revisión
+# para todos los workers)
+PERMISOS_CACHE = 'default'
+PERMISOS_CACHE_TIMEOUT = 24 * 3600     # vida de la revisión; al vencer los permisos se recalculan una vez
+
+# Árbol de componentes serializado (car/arbol_componentes.py): vive en la memoria de cada
+# proceso y se recarga cuando cambia el sello de versión guardado en esta caché
+COMPONENTES_ARBOL_CACHE = 'default'
+COMPONENTES_ARBOL_VERIFICAR_SEGUNDOS = 5
+COMPONENTES_ARBOL_MAX_SEGUNDOS = 600    # máximo tiempo de una copia sin recargar
+
+# Pizarra en vivo (car/pizarra.py): las pantallas piden solo los cambios con long-polling
+# (vista async: la espera solo se hace bajo ASGI); la secuencia de cambios vive en esta caché,
+# que debe ser compartida (con LocMemCache se responde siempre la pizarra completa)
+PIZARRA_CACHE = 'default'
+PIZARRA_ESPERA_MAXIMA = 25             # segundos que una petición puede quedar esperando cambios
+PIZARRA_INTERVALO_SEGUNDOS = 1         # cada cuánto revisa la secuencia mientras espera
+PIZARRA_LIMITE_CAMBIOS = 500           # más atrasado que esto recibe la pizarra completa
+PIZARRA_CACHE_TIMEOUT = 3600           # vida de cada cambio registrado
+
+# Tareas en segundo plano (car/tareas.py): PDF, Excel, algoritmo de relación y recepción
+# de compras. Con 'worker' start.sh inicia `python manage.py run_worker` junto al servidor;
+# 'hilo' las corre en el proceso web (sin worker) e 'inmediato' dentro del request.
+TAREAS_MODO = os.environ.get('TAREAS_MODO', 'worker')
+TAREAS_PROCESOS = 2
+TAREAS_TIMEOUT_MINUTOS = 30            # una tarea 'ejecutando' más tiempo se considera abandonada
+TAREAS_MAX_INTENTOS = 3
+TAREAS_CONSERVAR_DIAS = 7              # luego se borran la tarea y su archivo
+
+# Resúmenes de trabajos (car/resumenes.py): los eventos de auditoría marcan el trabajo y el
+# resumen se recalcula una vez al confirmar la transacción ('commit') o en el worker ('tarea')
+RESUMENES_MODO = os.environ.get('RESUMENES_MODO', 'commit')
+
+# Eventos de auditoría (car/cola_auditoria.py): se escriben en lote al terminar el request
+# ('sincrono') o en un hilo escritor del proceso sin demorar la respuesta ('hilo')
+AUDITORIA_MODO = os.environ.get('AUDITORIA_MODO', 'sincrono')
+if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    # Con varios escritores en el mismo proceso (hilo de auditoría, vistas async bajo ASGI)
+    # SQLite debe tomar el lock de escritura al abrir la transacción (si no, un SELECT
+    # seguido de INSERT/UPDATE falla con 'database is locked' en vez de esperar)
+    DATABASES['default'].setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
+
+# Consolas Netgogo en streaming (car/llm.py, car/views_ia_stream.py): el LLM se llama con un
+# httpx.AsyncClient con pool de conexiones y los tokens se envían por SSE. El streaming real
+# (sin ocupar un worker por conversación) requiere ASGI; el Dockerfile ya sirve
+#   gunicorn myproject.asgi:application -k uvicorn.workers.UvicornWorker
+# Con WSGI (runserver, wsgi.py) las vistas funcionan pero entregan la respuesta completa al
+# final y el cliente httpx de cada request se cierra al terminar.
+# Para pruebas y benchmarks: LLM_URL=http://127.0.0.1:8765/v1/responses con `manage.py mock_llm`
+LLM_URL = os.environ.get('LLM_URL', 'https://api.openai.com/v1/responses')
+LLM_API_KEY = os.environ.get('LLM_API_KEY') or os.environ.get('OPENAI_API_KEY')
+LLM_TIMEOUT = 60                       # segundos sin recibir datos del LLM
+LLM_TIMEOUT_CONEXION = 10
+LLM_MAX_CONEXIONES = 20                # conexiones keep-alive del pool por proceso
+
+# Herramientas de Netgogo (car/herramientas_ia.py): las function calls de solo lectura corren en
+# paralelo y su resultado se reutiliza mientras no cambien los datos (sello de versión en esta caché)
+HERRAMIENTAS_IA_CACHE = 'default'
+HERRAMIENTAS_IA_CACHE_TIMEOUT = 60     # segundos; 0 desactiva la caché
+HERRAMIENTAS_IA_HILOS = 4              # herramientas simultáneas por proceso
+
+# Resultado de las herramientas para el modelo (car/payload_ia.py): tablas columnares con resumen;
+# lo que pasa del presupuesto queda en esta caché bajo un cursor y se pide con siguiente_pagina
+# (debe ser compartida: la siguiente página puede atenderla otro worker)
+PAYLOAD_IA_CURSOR_CACHE = 'default'
+PAYLOAD_IA_MAX_TOKENS = 2500           # tokens estimados por resultado de herramienta
+PAYLOAD_IA_CARACTERES_POR_TOKEN = 4
+PAYLOAD_IA_MAX_TEXTO = 200             # caracteres por celda de texto
+PAYLOAD_IA_MAX_FILAS = 500             # techo del 'limite' de los listados
+PAYLOAD_IA_CURSOR_TIMEOUT = 1800       # segundos que vive un cursor de paginación
+
+# Diagnósticos parecidos (car/similitud_diagnosticos.py): índice TF-IDF en archivos NumPy (mmap)
+# compartidos por los procesos; los cambios van a un delta y se recargan con el sello de esta caché
+SIMILITUD_DIAGNOSTICOS_DIR = BASE_DIR / 'indices' / 'diagnosticos'
+SIMILITUD_DIAGNOSTICOS_CACHE = 'default'
+SIMILITUD_DIAGNOSTICOS_VERIFICAR_SEGUNDOS = 5
+SIMILITUD_DIAGNOSTICOS_MAX_DELTA = 500     # líneas del delta antes de reconstruir el segmento (tarea)
+SIMILITUD_DIAGNOSTICOS_MINIMA = 0.1        # similitud coseno mínima para sugerir un diagnóstico
+
+# Sugerencias del ingreso (car/sugerencias_ingreso.py): modelo de co-ocurrencias entrenado offline con
+# `manage.py entrenar_sugerencias_ingreso` (o la tarea del mismo nombre); cada proceso lo carga al primer uso
+SUGERENCIAS_INGRESO_ARCHIVO = BASE_DIR / 'indices' / 'sugerencias_ingreso.npz'
+SUGERENCIAS_INGRESO_VERIFICAR_SEGUNDOS = 30    # cada cuánto mirar si el archivo cambió
+SUGERENCIAS_INGRESO_MIN_SOPORTE = 2            # casos mínimos para que un rasgo cuente
+SUGERENCIAS_INGRESO_CONFIANZA_MINIMA = 0.05
+
 # Session configuration
 SESSION_COOKIE_AGE = 86400  # 24 horas
-SESSION_SAVE_EVERY_REQUEST = True  # Guardar sesión en cada request
+# No guardar en cada request: car.sesiones.SesionDeslizanteMiddleware extiende la
+# expiración solo cuando quedan menos de SESION_RENOVAR_SEGUNDOS
+SESSION_SAVE_EVERY_REQUEST = False
+SESION_RENOVAR_SEGUNDOS = 6 * 3600
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # Guardar sesiones en BD
+# Backend de sesiones configurable con DJANGO_SESSION_BACKEND: db, cached_db (defecto),
+# signed_cookies o file. cached_db lee desde la caché y solo escribe en BD al guardar.
+SESSION_BACKENDS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'file': 'django.contrib.sessions.backends.file',
+}
+SESSION_ENGINE = SESSION_BACKENDS[os.environ.get('DJANGO_SESSION_BACKEND', 'cached_db')]
 SESSION_COOKIE_NAME = 'talleres_sessionid'  # Nombre único para talleres
 SESSION_COOKIE_DOMAIN = None  # No compartir entre dominios
 
@@ -4,6 +4,11 @@ set -e
 # Cambiar al directorio de la aplicación
 cd /app
 
+# Tabla de la caché compartida (DatabaseCache, ver CACHES en settings.py); no hace nada si ya
+# existe. Va antes de migrate: los post_migrate que pueblan los índices ya escriben en la caché
+echo "Creando tabla de caché..."
+python3 manage.py createcachetable
+
 # Ejecutar migraciones
 echo "Ejecutando migraciones..."
 python3 manage.py migrate --noinput
@@ -12,6 +17,14 @@ python3 manage.py migrate --noinput
 echo "Recogiendo archivos estáticos..."
 python3 manage.py collectstatic --noinput || true
 
+# Worker de tareas en segundo plano (PDF, Excel, relación de repuestos, compras) cuando
+# TAREAS_MODO es 'worker' (el defecto). Se reinicia si termina. Con TAREAS_WORKER=0 no se
+# inicia aquí (p. ej. si corre como servicio aparte con `python3 manage.py run_worker`)
+if [ "${TAREAS_MODO:-worker}" = "worker" ] && [ "${TAREAS_WORKER:-1}" != "0" ]; then
+    echo "Iniciando worker de tareas..."
+    (while true; do python3 manage.py run_worker || true; sleep 5; done) &
+fi
+
 # Ejecutar el comando que viene como argumento (gunicorn)
 echo "Iniciando servidor..."
 exec "$@"